@@ -0,0 +1,126 @@
+"""
+多端點負載平衡測試：在同一個 process 內啟動多個 stub 副本，
+比較關閉 / 開啟 hedge 的尾端延遲，並在執行中讓一個副本故障，觀察剔除與恢復。
+
+- 副本 0、1：延遲分佈正常
+- 副本 2：延遲分佈的尾端較長（模擬偶發變慢的 GPU）
+- --fail-at 指定的進度時副本 1 故障（所有路由回 503），--recover-at 時恢復
+
+python -m benchmark.balancer --requests 400 --concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from services.openai_client import OpenAIClient
+from services.resilience import LLMError
+from .run import QUERY_TEMPLATES, summarize
+from .stub_server import StubOpenAIServer, StubConfig, LatencyModel
+
+SYSTEM_PROMPT = "你是一個資料庫查詢意圖判斷助手。"
+
+
+async def run_pool(
+    stubs: List[StubOpenAIServer],
+    hedge: bool,
+    requests: int,
+    concurrency: int,
+    fail_at: Optional[float],
+    recover_at: Optional[float],
+    health_interval: float,
+) -> Dict[str, Any]:
+    llm = OpenAIClient(endpoints=[s.base_url for s in stubs], api_key="stub", model_name="stub-model")
+    llm.cache = None
+    llm.flights = None
+    pool = llm.pool
+    pool.hedge = hedge
+    pool.health_interval = health_interval
+    pool.eject_seconds = 0.5
+    for stub in stubs:
+        stub.config.down = False
+
+    latencies: List[float] = []
+    failures = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(QUERY_TEMPLATES[i % len(QUERY_TEMPLATES)].format(n=i) + f"（hedge={hedge}）")
+    done = 0
+
+    async def worker():
+        nonlocal failures, done
+        while not queue.empty():
+            text = queue.get_nowait()
+            t0 = time.perf_counter()
+            try:
+                await llm.chat(SYSTEM_PROMPT, text)
+            except LLMError:
+                failures += 1
+            latencies.append((time.perf_counter() - t0) * 1000)
+            done += 1
+            if fail_at is not None and done == int(requests * fail_at):
+                stubs[1].config.down = True
+            if recover_at is not None and done == int(requests * recover_at):
+                stubs[1].config.down = False
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    snapshot = pool.snapshot()
+    await llm.aclose()
+    return {
+        "hedge": hedge,
+        "failures": failures,
+        "throughput_qps": round(requests / elapsed, 2),
+        "latency": summarize(latencies),
+        "pool": snapshot,
+    }
+
+
+async def _main() -> int:
+    parser = argparse.ArgumentParser(description="多端點負載平衡 / hedge 測試（本地 stub 副本）")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--ttft-ms", type=float, default=40.0)
+    parser.add_argument("--tail-spread", type=float, default=1.2, help="副本 2 的 lognormal spread（越大尾端越長）")
+    parser.add_argument("--fail-at", type=float, default=0.3, help="副本 1 故障的進度比例；負值表示不故障")
+    parser.add_argument("--recover-at", type=float, default=0.6)
+    parser.add_argument("--health-interval", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="結果輸出 JSON 路徑")
+    args = parser.parse_args()
+
+    configs = [
+        StubConfig(ttft=LatencyModel("lognormal", args.ttft_ms, 0.3), tokens_per_s=0, seed=args.seed),
+        StubConfig(ttft=LatencyModel("lognormal", args.ttft_ms, 0.3), tokens_per_s=0, seed=args.seed + 1),
+        StubConfig(ttft=LatencyModel("lognormal", args.ttft_ms, args.tail_spread), tokens_per_s=0, seed=args.seed + 2),
+    ]
+    fail_at = args.fail_at if args.fail_at >= 0 else None
+    stubs = [await StubOpenAIServer(config).start() for config in configs]
+    try:
+        results = [
+            await run_pool(stubs, hedge, args.requests, args.concurrency, fail_at, args.recover_at, args.health_interval)
+            for hedge in (False, True)
+        ]
+    finally:
+        for stub in stubs:
+            await stub.close()
+
+    print(f"{'hedge':<6} {'qps':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'fail':>5} {'hedges':>7}  per-endpoint requests/failures/ejections")
+    for r in results:
+        lat = r["latency"]
+        per_endpoint = " ".join(
+            f"{e['requests']}/{e['failures']}/{e['ejections']}" for e in r["pool"]["endpoints"]
+        )
+        print(f"{str(r['hedge']):<6} {r['throughput_qps']:>8} {lat['p50_ms']:>9} {lat['p95_ms']:>9} "
+              f"{lat['p99_ms']:>9} {r['failures']:>5} {r['pool']['hedges']:>7}  {per_endpoint}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
@@ -0,0 +1,118 @@
+"""
+意圖判斷 cascade 測試：小模型（快、偶爾沒把握）與大模型（慢）各一個 stub，
+比較只用大模型與 cascade 的延遲、各層級命中率，以及實際送往大模型的請求數。
+
+- 小模型：首 token 延遲 --small-ms；--hard-ratio 比例的輸入最高機率只有 --hard-confidence
+- 大模型：首 token 延遲 --large-ms
+
+python -m benchmark.cascade --requests 200 --concurrency 8
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from services.openai_client import OpenAIClient
+from tool.intent import IntentClassifierTool, IntentInput
+from .run import QUERY_TEMPLATES, summarize
+from .stub_server import StubOpenAIServer, StubConfig, LatencyModel
+
+
+def _client(stub: StubOpenAIServer, model_name: str) -> OpenAIClient:
+    llm = OpenAIClient(base_url=stub.base_url, api_key="stub", model_name=model_name)
+    llm.cache = None
+    return llm
+
+
+async def run_tool(
+    tool: IntentClassifierTool, queries: List[str], concurrency: int, large: StubOpenAIServer
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    failures = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for query in queries:
+        queue.put_nowait(query)
+    before = large.requests
+
+    async def worker():
+        nonlocal failures
+        while not queue.empty():
+            query = queue.get_nowait()
+            t0 = time.perf_counter()
+            result = await tool.execute(None, IntentInput(query=query))
+            latencies.append((time.perf_counter() - t0) * 1000)
+            failures += not result.success
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    return {
+        "failures": failures,
+        "throughput_qps": round(len(queries) / elapsed, 2),
+        "latency": summarize(latencies),
+        "large_requests": large.requests - before,
+        "cascade": tool.cascade_stats() if tool.cascade_llm is not None else None,
+    }
+
+
+async def _main() -> int:
+    parser = argparse.ArgumentParser(description="意圖判斷小模型 → 大模型 cascade 測試（本地 stub）")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--small-ms", type=float, default=15.0)
+    parser.add_argument("--large-ms", type=float, default=60.0)
+    parser.add_argument("--hard-ratio", type=float, default=0.2, help="小模型沒有把握的輸入比例")
+    parser.add_argument("--hard-confidence", type=float, default=0.55)
+    parser.add_argument("--threshold", type=float, default=0.85, help="採用小模型結果的信心門檻")
+    parser.add_argument("--json", help="結果輸出 JSON 路徑")
+    args = parser.parse_args()
+
+    def confidence(query: str) -> float:
+        # 以雜湊決定哪些輸入較難，兩次執行的難題相同
+        bucket = int(hashlib.md5(query.encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF
+        return args.hard_confidence if bucket < args.hard_ratio else 0.95
+
+    small = await StubOpenAIServer(StubConfig(
+        ttft=LatencyModel("lognormal", args.small_ms, 0.3), tokens_per_s=0, intent_confidence=confidence, seed=1,
+    )).start()
+    large = await StubOpenAIServer(StubConfig(
+        ttft=LatencyModel("lognormal", args.large_ms, 0.3), tokens_per_s=0, seed=2,
+    )).start()
+    small_llm, large_llm = _client(small, "stub-small"), _client(large, "stub-large")
+    queries = [QUERY_TEMPLATES[i % len(QUERY_TEMPLATES)].format(n=i) for i in range(args.requests)]
+    try:
+        results = {}
+        for name, cascade_llm in (("large_only", None), ("cascade", small_llm)):
+            tool = IntentClassifierTool(
+                large_llm, similarity_cache=None, cascade_llm=cascade_llm, cascade_threshold=args.threshold
+            )
+            # large_only 也不可使用 config 的 cascade 設定
+            tool.cascade_llm = cascade_llm
+            results[name] = await run_tool(tool, queries, args.concurrency, large)
+    finally:
+        await small_llm.aclose()
+        await large_llm.aclose()
+        await small.close()
+        await large.close()
+
+    print(f"{'mode':<11} {'qps':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'fail':>5} {'large_reqs':>11}  cascade")
+    for name, r in results.items():
+        lat = r["latency"]
+        cascade: Optional[Dict[str, Any]] = r["cascade"]
+        detail = "-" if cascade is None else (
+            f"small_hit={cascade['small_hit_rate']:.2f} escalated={cascade['escalated_by_reason']} "
+            f"small_mean={cascade['small_mean_ms']:.1f}ms large_mean={cascade['large_mean_ms']:.1f}ms"
+        )
+        print(f"{name:<11} {r['throughput_qps']:>8} {lat['p50_ms']:>9} {lat['p95_ms']:>9} {lat['p99_ms']:>9} "
+              f"{r['failures']:>5} {r['large_requests']:>11}  {detail}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
@@ -0,0 +1,119 @@
+"""
+提示詞前綴與首 token 延遲（TTFT）比較：
+- legacy：每次請求的內容放在 system 提示詞最前面（舊版 intent 提示詞的排列方式），請求之間沒有共用前綴
+- registry：tool.prompt_registry 的排列，固定指令在前、請求內容接在 user 訊息尾端
+
+預設在 process 內啟動開啟前綴快取模擬的 stub；指定 --base-url 時改測實際後端（例如開啟 prefix caching 的 vLLM）。
+
+python -m benchmark.prompt_ttft --requests 50
+python -m benchmark.prompt_ttft --base-url http://localhost:8000/v1 --model my-model --requests 50
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.openai_client import OpenAIClient
+from services.resilience import LLMError
+from tool.prompt_registry import PromptTemplate, prompt_registry
+from tool.semantic import SEMANTIC_CLASSIFICATION_PROMPT
+from tool.intent import INTENT_CLASSIFICATION_PROMPT
+from .run import QUERY_TEMPLATES, summarize
+from .stub_server import StubOpenAIServer, StubConfig, LatencyModel
+
+LAYOUTS = ("legacy", "registry")
+
+
+def render(template: PromptTemplate, value: str, layout: str) -> Tuple[str, str]:
+    system_prompt, user_prompt = template.render(value)
+    if layout == "legacy":
+        return f"{user_prompt}\n\n{system_prompt}", ""
+    return system_prompt, user_prompt
+
+
+async def first_token_ms(llm: OpenAIClient, system_prompt: str, user_prompt: str) -> Optional[float]:
+    """回傳收到第一段輸出的毫秒數；呼叫失敗時回傳 None"""
+    t0 = time.perf_counter()
+    ttft = None
+    try:
+        async for _ in llm.chat_stream(system_prompt, user_prompt):
+            if ttft is None:
+                ttft = (time.perf_counter() - t0) * 1000
+    except LLMError:
+        return None
+    return ttft
+
+
+async def run_layout(
+    llm: OpenAIClient, template: PromptTemplate, layout: str, requests: int, offset: int
+) -> Dict[str, Any]:
+    """依序送出（並行數 1，避免排隊影響 TTFT）；輸入各不相同，排除回覆快取的影響"""
+    latencies: List[float] = []
+    failures = 0
+    for i in range(requests):
+        value = QUERY_TEMPLATES[i % len(QUERY_TEMPLATES)].format(n=offset + i)
+        ttft = await first_token_ms(llm, *render(template, value, layout))
+        if ttft is None:
+            failures += 1
+        else:
+            latencies.append(ttft)
+    return {"ttft": summarize(latencies), "failures": failures}
+
+
+async def _main() -> int:
+    parser = argparse.ArgumentParser(description="提示詞排列對首 token 延遲的影響")
+    parser.add_argument("--requests", type=int, default=50, help="每種提示詞 × 排列的請求數")
+    parser.add_argument("--prompts", nargs="+", default=[INTENT_CLASSIFICATION_PROMPT.name, SEMANTIC_CLASSIFICATION_PROMPT.name])
+    parser.add_argument("--base-url", help="實際後端的 OpenAI 相容 URL；未指定時使用 stub")
+    parser.add_argument("--api-key", default="stub")
+    parser.add_argument("--model", default="stub-model")
+    parser.add_argument("--ttft-ms", type=float, default=20.0, help="stub 的基本首 token 延遲")
+    parser.add_argument("--prefill-tokens-per-s", type=float, default=5000.0, help="stub 的預填速度")
+    parser.add_argument("--json", help="結果輸出 JSON 路徑")
+    args = parser.parse_args()
+
+    stub = None
+    base_url = args.base_url
+    if base_url is None:
+        config = StubConfig(
+            ttft=LatencyModel("fixed", args.ttft_ms),
+            tokens_per_s=0,
+            prefill_tokens_per_s=args.prefill_tokens_per_s,
+            prefix_cache=True,
+        )
+        stub = await StubOpenAIServer(config).start()
+        base_url = stub.base_url
+
+    llm = OpenAIClient(base_url=base_url, api_key=args.api_key, model_name=args.model)
+    llm.cache = None
+    result: Dict[str, Any] = {"backend": args.base_url or "stub", "prompts": {}}
+    try:
+        offset = 0
+        for name in args.prompts:
+            template = prompt_registry.get(name)
+            result["prompts"][name] = {"prefix_fingerprint": template.prefix_fingerprint}
+            for layout in LAYOUTS:
+                result["prompts"][name][layout] = await run_layout(llm, template, layout, args.requests, offset)
+                offset += args.requests
+    finally:
+        await llm.aclose()
+        if stub is not None:
+            result["stub"] = {"prompt_tokens": stub.prompt_tokens, "cached_tokens": stub.cached_tokens}
+            await stub.close()
+
+    print(f"backend={result['backend']}")
+    print(f"{'prompt':<26} {'layout':<9} {'p50':>9} {'p95':>9} {'fail':>5}")
+    for name, layouts in result["prompts"].items():
+        for layout in LAYOUTS:
+            ttft = layouts[layout]["ttft"]
+            print(f"{name:<26} {layout:<9} {ttft['p50_ms']:>9} {ttft['p95_ms']:>9} {layouts[layout]['failures']:>5}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
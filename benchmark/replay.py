@@ -0,0 +1,120 @@
+"""
+錄製 / 重播測試：以一份輸入檔（每行一個 JSON {"query": ...} 或純文字）驅動完整的 Workflow.run。
+
+- --record：呼叫實際後端（--base-url 或 config 設定），並把每次 LLM 呼叫寫入卡帶
+- 預設重播：不連線，直接回傳卡帶中的回應，量測 CPU 端的額外開銷（每筆請求的 CPU 時間）
+- --timed：重播時依錄製的耗時等待，重現當時的端到端延遲
+
+python -m benchmark.replay traffic.jsonl --record --cassette data/cassettes/prod.jsonl
+python -m benchmark.replay traffic.jsonl --cassette data/cassettes/prod.jsonl --concurrency 8
+python -m benchmark.replay traffic.jsonl --cassette data/cassettes/prod.jsonl --timed --mode fused
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from services.cassette import build_cassette, CASSETTE_RECORD, CASSETTE_REPLAY, CASSETTE_REPLAY_TIMED
+from services.metrics import close_trace_sink
+from services.openai_client import OpenAIClient
+from workflow.workflow import WORKFLOW_MODES
+from .run import BENCH_USER, build_workflow, summarize
+
+
+def load_queries(path: str) -> List[str]:
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            queries.append(json.loads(line)["query"] if line.startswith("{") else line)
+    return queries
+
+
+async def replay(
+    llm: OpenAIClient, queries: List[str], mode: str, concurrency: int
+) -> Dict[str, Any]:
+    workflow = build_workflow(llm)
+    latencies: List[float] = []
+    replies: List[Optional[str]] = [None] * len(queries)
+    failures = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in enumerate(queries):
+        queue.put_nowait(item)
+
+    async def worker():
+        nonlocal failures
+        while True:
+            try:
+                i, query = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            t0 = time.perf_counter()
+            try:
+                replies[i] = await workflow.run(query, BENCH_USER, mode=mode)
+                if "意圖判斷結果" not in replies[i]:
+                    failures += 1
+            except Exception:
+                failures += 1
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    cpu0 = time.process_time()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu0
+    return {
+        "requests": len(queries),
+        "failures": failures,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_qps": round(len(queries) / elapsed, 2) if elapsed > 0 else 0.0,
+        "cpu_ms_per_request": round(cpu * 1000 / max(1, len(queries)), 3),
+        "latency": summarize(latencies),
+        "cassette": llm.cassette.stats.as_dict(),
+        "replies": replies,
+    }
+
+
+async def _main() -> int:
+    parser = argparse.ArgumentParser(description="以錄製的 LLM 回應重播 Workflow（不需 GPU 後端）")
+    parser.add_argument("inputs", help="輸入檔：每行一個 JSON {\"query\": ...} 或純文字")
+    parser.add_argument("--cassette", default="data/cassettes/llm.jsonl")
+    parser.add_argument("--record", action="store_true", help="呼叫實際後端並錄製")
+    parser.add_argument("--timed", action="store_true", help="重播時依錄製的耗時等待")
+    parser.add_argument("--base-url", help="錄製時使用的後端（預設使用 config 設定）")
+    parser.add_argument("--mode", default="pipeline", choices=WORKFLOW_MODES)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--json", help="結果輸出 JSON 路徑（含每筆回覆，可用於比對兩次重播）")
+    args = parser.parse_args()
+
+    if args.record:
+        cassette_mode = CASSETTE_RECORD
+    else:
+        cassette_mode = CASSETTE_REPLAY_TIMED if args.timed else CASSETTE_REPLAY
+    queries = load_queries(args.inputs)
+    llm = OpenAIClient(base_url=args.base_url, cassette=build_cassette(args.cassette, cassette_mode))
+    # 回應快取會讓重複的輸入不經過卡帶
+    llm.cache = None
+    try:
+        result = await replay(llm, queries, args.mode, args.concurrency)
+    finally:
+        await llm.aclose()
+        await close_trace_sink()
+
+    lat = result["latency"]
+    print(f"{cassette_mode} mode={args.mode} concurrency={args.concurrency} requests={result['requests']} "
+          f"failures={result['failures']}")
+    print(f"  qps={result['throughput_qps']} p50={lat['p50_ms']}ms p95={lat['p95_ms']}ms p99={lat['p99_ms']}ms "
+          f"cpu/request={result['cpu_ms_per_request']}ms")
+    print(f"  cassette {result['cassette']}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 1 if result["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
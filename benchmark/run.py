@@ -0,0 +1,312 @@
+"""
+Workflow 壓力測試：在同一個 process 內啟動 stub server，
+以指定的並行數驅動 Workflow.run，輸出 p50/p95/p99 延遲、吞吐量與各階段耗時。
+
+python -m benchmark.run --concurrency 1 8 32 --requests 200 --mode pipeline
+python -m benchmark.run --json result.json --baseline baseline.json   # 與基準比較，退化時 exit code 1
+python -m benchmark.run --mode speculative --greeting-ratio 0.3         # 推測執行的命中率 / 浪費率
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from vanna import Agent
+from vanna.core import ToolRegistry
+from vanna.core.user import User
+from vanna.integrations.local.agent_memory.in_memory import DemoAgentMemory
+from vanna.integrations.openai.llm import OpenAILlmService
+
+from services.metrics import close_trace_sink
+from services.openai_client import OpenAIClient
+from services.resilience import LLMError
+from tool.semantic import SemanticAnalysisTool
+from workflow.workflow import Workflow, WORKFLOW_MODES
+from .stub_server import StubOpenAIServer, StubConfig, LatencyModel, default_semantic_response
+
+BENCH_USER = User(id="bench", email="bench@example.com", group_memberships=["admin"])
+QUERY_TEMPLATES = [
+    "我想查詢 LTHDES{n:03d}N 最近一週的警報次數",
+    "請列出 {n} 號產線本月登入失敗的使用者",
+    "統計各設備第 {n} 季的異常趨勢",
+]
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 2) if values else 0.0,
+        "p50_ms": round(percentile(values, 0.50), 2),
+        "p95_ms": round(percentile(values, 0.95), 2),
+        "p99_ms": round(percentile(values, 0.99), 2),
+    }
+
+
+GREETING = "你好，"
+
+
+def greeting_semantic_response(user_input: str) -> str:
+    """開頭的問候語拆為 greeting，其餘為 main_query（main_query 與原始輸入不同）"""
+    if not user_input.startswith(GREETING):
+        return default_semantic_response(user_input)
+    data = json.loads(default_semantic_response(user_input[len(GREETING):]))
+    data["sentences"].insert(0, {"text": GREETING.rstrip("，"), "label": "greeting"})
+    data["greeting"] = GREETING.rstrip("，")
+    return json.dumps(data, ensure_ascii=False)
+
+
+def _timed(stage: str, fn, stage_latencies: Dict[str, List[float]]):
+    """包裝工具方法以記錄各階段耗時（毫秒）"""
+    async def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            stage_latencies[stage].append((time.perf_counter() - t0) * 1000)
+    return wrapper
+
+
+def build_workflow(llm: OpenAIClient) -> Workflow:
+    agent = Agent(
+        llm_service=OpenAILlmService(model=llm.model_name, api_key="stub", base_url="http://127.0.0.1:1/v1"),
+        tool_registry=ToolRegistry(),
+        user_resolver=None,
+        agent_memory=DemoAgentMemory(max_items=100),
+    )
+    workflow = Workflow(agent, llm)
+    # 壓測只量測 LLM 路徑，不走本地預分類與近似重複快取
+    workflow.prefilter = None
+    workflow.semantic_tool.similarity_cache = None
+    workflow.intent_tool.similarity_cache = None
+    return workflow
+
+
+async def run_level(
+    workflow: Workflow, concurrency: int, requests: int, mode: str, tag: str, greeting_ratio: float = 0.0
+) -> Dict[str, Any]:
+    stage_latencies: Dict[str, List[float]] = defaultdict(list)
+    semantic_execute = workflow.semantic_tool.execute
+    semantic_streaming = workflow.semantic_tool.execute_streaming
+    intent_execute = workflow.intent_tool.execute
+    fused_classify = workflow.fused_tool.classify
+    workflow.semantic_tool.execute = _timed("semantic", semantic_execute, stage_latencies)
+    workflow.semantic_tool.execute_streaming = _timed("semantic", semantic_streaming, stage_latencies)
+    workflow.intent_tool.execute = _timed("intent", intent_execute, stage_latencies)
+    workflow.fused_tool.classify = _timed("fused", fused_classify, stage_latencies)
+
+    latencies: List[float] = []
+    failures = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(requests):
+        # 平均分散：每 1/greeting_ratio 筆有一筆帶問候語
+        greeting = GREETING if int((i + 1) * greeting_ratio) > int(i * greeting_ratio) else ""
+        queue.put_nowait(greeting + QUERY_TEMPLATES[i % len(QUERY_TEMPLATES)].format(n=i) + f"（{tag}）")
+    workflow.speculation.clear()
+
+    async def worker():
+        nonlocal failures
+        while True:
+            try:
+                text = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            t0 = time.perf_counter()
+            try:
+                reply = await workflow.run(text, BENCH_USER, mode=mode)
+                if "意圖判斷結果" not in reply:
+                    failures += 1
+            except Exception:
+                failures += 1
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    workflow.semantic_tool.execute = semantic_execute
+    workflow.semantic_tool.execute_streaming = semantic_streaming
+    workflow.intent_tool.execute = intent_execute
+    workflow.fused_tool.classify = fused_classify
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "failures": failures,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_qps": round(requests / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency": summarize(latencies),
+        "stages": {stage: summarize(values) for stage, values in stage_latencies.items()},
+        "speculation": workflow.speculation_stats() if mode == "speculative" else None,
+    }
+
+
+def bench_parser(iterations: int) -> Dict[str, Any]:
+    """量測 _parse_llm_output 的 CPU 耗時（微秒 / 次）"""
+    tool = SemanticAnalysisTool(llm=object())
+    samples = [
+        default_semantic_response("我想查詢 LTHDES101N 最近一週的警報次數"),
+        "```json\n" + default_semantic_response("你好，請列出本月登入失敗的使用者") + "\n```",
+    ]
+    t0 = time.perf_counter()
+    for i in range(iterations):
+        tool._parse_llm_output(samples[i % len(samples)])
+    elapsed = time.perf_counter() - t0
+    return {"iterations": iterations, "us_per_call": round(elapsed / iterations * 1e6, 2)}
+
+
+async def bench_client(llm: OpenAIClient, requests: int, concurrency: int) -> Dict[str, Any]:
+    """stub 延遲為 0 時量測 client 層本身的額外耗時"""
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            t0 = time.perf_counter()
+            await llm.chat("你是一個資料庫查詢意圖判斷助手。", f"client-bench-{i}")
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - t0
+    return {"requests": requests, "throughput_qps": round(requests / elapsed, 2), "latency": summarize(latencies)}
+
+
+async def bench_burst(llm: OpenAIClient, stub: StubOpenAIServer, burst: int) -> Dict[str, Any]:
+    """同時送出 burst 個相同的呼叫（事故時多人查詢同一設備），統計實際送達後端的請求數"""
+    before = stub.requests
+    t0 = time.perf_counter()
+    replies = await asyncio.gather(
+        *(llm.chat("你是一個資料庫查詢意圖判斷助手。", "查詢 LTHDES101N 警報") for _ in range(burst)),
+        return_exceptions=True,
+    )
+    return {
+        "calls": burst,
+        "upstream_requests": stub.requests - before,
+        "failures": sum(1 for r in replies if isinstance(r, LLMError)),
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2),
+    }
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """回傳 p95 延遲或吞吐量退化超過 tolerance 的項目"""
+    regressions = []
+    base_levels = {(lvl["concurrency"]): lvl for lvl in baseline.get("levels", [])}
+    for lvl in result["levels"]:
+        base = base_levels.get(lvl["concurrency"])
+        if base is None:
+            continue
+        if lvl["latency"]["p95_ms"] > base["latency"]["p95_ms"] * (1 + tolerance):
+            regressions.append(f"c={lvl['concurrency']} p95 {base['latency']['p95_ms']} → {lvl['latency']['p95_ms']} ms")
+        if lvl["throughput_qps"] < base["throughput_qps"] * (1 - tolerance):
+            regressions.append(f"c={lvl['concurrency']} qps {base['throughput_qps']} → {lvl['throughput_qps']}")
+    base_parser = baseline.get("parser", {}).get("us_per_call")
+    if base_parser and result["parser"]["us_per_call"] > base_parser * (1 + tolerance):
+        regressions.append(f"parser {base_parser} → {result['parser']['us_per_call']} us/call")
+    return regressions
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    print(f"mode={result['mode']}  stub ttft={result['stub']['ttft_ms']}ms  tokens/s={result['stub']['tokens_per_s']}")
+    print(f"{'conc':>5} {'qps':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'fail':>5}  stages(p50 ms)")
+    for lvl in result["levels"]:
+        lat = lvl["latency"]
+        stages = " ".join(f"{k}={v['p50_ms']}" for k, v in lvl["stages"].items())
+        print(f"{lvl['concurrency']:>5} {lvl['throughput_qps']:>9} {lat['p50_ms']:>9} {lat['p95_ms']:>9} "
+              f"{lat['p99_ms']:>9} {lvl['failures']:>5}  {stages}")
+        spec = lvl.get("speculation")
+        if spec:
+            print(f"{'':>5} speculation: hit_rate={spec['hit_rate']:.2f} wasted_rate={spec['wasted_rate']:.2f} "
+                  f"exact={spec.get('exact', 0)} similar={spec.get('similar', 0)} miss={spec.get('miss', 0)}")
+    burst = result["burst"]
+    print(f"burst: {burst['calls']} identical calls -> {burst['upstream_requests']} upstream request(s) "
+          f"in {burst['elapsed_ms']}ms, {burst['failures']} failed")
+    print(f"parser: {result['parser']['us_per_call']} us/call")
+    client = result["client"]
+    print(f"client overhead (stub 0ms): p50={client['latency']['p50_ms']}ms qps={client['throughput_qps']}")
+
+
+async def _main() -> int:
+    parser = argparse.ArgumentParser(description="Workflow 壓力測試（本地 stub server）")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--requests", type=int, default=200, help="每個並行等級的請求數")
+    parser.add_argument("--mode", default="pipeline", choices=WORKFLOW_MODES)
+    parser.add_argument("--semantic-output", default="full", choices=["full", "spans"], help="語意分析輸出模式")
+    parser.add_argument("--ttft-ms", type=float, default=50.0)
+    parser.add_argument("--latency", default="lognormal", choices=["fixed", "uniform", "lognormal", "exponential"])
+    parser.add_argument("--spread", type=float, default=0.4)
+    parser.add_argument("--tokens-per-s", type=float, default=400.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--greeting-ratio", type=float, default=0.0, help="開頭帶問候語（main_query 與輸入不同）的請求比例")
+    parser.add_argument("--burst", type=int, default=32, help="同時送出的相同呼叫數（量測進行中呼叫合併）")
+    parser.add_argument("--parser-iterations", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="結果輸出 JSON 路徑")
+    parser.add_argument("--baseline", help="基準結果 JSON，退化超過 --tolerance 時 exit code 1")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        ttft=LatencyModel(args.latency, args.ttft_ms, args.spread),
+        tokens_per_s=args.tokens_per_s,
+        error_rate=args.error_rate,
+        semantic_response=greeting_semantic_response,
+        seed=args.seed,
+    )
+    result: Dict[str, Any] = {
+        "mode": args.mode,
+        "semantic_output": args.semantic_output,
+        "stub": {"ttft_ms": args.ttft_ms, "latency": args.latency, "tokens_per_s": args.tokens_per_s,
+                 "error_rate": args.error_rate},
+        "levels": [],
+    }
+
+    async with StubOpenAIServer(config) as stub:
+        llm = OpenAIClient(base_url=stub.base_url, api_key="stub", model_name="stub-model")
+        # 每筆請求內容不同，關閉快取以量測實際往返
+        llm.cache = None
+        workflow = build_workflow(llm)
+        workflow.semantic_tool.output_mode = args.semantic_output
+        for concurrency in args.concurrency:
+            result["levels"].append(
+                await run_level(
+                    workflow, concurrency, args.requests, args.mode, tag=f"c{concurrency}",
+                    greeting_ratio=args.greeting_ratio,
+                )
+            )
+        result["burst"] = await bench_burst(llm, stub, args.burst)
+
+        stub.config.ttft = LatencyModel("fixed", 0.0)
+        stub.config.tokens_per_s = 0
+        stub.config.error_rate = 0.0
+        result["client"] = await bench_client(llm, args.requests, max(args.concurrency))
+        await llm.aclose()
+        await close_trace_sink()
+
+    result["parser"] = bench_parser(args.parser_iterations)
+    print_report(result)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"[REGRESSION] {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
@@ -0,0 +1,113 @@
+"""
+LLM 排程測試：後端（stub）同時只能處理 --backend-concurrency 個請求，
+大量 batch 呼叫持續送出的同時有少量 interactive 呼叫，比較：
+
+- fifo：所有呼叫同一個等級（等同沒有優先順序，interactive 排在 batch 後面）
+- priority：batch 以 batch 等級排隊（最多使用 --batch-share 的名額），interactive 優先
+
+python -m benchmark.scheduler --batch 400 --interactive 40
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Any, Dict, List
+
+from services.openai_client import OpenAIClient
+from services.resilience import LLMError
+from services.scheduler import LLMScheduler, PRIORITY_BATCH, PRIORITY_INTERACTIVE, llm_priority
+from .run import QUERY_TEMPLATES, summarize
+from .stub_server import StubOpenAIServer, StubConfig, LatencyModel
+
+SYSTEM_PROMPT = "你是一個資料庫查詢意圖判斷助手。"
+
+
+async def run_mix(
+    stub: StubOpenAIServer, prioritized: bool, args: argparse.Namespace
+) -> Dict[str, Any]:
+    llm = OpenAIClient(base_url=stub.base_url, api_key="stub", model_name="stub-model")
+    llm.cache = None
+    llm.flights = None
+    llm.scheduler = LLMScheduler(args.backend_concurrency, batch_share=args.batch_share)
+    latencies: Dict[str, List[float]] = {PRIORITY_INTERACTIVE: [], PRIORITY_BATCH: []}
+    failures = {PRIORITY_INTERACTIVE: 0, PRIORITY_BATCH: 0}
+
+    async def call(priority: str, i: int) -> None:
+        text = QUERY_TEMPLATES[i % len(QUERY_TEMPLATES)].format(n=i) + f"（{priority} {prioritized}）"
+        t0 = time.perf_counter()
+        try:
+            with llm_priority(priority if prioritized else PRIORITY_INTERACTIVE):
+                await llm.chat(SYSTEM_PROMPT, text)
+        except LLMError:
+            failures[priority] += 1
+        latencies[priority].append((time.perf_counter() - t0) * 1000)
+
+    async def workers(priority: str, total: int, concurrency: int, delay: float = 0.0) -> float:
+        await asyncio.sleep(delay)
+        queue: asyncio.Queue = asyncio.Queue()
+        for i in range(total):
+            queue.put_nowait(i)
+
+        async def worker():
+            while not queue.empty():
+                await call(priority, queue.get_nowait())
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - t0
+
+    # interactive 在 batch 開始後才送出，遇到的是已經排滿的後端
+    batch_s, _ = await asyncio.gather(
+        workers(PRIORITY_BATCH, args.batch, args.batch_concurrency),
+        workers(PRIORITY_INTERACTIVE, args.interactive, args.interactive_concurrency, delay=0.2),
+    )
+    snapshot = llm.scheduler.snapshot()
+    await llm.aclose()
+    return {
+        "prioritized": prioritized,
+        "interactive": {"failures": failures[PRIORITY_INTERACTIVE], "latency": summarize(latencies[PRIORITY_INTERACTIVE])},
+        "batch": {
+            "failures": failures[PRIORITY_BATCH],
+            "throughput_qps": round(args.batch / batch_s, 2),
+            "latency": summarize(latencies[PRIORITY_BATCH]),
+        },
+        "scheduler": snapshot,
+    }
+
+
+async def _main() -> int:
+    parser = argparse.ArgumentParser(description="LLM 排程（interactive / batch 優先順序）測試（本地 stub）")
+    parser.add_argument("--batch", type=int, default=400, help="batch 呼叫數")
+    parser.add_argument("--batch-concurrency", type=int, default=64)
+    parser.add_argument("--interactive", type=int, default=40, help="interactive 呼叫數")
+    parser.add_argument("--interactive-concurrency", type=int, default=4)
+    parser.add_argument("--backend-concurrency", type=int, default=8, help="後端與用戶端每個後端的名額")
+    parser.add_argument("--batch-share", type=float, default=0.5)
+    parser.add_argument("--ttft-ms", type=float, default=40.0)
+    parser.add_argument("--json", help="結果輸出 JSON 路徑")
+    args = parser.parse_args()
+
+    stub = await StubOpenAIServer(StubConfig(
+        ttft=LatencyModel("lognormal", args.ttft_ms, 0.3), tokens_per_s=0,
+        max_concurrency=args.backend_concurrency, seed=0,
+    )).start()
+    try:
+        results = [await run_mix(stub, prioritized, args) for prioritized in (False, True)]
+    finally:
+        await stub.close()
+
+    print(f"{'mode':<9} {'int_p50':>9} {'int_p95':>9} {'int_fail':>9} {'batch_qps':>10} {'batch_p95':>10} {'batch_fail':>11}")
+    for r in results:
+        interactive, batch = r["interactive"], r["batch"]
+        print(f"{'priority' if r['prioritized'] else 'fifo':<9} {interactive['latency']['p50_ms']:>9} "
+              f"{interactive['latency']['p95_ms']:>9} {interactive['failures']:>9} {batch['throughput_qps']:>10} "
+              f"{batch['latency']['p95_ms']:>10} {batch['failures']:>11}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
@@ -0,0 +1,320 @@
+"""
+本地 OpenAI 相容 stub server：模擬 /v1/chat/completions 的延遲、吞吐與錯誤率，
+並依提示詞回傳固定格式的語意分析 / 意圖判斷結果，讓效能測試不需要 GPU 或網路。
+
+單獨啟動：python -m benchmark.stub_server --port 8000 --ttft-ms 150 --tokens-per-s 80
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from services.http_server import HTTPServer, Request, Response, StreamResponse, json_response
+
+_USER_INPUT = re.compile(r"================\n(.*?)\n================", re.DOTALL)
+_SEGMENT_LINE = re.compile(r"^\[\d+\] (.*)$", re.MULTILINE)
+_QUESTION = re.compile(r"「(.*?)」", re.DOTALL)
+
+
+@dataclass
+class LatencyModel:
+    """
+    首 token 延遲分佈（毫秒）。
+    kind: fixed | uniform | lognormal | exponential
+    """
+    kind: str = "lognormal"
+    median_ms: float = 150.0
+    spread: float = 0.4
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.median_ms
+        if self.kind == "uniform":
+            return rng.uniform(self.median_ms * (1 - self.spread), self.median_ms * (1 + self.spread))
+        if self.kind == "exponential":
+            return rng.expovariate(math.log(2) / self.median_ms) if self.median_ms > 0 else 0.0
+        return rng.lognormvariate(math.log(self.median_ms), self.spread) if self.median_ms > 0 else 0.0
+
+
+def default_semantic_response(user_input: str) -> str:
+    """預設語意分析回覆：整段輸入視為單一 main_query"""
+    return json.dumps({
+        "sentences": [{"text": user_input, "label": "main_query"}],
+        "main_query": user_input,
+        "greeting": None,
+        "presentation": None,
+    }, ensure_ascii=False)
+
+
+def default_fused_response(user_input: str) -> str:
+    data = json.loads(default_semantic_response(user_input))
+    data["intent"] = "A"
+    return json.dumps(data, ensure_ascii=False)
+
+
+def default_intent_confidence(user_input: str) -> float:
+    """logprobs 回覆中第一個 token 的機率；預設所有輸入皆為 0.9"""
+    return 0.9
+
+
+def default_span_response(segments: List[str]) -> str:
+    """span 模式預設回覆：第一句為 main_query，其餘為 other"""
+    return json.dumps({"labels": ["Q"] + ["O"] * (len(segments) - 1) if segments else []})
+
+
+@dataclass
+class StubConfig:
+    ttft: LatencyModel = field(default_factory=LatencyModel)
+    tokens_per_s: float = 80.0           # 解碼速度；0 表示不模擬解碼時間
+    error_rate: float = 0.0              # 回傳 500 的機率
+    max_concurrency: int = 0             # 模擬 GPU 批次上限；0 表示不限
+    prefill_tokens_per_s: float = 0.0    # prompt 預填速度；0 表示首 token 延遲與 prompt 長度無關
+    prefix_cache: bool = False           # 模擬後端自動前綴快取：已見過的前綴 block 不需預填
+    prefix_block_tokens: int = 16
+    prefix_cache_blocks: int = 8192
+    intent_label: str = "A"
+    semantic_response: Callable[[str], str] = default_semantic_response
+    fused_response: Callable[[str], str] = default_fused_response
+    span_response: Callable[[List[str]], str] = default_span_response
+    intent_confidence: Callable[[str], float] = default_intent_confidence
+    seed: Optional[int] = None
+    down: bool = False                   # 模擬副本故障：所有路由（含 /models 健康檢查）回傳 503
+
+
+def count_tokens(text: str) -> int:
+    """粗估 token 數：中文約一字一 token，英數約四字元一 token"""
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return max(1, (len(text) - ascii_chars) + ascii_chars // 4)
+
+
+class StubOpenAIServer:
+    """in-process 的 OpenAI 相容 stub；start() 後以 base_url 提供給 OpenAIClient。"""
+
+    def __init__(self, config: Optional[StubConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or StubConfig()
+        self.rng = random.Random(self.config.seed)
+        self.http = HTTPServer(self.handle, host, port)
+        self._slots = asyncio.Semaphore(self.config.max_concurrency) if self.config.max_concurrency else None
+        self._prefix_blocks: "OrderedDict[str, None]" = OrderedDict()
+        self.requests = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.http.base_url}/v1"
+
+    async def start(self) -> "StubOpenAIServer":
+        await self.http.start()
+        return self
+
+    async def close(self) -> None:
+        await self.http.close(grace=1.0)
+
+    async def __aenter__(self) -> "StubOpenAIServer":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    # ------------------ 路由 ------------------
+
+    async def handle(self, request: Request):
+        if self.config.down:
+            return json_response({"error": {"message": "stub is down", "type": "server_error"}}, 503)
+        if request.path.endswith("/models") and request.method == "GET":
+            return json_response({"object": "list", "data": [{"id": "stub-model", "object": "model"}]})
+        if request.path.endswith("/chat/completions") and request.method == "POST":
+            return await self._chat_completions(request.json())
+        return json_response({"error": {"message": "not found"}}, 404)
+
+    async def _chat_completions(self, body: Dict[str, Any]):
+        self.requests += 1
+        if self.config.error_rate and self.rng.random() < self.config.error_rate:
+            self.errors += 1
+            return json_response({"error": {"message": "stub injected error", "type": "server_error"}}, 500)
+
+        messages: List[Dict[str, str]] = body.get("messages", [])
+        content = self._canned_content(messages)
+        if body.get("max_tokens"):
+            content = content[: max(1, int(body["max_tokens"]))]
+        prompt_tokens = sum(count_tokens(m.get("content") or "") for m in messages)
+        completion_tokens = count_tokens(content)
+        cached_tokens = self._match_prefix(messages)
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        prefill_s = (
+            (prompt_tokens - cached_tokens) / self.config.prefill_tokens_per_s
+            if self.config.prefill_tokens_per_s > 0 else 0.0
+        )
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+        model = body.get("model", "stub-model")
+
+        if body.get("stream"):
+            return StreamResponse(
+                self._stream(model, content, completion_tokens, prefill_s, usage),
+                headers={"Content-Type": "text/event-stream"},
+            )
+
+        await self._simulate(completion_tokens, prefill_s)
+        choice: Dict[str, Any] = {
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }
+        if body.get("logprobs"):
+            choice["logprobs"] = {"content": [self._logprobs(messages, content, int(body.get("top_logprobs") or 5))]}
+        return json_response({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [choice],
+            "usage": usage,
+        })
+
+    # ------------------ 模擬 ------------------
+
+    @staticmethod
+    def _user_input(messages: List[Dict[str, str]]) -> str:
+        user = next((m.get("content") or "" for m in messages if m.get("role") == "user"), "")
+        match = _USER_INPUT.search(user) or _QUESTION.search(user)
+        return match.group(1).strip() if match else user.strip()
+
+    def _canned_content(self, messages: List[Dict[str, str]]) -> str:
+        system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+        user_input = self._user_input(messages)
+        if "已預先分句並編號" in system:
+            return self.config.span_response(_SEGMENT_LINE.findall(user_input))
+        # 語意分析提示詞也會提到「意圖」，以輸出欄位 "intent" 辨識 fused 提示詞
+        if "語意分析" in system and '"intent"' in system:
+            return self.config.fused_response(user_input)
+        if "語意分析" in system:
+            return self.config.semantic_response(user_input)
+        return self.config.intent_label
+
+    def _logprobs(self, messages: List[Dict[str, str]], content: str, top_n: int) -> Dict[str, Any]:
+        token = content[:1] or self.config.intent_label
+        p = min(0.999, max(0.25, self.config.intent_confidence(self._user_input(messages))))
+        others = [c for c in "ABCD" if c != token]
+        top = [{"token": token, "logprob": math.log(p), "bytes": None}]
+        top += [{"token": c, "logprob": math.log((1 - p) / 3), "bytes": None} for c in others]
+        return {"token": token, "logprob": top[0]["logprob"], "bytes": None, "top_logprobs": top[:top_n]}
+
+    def _match_prefix(self, messages: List[Dict[str, str]]) -> int:
+        """
+        以固定大小的 block 串接雜湊模擬前綴快取（與 vLLM 的 block 層級快取相同概念）：
+        回傳與先前請求共用的前綴 token 數，並記錄這次請求的所有完整 block。
+        """
+        if not self.config.prefix_cache:
+            return 0
+        text = "".join(f"<|{m.get('role')}|>{m.get('content') or ''}" for m in messages)
+        block = self.config.prefix_block_tokens
+        digest = hashlib.sha256()
+        cached_chars = 0
+        matching = True
+        for end in range(block, len(text) + 1, block):
+            digest.update(text[end - block:end].encode("utf-8"))
+            key = digest.hexdigest()
+            if matching and key in self._prefix_blocks:
+                self._prefix_blocks.move_to_end(key)
+                cached_chars = end
+                continue
+            matching = False
+            self._prefix_blocks[key] = None
+            if len(self._prefix_blocks) > self.config.prefix_cache_blocks:
+                self._prefix_blocks.popitem(last=False)
+        return count_tokens(text[:cached_chars]) if cached_chars else 0
+
+    async def _simulate(self, completion_tokens: int, prefill_s: float = 0.0) -> None:
+        async def _run():
+            await asyncio.sleep(self.config.ttft.sample(self.rng) / 1000 + prefill_s)
+            if self.config.tokens_per_s > 0:
+                await asyncio.sleep(completion_tokens / self.config.tokens_per_s)
+        if self._slots is None:
+            await _run()
+        else:
+            async with self._slots:
+                await _run()
+
+    async def _stream(
+        self, model: str, content: str, completion_tokens: int, prefill_s: float, usage: Dict[str, Any]
+    ) -> AsyncIterator[bytes]:
+        if self._slots is not None:
+            await self._slots.acquire()
+        try:
+            await asyncio.sleep(self.config.ttft.sample(self.rng) / 1000 + prefill_s)
+            chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+            step = 4
+            # 解碼總時間與非串流一致，平均分攤到每個 chunk
+            n_chunks = max(1, math.ceil(len(content) / step))
+            decode_s = completion_tokens / self.config.tokens_per_s if self.config.tokens_per_s > 0 else 0.0
+            per_chunk = decode_s / n_chunks
+            for i in range(0, len(content), step):
+                if i and per_chunk:
+                    await asyncio.sleep(per_chunk)
+                yield _sse({
+                    "id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "delta": {"content": content[i:i + step]}, "finish_reason": None}],
+                })
+            yield _sse({
+                "id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            yield b"data: [DONE]\n\n"
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+
+def _sse(data: Dict[str, Any]) -> bytes:
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+async def _main() -> None:
+    parser = argparse.ArgumentParser(description="本地 OpenAI 相容 stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--ttft-ms", type=float, default=150.0)
+    parser.add_argument("--latency", default="lognormal", choices=["fixed", "uniform", "lognormal", "exponential"])
+    parser.add_argument("--spread", type=float, default=0.4)
+    parser.add_argument("--tokens-per-s", type=float, default=80.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--max-concurrency", type=int, default=0)
+    parser.add_argument("--prefill-tokens-per-s", type=float, default=0.0)
+    parser.add_argument("--prefix-cache", action="store_true", help="模擬後端自動前綴快取")
+    args = parser.parse_args()
+
+    config = StubConfig(
+        ttft=LatencyModel(args.latency, args.ttft_ms, args.spread),
+        tokens_per_s=args.tokens_per_s,
+        error_rate=args.error_rate,
+        max_concurrency=args.max_concurrency,
+        prefill_tokens_per_s=args.prefill_tokens_per_s,
+        prefix_cache=args.prefix_cache,
+    )
+    server = await StubOpenAIServer(config, args.host, args.port).start()
+    print(f"stub server listening on {server.base_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
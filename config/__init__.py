@@ -1 +1,42 @@
-from .llm import LLM_MODEL_NAME, LLM_BASE_URL, LLM_API_KEY, LLM_TEMPERATURE
\ No newline at end of file
+from .llm import (
+    LLM_MODEL_NAME, LLM_BASE_URL, LLM_API_KEY, LLM_TEMPERATURE,
+    LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS, LLM_KEEPALIVE_EXPIRY,
+    LLM_HTTP2, LLM_TIMEOUT, LLM_CONNECT_TIMEOUT, LLM_SINGLE_FLIGHT,
+    LLM_ENDPOINT_MAX_CONCURRENCY, LLM_BATCH_MAX_SHARE,
+    LLM_QUEUE_MAX_INTERACTIVE, LLM_QUEUE_MAX_BATCH, LLM_QUEUE_TIMEOUT_INTERACTIVE, LLM_QUEUE_TIMEOUT_BATCH,
+    LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY, LLM_RETRY_BUDGET_RATIO, LLM_RETRY_BUDGET_MIN_PER_S,
+    LLM_BREAKER_WINDOW, LLM_BREAKER_MIN_REQUESTS, LLM_BREAKER_FAILURE_RATIO, LLM_BREAKER_OPEN_SECONDS,
+    LLM_ENDPOINTS, LLM_EJECT_FAILURES, LLM_EJECT_SECONDS, LLM_EJECT_MAX_SECONDS,
+    LLM_HEALTH_INTERVAL, LLM_HEALTH_TIMEOUT,
+    LLM_HEDGE_ENABLED, LLM_HEDGE_QUANTILE, LLM_HEDGE_MIN_DELAY, LLM_HEDGE_MAX_RATIO,
+    LLM_CASSETTE_MODE, LLM_CASSETTE_PATH, LLM_CASSETTE_FLUSH_INTERVAL,
+    LLM_CACHE_ENABLED, LLM_CACHE_MAX_BYTES, LLM_CACHE_TTL, LLM_CACHE_SQLITE_PATH,
+    LLM_CACHE_SQLITE_MAX_ROWS, LLM_CACHE_SQLITE_PRUNE_INTERVAL,
+)
+from .workflow import WORKFLOW_MODE, WORKFLOW_DEADLINE, WORKFLOW_SPECULATION_THRESHOLD
+from .metrics import METRICS_TRACE_PATH, METRICS_TRACE_FLUSH_INTERVAL, METRICS_TRACE_MAX_PENDING
+from .memory import (
+    MEMORY_LOG_ENABLED, MEMORY_LOG_PATH, MEMORY_LOG_RECENT, MEMORY_LOG_FLUSH_BYTES,
+    MEMORY_LOG_FLUSH_INTERVAL, MEMORY_LOG_MAX_BYTES, MEMORY_LOG_BACKUP_COUNT,
+    AGENT_MEMORY_BACKEND, AGENT_MEMORY_SQLITE_PATH, AGENT_MEMORY_MAX_PER_CONVERSATION,
+    AGENT_MEMORY_RETENTION_DAYS, AGENT_MEMORY_SEARCH_WINDOW,
+)
+from .batch import BATCH_CONCURRENCY, BATCH_DEDUPE_MAX
+from .intent import (
+    INTENT_MODE, INTENT_TOP_LOGPROBS, INTENT_CALIBRATION_TEMPERATURE, INTENT_CONFIDENCE_THRESHOLD,
+    INTENT_CASCADE_ENABLED, INTENT_CASCADE_MODEL, INTENT_CASCADE_BASE_URL, INTENT_CASCADE_THRESHOLD,
+)
+from .prefilter import (
+    PREFILTER_ENABLED, PREFILTER_CONFIDENCE_THRESHOLD, PREFILTER_MIN_SAMPLES, PREFILTER_PRECISION_PATH,
+    PREFILTER_MAX_LENGTH, PREFILTER_SHADOW,
+)
+from .similarity import (
+    SIMILARITY_CACHE_ENABLED, SIMILARITY_CACHE_SEMANTIC_THRESHOLD, SIMILARITY_CACHE_INTENT_THRESHOLD,
+    SIMILARITY_CACHE_CAPACITY, SIMILARITY_CACHE_DIM, SIMILARITY_CACHE_DIR,
+)
+from .semantic import SEMANTIC_GUIDED_JSON, SEMANTIC_OUTPUT_MODE
+
+from .server import (
+    SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_SHUTDOWN_GRACE, SERVER_MAX_INPUT_CHARS, SERVER_MAX_BODY_BYTES,
+    SERVER_API_TOKENS, SERVER_TRUST_USER_HEADER, SERVER_ALLOW_ANONYMOUS,
+)
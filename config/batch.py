@@ -0,0 +1,7 @@
+import os
+
+# ---------------- 批次分類 ----------------
+# 同時進行中的分類數（每筆最多兩次 LLM 呼叫）
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))
+# 去重時保留的已完成結果筆數（LRU，超過時淘汰最久未重複的項目）；進行中的分類另外追蹤，完成即釋放
+BATCH_DEDUPE_MAX = int(os.getenv("BATCH_DEDUPE_MAX", "10000"))
@@ -0,0 +1,20 @@
+import os
+
+# ---------------- 意圖判斷 ----------------
+# generate：讓模型自由輸出後取第一個字母（原行為）
+# logprobs：max_tokens=1 並讀取 A/B/C/D 的 logprobs，回傳機率分佈與信心分數
+INTENT_MODE = os.getenv("INTENT_MODE", "generate")
+# 向後端要求的 top logprobs 數量（vLLM 上限通常為 20）
+INTENT_TOP_LOGPROBS = int(os.getenv("INTENT_TOP_LOGPROBS", "10"))
+# 機率校正用的 temperature scaling（>1 讓分佈更平滑）
+INTENT_CALIBRATION_TEMPERATURE = float(os.getenv("INTENT_CALIBRATION_TEMPERATURE", "1.0"))
+# 最高機率低於此門檻時改判為 D（請使用者補充資訊）；0 表示不啟用
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.0"))
+
+# ---------------- 小模型 → 大模型 cascade ----------------
+# 啟用時先以小模型（logprobs）判斷；信心不足、輸出格式錯誤或呼叫失敗時才交給主要模型（LLM_MODEL_NAME）
+INTENT_CASCADE_ENABLED = os.getenv("INTENT_CASCADE_ENABLED", "false").lower() in ("1", "true", "yes")
+INTENT_CASCADE_MODEL = os.getenv("INTENT_CASCADE_MODEL", "openai/gpt-oss-20b")
+INTENT_CASCADE_BASE_URL = os.getenv("INTENT_CASCADE_BASE_URL", "http://10.13.18.40:8964/v1")
+# 小模型 A/B/C/D 的最高機率達此門檻才採用其結果
+INTENT_CASCADE_THRESHOLD = float(os.getenv("INTENT_CASCADE_THRESHOLD", "0.85"))
@@ -5,4 +5,79 @@ LLM_BASE_URL = os.getenv("LLM_BASE_URL", "http://10.13.18.40:2266/v1")
 # LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME", "openai/gpt-oss-20b")
 # LLM_BASE_URL = os.getenv("LLM_BASE_URL", "http://10.13.18.40:8964/v1")
 LLM_API_KEY = os.getenv("LLM_API_KEY", "none")
-LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.0"))
\ No newline at end of file
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.0"))
+
+# ---------------- 連線池與逾時設定 ----------------
+# 所有工具共用同一個 AsyncOpenAI client，連線池大小決定同時可送往後端的請求數
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+# HTTP/2 預設關閉；啟用需安裝 http2 extra（h2 套件），且僅在後端以 TLS (ALPN) 協商成功時生效，否則自動使用 HTTP/1.1
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "false").lower() in ("1", "true", "yes")
+# 單次呼叫逾時（秒），可在 chat(timeout=...) 逐次覆寫
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+# 同一時間相同 (model, 提示詞, 解碼參數) 的呼叫只送出一次，其餘呼叫者等待同一個結果
+LLM_SINGLE_FLIGHT = os.getenv("LLM_SINGLE_FLIGHT", "true").lower() in ("1", "true", "yes")
+
+# ---------------- 排程與背壓 ----------------
+# 每個後端同時處理的呼叫數上限；0 表示由所有端點平分 LLM_MAX_CONNECTIONS
+LLM_ENDPOINT_MAX_CONCURRENCY = int(os.getenv("LLM_ENDPOINT_MAX_CONCURRENCY", "0"))
+# batch 優先等級最多使用每個後端名額的比例，其餘保留給 interactive（批次工作不會佔滿後端）
+LLM_BATCH_MAX_SHARE = float(os.getenv("LLM_BATCH_MAX_SHARE", "0.5"))
+# 各優先等級的排隊上限（超過即拒絕）與最長排隊時間（秒，0 表示只受單次逾時與請求 deadline 限制）
+LLM_QUEUE_MAX_INTERACTIVE = int(os.getenv("LLM_QUEUE_MAX_INTERACTIVE", "200"))
+LLM_QUEUE_MAX_BATCH = int(os.getenv("LLM_QUEUE_MAX_BATCH", "1000"))
+LLM_QUEUE_TIMEOUT_INTERACTIVE = float(os.getenv("LLM_QUEUE_TIMEOUT_INTERACTIVE", "5"))
+LLM_QUEUE_TIMEOUT_BATCH = float(os.getenv("LLM_QUEUE_TIMEOUT_BATCH", "0"))
+
+# ---------------- 重試與熔斷 ----------------
+# 後端故障（連線錯誤、逾時、5xx、429）時的重試次數，重試前以指數退避加 full jitter 等待
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.1"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "2"))
+# 全域重試預算：重試數約不超過一般呼叫數的 ratio 倍，另每秒保底 min_per_s 次
+LLM_RETRY_BUDGET_RATIO = float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.2"))
+LLM_RETRY_BUDGET_MIN_PER_S = float(os.getenv("LLM_RETRY_BUDGET_MIN_PER_S", "1"))
+# 熔斷：最近 window 次呼叫（至少 min_requests 次）的失敗率達門檻即停止送出 open_seconds 秒
+LLM_BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "50"))
+LLM_BREAKER_MIN_REQUESTS = int(os.getenv("LLM_BREAKER_MIN_REQUESTS", "20"))
+LLM_BREAKER_FAILURE_RATIO = float(os.getenv("LLM_BREAKER_FAILURE_RATIO", "0.5"))
+LLM_BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "5"))
+
+# ---------------- 多端點負載平衡 ----------------
+# 逗號分隔的 OpenAI 相容端點，可用 base_url|model 指定該端點的模型名稱；留空時只使用 LLM_BASE_URL
+# 例：http://10.13.18.40:2266/v1,http://10.13.18.41:2266/v1
+LLM_ENDPOINTS = os.getenv("LLM_ENDPOINTS", "")
+# 被動健康檢查：連續失敗次數達門檻即剔除，剔除秒數連續剔除時加倍
+LLM_EJECT_FAILURES = int(os.getenv("LLM_EJECT_FAILURES", "3"))
+LLM_EJECT_SECONDS = float(os.getenv("LLM_EJECT_SECONDS", "10"))
+LLM_EJECT_MAX_SECONDS = float(os.getenv("LLM_EJECT_MAX_SECONDS", "120"))
+# 主動健康檢查間隔（秒，GET /models）；0 表示停用
+LLM_HEALTH_INTERVAL = float(os.getenv("LLM_HEALTH_INTERVAL", "5"))
+LLM_HEALTH_TIMEOUT = float(os.getenv("LLM_HEALTH_TIMEOUT", "2"))
+# hedge：非串流呼叫超過同類呼叫延遲的分位數仍未完成時，送一份到另一個端點（需至少兩個端點）
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.05"))
+# hedge 請求數不超過總請求數的比例，避免後端變慢時 hedge 放大負載
+LLM_HEDGE_MAX_RATIO = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.1"))
+
+# ---------------- 錄製 / 重播 ----------------
+# record：正常呼叫後端，並把請求指紋、回應與耗時追加寫入 LLM_CASSETTE_PATH
+# replay：不連線，直接回傳錄製的回應；replay_timed：並依錄製的耗時等待；留空表示停用
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "")
+LLM_CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH", "data/cassettes/llm.jsonl")
+# 錄製的紀錄在背景批次寫檔的間隔（秒）
+LLM_CASSETTE_FLUSH_INTERVAL = float(os.getenv("LLM_CASSETTE_FLUSH_INTERVAL", "1.0"))
+
+# ---------------- LLM 回覆快取 ----------------
+# temperature=0 時相同 (model, system_prompt, user_prompt) 的回覆可視為固定，可直接重用
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+# 設定路徑即啟用 SQLite 持久化快取（例：data/cache/llm_cache.sqlite3），留空則僅使用記憶體
+LLM_CACHE_SQLITE_PATH = os.getenv("LLM_CACHE_SQLITE_PATH", "")
+# SQLite 快取最多保留的筆數（超過時刪除最早寫入的），以及清除過期 / 超量資料的間隔（秒）
+LLM_CACHE_SQLITE_MAX_ROWS = int(os.getenv("LLM_CACHE_SQLITE_MAX_ROWS", "100000"))
+LLM_CACHE_SQLITE_PRUNE_INTERVAL = float(os.getenv("LLM_CACHE_SQLITE_PRUNE_INTERVAL", "300"))
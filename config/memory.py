@@ -0,0 +1,25 @@
+import os
+
+# ---------------- 本地記憶日誌 ----------------
+# 開啟後 Workflow 會將工具呼叫與回覆寫入日誌檔（批次非同步寫入）
+MEMORY_LOG_ENABLED = os.getenv("MEMORY_LOG_ENABLED", "false").lower() in ("1", "true", "yes")
+MEMORY_LOG_PATH = os.getenv("MEMORY_LOG_PATH", os.path.join("data", "memory", "demo_conversation.log"))
+# 記憶體中保留的最近行數（[最近記憶紀錄] 直接由此提供）
+MEMORY_LOG_RECENT = int(os.getenv("MEMORY_LOG_RECENT", "200"))
+# 批次寫入：累積達位元組數或經過秒數即 flush
+MEMORY_LOG_FLUSH_BYTES = int(os.getenv("MEMORY_LOG_FLUSH_BYTES", str(64 * 1024)))
+MEMORY_LOG_FLUSH_INTERVAL = float(os.getenv("MEMORY_LOG_FLUSH_INTERVAL", "1.0"))
+# 檔案超過此大小即輪替，保留 backup_count 個舊檔
+MEMORY_LOG_MAX_BYTES = int(os.getenv("MEMORY_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+MEMORY_LOG_BACKUP_COUNT = int(os.getenv("MEMORY_LOG_BACKUP_COUNT", "5"))
+
+# ---------------- Agent 記憶 ----------------
+# sqlite：持久化、依使用者 / 對話 / 時間建立索引；demo：vanna 內建的 DemoAgentMemory（僅存於記憶體）
+AGENT_MEMORY_BACKEND = os.getenv("AGENT_MEMORY_BACKEND", "sqlite")
+AGENT_MEMORY_SQLITE_PATH = os.getenv("AGENT_MEMORY_SQLITE_PATH", os.path.join("data", "memory", "agent_memory.sqlite3"))
+# 每個對話保留的最多筆數（寫入時以索引刪除超出的舊資料）
+AGENT_MEMORY_MAX_PER_CONVERSATION = int(os.getenv("AGENT_MEMORY_MAX_PER_CONVERSATION", "1000"))
+# 保留天數；0 表示不依時間清除
+AGENT_MEMORY_RETENTION_DAYS = float(os.getenv("AGENT_MEMORY_RETENTION_DAYS", "0"))
+# 相似度搜尋只比對同一使用者最近的 N 筆，查詢成本不隨歷史成長
+AGENT_MEMORY_SEARCH_WINDOW = int(os.getenv("AGENT_MEMORY_SEARCH_WINDOW", "500"))
@@ -0,0 +1,8 @@
+import os
+
+# ---------------- 效能量測 ----------------
+# 設定路徑即啟用逐請求 trace（JSONL），例：data/metrics/traces.jsonl
+METRICS_TRACE_PATH = os.getenv("METRICS_TRACE_PATH", "")
+# trace 在背景批次寫檔的間隔（秒），以及寫檔跟不上時最多保留的筆數（超過丟棄最舊的）
+METRICS_TRACE_FLUSH_INTERVAL = float(os.getenv("METRICS_TRACE_FLUSH_INTERVAL", "1.0"))
+METRICS_TRACE_MAX_PENDING = int(os.getenv("METRICS_TRACE_MAX_PENDING", "10000"))
@@ -0,0 +1,15 @@
+import os
+
+# ---------------- 本地預分類（LLM 快速路徑） ----------------
+PREFILTER_ENABLED = os.getenv("PREFILTER_ENABLED", "true").lower() in ("1", "true", "yes")
+# 規則的信心分數為其對照 LLM 標註的實測精確率，達此門檻才略過 LLM
+PREFILTER_CONFIDENCE_THRESHOLD = float(os.getenv("PREFILTER_CONFIDENCE_THRESHOLD", "0.98"))
+# 規則與 LLM 比對的樣本數少於此數時信心為 0（不略過 LLM）
+PREFILTER_MIN_SAMPLES = int(os.getenv("PREFILTER_MIN_SAMPLES", "200"))
+# 各規則精確率的存檔（python -m tool.prefilter.evaluate 產生，shadow 比對結果也會累加）；留空則只在記憶體中統計
+PREFILTER_PRECISION_PATH = os.getenv("PREFILTER_PRECISION_PATH", "")
+# 超過此長度的輸入一律交給 LLM
+PREFILTER_MAX_LENGTH = int(os.getenv("PREFILTER_MAX_LENGTH", "40"))
+# shadow 模式（預設）：規則命中時仍呼叫 LLM 並以 LLM 結果回覆，規則與 LLM 的標籤記入請求 trace 並累計精確率；
+# 確認精確率足夠後再關閉
+PREFILTER_SHADOW = os.getenv("PREFILTER_SHADOW", "true").lower() in ("1", "true", "yes")
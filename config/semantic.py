@@ -0,0 +1,7 @@
+import os
+
+# ---------------- 語意分析 ----------------
+# 以 response_format（JSON schema）要求後端做 guided decoding；後端不支援時請關閉
+SEMANTIC_GUIDED_JSON = os.getenv("SEMANTIC_GUIDED_JSON", "false").lower() in ("1", "true", "yes")
+# 輸出模式：full 由模型複述每個句子；spans 於本地分句，模型只回覆每句的類別代號（大幅減少輸出 token）
+SEMANTIC_OUTPUT_MODE = os.getenv("SEMANTIC_OUTPUT_MODE", "full")
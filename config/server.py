@@ -0,0 +1,22 @@
+import os
+
+# ---------------- HTTP 服務入口（python server.py） ----------------
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8080"))
+# worker process 數；大於 1 時以 SO_REUSEPORT 共用同一個 port，每個 process 各自持有 Workflow 與連線池
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "1"))
+# 收到 SIGTERM / SIGINT 後等待進行中請求的最長秒數
+SERVER_SHUTDOWN_GRACE = float(os.getenv("SERVER_SHUTDOWN_GRACE", "10"))
+# 單次請求輸入文字的最大字數
+SERVER_MAX_INPUT_CHARS = int(os.getenv("SERVER_MAX_INPUT_CHARS", "4000"))
+# 請求 body 的最大位元組數，超過回傳 413
+SERVER_MAX_BODY_BYTES = int(os.getenv("SERVER_MAX_BODY_BYTES", str(1024 * 1024)))
+
+# ---------------- 使用者解析 ----------------
+# Bearer token 與使用者對應，格式：token=user_id[:group1|group2],token2=user_id2
+# 未指定群組（或 X-User-Groups 為空）時為一般使用者（user），admin 必須明確指定
+SERVER_API_TOKENS = os.getenv("SERVER_API_TOKENS", "")
+# 信任上游 gateway 已驗證並傳入的 X-User-Id / X-User-Groups 標頭（服務不可直接對外時才開啟）
+SERVER_TRUST_USER_HEADER = os.getenv("SERVER_TRUST_USER_HEADER", "false").lower() in ("1", "true", "yes")
+# 沒有憑證的請求以 anonymous 使用者處理（僅供本地開發）
+SERVER_ALLOW_ANONYMOUS = os.getenv("SERVER_ALLOW_ANONYMOUS", "false").lower() in ("1", "true", "yes")
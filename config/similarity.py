@@ -0,0 +1,16 @@
+import os
+
+# ---------------- 近似重複輸入快取（字元 n-gram 向量） ----------------
+# 預設關閉：字元相似度分不出只差一個關鍵詞的查詢（例如「怎麼修」與「怎麼查」），確認命中結果正確後再開啟
+SIMILARITY_CACHE_ENABLED = os.getenv("SIMILARITY_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+# cosine 相似度達此門檻才重用語意分析結果（另需結果中的句子皆出現在新輸入裡）
+SIMILARITY_CACHE_SEMANTIC_THRESHOLD = float(os.getenv("SIMILARITY_CACHE_SEMANTIC_THRESHOLD", "0.8"))
+# cosine 相似度達此門檻才重用 main_query 的意圖判斷（另需兩者的意圖關鍵詞相同）；
+# 只差一個關鍵詞的查詢相似度約 0.94，門檻需高於此值
+SIMILARITY_CACHE_INTENT_THRESHOLD = float(os.getenv("SIMILARITY_CACHE_INTENT_THRESHOLD", "0.98"))
+# 每個快取的最多項目數（超過時淘汰最久未使用的項目）
+SIMILARITY_CACHE_CAPACITY = int(os.getenv("SIMILARITY_CACHE_CAPACITY", "5000"))
+# hashing 向量維度
+SIMILARITY_CACHE_DIM = int(os.getenv("SIMILARITY_CACHE_DIM", "1024"))
+# 索引存檔目錄（semantic.npz / intent.npz）；留空則不存檔
+SIMILARITY_CACHE_DIR = os.getenv("SIMILARITY_CACHE_DIR", "")
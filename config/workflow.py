@@ -0,0 +1,13 @@
+import os
+
+# ---------------- Workflow 執行模式 ----------------
+# pipeline：語意分析與意圖判斷各呼叫一次 LLM（兩段式）
+# fused：單次 LLM 呼叫同時完成語意分析與意圖判斷
+# streaming：串流接收語意分析輸出，main_query 一確定就啟動意圖判斷
+# speculative：意圖判斷以原始輸入與語意分析同時執行，main_query 與原始輸入相近時沿用結果
+WORKFLOW_MODE = os.getenv("WORKFLOW_MODE", "pipeline")
+
+# 每個請求的總時限（秒），傳遞到其中的每一次 LLM 呼叫；0 表示不設限
+WORKFLOW_DEADLINE = float(os.getenv("WORKFLOW_DEADLINE", "30"))
+# speculative 模式：main_query 與原始輸入的 n-gram cosine 相似度達此門檻即沿用推測的意圖結果（1 表示需完全相同）
+WORKFLOW_SPECULATION_THRESHOLD = float(os.getenv("WORKFLOW_SPECULATION_THRESHOLD", "0.9"))
@@ -1,18 +1,16 @@
 import asyncio
 from vanna import Agent
 from vanna.core import ToolRegistry
-from vanna.core.user import UserResolver, User, RequestContext
-from vanna.integrations.local.agent_memory.in_memory import DemoAgentMemory
+from vanna.core.user import RequestContext
 
 from config.llm import LLM_MODEL_NAME, LLM_BASE_URL, LLM_API_KEY
 from vanna.integrations.openai.llm import OpenAILlmService
 from workflow.workflow import Workflow
+from services.metrics import close_trace_sink
+from services.openai_client import close_openai_client
+from services.agent_memory import build_agent_memory
+from services.user_resolver import HeaderUserResolver
 
-# 簡單的使用者解析器：固定回傳 demo 使用者
-class SimpleUserResolver(UserResolver):
-    async def resolve_user(self, request_context: RequestContext) -> User:
-        return User(id="demo", email="demo@example.com", group_memberships=["admin"])
-    
 async def main():
     # 建立必要的元件
     llm_service = OpenAILlmService(
@@ -21,8 +19,10 @@ async def main():
         base_url=LLM_BASE_URL,
     )
     tool_registry = ToolRegistry()
-    user_resolver = SimpleUserResolver()
-    agent_memory = DemoAgentMemory(max_items=100)
+    # 依標頭解析使用者；本地示範直接信任 X-User-Id（服務入口見 server.py）
+    user_resolver = HeaderUserResolver(trust_user_header=True)
+    # 預設為 SQLite 持久化記憶（config.AGENT_MEMORY_BACKEND）
+    agent_memory = build_agent_memory()
 
     # 建立 Agent
     agent = Agent(
@@ -37,9 +37,9 @@ async def main():
 
     # 測試輸入
     user_input = "你好，我想查詢 LTHDES101N 設備資訊"
-    # 建立使用者（與 SimpleUserResolver 一致）
-    user = await user_resolver.resolve_user(RequestContext())    
-    reply = await workflow.run(user_input, user)
+    # 建立使用者（模擬帶有 X-User-Id / X-User-Groups 標頭的請求）
+    user = await user_resolver.resolve_user(RequestContext(headers={"X-User-Id": "demo", "X-User-Groups": "admin"}))
+    reply = await workflow.run(user_input, user, conversation_id="demo_conversation")
 
     # 檢查是否有工具呼叫標記
     if "<tool_call>" in reply:
@@ -47,5 +47,12 @@ async def main():
     else:
         print("最終回覆:\n", reply)
 
+    # 寫出尚未 flush 的記憶日誌、agent 記憶與 trace，並釋放共用 LLM client 的連線池
+    await workflow.aclose()
+    if hasattr(agent_memory, "aclose"):
+        await agent_memory.aclose()
+    await close_trace_sink()
+    await close_openai_client()
+
 if __name__ == "__main__":
     asyncio.run(main())
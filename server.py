@@ -0,0 +1,306 @@
+"""
+HTTP 服務入口：每個 worker process 建立一組 Agent / Workflow / 工具與 LLM 連線池，供所有請求共用。
+
+python server.py --port 8080 --workers 4
+
+POST /v1/classify   {"text": "...", "conversation_id": "...", "mode": "pipeline", "stream": false}
+                    conversation_id 亦可由 X-Conversation-Id 標頭提供，request_id 由 X-Request-Id 提供；
+                    皆未提供時自動產生並於回應標頭與內容中回傳，供後續請求延續同一對話。
+                    stream=true 時以 NDJSON 逐段回傳（語意分析完成即送出第一段）。
+                    X-Request-Timeout（秒）可縮短這次請求的時限（不超過 WORKFLOW_DEADLINE）。
+                    X-Request-Priority: batch 表示離線工作，LLM 呼叫以 batch 等級排隊（預設 interactive）。
+GET  /healthz       存活檢查；收到關閉訊號後回 503，讓負載平衡器停止派送
+GET  /metrics       Prometheus text format（各 worker process 各自統計）
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import uuid
+from multiprocessing.connection import wait as wait_processes
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional, Set, Union
+
+from vanna import Agent
+from vanna.core import ToolRegistry
+from vanna.core.user import RequestContext, User, UserResolver
+from vanna.integrations.openai.llm import OpenAILlmService
+
+from config import (
+    LLM_MODEL_NAME, LLM_BASE_URL, LLM_API_KEY,
+    SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_SHUTDOWN_GRACE, SERVER_MAX_INPUT_CHARS, SERVER_MAX_BODY_BYTES,
+    WORKFLOW_DEADLINE,
+)
+from services.agent_memory import build_agent_memory
+from services.http_server import HTTPServer, Request, Response, StreamResponse, json_response
+from services.metrics import close_trace_sink, metrics
+from services.openai_client import close_openai_client
+from services.scheduler import PRIORITIES, PRIORITY_INTERACTIVE
+from services.user_resolver import AuthenticationError, HeaderUserResolver
+from workflow.workflow import Workflow, WORKFLOW_MODES
+
+ROUTE_CLASSIFY = "/v1/classify"
+ROUTE_HEALTH = "/healthz"
+ROUTE_METRICS = "/metrics"
+ROUTES = (ROUTE_CLASSIFY, ROUTE_HEALTH, ROUTE_METRICS)
+
+metrics.describe("http_requests_total", "HTTP requests by route and status")
+metrics.describe("http_request_seconds", "Time until the HTTP response head is ready, by route")
+
+
+def _ndjson(data: Dict[str, Any]) -> bytes:
+    return json.dumps(data, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def _error(status: int, message: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    return json_response({"error": {"message": message}}, status, headers)
+
+
+def _request_timeout(value: Optional[str]) -> Optional[float]:
+    """解析 X-Request-Timeout；未提供時回傳 None（使用 WORKFLOW_DEADLINE），不接受超過 WORKFLOW_DEADLINE 的值"""
+    if value is None:
+        return None
+    seconds = float(value)
+    if not seconds > 0:
+        raise ValueError(value)
+    return min(seconds, WORKFLOW_DEADLINE) if WORKFLOW_DEADLINE > 0 else seconds
+
+
+class ClassificationService:
+    """
+    將 HTTP 請求轉成 Workflow.run 呼叫。
+    Workflow 與工具在 process 內只建立一次；每個請求只帶入自己的使用者、conversation_id 與 request_id。
+    """
+
+    def __init__(self, workflow: Workflow, user_resolver: UserResolver, max_input_chars: int = SERVER_MAX_INPUT_CHARS):
+        self.workflow = workflow
+        self.user_resolver = user_resolver
+        self.max_input_chars = max_input_chars
+        self.draining = False
+        # 進行中的 workflow 執行（串流的客戶端中途斷線時仍會執行完畢並寫入記憶）
+        self._inflight: Set[asyncio.Task] = set()
+
+    async def handle(self, request: Request) -> Union[Response, StreamResponse]:
+        started = time.perf_counter()
+        route = request.path if request.path in ROUTES else "other"
+        response = await self._dispatch(request)
+        metrics.inc("http_requests_total", route=route, status=response.status)
+        metrics.observe("http_request_seconds", time.perf_counter() - started, route=route)
+        return response
+
+    async def _dispatch(self, request: Request) -> Union[Response, StreamResponse]:
+        if request.path == ROUTE_HEALTH:
+            if self.draining:
+                return json_response({"status": "draining"}, 503)
+            return json_response({"status": "ok", "pid": os.getpid()})
+        if request.path == ROUTE_METRICS:
+            body = metrics.render_prometheus().encode("utf-8")
+            return Response(200, body, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+        if request.path != ROUTE_CLASSIFY:
+            return _error(404, f"unknown path: {request.path}")
+        if request.method != "POST":
+            return _error(405, "use POST", {"Allow": "POST"})
+        if self.draining:
+            return _error(503, "server is shutting down")
+        return await self._classify(request)
+
+    async def _classify(self, request: Request) -> Union[Response, StreamResponse]:
+        try:
+            user = await self.user_resolver.resolve_user(
+                RequestContext(headers=request.headers, remote_addr=request.remote_addr, query_params=request.query)
+            )
+        except AuthenticationError as e:
+            return _error(401, str(e), {"WWW-Authenticate": "Bearer"})
+
+        try:
+            body = request.json()
+        except ValueError:
+            return _error(400, "request body must be JSON")
+        if not isinstance(body, dict):
+            return _error(400, "request body must be a JSON object")
+        text = body.get("text")
+        if not isinstance(text, str) or not text.strip():
+            return _error(400, "'text' must be a non-empty string")
+        if len(text) > self.max_input_chars:
+            return _error(413, f"'text' exceeds {self.max_input_chars} characters")
+        mode = body.get("mode")
+        if mode is not None and mode not in WORKFLOW_MODES:
+            return _error(400, f"'mode' must be one of {list(WORKFLOW_MODES)}")
+
+        try:
+            timeout = _request_timeout(request.headers.get("x-request-timeout"))
+        except ValueError:
+            return _error(400, "X-Request-Timeout must be a positive number of seconds")
+        priority = request.headers.get("x-request-priority", PRIORITY_INTERACTIVE).lower()
+        if priority not in PRIORITIES:
+            return _error(400, f"X-Request-Priority must be one of {list(PRIORITIES)}")
+
+        conversation_id = str(body.get("conversation_id") or request.headers.get("x-conversation-id") or uuid.uuid4())
+        request_id = request.headers.get("x-request-id") or str(uuid.uuid4())
+        headers = {"X-Request-Id": request_id, "X-Conversation-Id": conversation_id}
+        stream = body.get("stream") is True or request.query.get("stream", "").lower() in ("1", "true", "yes")
+
+        if stream:
+            chunks = self._stream(text, user, mode, conversation_id, request_id, timeout, priority)
+            return StreamResponse(chunks, 200, {"Content-Type": "application/x-ndjson; charset=utf-8", **headers})
+
+        reply = await self._spawn(
+            self.workflow.run(text, user, mode, conversation_id, request_id, timeout=timeout, priority=priority)
+        )
+        return json_response(
+            {"request_id": request_id, "conversation_id": conversation_id, "reply": reply}, headers=headers
+        )
+
+    async def _stream(
+        self,
+        text: str,
+        user: User,
+        mode: Optional[str],
+        conversation_id: str,
+        request_id: str,
+        timeout: Optional[float] = None,
+        priority: str = PRIORITY_INTERACTIVE,
+    ) -> AsyncIterator[bytes]:
+        """每行一個 JSON：chunk 為回覆的一段（依序以換行串接即為完整回覆），最後一行為 done 或 error"""
+        queue: asyncio.Queue = asyncio.Queue()
+        task = self._spawn(
+            self.workflow.run(
+                text, user, mode, conversation_id, request_id,
+                on_chunk=queue.put_nowait, timeout=timeout, priority=priority,
+            )
+        )
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                break
+            yield _ndjson({"type": "chunk", "text": chunk})
+        if task.cancelled():
+            yield _ndjson({"type": "error", "message": "cancelled"})
+        elif task.exception() is not None:
+            e = task.exception()
+            yield _ndjson({"type": "error", "message": f"{type(e).__name__}: {e}"})
+        else:
+            yield _ndjson({"type": "done", "request_id": request_id, "conversation_id": conversation_id})
+
+    def _spawn(self, coro: Awaitable[str]) -> asyncio.Task:
+        task = asyncio.ensure_future(coro)
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+        return task
+
+    async def drain(self, grace: float = SERVER_SHUTDOWN_GRACE) -> None:
+        """停止接受新的分類請求，並等待進行中的 workflow 最多 grace 秒"""
+        self.draining = True
+        if self._inflight:
+            await asyncio.wait(set(self._inflight), timeout=grace)
+
+
+def build_workflow(user_resolver: UserResolver, agent_memory) -> Workflow:
+    """建立 Agent 與 Workflow（每個 worker process 呼叫一次）"""
+    agent = Agent(
+        llm_service=OpenAILlmService(model=LLM_MODEL_NAME, api_key=LLM_API_KEY, base_url=LLM_BASE_URL),
+        tool_registry=ToolRegistry(),
+        user_resolver=user_resolver,
+        agent_memory=agent_memory,
+    )
+    return Workflow(agent)
+
+
+async def serve(
+    host: str = SERVER_HOST,
+    port: int = SERVER_PORT,
+    reuse_port: bool = False,
+    grace: float = SERVER_SHUTDOWN_GRACE,
+) -> None:
+    """單一 process 的服務迴圈：收到 SIGTERM / SIGINT 後停止接受連線、等待進行中請求，再釋放資源"""
+    user_resolver = HeaderUserResolver()
+    agent_memory = build_agent_memory()
+    workflow = build_workflow(user_resolver, agent_memory)
+    service = ClassificationService(workflow, user_resolver)
+    http = await HTTPServer(
+        service.handle, host, port, reuse_port=reuse_port, max_body_bytes=SERVER_MAX_BODY_BYTES
+    ).start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    print(f"[server] pid={os.getpid()} listening on {http.base_url}", flush=True)
+
+    try:
+        await stop.wait()
+    finally:
+        service.draining = True
+        await http.close(grace)
+        await service.drain(grace)
+        await workflow.aclose()
+        if hasattr(agent_memory, "aclose"):
+            await agent_memory.aclose()
+        await close_trace_sink()
+        await close_openai_client()
+        print(f"[server] pid={os.getpid()} stopped", flush=True)
+
+
+def _worker_main(host: str, port: int, grace: float) -> None:
+    asyncio.run(serve(host, port, reuse_port=True, grace=grace))
+
+
+def run_workers(host: str, port: int, workers: int, grace: float) -> int:
+    """
+    啟動 workers 個 process，以 SO_REUSEPORT 綁定同一個 port，由 kernel 分配連線。
+    worker 意外結束時重新啟動；收到 SIGTERM / SIGINT 時轉送 SIGTERM 並等待所有 worker 結束。
+    """
+    if port == 0:
+        raise ValueError("多個 worker 必須指定固定的 port")
+    ctx = multiprocessing.get_context("spawn")
+    stopping = False
+
+    def start_worker() -> multiprocessing.Process:
+        process = ctx.Process(target=_worker_main, args=(host, port, grace), daemon=False)
+        process.start()
+        return process
+
+    def on_signal(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    processes: List[multiprocessing.Process] = [start_worker() for _ in range(workers)]
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    while not stopping:
+        wait_processes([p.sentinel for p in processes])
+        for i, process in enumerate(processes):
+            if not process.is_alive() and not stopping:
+                print(f"[server] worker pid={process.pid} exited with {process.exitcode}; restarting", flush=True)
+                # 避免啟動即失敗（例如 port 被占用）時不斷重啟
+                time.sleep(1.0)
+                processes[i] = start_worker()
+    for process in processes:
+        process.join()
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="語意分析 + 意圖判斷 HTTP 服務")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="worker process 數")
+    parser.add_argument("--grace", type=float, default=SERVER_SHUTDOWN_GRACE, help="關閉時等待進行中請求的秒數")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        return run_workers(args.host, args.port, args.workers, args.grace)
+    asyncio.run(serve(args.host, args.port, grace=args.grace))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
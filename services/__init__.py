@@ -1 +1,5 @@
-from .openai_client import OpenAIClient
\ No newline at end of file
+from .openai_client import OpenAIClient, get_openai_client, close_openai_client
+from .llm_cache import LLMResponseCache, MemoryLRUCache, SQLiteCache, CacheStats
+from .agent_memory import SQLiteAgentMemory, build_agent_memory
+from .similarity_cache import NgramVectorizer, SimilarityCache, build_similarity_cache
+from .user_resolver import HeaderUserResolver, AuthenticationError, parse_api_tokens
\ No newline at end of file
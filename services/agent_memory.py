@@ -0,0 +1,389 @@
+import asyncio
+import difflib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from vanna.capabilities.agent_memory import (
+    AgentMemory, ToolMemory, TextMemory, ToolMemorySearchResult, TextMemorySearchResult,
+)
+from vanna.core.tool import ToolContext
+
+from config import (
+    AGENT_MEMORY_BACKEND, AGENT_MEMORY_SQLITE_PATH, AGENT_MEMORY_MAX_PER_CONVERSATION,
+    AGENT_MEMORY_RETENTION_DAYS, AGENT_MEMORY_SEARCH_WINDOW,
+)
+from .metrics import metrics
+
+metrics.describe("agent_memory_writes_total", "Agent memory rows committed by table")
+metrics.describe("agent_memory_flush_seconds", "Time spent committing one agent memory write batch")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tool_memories (
+    seq INTEGER PRIMARY KEY,
+    memory_id TEXT NOT NULL UNIQUE,
+    user_id TEXT NOT NULL,
+    conversation_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    question TEXT NOT NULL,
+    tool_name TEXT NOT NULL,
+    args TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    metadata TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_tool_conv ON tool_memories (user_id, conversation_id, seq);
+CREATE INDEX IF NOT EXISTS idx_tool_user ON tool_memories (user_id, seq);
+CREATE INDEX IF NOT EXISTS idx_tool_ts ON tool_memories (ts);
+
+CREATE TABLE IF NOT EXISTS text_memories (
+    seq INTEGER PRIMARY KEY,
+    memory_id TEXT NOT NULL UNIQUE,
+    user_id TEXT NOT NULL,
+    conversation_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_text_conv ON text_memories (user_id, conversation_id, seq);
+CREATE INDEX IF NOT EXISTS idx_text_user ON text_memories (user_id, seq);
+CREATE INDEX IF NOT EXISTS idx_text_ts ON text_memories (ts);
+"""
+
+_INSERT = {
+    "tool_memories": (
+        "INSERT OR REPLACE INTO tool_memories"
+        " (memory_id, user_id, conversation_id, ts, question, tool_name, args, success, metadata)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    ),
+    "text_memories": (
+        "INSERT OR REPLACE INTO text_memories (memory_id, user_id, conversation_id, ts, content)"
+        " VALUES (?, ?, ?, ?, ?)"
+    ),
+}
+
+_TOOL_COLUMNS = "memory_id, ts, question, tool_name, args, success, metadata"
+_TEXT_COLUMNS = "memory_id, ts, content"
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def _scope(context: ToolContext) -> Tuple[str, str]:
+    return getattr(context.user, "id", None) or "unknown", context.conversation_id or "default"
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts).isoformat()
+
+
+def _similarity(a: str, b: str) -> float:
+    """與 DemoAgentMemory 相同的度量：max(詞集合 Jaccard, difflib ratio)，門檻可共用"""
+    a, b = a.strip().lower(), b.strip().lower()
+    if not a or not b:
+        return 0.0
+    ta, tb = set(_TOKEN_PATTERN.findall(a)), set(_TOKEN_PATTERN.findall(b))
+    jaccard = len(ta & tb) / len(ta | tb) if ta and tb else 0.0
+    return max(jaccard, difflib.SequenceMatcher(None, a, b).ratio())
+
+
+class SQLiteAgentMemory(AgentMemory):
+    """
+    SQLite 持久化的 AgentMemory，可直接取代 DemoAgentMemory 傳入 vanna Agent。
+
+    - 每筆記憶以 (user_id, conversation_id, seq) 建立索引：「此對話最近 N 筆」是一次有界的索引查詢
+    - 寫入先進入記憶體佇列，累積到 batch_size 或經過 flush_interval 後以單一交易提交；
+      讀取前會先提交佇列，保證讀得到自己剛寫入的資料
+    - 保留上限在提交時依索引刪除：每個對話只保留最近 max_per_conversation 筆，
+      retention_days > 0 時另以 ts 索引刪除過期資料，兩者皆不需掃描整張表
+    - 相似度搜尋只比對同一使用者最近 search_window 筆，成本不隨歷史總量成長
+    """
+
+    def __init__(
+        self,
+        path: str = AGENT_MEMORY_SQLITE_PATH,
+        max_per_conversation: int = AGENT_MEMORY_MAX_PER_CONVERSATION,
+        retention_days: float = AGENT_MEMORY_RETENTION_DAYS,
+        search_window: int = AGENT_MEMORY_SEARCH_WINDOW,
+        batch_size: int = 64,
+        flush_interval: float = 0.05,
+    ):
+        self.path = path
+        self.max_per_conversation = max_per_conversation if max_per_conversation > 0 else None
+        self.retention = retention_days * 86400 if retention_days > 0 else None
+        self.search_window = search_window
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        # 待提交的 (table, row)；由 _write_lock 保護提交順序
+        self._pending: List[Tuple[str, tuple]] = []
+        self._write_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    # ---------------- 寫入 ----------------
+
+    async def save_tool_usage(
+        self,
+        question: str,
+        tool_name: str,
+        args: Dict[str, Any],
+        context: ToolContext,
+        success: bool = True,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        user_id, conversation_id = _scope(context)
+        row = (
+            str(uuid.uuid4()), user_id, conversation_id, time.time(), question, tool_name,
+            json.dumps(args, ensure_ascii=False, default=str), int(success),
+            json.dumps(metadata, ensure_ascii=False, default=str) if metadata is not None else None,
+        )
+        await self._enqueue("tool_memories", row)
+
+    async def save_text_memory(self, content: str, context: ToolContext) -> TextMemory:
+        user_id, conversation_id = _scope(context)
+        memory_id, ts = str(uuid.uuid4()), time.time()
+        await self._enqueue("text_memories", (memory_id, user_id, conversation_id, ts, content))
+        return TextMemory(memory_id=memory_id, content=content, timestamp=_iso(ts))
+
+    async def _enqueue(self, table: str, row: tuple) -> None:
+        self._pending.append((table, row))
+        if len(self._pending) >= self.batch_size:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await self.flush()
+        except Exception:
+            # 失敗的批次已放回佇列，於下一次寫入或讀取時重試
+            pass
+
+    async def flush(self) -> None:
+        """以單一交易提交所有待寫入的記憶"""
+        async with self._write_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception:
+                self._pending[:0] = batch
+                raise
+
+    def _write_batch(self, batch: List[Tuple[str, tuple]]) -> None:
+        started = time.perf_counter()
+        touched = set()
+        rows: Dict[str, List[tuple]] = {}
+        for table, row in batch:
+            rows.setdefault(table, []).append(row)
+            touched.add((table, row[1], row[2]))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for table, table_rows in rows.items():
+                    self._conn.executemany(_INSERT[table], table_rows)
+                if self.max_per_conversation is not None:
+                    for table, user_id, conversation_id in touched:
+                        self._trim_conversation(table, user_id, conversation_id)
+                if self.retention is not None:
+                    cutoff = time.time() - self.retention
+                    for table in _INSERT:
+                        self._conn.execute(f"DELETE FROM {table} WHERE ts < ?", (cutoff,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        for table, table_rows in rows.items():
+            metrics.inc("agent_memory_writes_total", len(table_rows), table=table)
+        metrics.observe("agent_memory_flush_seconds", time.perf_counter() - started)
+
+    def _trim_conversation(self, table: str, user_id: str, conversation_id: str) -> None:
+        # 以 (user_id, conversation_id, seq) 索引找出第 N 新的 seq，刪除更舊的資料
+        self._conn.execute(
+            f"DELETE FROM {table} WHERE user_id = ? AND conversation_id = ? AND seq <= ("
+            f" SELECT seq FROM {table} WHERE user_id = ? AND conversation_id = ?"
+            f" ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+            (user_id, conversation_id, user_id, conversation_id, self.max_per_conversation),
+        )
+
+    # ---------------- 讀取 ----------------
+
+    async def _query(self, sql: str, params: tuple) -> List[tuple]:
+        await self.flush()
+
+        def run() -> List[tuple]:
+            with self._lock:
+                return self._conn.execute(sql, params).fetchall()
+
+        return await asyncio.to_thread(run)
+
+    async def _execute(self, sql: str, params: tuple) -> int:
+        await self.flush()
+
+        def run() -> int:
+            with self._lock:
+                return self._conn.execute(sql, params).rowcount
+
+        return await asyncio.to_thread(run)
+
+    @staticmethod
+    def _tool_memory(row: tuple) -> ToolMemory:
+        memory_id, ts, question, tool_name, args, success, metadata = row
+        return ToolMemory(
+            memory_id=memory_id,
+            question=question,
+            tool_name=tool_name,
+            args=json.loads(args),
+            timestamp=_iso(ts),
+            success=bool(success),
+            metadata=json.loads(metadata) if metadata is not None else None,
+        )
+
+    @staticmethod
+    def _text_memory(row: tuple) -> TextMemory:
+        memory_id, ts, content = row
+        return TextMemory(memory_id=memory_id, content=content, timestamp=_iso(ts))
+
+    async def get_recent_memories(self, context: ToolContext, limit: int = 10) -> List[ToolMemory]:
+        """此對話最近的工具記憶，新的在前"""
+        rows = await self._query(
+            f"SELECT {_TOOL_COLUMNS} FROM tool_memories WHERE user_id = ? AND conversation_id = ?"
+            " ORDER BY seq DESC LIMIT ?",
+            (*_scope(context), limit),
+        )
+        return [self._tool_memory(r) for r in rows]
+
+    async def get_recent_text_memories(self, context: ToolContext, limit: int = 10) -> List[TextMemory]:
+        """此對話最近的文字記憶，新的在前"""
+        rows = await self._query(
+            f"SELECT {_TEXT_COLUMNS} FROM text_memories WHERE user_id = ? AND conversation_id = ?"
+            " ORDER BY seq DESC LIMIT ?",
+            (*_scope(context), limit),
+        )
+        return [self._text_memory(r) for r in rows]
+
+    async def search_similar_usage(
+        self,
+        question: str,
+        context: ToolContext,
+        *,
+        limit: int = 10,
+        similarity_threshold: float = 0.7,
+        tool_name_filter: Optional[str] = None,
+    ) -> List[ToolMemorySearchResult]:
+        user_id, _ = _scope(context)
+        rows = await self._query(
+            f"SELECT {_TOOL_COLUMNS} FROM tool_memories WHERE user_id = ? ORDER BY seq DESC LIMIT ?",
+            (user_id, self.search_window),
+        )
+        scored = []
+        for row in rows:
+            memory = self._tool_memory(row)
+            if not memory.success or (tool_name_filter and memory.tool_name != tool_name_filter):
+                continue
+            score = _similarity(question, memory.question)
+            if score >= similarity_threshold:
+                scored.append((memory, score))
+        scored.sort(key=lambda x: x[1], reverse=True)
+        return [
+            ToolMemorySearchResult(memory=m, similarity_score=s, rank=i)
+            for i, (m, s) in enumerate(scored[:limit], start=1)
+        ]
+
+    async def search_text_memories(
+        self,
+        query: str,
+        context: ToolContext,
+        *,
+        limit: int = 10,
+        similarity_threshold: float = 0.7,
+    ) -> List[TextMemorySearchResult]:
+        user_id, _ = _scope(context)
+        rows = await self._query(
+            f"SELECT {_TEXT_COLUMNS} FROM text_memories WHERE user_id = ? ORDER BY seq DESC LIMIT ?",
+            (user_id, self.search_window),
+        )
+        scored = []
+        for row in rows:
+            memory = self._text_memory(row)
+            score = _similarity(query, memory.content)
+            if score >= similarity_threshold:
+                scored.append((memory, score))
+        scored.sort(key=lambda x: x[1], reverse=True)
+        return [
+            TextMemorySearchResult(memory=m, similarity_score=s, rank=i)
+            for i, (m, s) in enumerate(scored[:limit], start=1)
+        ]
+
+    # ---------------- 刪除 ----------------
+
+    async def delete_by_id(self, context: ToolContext, memory_id: str) -> bool:
+        user_id, _ = _scope(context)
+        deleted = await self._execute(
+            "DELETE FROM tool_memories WHERE memory_id = ? AND user_id = ?", (memory_id, user_id)
+        )
+        return deleted > 0
+
+    async def delete_text_memory(self, context: ToolContext, memory_id: str) -> bool:
+        user_id, _ = _scope(context)
+        deleted = await self._execute(
+            "DELETE FROM text_memories WHERE memory_id = ? AND user_id = ?", (memory_id, user_id)
+        )
+        return deleted > 0
+
+    async def clear_memories(
+        self,
+        context: ToolContext,
+        tool_name: Optional[str] = None,
+        before_date: Optional[str] = None,
+    ) -> int:
+        """
+        刪除此使用者的記憶，回傳刪除筆數。
+        指定 tool_name 時只刪除該工具的記憶（不含文字記憶）；before_date 為 ISO 格式日期。
+        """
+        user_id, _ = _scope(context)
+        cutoff = datetime.fromisoformat(before_date).timestamp() if before_date else None
+        conditions, params = ["user_id = ?"], [user_id]
+        if cutoff is not None:
+            conditions.append("ts < ?")
+            params.append(cutoff)
+        where = " AND ".join(conditions)
+        deleted = 0
+        if tool_name:
+            deleted += await self._execute(
+                f"DELETE FROM tool_memories WHERE {where} AND tool_name = ?", (*params, tool_name)
+            )
+        else:
+            deleted += await self._execute(f"DELETE FROM tool_memories WHERE {where}", tuple(params))
+            deleted += await self._execute(f"DELETE FROM text_memories WHERE {where}", tuple(params))
+        return deleted
+
+    async def aclose(self) -> None:
+        """提交剩餘的寫入並關閉資料庫"""
+        await self.flush()
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        with self._lock:
+            self._conn.close()
+
+
+def build_agent_memory() -> AgentMemory:
+    """依 config.AGENT_MEMORY_BACKEND 建立 agent 記憶；demo 為 vanna 內建的記憶體版本"""
+    if AGENT_MEMORY_BACKEND == "demo":
+        from vanna.integrations.local.agent_memory.in_memory import DemoAgentMemory
+        return DemoAgentMemory(max_items=100)
+    if AGENT_MEMORY_BACKEND != "sqlite":
+        raise ValueError(f"未知的 AGENT_MEMORY_BACKEND: {AGENT_MEMORY_BACKEND}")
+    return SQLiteAgentMemory()
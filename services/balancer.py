@@ -0,0 +1,286 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, asdict
+from typing import Any, Deque, Dict, Hashable, List, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError
+
+from config import (
+    LLM_MODEL_NAME, LLM_API_KEY,
+    LLM_EJECT_FAILURES, LLM_EJECT_SECONDS, LLM_EJECT_MAX_SECONDS, LLM_HEALTH_INTERVAL, LLM_HEALTH_TIMEOUT,
+    LLM_HEDGE_ENABLED, LLM_HEDGE_QUANTILE, LLM_HEDGE_MIN_DELAY, LLM_HEDGE_MAX_RATIO,
+)
+from .metrics import metrics
+
+# 計算 hedge 延遲前每種呼叫至少需要的延遲樣本數
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 256
+LATENCY_KEYS = 64
+
+metrics.describe("llm_endpoint_requests_total", "LLM requests per backend endpoint by outcome (ok / error / cancelled)")
+metrics.describe("llm_endpoint_ejections_total", "Times a backend endpoint was ejected from the pool")
+metrics.describe("llm_hedges_total", "Hedged LLM requests (launched / won)")
+metrics.describe("llm_failovers_total", "LLM retries sent to a different endpoint after an endpoint failure")
+
+
+def parse_endpoints(spec: str, default_model: str = LLM_MODEL_NAME) -> List[Tuple[str, str]]:
+    """解析 LLM_ENDPOINTS：逗號分隔的 base_url，可用 base_url|model 指定該端點的模型名稱"""
+    endpoints = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        base_url, _, model = item.partition("|")
+        endpoints.append((base_url.strip(), model.strip() or default_model))
+    return endpoints
+
+
+def is_endpoint_failure(error: BaseException) -> bool:
+    """連線錯誤、逾時、5xx 與 429 視為端點故障；其餘 4xx 為請求本身的問題，不影響端點健康狀態"""
+    if isinstance(error, APIStatusError):
+        return error.status_code >= 500 or error.status_code == 429
+    return isinstance(error, (APIConnectionError, httpx.HTTPError, asyncio.TimeoutError, OSError))
+
+
+@dataclass
+class EndpointStats:
+    requests: int = 0
+    failures: int = 0
+    ejections: int = 0
+    hedges_won: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class Endpoint:
+    """
+    單一後端副本：各自的 AsyncOpenAI（共用同一個 httpx 連線池）、進行中請求數與健康狀態。
+    SDK 內部不重試（max_retries=0）：重試由 OpenAIClient 統一處理並換到其他副本，每次失敗都計入健康狀態。
+    """
+
+    def __init__(
+        self, base_url: str, model_name: str, api_key: str, http_client: httpx.AsyncClient, max_retries: int = 0
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.model_name = model_name
+        self.api_key = api_key
+        self.http_client = http_client
+        self.client = AsyncOpenAI(
+            base_url=self.base_url, api_key=api_key, http_client=http_client, max_retries=max_retries
+        )
+        self.outstanding = 0
+        # healthy：主動健康檢查的結果；ejected_until：被動偵測連續失敗後的剔除期限
+        self.healthy = True
+        self.ejected_until = 0.0
+        self.consecutive_failures = 0
+        self.consecutive_ejections = 0
+        self.stats = EndpointStats()
+
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.ejected_until
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "model": self.model_name,
+            "outstanding": self.outstanding,
+            "healthy": self.healthy,
+            "ejected_for_s": round(max(0.0, self.ejected_until - time.monotonic()), 2),
+            **self.stats.as_dict(),
+        }
+
+
+class EndpointPool:
+    """
+    用戶端負載平衡：
+    - 路由：可用端點中進行中請求數最少者（相同時輪流），全部不可用時仍送往最早恢復的端點
+    - 被動健康檢查：連續 eject_failures 次故障即剔除 eject_seconds 秒，連續剔除時加倍（上限 eject_max_seconds）
+    - 主動健康檢查：每 health_interval 秒 GET {base_url}/models，失敗的端點在恢復前不參與路由
+    - hedge：同一種呼叫（latency_key）的延遲超過其 p95 仍未完成時，送一份相同請求到另一個端點，取先完成者；
+      hedge 數量不超過總請求數的 hedge_max_ratio
+    """
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        eject_failures: int = LLM_EJECT_FAILURES,
+        eject_seconds: float = LLM_EJECT_SECONDS,
+        eject_max_seconds: float = LLM_EJECT_MAX_SECONDS,
+        health_interval: float = LLM_HEALTH_INTERVAL,
+        health_timeout: float = LLM_HEALTH_TIMEOUT,
+        hedge: bool = LLM_HEDGE_ENABLED,
+        hedge_quantile: float = LLM_HEDGE_QUANTILE,
+        hedge_min_delay: float = LLM_HEDGE_MIN_DELAY,
+        hedge_max_ratio: float = LLM_HEDGE_MAX_RATIO,
+    ):
+        if not endpoints:
+            raise ValueError("EndpointPool 至少需要一個端點")
+        self.endpoints = endpoints
+        self.eject_failures = eject_failures
+        self.eject_seconds = eject_seconds
+        self.eject_max_seconds = eject_max_seconds
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_ratio = hedge_max_ratio
+        self.requests = 0
+        self.hedges = 0
+        self.failovers = 0
+        self._next = 0
+        self._latencies: "OrderedDict[Hashable, Deque[float]]" = OrderedDict()
+        self._health_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_urls(
+        cls, endpoints: List[Tuple[str, str]], http_client: httpx.AsyncClient, api_key: str = LLM_API_KEY, **kwargs: Any
+    ) -> "EndpointPool":
+        return cls([Endpoint(url, model, api_key, http_client) for url, model in endpoints], **kwargs)
+
+    # ------------------ 路由 ------------------
+
+    def pick(self, exclude: Optional[Endpoint] = None, fallback: bool = True) -> Optional[Endpoint]:
+        """
+        回傳進行中請求最少的可用端點。
+        沒有可用端點時：fallback=True 回傳最早恢復的端點（仍嘗試送出，不直接失敗），否則回傳 None。
+        """
+        self._ensure_health_checks()
+        now = time.monotonic()
+        n = len(self.endpoints)
+        best = None
+        for i in range(n):
+            endpoint = self.endpoints[(self._next + i) % n]
+            if endpoint is exclude or not endpoint.available(now):
+                continue
+            if best is None or endpoint.outstanding < best.outstanding:
+                best = endpoint
+        self._next = (self._next + 1) % n
+        if best is None and fallback:
+            candidates = [e for e in self.endpoints if e is not exclude]
+            if candidates:
+                best = min(candidates, key=lambda e: (not e.healthy, e.ejected_until, e.outstanding))
+        return best
+
+    def begin(self, endpoint: Endpoint) -> None:
+        endpoint.outstanding += 1
+        endpoint.stats.requests += 1
+        self.requests += 1
+
+    def end(
+        self,
+        endpoint: Endpoint,
+        latency: Optional[float] = None,
+        latency_key: Optional[Hashable] = None,
+        error: Optional[BaseException] = None,
+        cancelled: bool = False,
+    ) -> None:
+        """請求結束：成功時記錄延遲（供 hedge 延遲計算），端點故障時累計失敗並視情況剔除"""
+        endpoint.outstanding -= 1
+        if cancelled:
+            outcome = "cancelled"
+        elif error is not None:
+            outcome = "error"
+            endpoint.stats.failures += 1
+            if is_endpoint_failure(error):
+                endpoint.consecutive_failures += 1
+                if endpoint.consecutive_failures >= self.eject_failures:
+                    self._eject(endpoint)
+        else:
+            outcome = "ok"
+            endpoint.consecutive_failures = 0
+            endpoint.consecutive_ejections = 0
+            if latency is not None and latency_key is not None:
+                self._record_latency(latency_key, latency)
+        metrics.inc("llm_endpoint_requests_total", endpoint=endpoint.base_url, outcome=outcome)
+
+    def _eject(self, endpoint: Endpoint) -> None:
+        duration = min(self.eject_max_seconds, self.eject_seconds * (2 ** endpoint.consecutive_ejections))
+        endpoint.ejected_until = time.monotonic() + duration
+        endpoint.consecutive_ejections += 1
+        endpoint.consecutive_failures = 0
+        endpoint.stats.ejections += 1
+        metrics.inc("llm_endpoint_ejections_total", endpoint=endpoint.base_url)
+
+    def record_failover(self) -> None:
+        self.failovers += 1
+        metrics.inc("llm_failovers_total")
+
+    # ------------------ hedge ------------------
+
+    def _record_latency(self, key: Hashable, latency: float) -> None:
+        window = self._latencies.get(key)
+        if window is None:
+            window = self._latencies[key] = deque(maxlen=LATENCY_WINDOW)
+            if len(self._latencies) > LATENCY_KEYS:
+                self._latencies.popitem(last=False)
+        else:
+            self._latencies.move_to_end(key)
+        window.append(latency)
+
+    def hedge_delay(self, latency_key: Hashable) -> Optional[float]:
+        """回傳送出 hedge 前的等待秒數；不應 hedge（未啟用、端點不足、樣本不足或超過比例上限）時回傳 None"""
+        if not self.hedge or len(self.endpoints) < 2:
+            return None
+        if self.hedges >= self.hedge_max_ratio * self.requests:
+            return None
+        window = self._latencies.get(latency_key)
+        if window is None or len(window) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(window)
+        return max(self.hedge_min_delay, ordered[min(len(ordered) - 1, int(self.hedge_quantile * len(ordered)))])
+
+    def record_hedge(self, won: Optional[Endpoint] = None) -> None:
+        """launched 時 won 為 None；hedge 先完成時傳入其端點"""
+        if won is None:
+            self.hedges += 1
+            metrics.inc("llm_hedges_total", outcome="launched")
+        else:
+            won.stats.hedges_won += 1
+            metrics.inc("llm_hedges_total", outcome="won")
+
+    # ------------------ 主動健康檢查 ------------------
+
+    def _ensure_health_checks(self) -> None:
+        """第一次路由時於目前的 event loop 啟動背景檢查（只有一個端點時不需要）"""
+        if self._health_task is not None or self.health_interval <= 0 or len(self.endpoints) < 2:
+            return
+        self._health_task = asyncio.get_running_loop().create_task(self._health_loop())
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await asyncio.gather(*(self.check(e) for e in self.endpoints))
+
+    async def check(self, endpoint: Endpoint) -> bool:
+        """GET {base_url}/models；2xx 視為健康"""
+        try:
+            resp = await endpoint.http_client.get(
+                f"{endpoint.base_url}/models",
+                headers={"Authorization": f"Bearer {endpoint.api_key}"},
+                timeout=self.health_timeout,
+            )
+            endpoint.healthy = resp.status_code < 300
+        except Exception:
+            endpoint.healthy = False
+        return endpoint.healthy
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "failovers": self.failovers,
+            "endpoints": [e.as_dict() for e in self.endpoints],
+        }
+
+    async def aclose(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
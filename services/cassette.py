@@ -0,0 +1,218 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from openai.types.chat import ChatCompletion
+
+from config import LLM_CASSETTE_MODE, LLM_CASSETTE_PATH, LLM_CASSETTE_FLUSH_INTERVAL
+from .resilience import LLMError
+
+CASSETTE_RECORD = "record"
+CASSETTE_REPLAY = "replay"
+CASSETTE_REPLAY_TIMED = "replay_timed"
+CASSETTE_MODES = (CASSETTE_RECORD, CASSETTE_REPLAY, CASSETTE_REPLAY_TIMED)
+
+
+class CassetteMissError(LLMError):
+    """重播時卡帶中沒有這個請求指紋的紀錄"""
+    error_type = "llm_cassette_miss"
+
+
+@dataclass
+class CassetteStats:
+    recorded: int = 0
+    replayed: int = 0
+    misses: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+@dataclass
+class RecordedStream:
+    """錄製的串流回應：片段、用量與耗時（秒）"""
+    chunks: List[str]
+    usage: Dict[str, int]
+    ttft: float
+    total: float
+
+
+class Cassette:
+    """
+    LLM 呼叫的錄製與重播，卡帶為 append-only JSONL，每行一次成功的呼叫：
+      非串流 {"k": 指紋, "ms": 耗時, "r": ChatCompletion（省略 null 欄位）}
+      串流   {"k": 指紋, "ms": 耗時, "ttft": 首段耗時, "c": [片段...], "u": usage}
+    耗時為取得連線名額後到回應完成（不含排隊）。
+
+    - record：正常呼叫後端，成功的回應追加寫入卡帶
+    - replay：不連線，依指紋回傳錄製的回應；同一指紋有多筆時依錄製順序輪流
+    - replay_timed：同 replay，並依錄製的耗時等待（串流時首段與其餘片段分別等待）
+
+    錄製的紀錄先放進記憶體佇列，由背景 task 每 flush_interval 秒在 thread 中序列化並批次追加寫檔，不阻塞 event loop；
+    寫檔固定由同一個 thread 依序執行，紀錄順序與錄製順序一致（重播時同一指紋依此順序輪流）。
+    """
+
+    def __init__(self, path: str, mode: str, flush_interval: float = LLM_CASSETTE_FLUSH_INTERVAL):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"未知的 cassette mode: {mode}（應為 {'/'.join(CASSETTE_MODES)}）")
+        self.path = path
+        self.mode = mode
+        self.stats = CassetteStats()
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursor: Dict[str, int] = defaultdict(int)
+        self.flush_interval = flush_interval
+        self._pending: List[Dict[str, Any]] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cassette")
+        if self.replaying:
+            self._load()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode != CASSETTE_RECORD
+
+    @staticmethod
+    def fingerprint(model: str, temperature: float, request: Dict[str, Any]) -> str:
+        """請求指紋：模型、temperature 與請求參數（messages、response_format、logprobs、stream 等）；不含逾時"""
+        payload = json.dumps([model, temperature, request], ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+    # ------------------ 重播 ------------------
+
+    def _load(self) -> None:
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 錄製中斷時最後一行可能不完整
+                    continue
+                self._entries.setdefault(entry["k"], []).append(entry)
+
+    def _next(self, key: str) -> Dict[str, Any]:
+        entries = self._entries.get(key)
+        if not entries:
+            self.stats.misses += 1
+            raise CassetteMissError(f"no recorded response for request {key} in {self.path}")
+        index = self._cursor[key]
+        self._cursor[key] = index + 1
+        self.stats.replayed += 1
+        return entries[index % len(entries)]
+
+    async def replay(self, key: str) -> ChatCompletion:
+        entry = self._next(key)
+        if self.mode == CASSETTE_REPLAY_TIMED:
+            await asyncio.sleep(entry["ms"] / 1000)
+        return ChatCompletion.model_validate(entry["r"])
+
+    def stream(self, key: str) -> RecordedStream:
+        entry = self._next(key)
+        return RecordedStream(entry["c"], entry.get("u") or {}, entry.get("ttft", 0.0) / 1000, entry["ms"] / 1000)
+
+    async def play(self, recorded: RecordedStream) -> AsyncIterator[str]:
+        """逐段 yield 錄製的串流片段；replay_timed 時首段前等待 ttft，其餘時間平均分配到之後的片段"""
+        timed = self.mode == CASSETTE_REPLAY_TIMED
+        gap = (recorded.total - recorded.ttft) / max(1, len(recorded.chunks) - 1)
+        for i, chunk in enumerate(recorded.chunks):
+            if timed:
+                await asyncio.sleep(recorded.ttft if i == 0 else gap)
+            yield chunk
+
+    # ------------------ 錄製 ------------------
+
+    def record(self, key: str, latency: float, response: ChatCompletion) -> None:
+        self._append({"k": key, "ms": round(latency * 1000, 2), "r": response.model_dump(mode="json", exclude_none=True)})
+
+    def record_stream(
+        self, key: str, latency: float, ttft: float, chunks: List[str], usage: Optional[Dict[str, int]]
+    ) -> None:
+        self._append({
+            "k": key, "ms": round(latency * 1000, 2), "ttft": round(ttft * 1000, 2), "c": chunks, "u": usage or {},
+        })
+
+    def _append(self, entry: Dict[str, Any]) -> None:
+        self._pending.append(entry)
+        self.stats.recorded += 1
+        self._ensure_flusher()
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        await asyncio.get_running_loop().run_in_executor(self._writer, self._write_batch, batch)
+
+    async def aclose(self) -> None:
+        """
+        停止背景 task 並寫出尚未寫入的紀錄；之後再錄製時會重新啟動背景 task
+        （共用卡帶被其中一個 client 關閉也不影響其他 client）。
+        """
+        flusher, self._flusher = self._flusher, None
+        if flusher is not None and flusher.get_loop() is asyncio.get_running_loop():
+            flusher.cancel()
+            try:
+                await flusher
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    def close(self) -> None:
+        """同步版 aclose()（沒有 event loop 時使用）"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        batch, self._pending = self._pending, []
+        self._writer.submit(self._write_batch, batch).result()
+
+    def _ensure_flusher(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 沒有 event loop（同步情境）時直接寫入
+            self.close()
+            return
+        if self._flusher is not None and not self._flusher.done() and self._flusher.get_loop() is loop:
+            return
+        self._flusher = loop.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except OSError:
+                pass
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        if not batch:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = "".join(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n" for entry in batch)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(data)
+
+
+# 同一路徑在 process 內只有一個卡帶：多個 client（例如 cascade 的大小模型）共用同一個寫入 handle 與重播游標
+_cassettes: Dict[str, Cassette] = {}
+
+
+def build_cassette(path: str = LLM_CASSETTE_PATH, mode: str = LLM_CASSETTE_MODE) -> Optional[Cassette]:
+    """回傳 path 的共用卡帶（第一次使用時建立）；mode 為空時回傳 None，同一路徑以不同 mode 使用時丟出 ValueError"""
+    if not mode:
+        return None
+    key = os.path.abspath(path)
+    cassette = _cassettes.get(key)
+    if cassette is None:
+        cassette = _cassettes[key] = Cassette(path, mode)
+    elif cassette.mode != mode:
+        raise ValueError(f"卡帶 {path} 已以 {cassette.mode} 模式使用，不能再以 {mode} 模式開啟")
+    return cassette
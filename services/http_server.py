@@ -0,0 +1,233 @@
+import asyncio
+import json
+import logging
+import socket
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Set, Union
+from urllib.parse import parse_qsl, urlsplit
+
+_REASONS = {
+    200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 429: "Too Many Requests", 500: "Internal Server Error",
+    503: "Service Unavailable", 504: "Gateway Timeout",
+}
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 8 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    query: Dict[str, str]
+    headers: Dict[str, str]
+    body: bytes = b""
+    remote_addr: Optional[str] = None
+
+    def json(self):
+        return json.loads(self.body or b"null")
+
+
+@dataclass
+class Response:
+    status: int = 200
+    body: bytes = b""
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class StreamResponse:
+    """以 chunked transfer encoding 逐段送出的回應（SSE / NDJSON）"""
+    chunks: AsyncIterator[bytes]
+    status: int = 200
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+Handler = Callable[[Request], Awaitable[Union[Response, StreamResponse]]]
+
+
+def json_response(data, status: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    return Response(status, body, {"Content-Type": "application/json; charset=utf-8", **(headers or {})})
+
+
+class HTTPServer:
+    """
+    以 asyncio streams 實作的精簡 HTTP/1.1 server（支援 keep-alive 與 chunked 串流回應）。
+    供本地 stub 與服務入口使用，不依賴額外套件。
+    請求 body 只接受 Content-Length（不支援 chunked 上傳）；格式錯誤回傳 400，超過 max_body_bytes 回傳 413。
+    串流回應送出標頭後 handler 才失敗時，記錄錯誤並直接中斷連線（不送出 chunked 結尾）。
+    """
+
+    def __init__(
+        self,
+        handler: Handler,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        reuse_port: bool = False,
+        max_body_bytes: int = MAX_BODY_BYTES,
+    ):
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.reuse_port = reuse_port
+        self.max_body_bytes = max_body_bytes
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._connections: Set[asyncio.Task] = set()
+        self._busy: Set[asyncio.Task] = set()
+        self._closing = False
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> "HTTPServer":
+        sock = None
+        if self.reuse_port:
+            # 多個 worker process 綁定同一個 port，由 kernel 分配連線
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind((self.host, self.port))
+            self._server = await asyncio.start_server(self._on_connection, sock=sock, backlog=1024)
+        else:
+            self._server = await asyncio.start_server(self._on_connection, self.host, self.port, backlog=1024)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self, grace: float = 10.0) -> None:
+        """停止接受新連線，等待進行中的請求最多 grace 秒後關閉其餘連線。"""
+        self._closing = True
+        if self._server is not None:
+            self._server.close()
+        if self._busy:
+            await asyncio.wait(set(self._busy), timeout=grace)
+        for task in list(self._connections):
+            task.cancel()
+        if self._connections:
+            await asyncio.gather(*self._connections, return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    async def _on_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._connections.add(task)
+        peer = writer.get_extra_info("peername")
+        try:
+            while not self._closing:
+                request = await self._read_request(reader, peer[0] if peer else None)
+                if request is None:
+                    break
+                self._busy.add(task)
+                try:
+                    try:
+                        response = await self.handler(request)
+                    except Exception as e:
+                        response = json_response({"error": {"message": f"{type(e).__name__}: {e}"}}, 500)
+                    keep_alive = request.headers.get("connection", "").lower() != "close" and not self._closing
+                    await self._write_response(writer, response, keep_alive)
+                finally:
+                    self._busy.discard(task)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError, _StreamAborted):
+            pass
+        except _BadRequest as e:
+            try:
+                await self._write_response(writer, json_response({"error": {"message": str(e)}}, e.status), False)
+            except ConnectionError:
+                pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _read_request(self, reader: asyncio.StreamReader, remote_addr: Optional[str]) -> Optional[Request]:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError:
+            raise _BadRequest(413, "header too large")
+        if len(head) > MAX_HEADER_BYTES:
+            raise _BadRequest(413, "header too large")
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            raise _BadRequest(400, "malformed request line")
+        headers: Dict[str, str] = {}
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, _, value = line.partition(":")
+            name, value = name.strip().lower(), value.strip()
+            # 重複且不一致的 Content-Length 無法判斷 body 邊界
+            if name == "content-length" and headers.get(name, value) != value:
+                raise _BadRequest(400, "conflicting content-length")
+            headers[name] = value
+        if "transfer-encoding" in headers:
+            raise _BadRequest(400, "transfer-encoding request bodies are not supported")
+        length = self._content_length(headers)
+        body = await reader.readexactly(length) if length else b""
+        url = urlsplit(target)
+        return Request(method.upper(), url.path, dict(parse_qsl(url.query)), headers, body, remote_addr)
+
+    def _content_length(self, headers: Dict[str, str]) -> int:
+        value = headers.get("content-length")
+        if value is None:
+            return 0
+        # 只接受十進位數字（int() 會接受正負號、底線與空白）
+        if not (value.isascii() and value.isdigit()):
+            raise _BadRequest(400, "malformed content-length")
+        length = int(value)
+        if length > self.max_body_bytes:
+            raise _BadRequest(413, "body too large")
+        return length
+
+    async def _write_response(
+        self, writer: asyncio.StreamWriter, response: Union[Response, StreamResponse], keep_alive: bool
+    ) -> None:
+        headers = dict(response.headers)
+        headers["Connection"] = "keep-alive" if keep_alive else "close"
+        streaming = isinstance(response, StreamResponse)
+        if streaming:
+            headers["Transfer-Encoding"] = "chunked"
+        else:
+            headers["Content-Length"] = str(len(response.body))
+        status_line = f"HTTP/1.1 {response.status} {_REASONS.get(response.status, 'Unknown')}\r\n"
+        head = status_line + "".join(f"{k}: {v}\r\n" for k, v in headers.items()) + "\r\n"
+        writer.write(head.encode("latin-1"))
+        if not streaming:
+            writer.write(response.body)
+            await writer.drain()
+            return
+        try:
+            async for chunk in response.chunks:
+                if chunk:
+                    writer.write(f"{len(chunk):X}\r\n".encode("ascii") + chunk + b"\r\n")
+                    await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            raise
+        except Exception:
+            # 標頭已送出，無法改回 500：中斷連線且不送出結尾的 0 chunk，client 才能判斷回應不完整
+            logger.exception("stream response failed; aborting connection")
+            writer.transport.abort()
+            raise _StreamAborted() from None
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+class _BadRequest(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class _StreamAborted(Exception):
+    """串流回應中途失敗，連線已中斷"""
@@ -0,0 +1,344 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Iterable, Optional, Protocol, Tuple
+
+from config import (
+    LLM_CACHE_ENABLED, LLM_CACHE_MAX_BYTES, LLM_CACHE_TTL, LLM_CACHE_SQLITE_PATH,
+    LLM_CACHE_SQLITE_MAX_ROWS, LLM_CACHE_SQLITE_PRUNE_INTERVAL,
+)
+from .metrics import metrics
+
+metrics.describe("llm_cache_lookups_total", "LLM response cache lookups by tier and outcome (hit / miss)")
+metrics.describe("llm_cache_evictions_total", "LLM response cache entries removed by tier and reason (capacity / expired)")
+
+
+@dataclass
+class CacheStats:
+    """快取命中統計（hit / miss / eviction）。"""
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+    def hit(self, tier: str) -> None:
+        self.hits += 1
+        metrics.inc("llm_cache_lookups_total", tier=tier, outcome="hit")
+
+    def miss(self, tier: str) -> None:
+        self.misses += 1
+        metrics.inc("llm_cache_lookups_total", tier=tier, outcome="miss")
+
+    def evict(self, tier: str, count: int = 1) -> None:
+        if count:
+            self.evictions += count
+            metrics.inc("llm_cache_evictions_total", count, tier=tier, reason="capacity")
+
+    def expire(self, tier: str, count: int = 1) -> None:
+        if count:
+            self.expirations += count
+            metrics.inc("llm_cache_evictions_total", count, tier=tier, reason="expired")
+
+
+class CacheBackend(Protocol):
+    """快取層介面：任何提供 get / set / set_many / clear 的物件都可以作為一層快取。"""
+    stats: CacheStats
+
+    def get(self, key: str) -> Optional[str]: ...
+
+    def set(self, key: str, value: str) -> None: ...
+
+    def set_many(self, items: Iterable[Tuple[str, str]]) -> None: ...
+
+    def clear(self) -> None: ...
+
+
+class MemoryLRUCache:
+    """
+    記憶體 LRU 快取：以位元組數限制總容量，並支援 TTL。
+    value 僅為 LLM 回覆字串，容量以 key + value 的 UTF-8 長度估算。
+    """
+
+    def __init__(self, max_bytes: int = LLM_CACHE_MAX_BYTES, ttl: Optional[float] = LLM_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self.stats = CacheStats()
+        self._data: "OrderedDict[str, Tuple[str, Optional[float], int]]" = OrderedDict()
+        self._size = 0
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.stats.miss("memory")
+            return None
+        value, expires_at, size = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            self._size -= size
+            self.stats.expire("memory")
+            self.stats.miss("memory")
+            return None
+        self._data.move_to_end(key)
+        self.stats.hit("memory")
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        size = len(key.encode("utf-8")) + len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        old = self._data.pop(key, None)
+        if old is not None:
+            self._size -= old[2]
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        self._data[key] = (value, expires_at, size)
+        self._size += size
+        while self._size > self.max_bytes and self._data:
+            _, (_, _, evicted_size) = self._data.popitem(last=False)
+            self._size -= evicted_size
+            self.stats.evict("memory")
+
+    def set_many(self, items: Iterable[Tuple[str, str]]) -> None:
+        for key, value in items:
+            self.set(key, value)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._size = 0
+
+
+class SQLiteCache:
+    """
+    SQLite 持久化快取：重啟後仍可命中。
+    每筆查詢皆為主鍵查找；過期資料於讀取時刪除，並每 prune_interval 秒（於寫入時）批次清除，
+    同時刪除超過 max_rows 的最早寫入資料（max_rows <= 0 表示不限筆數）。
+    所有方法皆為同步的 sqlite3 呼叫，在 event loop 中應透過 LLMResponseCache 使用（於 thread 中執行）。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: Optional[float] = LLM_CACHE_TTL,
+        max_rows: int = LLM_CACHE_SQLITE_MAX_ROWS,
+        prune_interval: float = LLM_CACHE_SQLITE_PRUNE_INTERVAL,
+    ):
+        self.path = path
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self.max_rows = max_rows
+        self.prune_interval = prune_interval
+        self.stats = CacheStats()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # 第一次寫入時即清除一次（前一次執行留下的過期 / 超量資料）
+        self._last_prune = float("-inf")
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats.miss("sqlite")
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= time.time():
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.stats.expire("sqlite")
+                self.stats.miss("sqlite")
+                return None
+            self.stats.hit("sqlite")
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        self.set_many([(key, value)])
+
+    def set_many(self, items: Iterable[Tuple[str, str]]) -> None:
+        """在同一個 transaction 內寫入多筆；距上次清除超過 prune_interval 秒時順便執行 prune()"""
+        expires_at = time.time() + self.ttl if self.ttl else None
+        rows = [(key, value, expires_at) for key, value in items]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                # INSERT OR REPLACE 會給覆寫的資料新的 rowid，rowid 順序即為寫入順序
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)", rows,
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            due = time.monotonic() - self._last_prune >= self.prune_interval
+        if due:
+            self.prune()
+
+    def prune(self) -> int:
+        """刪除所有已過期的資料，再刪除超過 max_rows 的最早寫入資料；回傳刪除筆數。"""
+        with self._lock:
+            self._last_prune = time.monotonic()
+            expired = self._conn.execute(
+                "DELETE FROM llm_cache WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (time.time(),),
+            ).rowcount
+            overflow = 0
+            if self.max_rows > 0:
+                count = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+                if count > self.max_rows:
+                    overflow = self._conn.execute(
+                        "DELETE FROM llm_cache WHERE rowid IN"
+                        " (SELECT rowid FROM llm_cache ORDER BY rowid LIMIT ?)",
+                        (count - self.max_rows,),
+                    ).rowcount
+            self.stats.expire("sqlite", expired)
+            self.stats.evict("sqlite", overflow)
+            return expired + overflow
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class LLMResponseCache:
+    """
+    LLM 回覆快取：記憶體 LRU 為第一層，可選擇再掛一層持久化快取。
+    第二層命中時會回填第一層。
+    在 event loop 中以 aget() 讀取：第二層的查詢在 thread 中執行；
+    set() 只同步寫入第一層，第二層的寫入放進佇列，由背景 task 在 thread 中批次寫出，不阻塞 event loop。
+    """
+
+    def __init__(self, memory: Optional[CacheBackend] = None, persistent: Optional[CacheBackend] = None):
+        self.memory = memory if memory is not None else MemoryLRUCache()
+        self.persistent = persistent
+        # 尚未寫入第二層的資料（key → value），同一個 key 只保留最後一次寫入
+        self._pending: Dict[str, str] = {}
+        self._writer: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, user_prompt: str, temperature: float, *extra: Any) -> str:
+        """extra 用於區分同一組提示詞的不同解碼參數（例如 logprobs 模式）"""
+        payload = json.dumps(
+            [model, system_prompt, user_prompt, temperature, *extra], ensure_ascii=False, separators=(",", ":")
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """同步版 aget()（沒有 event loop 時使用）"""
+        value = self.memory.get(key)
+        if value is not None or self.persistent is None:
+            return value
+        value = self._pending.get(key)
+        if value is None:
+            value = self.persistent.get(key)
+        if value is not None:
+            self.memory.set(key, value)
+        return value
+
+    async def aget(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is not None or self.persistent is None:
+            return value
+        value = self._pending.get(key)
+        if value is None:
+            value = await asyncio.to_thread(self.persistent.get, key)
+        if value is not None:
+            self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            self._pending[key] = value
+            self._ensure_writer()
+
+    def clear(self) -> None:
+        self.memory.clear()
+        self._pending.clear()
+        if self.persistent is not None:
+            self.persistent.clear()
+
+    def close(self) -> None:
+        """同步寫出佇列中的資料並關閉第二層；之後僅使用記憶體層"""
+        if self.persistent is None:
+            return
+        self._write_pending()
+        close = getattr(self.persistent, "close", None)
+        if close is not None:
+            close()
+        self.persistent = None
+
+    async def aclose(self) -> None:
+        """等待背景寫入完成後在 thread 中執行 close()"""
+        writer, self._writer = self._writer, None
+        if writer is not None and writer.get_loop() is asyncio.get_running_loop():
+            await writer
+        await asyncio.to_thread(self.close)
+
+    def _ensure_writer(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 沒有 event loop（同步情境）時直接寫入
+            self._write_pending()
+            return
+        if self._writer is not None and not self._writer.done() and self._writer.get_loop() is loop:
+            return
+        self._writer = loop.create_task(self._write_loop())
+
+    async def _write_loop(self) -> None:
+        # 寫入期間新進的資料累積到下一批，負載高時自然合併成較大的 transaction
+        while self._pending and self.persistent is not None:
+            batch, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self.persistent.set_many, list(batch.items()))
+            except (OSError, sqlite3.Error):
+                pass
+
+    def _write_pending(self) -> None:
+        batch, self._pending = self._pending, {}
+        if batch and self.persistent is not None:
+            self.persistent.set_many(list(batch.items()))
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        out = {"memory": self.memory.stats.as_dict()}
+        if self.persistent is not None:
+            out["persistent"] = self.persistent.stats.as_dict()
+        return out
+
+
+def build_response_cache() -> Optional[LLMResponseCache]:
+    """依 config 建立預設快取；LLM_CACHE_ENABLED 為 false 時回傳 None。"""
+    if not LLM_CACHE_ENABLED:
+        return None
+    persistent = SQLiteCache(LLM_CACHE_SQLITE_PATH) if LLM_CACHE_SQLITE_PATH else None
+    return LLMResponseCache(MemoryLRUCache(), persistent)
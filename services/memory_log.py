@@ -0,0 +1,154 @@
+import asyncio
+import os
+from collections import deque
+from typing import Deque, List, Optional
+
+from config import (
+    MEMORY_LOG_RECENT, MEMORY_LOG_FLUSH_BYTES, MEMORY_LOG_FLUSH_INTERVAL,
+    MEMORY_LOG_MAX_BYTES, MEMORY_LOG_BACKUP_COUNT,
+)
+
+_TAIL_BLOCK = 8192
+
+
+def tail_file(path: str, n: int, encoding: str = "utf-8") -> List[str]:
+    """從檔尾往前按區塊讀取最後 n 行，成本只與讀取的行數有關，與檔案大小無關。"""
+    if n <= 0:
+        return []
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        # 需要 n 行內容，因此要找到 n+1 個換行（最後一行可能沒有換行）
+        while pos > 0 and data.count(b"\n") <= n:
+            step = min(_TAIL_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.decode(encoding, errors="replace").splitlines(keepends=True)
+    return lines[-n:]
+
+
+class MemoryLogWriter:
+    """
+    記憶日誌的非同步批次寫入器。
+    - write() 只把資料放進記憶體，由背景 task 依位元組數或時間批次寫檔
+    - 最近的紀錄保留在固定大小的 ring buffer，tail() 不需讀檔
+    - 檔案超過 max_bytes 時輪替（path.1、path.2 …）
+    """
+
+    def __init__(
+        self,
+        path: str,
+        recent: int = MEMORY_LOG_RECENT,
+        flush_bytes: int = MEMORY_LOG_FLUSH_BYTES,
+        flush_interval: float = MEMORY_LOG_FLUSH_INTERVAL,
+        max_bytes: int = MEMORY_LOG_MAX_BYTES,
+        backup_count: int = MEMORY_LOG_BACKUP_COUNT,
+    ):
+        self.path = path
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._recent: Deque[str] = deque(maxlen=max(1, recent))
+        self._pending: List[str] = []
+        self._pending_bytes = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._closed = False
+        # 啟動時以檔尾內容預先填入 ring buffer
+        if os.path.exists(path):
+            try:
+                self._recent.extend(tail_file(path, self._recent.maxlen))
+            except OSError:
+                pass
+
+    # ------------------ 讀取 ------------------
+
+    def tail(self, n: int = 10) -> List[str]:
+        """最近 n 行；超過 ring buffer 容量時才從檔尾讀取（未寫入的資料一併附上）"""
+        if n <= len(self._recent) or len(self._recent) < self._recent.maxlen:
+            return list(self._recent)[-n:]
+        lines = tail_file(self.path, n) if os.path.exists(self.path) else []
+        return (lines + self._pending)[-n:]
+
+    # ------------------ 寫入 ------------------
+
+    def write(self, line: str) -> None:
+        if self._closed:
+            return
+        if not line.endswith("\n"):
+            line += "\n"
+        self._recent.append(line)
+        self._pending.append(line)
+        self._pending_bytes += len(line.encode("utf-8"))
+        self._ensure_flusher()
+        if self._pending_bytes >= self.flush_bytes and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        batch, self._pending, self._pending_bytes = self._pending, [], 0
+        await asyncio.to_thread(self._write_batch, "".join(batch))
+
+    async def aclose(self) -> None:
+        self._closed = True
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is not None and not self._flusher.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 沒有 event loop（同步情境）時直接寫入
+            batch, self._pending, self._pending_bytes = self._pending, [], 0
+            self._write_batch("".join(batch))
+            return
+        self._wakeup = asyncio.Event()
+        self._flusher = loop.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except OSError:
+                pass
+
+    def _write_batch(self, data: str) -> None:
+        if not data:
+            return
+        encoded = data.encode("utf-8")
+        if self.max_bytes > 0 and os.path.exists(self.path):
+            if os.path.getsize(self.path) + len(encoded) > self.max_bytes:
+                self._rotate()
+        with open(self.path, "ab") as f:
+            f.write(encoded)
+
+    def _rotate(self) -> None:
+        if self.backup_count <= 0:
+            os.remove(self.path)
+            return
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
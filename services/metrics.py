@@ -0,0 +1,364 @@
+import asyncio
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict, field
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from config import METRICS_TRACE_PATH, METRICS_TRACE_FLUSH_INTERVAL, METRICS_TRACE_MAX_PENDING
+
+# 預設 histogram 分桶（秒），涵蓋本地規則（<1ms）到 LLM 長輸出（數十秒）
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    process 內的 counter / gauge / histogram 彙總，輸出 Prometheus text format。
+    metric 於第一次使用時自動建立；help 文字可事先以 describe() 設定。
+    """
+
+    def __init__(self, namespace: str = "sqlrag"):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._help: Dict[str, str] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+
+    def describe(self, name: str, help_text: str, buckets: Optional[Tuple[float, ...]] = None) -> None:
+        self._help[name] = help_text
+        if buckets is not None:
+            self._buckets[name] = buckets
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels: Any) -> None:
+        """設定 gauge 目前的值（例如佇列長度）"""
+        key = _label_key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = _Histogram(self._buckets.get(name, DEFAULT_BUCKETS))
+            hist.observe(value)
+
+    def counter_value(self, name: str, **labels: Any) -> float:
+        return self._counters.get(name, {}).get(_label_key(labels), 0.0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def render_prometheus(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                full = f"{self.namespace}_{name}"
+                lines.append(f"# HELP {full} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {full} counter")
+                for key, value in series.items():
+                    lines.append(f"{full}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self._gauges.items()):
+                full = f"{self.namespace}_{name}"
+                lines.append(f"# HELP {full} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {full} gauge")
+                for key, value in series.items():
+                    lines.append(f"{full}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                full = f"{self.namespace}_{name}"
+                lines.append(f"# HELP {full} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {full} histogram")
+                for key, hist in series.items():
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f"{full}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {cumulative}")
+                    lines.append(f"{full}_bucket{_format_labels(key, ('le', '+Inf'))} {hist.count}")
+                    lines.append(f"{full}_sum{_format_labels(key)} {hist.sum:.6f}")
+                    lines.append(f"{full}_count{_format_labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """寫成 node_exporter textfile collector 可讀取的檔案（先寫暫存檔再 rename）"""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp, path)
+
+
+metrics = MetricsRegistry()
+metrics.describe("span_duration_seconds", "Duration of workflow stages and tool calls")
+metrics.describe("llm_queue_seconds", "Time an LLM call waited for a client connection slot")
+metrics.describe("llm_network_seconds", "Time an LLM call spent on the backend round-trip")
+metrics.describe("llm_calls_total", "LLM calls by model and outcome (ok / error / cached / coalesced)")
+metrics.describe("llm_tokens_total", "Prompt / completion tokens by model")
+
+
+# ---------------- LLM token 用量 ----------------
+
+@dataclass
+class LLMUsage:
+    """單一工具呼叫期間累計的 LLM 用量"""
+    calls: int = 0
+    cached_calls: int = 0
+    coalesced_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    queue_ms: float = 0.0
+    network_ms: float = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["queue_ms"] = round(self.queue_ms, 2)
+        data["network_ms"] = round(self.network_ms, 2)
+        return data
+
+
+_usage_var: ContextVar[Optional[LLMUsage]] = ContextVar("llm_usage", default=None)
+
+
+@contextmanager
+def track_usage() -> Iterator[LLMUsage]:
+    """在此範圍內（含其啟動的子 task）發生的 LLM 呼叫會累計到回傳的 LLMUsage"""
+    usage = LLMUsage()
+    token = _usage_var.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage_var.reset(token)
+
+
+def record_llm_call(
+    model: str,
+    queue_s: float,
+    network_s: float,
+    prompt_tokens: int = 0,
+    completion_tokens: int = 0,
+    cached: bool = False,
+    error: Optional[str] = None,
+    coalesced: bool = False,
+) -> None:
+    """cached：由回覆快取提供；coalesced：併入同一時間進行中的相同呼叫（兩者皆未送往後端）"""
+    status = "error" if error else ("cached" if cached else ("coalesced" if coalesced else "ok"))
+    metrics.inc("llm_calls_total", model=model, status=status)
+    if not cached and not coalesced:
+        metrics.observe("llm_queue_seconds", queue_s, model=model)
+        metrics.observe("llm_network_seconds", network_s, model=model)
+    if prompt_tokens:
+        metrics.inc("llm_tokens_total", prompt_tokens, model=model, kind="prompt")
+    if completion_tokens:
+        metrics.inc("llm_tokens_total", completion_tokens, model=model, kind="completion")
+
+    usage = _usage_var.get()
+    if usage is not None:
+        usage.calls += 1
+        usage.cached_calls += int(cached)
+        usage.coalesced_calls += int(coalesced)
+        usage.prompt_tokens += prompt_tokens
+        usage.completion_tokens += completion_tokens
+        usage.queue_ms += queue_s * 1000
+        usage.network_ms += network_s * 1000
+
+    trace = _trace_var.get()
+    if trace is not None:
+        trace.add("llm.call", time.perf_counter() - queue_s - network_s, queue_s + network_s, {
+            "model": model, "status": status,
+            "queue_ms": round(queue_s * 1000, 2), "network_ms": round(network_s * 1000, 2),
+            "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+        })
+
+
+# ---------------- 請求層級 trace ----------------
+
+@dataclass
+class Trace:
+    request_id: str
+    started: float = field(default_factory=time.perf_counter)
+    wall_time: float = field(default_factory=time.time)
+    spans: List[Dict[str, Any]] = field(default_factory=list)
+
+    def add(self, name: str, start: float, duration: float, attrs: Optional[Dict[str, Any]] = None) -> None:
+        self.spans.append({
+            "name": name,
+            "start_ms": round((start - self.started) * 1000, 3),
+            "duration_ms": round(duration * 1000, 3),
+            **({"attrs": attrs} if attrs else {}),
+        })
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"request_id": self.request_id, "ts": self.wall_time, "spans": self.spans}
+
+
+_trace_var: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[None]:
+    """量測一個階段：耗時寫入 span_duration_seconds，並附加到目前的請求 trace"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        metrics.observe("span_duration_seconds", duration, span=name)
+        trace = _trace_var.get()
+        if trace is not None:
+            trace.add(name, start, duration, attrs or None)
+
+
+def trace_event(name: str, **attrs: Any) -> None:
+    """在目前的請求 trace 加上一筆零耗時的事件（例如 shadow 比對的兩邊標籤）"""
+    trace = _trace_var.get()
+    if trace is not None:
+        trace.add(name, time.perf_counter(), 0.0, attrs or None)
+
+
+class JsonlTraceSink:
+    """
+    每個請求的 trace 以一行 JSON 追加寫入檔案。
+    - write() 只把 trace 放進記憶體佇列，由背景 task 每 flush_interval 秒在 thread 中序列化並批次寫檔，不阻塞 event loop
+    - 佇列最多保留 max_pending 筆，寫檔跟不上時丟棄最舊的 trace（計入 dropped）
+    """
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = METRICS_TRACE_FLUSH_INTERVAL,
+        max_pending: int = METRICS_TRACE_MAX_PENDING,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._pending: Deque[Dict[str, Any]] = deque(maxlen=max(1, max_pending))
+        self._flusher: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def write(self, trace: Trace) -> None:
+        if len(self._pending) == self._pending.maxlen:
+            self.dropped += 1
+        self._pending.append(trace.as_dict())
+        self._ensure_flusher()
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        batch = list(self._pending)
+        self._pending.clear()
+        await asyncio.to_thread(self._write_batch, batch)
+
+    async def aclose(self) -> None:
+        """停止背景 task 並寫出佇列中的 trace；之後的 write() 會重新啟動背景 task"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    def _ensure_flusher(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 沒有 event loop（同步情境）時直接寫入
+            batch = list(self._pending)
+            self._pending.clear()
+            self._write_batch(batch)
+            return
+        if self._flusher is not None and not self._flusher.done() and self._flusher.get_loop() is loop:
+            return
+        self._flusher = loop.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except OSError:
+                pass
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        if not batch:
+            return
+        data = "".join(json.dumps(trace, ensure_ascii=False) + "\n" for trace in batch)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(data)
+
+
+trace_sink: Optional[JsonlTraceSink] = JsonlTraceSink(METRICS_TRACE_PATH) if METRICS_TRACE_PATH else None
+
+
+async def close_trace_sink() -> None:
+    """寫出尚未寫入的 trace（關閉服務前呼叫）"""
+    if trace_sink is not None:
+        try:
+            await trace_sink.aclose()
+        except OSError:
+            pass
+
+
+@contextmanager
+def request_trace(request_id: str) -> Iterator[Trace]:
+    """開始一個請求 trace；結束時若有設定 sink 則寫出"""
+    trace = Trace(request_id)
+    token = _trace_var.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace_var.reset(token)
+        if trace_sink is not None:
+            try:
+                trace_sink.write(trace)
+            except OSError:
+                pass
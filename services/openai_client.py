@@ -1,26 +1,664 @@
-from openai import OpenAI
-from config import LLM_MODEL_NAME, LLM_BASE_URL, LLM_API_KEY, LLM_TEMPERATURE
 import asyncio
+import importlib.util
+import json
+import time
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple, TypeVar
+
+import httpx
+from openai import APITimeoutError
+
+from config import (
+    LLM_MODEL_NAME, LLM_BASE_URL, LLM_API_KEY, LLM_TEMPERATURE,
+    LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE_CONNECTIONS, LLM_KEEPALIVE_EXPIRY,
+    LLM_HTTP2, LLM_TIMEOUT, LLM_CONNECT_TIMEOUT, LLM_SINGLE_FLIGHT, LLM_ENDPOINTS, LLM_MAX_RETRIES,
+    LLM_ENDPOINT_MAX_CONCURRENCY,
+)
+from .balancer import Endpoint, EndpointPool, parse_endpoints, is_endpoint_failure
+from .cassette import Cassette, build_cassette
+from .llm_cache import LLMResponseCache, build_response_cache
+from .metrics import metrics, record_llm_call
+from .resilience import (
+    CircuitBreaker, LLMError, LLMTimeoutError, LLMUnavailableError, RetryBudget, backoff_delay, detached_context,
+    time_remaining,
+)
+from .scheduler import Grant, LLMScheduler, current_priority
+from .single_flight import SingleFlight
+
+T = TypeVar("T")
+
+def build_http_client() -> httpx.AsyncClient:
+    """
+    建立帶 keep-alive 連線池的 httpx.AsyncClient。
+    LLM_HTTP2=true 時使用 HTTP/2（需安裝 http2 extra，即 h2 套件）；未安裝時退回 HTTP/1.1。
+    """
+    http2 = LLM_HTTP2 and importlib.util.find_spec("h2") is not None
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+    )
+
 
 class OpenAIClient:
-    def __init__(self):
-        self.model_name = LLM_MODEL_NAME
+    """
+    原生 async 的 LLM client。
+    同一個 process 應透過 get_openai_client() 共用單一實例，避免每個工具各自建立連線池。
+    每次呼叫會記錄排隊時間（等待後端名額）、網路往返時間與 token 用量（services.metrics）。
+    送往每個後端的呼叫數由 LLMScheduler 限制，interactive 優先於 batch，後端滿載時及早拒絕（LLMOverloadedError）。
+    同一時間相同的呼叫只送出一次（single-flight），併入的呼叫記為 llm_calls_total{status="coalesced"}。
+    設定多個端點（LLM_ENDPOINTS）時由 EndpointPool 做負載平衡、健康檢查與 hedge。
+    呼叫受請求 deadline（services.resilience.deadline）限制；端點故障時以 jitter 退避重試（受全域重試預算限制），
+    後端持續故障時由熔斷器直接丟出 LLMUnavailableError。
+    設定卡帶（LLM_CASSETTE_MODE）時可錄製成功的呼叫，或不連線重播錄製的回應（services.cassette）；
+    重播時不選擇端點（也就不啟動健康檢查）、不排隊、不經過熔斷與重試。
+    """
+
+    def __init__(
+        self,
+        http_client: Optional[httpx.AsyncClient] = None,
+        cache: Optional[LLMResponseCache] = None,
+        model_name: Optional[str] = None,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        endpoints: Optional[List[str]] = None,
+        cassette: Optional[Cassette] = None,
+    ):
+        """
+        model_name / base_url / api_key 未指定時使用 config 設定（例如指向本地 stub 時覆寫）。
+        endpoints 為多個端點（格式同 LLM_ENDPOINTS 的每一項：base_url 或 base_url|model）；
+        未指定時依序使用 base_url、LLM_ENDPOINTS、LLM_BASE_URL。
+        cassette 未指定時依 LLM_CASSETTE_MODE 取得共用卡帶（未設定則不錄製也不重播）。
+        """
+        self.model_name = model_name or LLM_MODEL_NAME
         self.temperature = LLM_TEMPERATURE
-        self.client = OpenAI(base_url=LLM_BASE_URL, api_key=LLM_API_KEY)
+        # temperature > 0 時回覆不具決定性，不啟用快取
+        self.cache = (cache or build_response_cache()) if self.temperature == 0 else None
+        self.http_client = http_client or build_http_client()
+        if endpoints is not None:
+            targets = parse_endpoints(",".join(endpoints), self.model_name)
+        elif base_url:
+            targets = [(base_url, self.model_name)]
+        else:
+            targets = parse_endpoints(LLM_ENDPOINTS, self.model_name) or [(LLM_BASE_URL, self.model_name)]
+        self.pool = EndpointPool.from_urls(targets, self.http_client, api_key or LLM_API_KEY)
+        # 每個後端的名額（預設平分連線池）；在此排隊的時間即為 queue time，避免在 httpx 內部看不見地等待
+        self.scheduler = LLMScheduler(
+            LLM_ENDPOINT_MAX_CONCURRENCY or LLM_MAX_CONNECTIONS // len(self.pool.endpoints)
+        )
+        # 進行中呼叫的合併；None 表示停用。共用呼叫不帶 leader 的 deadline，各呼叫者以自己的 deadline 限制等待
+        self.flights = SingleFlight(context=detached_context) if LLM_SINGLE_FLIGHT else None
+        # 重試由這裡統一處理（SDK 內部不重試），重試數受全域預算限制
+        self.max_retries = LLM_MAX_RETRIES
+        self.retry_budget = RetryBudget()
+        self.breaker = CircuitBreaker(self.model_name)
+        self.cassette = cassette or build_cassette()
 
-    async def chat(self, system_prompt: str, user_prompt: str) -> str:
-        messages = [
+    def _messages(self, system_prompt: str, user_prompt: str):
+        return [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
         ]
+
+    @staticmethod
+    def _format_params(response_format: Optional[Dict[str, Any]]) -> Tuple[Tuple[str, ...], Dict[str, Any]]:
+        """回傳 (額外的快取 key 欄位, 額外的請求參數)；未指定 response_format 時兩者皆為空，既有快取 key 不變"""
+        if response_format is None:
+            return (), {}
+        return (json.dumps(response_format, sort_keys=True),), {"response_format": response_format}
+
+    async def _cache_get(self, *key_parts: Any) -> Tuple[Optional[str], Optional[str]]:
+        """回傳 (cache_key, 命中的內容)；未啟用快取時兩者皆為 None"""
+        if self.cache is None:
+            return None, None
+        cache_key = self.cache.make_key(self.model_name, *key_parts)
+        cached = await self.cache.aget(cache_key)
+        if cached is not None:
+            record_llm_call(self.model_name, 0.0, 0.0, cached=True)
+        return cache_key, cached
+
+    async def _coalesce(self, key_parts: Tuple[Any, ...], cache_key: Optional[str], call: Callable[[], Awaitable[T]]) -> T:
+        """
+        相同 key 的呼叫進行中時等待其結果，否則執行 call()；key 為快取 key（快取停用時另行計算）加上優先等級，
+        共用呼叫只會以所有等待者共同的優先等級排隊。等待受這個呼叫者自己的 deadline 限制。
+        """
+        if self.flights is None:
+            return await call()
+        key = self._flight_key(cache_key or LLMResponseCache.make_key(self.model_name, *key_parts))
+        t0 = time.perf_counter()
+        try:
+            result, coalesced = await self.flights.do(key, call, self._flight_timeout())
+        except TimeoutError:
+            metrics.inc("llm_deadline_exceeded_total", model=self.model_name)
+            raise LLMTimeoutError("request deadline exceeded while waiting for a shared LLM call") from None
+        if coalesced:
+            record_llm_call(self.model_name, 0.0, time.perf_counter() - t0, coalesced=True)
+        return result
+
+    @staticmethod
+    def _flight_key(key: str) -> str:
+        return f"{current_priority()}:{key}"
+
+    def _flight_timeout(self) -> Optional[float]:
+        """等待共用呼叫的時限：呼叫者自己的 deadline 剩餘秒數（未設定時為 None）；deadline 已到時丟出 LLMTimeoutError"""
+        remaining = time_remaining()
+        if remaining is not None and remaining <= 0:
+            metrics.inc("llm_deadline_exceeded_total", model=self.model_name)
+            raise LLMTimeoutError("request deadline exceeded before the LLM call")
+        return remaining
+
+    async def _send(self, endpoint: Endpoint, timeout: float, **params: Any):
+        return await endpoint.client.chat.completions.create(
+            model=endpoint.model_name,
+            temperature=self.temperature,
+            timeout=timeout,
+            **params,
+        )
+
+    async def _attempt(self, endpoint: Endpoint, latency_key: Hashable, timeout: float, params: Dict[str, Any]):
+        """送往指定端點一次，並回報結果給 EndpointPool（延遲、故障或被取消）"""
+        self.pool.begin(endpoint)
+        t0 = time.perf_counter()
+        try:
+            resp = await self._send(endpoint, timeout, **params)
+        except asyncio.CancelledError:
+            self.pool.end(endpoint, cancelled=True)
+            raise
+        except Exception as e:
+            self.pool.end(endpoint, error=e)
+            raise
+        self.pool.end(endpoint, time.perf_counter() - t0, latency_key)
+        return resp
+
+    async def _granted(
+        self, grant: Grant, endpoint: Endpoint, latency_key: Hashable, timeout: float, params: Dict[str, Any]
+    ):
+        """以已取得的名額送出一次，結束時歸還名額"""
+        try:
+            return await self._attempt(endpoint, latency_key, timeout, params)
+        finally:
+            self.scheduler.release(grant)
+
+    async def _hedged(self, primary: Endpoint, latency_key: Hashable, timeout: float, params: Dict[str, Any]):
+        """
+        啟用 hedge 且已有足夠的延遲樣本時，超過同類呼叫的 p95 仍未完成就送一份到另一個端點，
+        採用先成功的回應並取消另一個；否則只送往 primary。
+        hedge 不排隊：另一個端點沒有空閒名額時不送出（呼叫端已持有 primary 的名額）。
+        """
+        delay = self.pool.hedge_delay(latency_key)
+        if delay is None:
+            return await self._attempt(primary, latency_key, timeout, params)
+
+        tasks = [asyncio.ensure_future(self._attempt(primary, latency_key, timeout, params))]
+        backup = None
         try:
-            resp = await asyncio.to_thread(
-                lambda: self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=messages,
-                    temperature=self.temperature,
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                backup = self.pool.pick(exclude=primary, fallback=False)
+                grant = self.scheduler.try_acquire(backup.base_url) if backup is not None else None
+                if grant is not None:
+                    self.pool.record_hedge()
+                    tasks.append(asyncio.ensure_future(self._granted(grant, backup, latency_key, timeout, params)))
+                else:
+                    backup = None
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if backup is not None and task is tasks[-1]:
+                            self.pool.record_hedge(won=backup)
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    # ------------------ deadline / 重試 / 熔斷 ------------------
+
+    def _attempt_timeout(self, call_timeout: float) -> float:
+        """本次嘗試可用的秒數：單次逾時與請求 deadline 剩餘時間取小者；deadline 已到時丟出 LLMTimeoutError"""
+        remaining = time_remaining()
+        if remaining is None:
+            return call_timeout
+        if remaining <= 0:
+            metrics.inc("llm_deadline_exceeded_total", model=self.model_name)
+            raise LLMTimeoutError("request deadline exceeded before the LLM call")
+        return min(call_timeout, remaining)
+
+    def _admit(self) -> None:
+        if not self.breaker.allow():
+            raise LLMUnavailableError(f"circuit breaker open for {self.model_name}; backend considered unhealthy")
+
+    def _pick(self, failed: Optional[Endpoint]) -> Endpoint:
+        """重試時優先換到另一個可用端點"""
+        if failed is not None:
+            endpoint = self.pool.pick(exclude=failed, fallback=False)
+            if endpoint is not None:
+                self.pool.record_failover()
+                return endpoint
+        return self.pool.pick()
+
+    @staticmethod
+    def _outcome(error: Optional[BaseException], truncated: bool) -> Optional[bool]:
+        """
+        回報給熔斷器的結果：成功 True、後端故障 False；
+        請求本身的錯誤與被 deadline 截斷的逾時不代表後端不健康，回傳 None。
+        """
+        if error is None:
+            return True
+        if truncated and isinstance(error, TimeoutError):
+            return None
+        return False if is_endpoint_failure(error) else None
+
+    def _retry_delay(self, attempt: int, error: BaseException, truncated: bool) -> Optional[float]:
+        """回傳重試前的等待秒數；不可重試、次數用完、預算不足或 deadline 前來不及時回傳 None"""
+        if attempt >= self.max_retries or self._outcome(error, truncated) is not False:
+            return None
+        delay = backoff_delay(attempt)
+        remaining = time_remaining()
+        if remaining is not None and delay >= remaining:
+            metrics.inc("llm_retries_total", model=self.model_name, outcome="no_time")
+            return None
+        if not self.retry_budget.withdraw():
+            metrics.inc("llm_retries_total", model=self.model_name, outcome="budget_exhausted")
+            return None
+        metrics.inc("llm_retries_total", model=self.model_name, outcome="retried")
+        return delay
+
+    def _typed(self, error: BaseException, budget: float, truncated: bool) -> LLMError:
+        """將最後一次嘗試的例外轉成 LLMError 子類別（原例外保留在 __cause__）"""
+        if isinstance(error, LLMError):
+            return error
+        if isinstance(error, (TimeoutError, APITimeoutError)):
+            if truncated:
+                metrics.inc("llm_deadline_exceeded_total", model=self.model_name)
+                return LLMTimeoutError(f"request deadline exceeded after {budget:.2f}s")
+            return LLMTimeoutError(f"LLM call timed out after {budget:.2f}s")
+        return LLMError(f"{type(error).__name__}: {error}")
+
+    def _tape_key(self, params: Dict[str, Any]) -> Optional[str]:
+        """卡帶中的請求指紋；未設定卡帶時回傳 None"""
+        if self.cassette is None:
+            return None
+        return self.cassette.fingerprint(self.model_name, self.temperature, params)
+
+    async def _create(self, timeout: Optional[float], **params: Any):
+        """
+        送出非串流請求並記錄每次嘗試的排隊 / 網路時間與 token 用量。
+        排隊等待名額不超過單次逾時與請求 deadline（逾時丟出 LLMOverloadedError，不重試、不計入熔斷）；
+        取得名額後才開始計算本次嘗試的逾時。端點故障時換端點重試，
+        重試失敗、deadline 已到或熔斷時丟出 LLMError 子類別。
+        """
+        # 同一個 system prompt 與解碼方式視為同一類呼叫（str 的 hash 會快取，不需每次重算）
+        latency_key = (params["messages"][0]["content"], "logprobs" in params)
+        call_timeout = timeout if timeout is not None else LLM_TIMEOUT
+        tape_key = self._tape_key(params)
+        if tape_key is not None and self.cassette.replaying:
+            return await self._replay(tape_key, call_timeout)
+        self.retry_budget.deposit()
+        failed: Optional[Endpoint] = None
+        attempt = 0
+        while True:
+            budget = self._attempt_timeout(call_timeout)
+            truncated = budget < call_timeout
+            self._admit()
+            endpoint = self._pick(failed)
+            t0 = time.perf_counter()
+            t1 = None
+            try:
+                async with self.scheduler.slot(endpoint.base_url, budget):
+                    t1 = time.perf_counter()
+                    budget = self._attempt_timeout(call_timeout)
+                    truncated = budget < call_timeout
+                    async with asyncio.timeout(budget):
+                        resp = await self._hedged(endpoint, latency_key, call_timeout, params)
+            except asyncio.CancelledError:
+                self.breaker.record(None)
+                raise
+            except Exception as e:
+                t1 = t1 or time.perf_counter()
+                record_llm_call(self.model_name, t1 - t0, time.perf_counter() - t1, error=type(e).__name__)
+                self.breaker.record(self._outcome(e, truncated))
+                delay = self._retry_delay(attempt, e, truncated)
+                if delay is None:
+                    raise self._typed(e, budget, truncated) from e
+                attempt += 1
+                failed = endpoint
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record(True)
+            if tape_key is not None:
+                self.cassette.record(tape_key, time.perf_counter() - t1, resp)
+            usage = getattr(resp, "usage", None)
+            record_llm_call(
+                self.model_name, t1 - t0, time.perf_counter() - t1,
+                prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+                completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+            )
+            return resp
+
+    async def chat(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        timeout: Optional[float] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        response_format 會原樣傳給後端（例如 json_schema 限制輸出格式）。
+        呼叫失敗時丟出 LLMError（LLMTimeoutError：deadline / 逾時；LLMUnavailableError：熔斷中）。
+        """
+        key_extra, params = self._format_params(response_format)
+        key_parts = (system_prompt, user_prompt, self.temperature, *key_extra)
+        cache_key, cached = await self._cache_get(*key_parts)
+        if cached is not None:
+            return cached
+
+        async def call() -> str:
+            resp = await self._create(timeout, messages=self._messages(system_prompt, user_prompt), **params)
+            content = resp.choices[0].message.content.strip()
+            if cache_key is not None:
+                self.cache.set(cache_key, content)
+            return content
+
+        return await self._coalesce(key_parts, cache_key, call)
+
+    async def chat_stream(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        timeout: Optional[float] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        串流版 chat：逐段 yield 模型輸出的文字。
+        快取命中時一次 yield 完整內容；呼叫失敗時丟出 LLMError（可能已輸出部分片段）。
+        相同的串流呼叫進行中時共用其輸出（先重播已收到的片段）。
+        """
+        key_extra, params = self._format_params(response_format)
+        key_parts = (system_prompt, user_prompt, self.temperature, *key_extra)
+        cache_key, cached = await self._cache_get(*key_parts)
+        if cached is not None:
+            yield cached
+            return
+
+        def stream() -> AsyncIterator[str]:
+            return self._stream_once(system_prompt, user_prompt, timeout, params, cache_key)
+
+        if self.flights is None:
+            async for chunk in stream():
+                yield chunk
+            return
+
+        def on_join(coalesced: bool) -> None:
+            if coalesced:
+                record_llm_call(self.model_name, 0.0, 0.0, coalesced=True)
+
+        key = self._flight_key(LLMResponseCache.make_key(self.model_name, *key_parts, "stream"))
+        try:
+            async for chunk in self.flights.stream(key, stream, on_join, self._flight_timeout()):
+                yield chunk
+        except TimeoutError:
+            metrics.inc("llm_deadline_exceeded_total", model=self.model_name)
+            raise LLMTimeoutError("request deadline exceeded while waiting for a shared LLM stream") from None
+
+    async def _stream_once(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        timeout: Optional[float],
+        params: Dict[str, Any],
+        cache_key: Optional[str],
+    ) -> AsyncIterator[str]:
+        """
+        送出串流請求（不 hedge，只選擇端點），完成後寫入快取。
+        尚未輸出任何片段前發生端點故障時換端點重試；已輸出部分內容後的失敗直接丟出 LLMError。
+        """
+        call_timeout = timeout if timeout is not None else LLM_TIMEOUT
+        messages = self._messages(system_prompt, user_prompt)
+        tape_key = self._tape_key({"messages": messages, "stream": True, **params})
+        if tape_key is not None and self.cassette.replaying:
+            async for delta in self._replay_stream(tape_key, cache_key):
+                yield delta
+            return
+        self.retry_budget.deposit()
+        failed: Optional[Endpoint] = None
+        attempt = 0
+        while True:
+            queue_timeout = self._attempt_timeout(call_timeout)
+            self._admit()
+            endpoint = self._pick(failed)
+            chunks: List[str] = []
+            try:
+                async with aclosing(
+                    self._stream_attempt(endpoint, call_timeout, queue_timeout, messages, params, tape_key)
+                ) as deltas:
+                    async for delta in deltas:
+                        chunks.append(delta)
+                        yield delta
+            except Exception as e:
+                # 被 deadline 截斷的逾時已在 _stream_attempt 轉成 LLMTimeoutError
+                delay = None if chunks else self._retry_delay(attempt, e, False)
+                if delay is None:
+                    raise self._typed(e, call_timeout, False) from e
+                attempt += 1
+                failed = endpoint
+                await asyncio.sleep(delay)
+                continue
+            content = "".join(chunks).strip()
+            if cache_key is not None and content:
+                self.cache.set(cache_key, content)
+            return
+
+    async def _stream_attempt(
+        self,
+        endpoint: Endpoint,
+        call_timeout: float,
+        queue_timeout: float,
+        messages: List[Dict[str, str]],
+        params: Dict[str, Any],
+        tape_key: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """
+        對單一端點送出一次串流請求並逐段 yield。排隊等待名額不超過 queue_timeout 秒；
+        取得名額後，建立串流與等待每個片段合計不超過單次逾時與請求 deadline，被 deadline 截斷時丟出 LLMTimeoutError。
+        結果回報給 EndpointPool、熔斷器與用量統計；指定 tape_key 時完整收到的串流寫入卡帶。
+        """
+        loop = asyncio.get_running_loop()
+        budget = call_timeout
+        truncated = False
+        usage = None
+        stream = None
+        error: Optional[BaseException] = None
+        finished = False
+        grant: Optional[Grant] = None
+        recorded: List[str] = []
+        first: Optional[float] = None
+        t0 = time.perf_counter()
+        t1 = t0
+        try:
+            # 串流期間持續佔用後端名額
+            grant = await self.scheduler.acquire(endpoint.base_url, queue_timeout)
+            t1 = time.perf_counter()
+            budget = self._attempt_timeout(call_timeout)
+            truncated = budget < call_timeout
+            expires = loop.time() + budget
+            self.pool.begin(endpoint)
+            try:
+                stream = await asyncio.wait_for(
+                    self._send(
+                        endpoint,
+                        call_timeout,
+                        messages=messages,
+                        stream=True,
+                        stream_options={"include_usage": True},
+                        **params,
+                    ),
+                    expires - loop.time(),
                 )
+                events = stream.__aiter__()
+                while True:
+                    try:
+                        event = await asyncio.wait_for(events.__anext__(), expires - loop.time())
+                    except StopAsyncIteration:
+                        break
+                    if getattr(event, "usage", None) is not None:
+                        usage = event.usage
+                    if not event.choices:
+                        continue
+                    delta = event.choices[0].delta.content
+                    if delta:
+                        if tape_key is not None:
+                            first = first or time.perf_counter()
+                            recorded.append(delta)
+                        yield delta
+                finished = True
+                if tape_key is not None:
+                    now = time.perf_counter()
+                    self.cassette.record_stream(
+                        tape_key, now - t1, (first or now) - t1, recorded,
+                        usage.model_dump(exclude_none=True) if usage is not None else None,
+                    )
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                # 呼叫端中途停止讀取，或 deadline 截斷的逾時，不計入端點故障
+                cut_short = truncated and isinstance(error, TimeoutError)
+                self.pool.end(
+                    endpoint,
+                    error=None if cut_short else error,
+                    cancelled=cut_short or (not finished and error is None),
+                )
+                if stream is not None:
+                    await stream.close()
+        except Exception as e:
+            error = e
+            if truncated and isinstance(e, TimeoutError):
+                raise self._typed(e, budget, truncated) from e
+            raise
+        finally:
+            if grant is not None:
+                self.scheduler.release(grant)
+            if finished or error is not None:
+                self.breaker.record(self._outcome(error, truncated))
+            else:
+                self.breaker.record(None)
+            record_llm_call(
+                self.model_name, t1 - t0, time.perf_counter() - t1,
+                prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+                completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+                error=type(error).__name__ if error is not None else None,
             )
-            return resp.choices[0].message.content.strip()
+
+    async def _replay(self, tape_key: str, call_timeout: float):
+        """重播錄製的非串流回應（不連線）；replay_timed 的等待仍受單次逾時與請求 deadline 限制"""
+        budget = self._attempt_timeout(call_timeout)
+        t0 = time.perf_counter()
+        try:
+            async with asyncio.timeout(budget):
+                resp = await self.cassette.replay(tape_key)
         except Exception as e:
-            return f"ERROR_CALLING_LLM::{type(e).__name__}:{e}"
\ No newline at end of file
+            record_llm_call(self.model_name, 0.0, time.perf_counter() - t0, error=type(e).__name__)
+            raise self._typed(e, budget, budget < call_timeout) from e
+        usage = getattr(resp, "usage", None)
+        record_llm_call(
+            self.model_name, 0.0, time.perf_counter() - t0,
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+        )
+        return resp
+
+    async def _replay_stream(self, tape_key: str, cache_key: Optional[str]) -> AsyncIterator[str]:
+        """重播錄製的串流；用量照常記錄，完成後寫入快取"""
+        t0 = time.perf_counter()
+        recorded = self.cassette.stream(tape_key)
+        async for chunk in self.cassette.play(recorded):
+            yield chunk
+        record_llm_call(
+            self.model_name, 0.0, time.perf_counter() - t0,
+            prompt_tokens=recorded.usage.get("prompt_tokens", 0),
+            completion_tokens=recorded.usage.get("completion_tokens", 0),
+        )
+        content = "".join(recorded.chunks).strip()
+        if cache_key is not None and content:
+            self.cache.set(cache_key, content)
+
+    async def chat_logprobs(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        top_logprobs: int = 5,
+        timeout: Optional[float] = None,
+    ) -> Tuple[str, Dict[str, float]]:
+        """
+        單 token 分類用：max_tokens=1 並要求第一個 token 的 top logprobs。
+        回傳 (輸出文字, {token: logprob})；呼叫失敗時丟出 LLMError。
+        """
+        key_parts = (system_prompt, user_prompt, self.temperature, "logprobs", top_logprobs)
+        cache_key, cached = await self._cache_get(*key_parts)
+        if cached is not None:
+            data = json.loads(cached)
+            return data["content"], data["logprobs"]
+
+        async def call() -> Tuple[str, Dict[str, float]]:
+            resp = await self._create(
+                timeout,
+                messages=self._messages(system_prompt, user_prompt),
+                max_tokens=1,
+                logprobs=True,
+                top_logprobs=top_logprobs,
+            )
+            choice = resp.choices[0]
+            content = (choice.message.content or "").strip()
+            logprobs: Dict[str, float] = {}
+            if choice.logprobs is not None and choice.logprobs.content:
+                for item in choice.logprobs.content[0].top_logprobs:
+                    logprobs[item.token] = item.logprob
+            if cache_key is not None and logprobs:
+                self.cache.set(cache_key, json.dumps({"content": content, "logprobs": logprobs}, ensure_ascii=False))
+            return content, logprobs
+
+        content, logprobs = await self._coalesce(key_parts, cache_key, call)
+        # 併入的呼叫者各自取得一份 dict，避免互相修改
+        return content, dict(logprobs)
+
+    async def aclose(self) -> None:
+        if self.cache is not None:
+            await self.cache.aclose()
+        if self.cassette is not None:
+            await self.cassette.aclose()
+        await self.pool.aclose()
+        await self.http_client.aclose()
+
+
+# ---------------- process 共用實例 ----------------
+
+_shared_clients: Dict[Tuple[Optional[str], Optional[str]], OpenAIClient] = {}
+
+
+def get_openai_client(model_name: Optional[str] = None, base_url: Optional[str] = None) -> OpenAIClient:
+    """
+    取得 process 內共用的 OpenAIClient（延遲建立）。
+    未指定 model_name / base_url 時為 config 設定的主要模型；指定時（例如 cascade 的小模型）每組各共用一個實例。
+    """
+    key = (model_name, base_url)
+    client = _shared_clients.get(key)
+    if client is None:
+        client = _shared_clients[key] = OpenAIClient(model_name=model_name, base_url=base_url)
+    return client
+
+
+async def close_openai_client() -> None:
+    """關閉所有共用 client 的連線池（程式結束或 worker 關閉時呼叫）。"""
+    clients = list(_shared_clients.values())
+    _shared_clients.clear()
+    for client in clients:
+        await client.aclose()
@@ -0,0 +1,207 @@
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import Context, ContextVar, copy_context
+from typing import Any, Deque, Dict, Iterator, Optional
+
+from config import (
+    LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY, LLM_RETRY_BUDGET_RATIO, LLM_RETRY_BUDGET_MIN_PER_S,
+    LLM_BREAKER_WINDOW, LLM_BREAKER_MIN_REQUESTS, LLM_BREAKER_FAILURE_RATIO, LLM_BREAKER_OPEN_SECONDS,
+)
+from .metrics import metrics
+
+metrics.describe("llm_retries_total", "LLM call retries by outcome (retried / budget_exhausted / no_time)")
+metrics.describe("llm_deadline_exceeded_total", "LLM calls rejected or cut short by the request deadline")
+metrics.describe("llm_circuit_transitions_total", "LLM circuit breaker state transitions by new state")
+metrics.describe("llm_circuit_rejections_total", "LLM calls failed fast while the circuit breaker was open")
+
+
+# ---------------- 型別化錯誤 ----------------
+
+class LLMError(Exception):
+    """LLM 呼叫失敗（已用完重試）；error_type 會寫入工具結果的 metadata"""
+    error_type = "llm_error"
+
+
+class LLMTimeoutError(LLMError):
+    """請求的 deadline 已到，或單次呼叫逾時"""
+    error_type = "llm_timeout"
+
+
+class LLMUnavailableError(LLMError):
+    """熔斷器開啟中，後端視為不可用，不送出請求"""
+    error_type = "llm_unavailable"
+
+
+class LLMOverloadedError(LLMError):
+    """後端已滿載：排隊已滿、排隊超過時限或呼叫端的時限，或預估等待時間超過 deadline，未送出請求"""
+    error_type = "llm_overloaded"
+
+
+# ---------------- 請求 deadline ----------------
+
+_deadline_var: ContextVar[Optional[float]] = ContextVar("llm_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[None]:
+    """
+    在此範圍內（含其啟動的子 task）的 LLM 呼叫都必須在 seconds 秒內完成。
+    巢狀使用時取較早的期限；seconds 為 None 或 <= 0 時不設限。
+    """
+    if seconds is None or seconds <= 0:
+        yield
+        return
+    expires = time.monotonic() + seconds
+    current = _deadline_var.get()
+    if current is not None:
+        expires = min(expires, current)
+    token = _deadline_var.set(expires)
+    try:
+        yield
+    finally:
+        _deadline_var.reset(token)
+
+
+def time_remaining() -> Optional[float]:
+    """目前 deadline 剩餘的秒數（可能 <= 0）；未設定 deadline 時回傳 None"""
+    expires = _deadline_var.get()
+    return None if expires is None else expires - time.monotonic()
+
+
+def detached_context() -> Context:
+    """目前 context 的複本，但清除 deadline：供多個請求共用的呼叫使用，避免被其中一個請求的 deadline 截斷"""
+    context = copy_context()
+    context.run(_deadline_var.set, None)
+    return context
+
+
+# ---------------- 重試 ----------------
+
+def backoff_delay(attempt: int, base: float = LLM_RETRY_BASE_DELAY, cap: float = LLM_RETRY_MAX_DELAY) -> float:
+    """指數退避加 full jitter：第 attempt 次重試（從 0 起算）前等待 [0, min(cap, base * 2^attempt)] 秒"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class RetryBudget:
+    """
+    全域重試預算（token bucket）：每個新呼叫存入 ratio 個 token，每次重試取出 1 個，
+    另外每秒固定補充 min_per_s 個，讓低流量時仍可重試。
+    後端大範圍故障時重試數被限制在一般流量的 ratio 倍左右，不會放大負載。
+    """
+
+    def __init__(self, ratio: float = LLM_RETRY_BUDGET_RATIO, min_per_s: float = LLM_RETRY_BUDGET_MIN_PER_S):
+        self.ratio = ratio
+        self.min_per_s = min_per_s
+        # 上限約為 10 秒的補充量，避免閒置一段時間後累積出大量重試
+        self.capacity = max(1.0, min_per_s * 10)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.min_per_s)
+        self._updated = now
+
+    def deposit(self) -> None:
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+# ---------------- 熔斷 ----------------
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    依最近 window 次呼叫的失敗率熔斷：
+    - closed：正常送出；樣本數達 min_requests 且失敗率 >= failure_ratio 時轉為 open
+    - open：open_seconds 秒內直接拒絕（丟出 LLMUnavailableError），之後轉為 half_open
+    - half_open：只放行一個探測呼叫，成功即恢復 closed，失敗則再次 open
+    只有後端故障（連線錯誤、逾時、5xx、429）計入失敗；請求本身的錯誤（其他 4xx）不計。
+    """
+
+    def __init__(
+        self,
+        name: str = "llm",
+        window: int = LLM_BREAKER_WINDOW,
+        min_requests: int = LLM_BREAKER_MIN_REQUESTS,
+        failure_ratio: float = LLM_BREAKER_FAILURE_RATIO,
+        open_seconds: float = LLM_BREAKER_OPEN_SECONDS,
+    ):
+        self.name = name
+        self.min_requests = min_requests
+        self.failure_ratio = failure_ratio
+        self.open_seconds = open_seconds
+        self.state = CIRCUIT_CLOSED
+        self.opened_until = 0.0
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._failures = 0
+        self._probing = False
+        self.rejections = 0
+
+    def allow(self) -> bool:
+        """是否可以送出呼叫；half_open 時第一個呼叫者成為探測呼叫"""
+        if self.state == CIRCUIT_OPEN:
+            if time.monotonic() < self.opened_until:
+                self.rejections += 1
+                metrics.inc("llm_circuit_rejections_total", breaker=self.name)
+                return False
+            self._transition(CIRCUIT_HALF_OPEN)
+        if self.state == CIRCUIT_HALF_OPEN:
+            if self._probing:
+                self.rejections += 1
+                metrics.inc("llm_circuit_rejections_total", breaker=self.name)
+                return False
+            self._probing = True
+        return True
+
+    def record(self, ok: Optional[bool]) -> None:
+        """
+        回報 allow() 放行的呼叫結果：True 成功、False 後端故障、
+        None 沒有結論（被取消或請求本身的錯誤），half_open 時讓下一個呼叫者重新探測。
+        """
+        if self.state == CIRCUIT_HALF_OPEN:
+            self._probing = False
+            if ok is True:
+                self._outcomes.clear()
+                self._failures = 0
+                self._transition(CIRCUIT_CLOSED)
+            elif ok is False:
+                self._open()
+            return
+        if ok is None or self.state == CIRCUIT_OPEN:
+            return
+        if len(self._outcomes) == self._outcomes.maxlen:
+            self._failures -= not self._outcomes[0]
+        self._outcomes.append(ok)
+        self._failures += not ok
+        if len(self._outcomes) >= self.min_requests and self._failures >= self.failure_ratio * len(self._outcomes):
+            self._open()
+
+    def _open(self) -> None:
+        self.opened_until = time.monotonic() + self.open_seconds
+        self._transition(CIRCUIT_OPEN)
+
+    def _transition(self, state: str) -> None:
+        self.state = state
+        metrics.inc("llm_circuit_transitions_total", breaker=self.name, state=state)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "window": len(self._outcomes),
+            "failures": self._failures,
+            "rejections": self.rejections,
+        }
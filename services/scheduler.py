@@ -0,0 +1,243 @@
+import asyncio
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, Optional
+
+from config import (
+    LLM_BATCH_MAX_SHARE,
+    LLM_QUEUE_MAX_INTERACTIVE, LLM_QUEUE_MAX_BATCH, LLM_QUEUE_TIMEOUT_INTERACTIVE, LLM_QUEUE_TIMEOUT_BATCH,
+)
+from .metrics import metrics
+from .resilience import LLMOverloadedError, time_remaining
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BATCH = "batch"
+# 依優先順序排列：名額釋出時先分配給前面的等級
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BATCH)
+
+# 估計排隊時間前至少需要的佔用時間樣本數
+HOLD_MIN_SAMPLES = 10
+HOLD_EWMA_ALPHA = 0.2
+
+metrics.describe("llm_scheduler_queue_depth", "LLM calls waiting for a backend slot, by endpoint and priority")
+metrics.describe("llm_scheduler_active", "LLM calls holding a backend slot, by endpoint and priority")
+metrics.describe("llm_scheduler_wait_seconds", "Time an LLM call waited in the scheduler queue, by priority")
+metrics.describe(
+    "llm_scheduler_rejections_total",
+    "LLM calls rejected before reaching the backend (queue_full / queue_timeout / deadline), by endpoint and priority",
+)
+
+
+# ---------------- 呼叫的優先等級 ----------------
+
+_priority_var: ContextVar[str] = ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(priority: str) -> Iterator[None]:
+    """在此範圍內（含其啟動的子 task）的 LLM 呼叫都以 priority 排隊；未設定時為 interactive"""
+    if priority not in PRIORITIES:
+        raise ValueError(f"未知的 LLM priority: {priority}（應為 {'/'.join(PRIORITIES)}）")
+    token = _priority_var.set(priority)
+    try:
+        yield
+    finally:
+        _priority_var.reset(token)
+
+
+def current_priority() -> str:
+    return _priority_var.get()
+
+
+# ---------------- 排程 ----------------
+
+@dataclass
+class Grant:
+    """取得的後端名額；呼叫結束時交給 LLMScheduler.release()"""
+    lane: "_Lane"
+    priority: str
+    started: float
+
+
+class _Lane:
+    """單一後端的名額與各優先等級的等待佇列"""
+
+    def __init__(self, name: str, limit: int, batch_share: float):
+        self.name = name
+        self.limit = limit
+        self.limits = {PRIORITY_INTERACTIVE: limit, PRIORITY_BATCH: max(1, int(limit * batch_share))}
+        self.active: Counter = Counter()
+        self.waiters: Dict[str, Deque[asyncio.Future]] = {p: deque() for p in PRIORITIES}
+        self.hold_ewma = 0.0
+        self.hold_samples = 0
+        self.rejections: Counter = Counter()
+
+    def can_run(self, priority: str) -> bool:
+        return sum(self.active.values()) < self.limit and self.active[priority] < self.limits[priority]
+
+    def ahead(self, priority: str) -> int:
+        """排在 priority 前面（同等級或更優先）的等待數"""
+        rank = PRIORITIES.index(priority)
+        return sum(len(self.waiters[p]) for p in PRIORITIES[:rank + 1])
+
+    def estimated_wait(self, priority: str) -> Optional[float]:
+        """依平均佔用時間估計新加入的呼叫需排隊的秒數；樣本不足時回傳 None"""
+        if self.hold_samples < HOLD_MIN_SAMPLES:
+            return None
+        return (self.ahead(priority) + 1) * self.hold_ewma / self.limits[priority]
+
+    def observe_hold(self, seconds: float) -> None:
+        self.hold_samples += 1
+        self.hold_ewma = seconds if self.hold_samples == 1 else (
+            HOLD_EWMA_ALPHA * seconds + (1 - HOLD_EWMA_ALPHA) * self.hold_ewma
+        )
+
+    def publish(self, priority: str) -> None:
+        metrics.set("llm_scheduler_queue_depth", len(self.waiters[priority]), endpoint=self.name, priority=priority)
+        metrics.set("llm_scheduler_active", self.active[priority], endpoint=self.name, priority=priority)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "endpoint": self.name,
+            "limit": self.limit,
+            "limits": dict(self.limits),
+            "active": {p: self.active[p] for p in PRIORITIES},
+            "queued": {p: len(self.waiters[p]) for p in PRIORITIES},
+            "mean_hold_ms": round(self.hold_ewma * 1000, 2),
+            "rejections": dict(self.rejections),
+        }
+
+
+class LLMScheduler:
+    """
+    OpenAIClient 與後端之間的排程層：
+    - 每個後端（以 base_url 區分）最多同時處理 limit 個呼叫，batch 最多使用其中 batch_share 的比例
+    - interactive 與 batch 各自排隊；名額釋出時先分配給 interactive，同一等級先到先得
+    - 背壓：排隊已滿、排隊超過該等級的時限，或預估等待時間已超過請求 deadline 時，
+      不再等待而是立即丟出 LLMOverloadedError，讓呼叫端盡早得知後端已滿載
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        batch_share: float = LLM_BATCH_MAX_SHARE,
+        max_queue: Optional[Dict[str, int]] = None,
+        queue_timeout: Optional[Dict[str, float]] = None,
+    ):
+        self.limit = max(1, limit)
+        self.batch_share = batch_share
+        self.max_queue = max_queue or {
+            PRIORITY_INTERACTIVE: LLM_QUEUE_MAX_INTERACTIVE, PRIORITY_BATCH: LLM_QUEUE_MAX_BATCH,
+        }
+        self.queue_timeout = queue_timeout or {
+            PRIORITY_INTERACTIVE: LLM_QUEUE_TIMEOUT_INTERACTIVE, PRIORITY_BATCH: LLM_QUEUE_TIMEOUT_BATCH,
+        }
+        self._lanes: Dict[str, _Lane] = {}
+
+    def lane(self, name: str) -> _Lane:
+        lane = self._lanes.get(name)
+        if lane is None:
+            lane = self._lanes[name] = _Lane(name, self.limit, self.batch_share)
+        return lane
+
+    def try_acquire(self, name: str) -> Optional[Grant]:
+        """不排隊：後端有空閒名額且沒有同等級以上的等待者時立即取得，否則回傳 None（供 hedge 使用）"""
+        lane = self.lane(name)
+        priority = current_priority()
+        if lane.ahead(priority) or not lane.can_run(priority):
+            return None
+        return self._grant(lane, priority, 0.0)
+
+    async def acquire(self, name: str, timeout: Optional[float] = None) -> Grant:
+        """
+        取得 name 後端的一個名額。因背壓被拒絕，或排隊超過該等級的時限或 timeout 秒（呼叫端的時限）時
+        丟出 LLMOverloadedError：排隊逾時代表後端滿載，不是後端故障，呼叫端不應重試或計入熔斷。
+        """
+        grant = self.try_acquire(name)
+        if grant is not None:
+            return grant
+        lane = self.lane(name)
+        priority = current_priority()
+        queue = lane.waiters[priority]
+        if len(queue) >= self.max_queue[priority]:
+            self._reject(lane, priority, "queue_full")
+        remaining = time_remaining()
+        estimate = lane.estimated_wait(priority)
+        if remaining is not None and estimate is not None and estimate > remaining:
+            self._reject(lane, priority, "deadline")
+
+        # 排隊時限取該等級的時限與呼叫端的時限中較短者
+        limit = self.queue_timeout[priority] or None
+        wait = limit if timeout is None else (timeout if limit is None else min(limit, timeout))
+        started = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        queue.append(future)
+        lane.publish(priority)
+        try:
+            # 不用 wait_for：逾時時 future 不會被取消，可判斷名額是否已在同一時間交付
+            await asyncio.wait((future,), timeout=wait)
+        except BaseException:
+            self._abandon(lane, priority, future)
+            raise
+        if not future.done():
+            self._abandon(lane, priority, future)
+            self._reject(lane, priority, "queue_timeout" if wait == limit else "deadline")
+        waited = time.monotonic() - started
+        metrics.observe("llm_scheduler_wait_seconds", waited, priority=priority)
+        return Grant(lane, priority, time.monotonic())
+
+    def release(self, grant: Grant) -> None:
+        lane = grant.lane
+        lane.active[grant.priority] -= 1
+        lane.observe_hold(time.monotonic() - grant.started)
+        self._dispatch(lane)
+
+    @asynccontextmanager
+    async def slot(self, name: str, timeout: Optional[float] = None) -> AsyncIterator[Grant]:
+        grant = await self.acquire(name, timeout)
+        try:
+            yield grant
+        finally:
+            self.release(grant)
+
+    def _grant(self, lane: _Lane, priority: str, waited: float) -> Grant:
+        lane.active[priority] += 1
+        lane.publish(priority)
+        metrics.observe("llm_scheduler_wait_seconds", waited, priority=priority)
+        return Grant(lane, priority, time.monotonic())
+
+    def _dispatch(self, lane: _Lane) -> None:
+        """依優先順序把空出的名額交給等待者（名額直接轉交，不會被新到的呼叫插隊）"""
+        for priority in PRIORITIES:
+            queue = lane.waiters[priority]
+            while queue and lane.can_run(priority):
+                future = queue.popleft()
+                if future.done():
+                    continue
+                lane.active[priority] += 1
+                future.set_result(None)
+            lane.publish(priority)
+
+    def _abandon(self, lane: _Lane, priority: str, future: asyncio.Future) -> None:
+        """等待者放棄（逾時或被取消）：名額若已在同一時間交付則歸還，否則移出佇列"""
+        if future.done() and not future.cancelled():
+            lane.active[priority] -= 1
+            self._dispatch(lane)
+            return
+        future.cancel()
+        try:
+            lane.waiters[priority].remove(future)
+        except ValueError:
+            pass
+        lane.publish(priority)
+
+    def _reject(self, lane: _Lane, priority: str, reason: str) -> None:
+        lane.rejections[reason] += 1
+        metrics.inc("llm_scheduler_rejections_total", endpoint=lane.name, priority=priority, reason=reason)
+        raise LLMOverloadedError(f"{lane.name} overloaded: {priority} call rejected ({reason})")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"lanes": [lane.as_dict() for lane in self._lanes.values()]}
@@ -0,0 +1,197 @@
+import json
+import os
+import unicodedata
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import (
+    SIMILARITY_CACHE_ENABLED, SIMILARITY_CACHE_CAPACITY, SIMILARITY_CACHE_DIM, SIMILARITY_CACHE_DIR,
+)
+from .llm_cache import CacheStats
+from .metrics import metrics
+
+metrics.describe("similarity_cache_total", "Near-duplicate cache lookups by cache name and outcome")
+
+
+class NgramVectorizer:
+    """
+    字元 n-gram 的 hashing 向量化：不需詞典、embedding 服務或網路。
+    正規化（NFKC、小寫、去除空白與標點）後取 n-gram，以 crc32 映射到 dim 維並帶正負號，
+    回傳 L2 正規化的 float32 向量，兩向量內積即為 cosine 相似度。
+    crc32 與 process 無關，因此存檔後重新載入仍可比對。
+    """
+
+    def __init__(self, dim: int = SIMILARITY_CACHE_DIM, ngram_range: Tuple[int, int] = (1, 3)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        text = unicodedata.normalize("NFKC", text).lower()
+        return "".join(ch for ch in text if unicodedata.category(ch)[0] not in "PZSC")
+
+    def transform(self, text: str) -> np.ndarray:
+        text = self.normalize(text)
+        indices: List[int] = []
+        signs: List[float] = []
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(text) - n + 1):
+                h = zlib.crc32(text[i:i + n].encode("utf-8"))
+                indices.append(h % self.dim)
+                signs.append(1.0 if h & 0x80000000 else -1.0)
+        vector = np.bincount(indices, weights=signs, minlength=self.dim).astype(np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
+
+
+class SimilarityCache:
+    """
+    近似重複輸入的快取：已分類的輸入以 n-gram 向量存成一個 (n, dim) 矩陣，
+    查詢時以一次矩陣乘法取得與所有項目的相似度，最高分達 threshold 即重用其結果。
+
+    - 完全相同（正規化後）的輸入走 dict 查找，不做矩陣運算
+    - 超過 capacity 時淘汰最久未使用的項目（直接覆寫該列）
+    - 值需可 JSON 序列化；save() / load() 以 .npz 存放矩陣與值
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        capacity: int = SIMILARITY_CACHE_CAPACITY,
+        vectorizer: Optional[NgramVectorizer] = None,
+        path: Optional[str] = None,
+        name: str = "default",
+    ):
+        self.threshold = threshold
+        self.capacity = capacity
+        self.vectorizer = vectorizer or NgramVectorizer()
+        self.path = path
+        self.name = name
+        self.stats = CacheStats()
+        self._matrix = np.zeros((min(capacity, 64), self.vectorizer.dim), dtype=np.float32)
+        self._last_used = np.zeros(self._matrix.shape[0], dtype=np.int64)
+        self._keys: List[str] = []
+        self._values: List[Any] = []
+        self._index: Dict[str, int] = {}
+        self._tick = 0
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def lookup(self, text: str, validate: Optional[Callable[[Any], bool]] = None) -> Optional[Tuple[Any, float]]:
+        """
+        回傳 (value, 相似度) 或 None。
+        validate 可進一步檢查候選值是否適用於此輸入（例如結果中的句子須出現在輸入裡）。
+        """
+        key = self.vectorizer.normalize(text)
+        row = self._index.get(key)
+        if row is not None:
+            score = 1.0
+        elif self._keys:
+            scores = self._matrix[:len(self._keys)] @ self.vectorizer.transform(text)
+            row = int(np.argmax(scores))
+            score = float(scores[row])
+        else:
+            score = 0.0
+        if row is None or score < self.threshold or (validate is not None and not validate(self._values[row])):
+            self.stats.misses += 1
+            metrics.inc("similarity_cache_total", cache=self.name, outcome="miss")
+            return None
+        self._touch(row)
+        self.stats.hits += 1
+        metrics.inc("similarity_cache_total", cache=self.name, outcome="hit")
+        return self._values[row], score
+
+    def add(self, text: str, value: Any) -> None:
+        key = self.vectorizer.normalize(text)
+        if not key:
+            return
+        row = self._index.get(key)
+        if row is None:
+            row = self._allocate()
+            self._matrix[row] = self.vectorizer.transform(text)
+            if row == len(self._keys):
+                self._keys.append(key)
+                self._values.append(value)
+            else:
+                del self._index[self._keys[row]]
+                self._keys[row] = key
+            self._index[key] = row
+        self._values[row] = value
+        self._touch(row)
+
+    def _allocate(self) -> int:
+        n = len(self._keys)
+        if n < self.capacity:
+            if n == self._matrix.shape[0]:
+                size = min(self.capacity, n * 2)
+                self._matrix = np.resize(self._matrix, (size, self.vectorizer.dim))
+                self._matrix[n:] = 0
+                self._last_used = np.resize(self._last_used, size)
+                self._last_used[n:] = 0
+            return n
+        self.stats.evictions += 1
+        return int(np.argmin(self._last_used[:n]))
+
+    def _touch(self, row: int) -> None:
+        self._tick += 1
+        self._last_used[row] = self._tick
+
+    def clear(self) -> None:
+        self._keys, self._values, self._index = [], [], {}
+        self._last_used[:] = 0
+        self._tick = 0
+
+    def save(self, path: Optional[str] = None) -> None:
+        """寫入 .npz（先寫暫存檔再 rename，避免中斷時留下損毀的檔案）"""
+        path = path or self.path
+        if not path:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        n = len(self._keys)
+        # 多個 worker process 可能同時存檔，暫存檔以 pid 區分
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(
+                f,
+                matrix=self._matrix[:n],
+                last_used=self._last_used[:n],
+                keys=np.array(self._keys, dtype=str),
+                values=np.array([json.dumps(v, ensure_ascii=False) for v in self._values], dtype=str),
+                dim=np.array(self.vectorizer.dim),
+                ngram_range=np.array(self.vectorizer.ngram_range),
+            )
+        os.replace(tmp, path)
+
+    def load(self, path: str) -> None:
+        """載入 save() 產生的檔案；向量化設定不同時忽略該檔案"""
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["dim"]) != self.vectorizer.dim or tuple(data["ngram_range"]) != self.vectorizer.ngram_range:
+                return
+            keys = [str(k) for k in data["keys"]][-self.capacity:]
+            values = [json.loads(str(v)) for v in data["values"]][-self.capacity:]
+            matrix = data["matrix"][-self.capacity:]
+            last_used = data["last_used"][-self.capacity:]
+        n = len(keys)
+        self._matrix = np.zeros((max(n, min(self.capacity, 64)), self.vectorizer.dim), dtype=np.float32)
+        self._matrix[:n] = matrix
+        self._last_used = np.zeros(self._matrix.shape[0], dtype=np.int64)
+        self._last_used[:n] = last_used
+        self._keys, self._values = keys, values
+        self._index = {k: i for i, k in enumerate(keys)}
+        self._tick = int(last_used.max()) if n else 0
+
+
+def build_similarity_cache(name: str, threshold: float) -> Optional[SimilarityCache]:
+    """依 config 建立工具用的近似重複快取；未啟用時回傳 None"""
+    if not SIMILARITY_CACHE_ENABLED:
+        return None
+    path = os.path.join(SIMILARITY_CACHE_DIR, f"{name}.npz") if SIMILARITY_CACHE_DIR else None
+    return SimilarityCache(threshold, path=path, name=name)
@@ -0,0 +1,163 @@
+import asyncio
+from contextvars import Context, copy_context
+from dataclasses import dataclass, asdict
+from typing import AsyncIterator, Awaitable, Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass
+class SingleFlightStats:
+    """leaders：實際送往後端的呼叫；followers：併入進行中呼叫的次數；abandoned：所有等待者都離開而取消的共用呼叫"""
+    leaders: int = 0
+    followers: int = 0
+    abandoned: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class _Flight(Generic[T]):
+    """一個進行中的共用呼叫與其等待者數；串流呼叫另帶共用輸出 broadcast"""
+
+    def __init__(self, key: str, task: "asyncio.Task[T]"):
+        self.key = key
+        self.task = task
+        self.waiters = 0
+        self.broadcast: Optional["_Broadcast"] = None
+
+
+class _Broadcast:
+    """串流呼叫的共用輸出：已收到的片段保留在 chunks，晚加入的訂閱者從頭重播"""
+
+    def __init__(self) -> None:
+        self.chunks: List[str] = []
+        self.closed = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+
+    def push(self, chunk: str) -> None:
+        self.chunks.append(chunk)
+        self._notify()
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        self.closed = True
+        self.error = error
+        self._notify()
+
+    def _notify(self) -> None:
+        # 喚醒目前所有等待者，之後的等待改用新的 Event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self) -> None:
+        await self._changed.wait()
+
+
+class SingleFlight:
+    """
+    進行中呼叫的合併（single-flight）：同一個 key 同時間只執行一次，
+    後到的呼叫者等待同一個結果，不另外送出請求。
+
+    - 共用呼叫以獨立 task 執行並以 asyncio.shield 等待，單一呼叫者被取消（例如客戶端斷線）不影響其他等待者
+    - 所有等待者都離開時才取消共用呼叫，避免後端繼續生成沒人要的結果
+    - 呼叫完成後即移除，不保留結果（結果重用由 LLMResponseCache 負責）
+    - 共用呼叫在 context() 建立的 context 中執行，而不是繼承 leader 的 context；
+      需要清除 leader 專屬的 contextvars（例如請求 deadline）時傳入自訂的 context，各等待者以 timeout 限制自己的等待
+    """
+
+    def __init__(self, context: Callable[[], Context] = copy_context) -> None:
+        self.stats = SingleFlightStats()
+        self._context = context
+        self._flights: Dict[str, _Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def _join(self, key: str, start: Callable[[], Awaitable]) -> Tuple[_Flight, bool]:
+        """回傳 (flight, 是否為 leader)；沒有進行中的呼叫時以 start() 建立"""
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _Flight(key, asyncio.get_running_loop().create_task(start(), context=self._context()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(flight))
+            self.stats.leaders += 1
+        else:
+            self.stats.followers += 1
+        flight.waiters += 1
+        return flight, leader
+
+    def _leave(self, flight: _Flight) -> None:
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.task.done():
+            # 先移除再取消，取消生效前到達的呼叫者會另起新的呼叫，而不是併入已取消的呼叫
+            self._forget(flight)
+            flight.task.cancel()
+            self.stats.abandoned += 1
+
+    def _forget(self, flight: _Flight) -> None:
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+        # 沒有人等待結果時取出例外，避免 "exception was never retrieved" 警告
+        if flight.task.done() and not flight.task.cancelled():
+            flight.task.exception()
+
+    async def do(
+        self, key: str, call: Callable[[], Awaitable[T]], timeout: Optional[float] = None
+    ) -> Tuple[T, bool]:
+        """
+        執行 call() 或加入同一個 key 進行中的呼叫，回傳 (結果, 是否為併入的呼叫)。
+        call 丟出的例外會傳給所有等待者；等待超過 timeout 秒時丟出 TimeoutError（只影響這個等待者）。
+        """
+        flight, leader = self._join(key, call)
+        try:
+            async with asyncio.timeout(timeout):
+                return await asyncio.shield(flight.task), not leader
+        finally:
+            self._leave(flight)
+
+    async def stream(
+        self,
+        key: str,
+        call: Callable[[], AsyncIterator[str]],
+        on_join: Optional[Callable[[bool], None]] = None,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[str]:
+        """
+        串流版 do：共用同一個上游串流，每個訂閱者都收到完整的片段序列（晚加入者先重播已收到的片段）。
+        on_join(是否為併入的呼叫) 在開始接收前呼叫一次；
+        從加入起算超過 timeout 秒仍在等待上游的片段時丟出 TimeoutError（只影響這個訂閱者）。
+        """
+        async def pump(broadcast: _Broadcast) -> None:
+            try:
+                async for chunk in call():
+                    broadcast.push(chunk)
+            except BaseException as e:
+                broadcast.close(e)
+                raise
+            broadcast.close()
+
+        created = _Broadcast()
+        expires = None if timeout is None else asyncio.get_running_loop().time() + timeout
+        flight, leader = self._join(key, lambda: pump(created))
+        if leader:
+            flight.broadcast = created
+        shared = flight.broadcast
+        if on_join is not None:
+            on_join(not leader)
+        try:
+            i = 0
+            while True:
+                while i < len(shared.chunks):
+                    yield shared.chunks[i]
+                    i += 1
+                if shared.closed:
+                    if shared.error is not None:
+                        raise shared.error
+                    return
+                # 逾時只包住等待上游的部分，不跨越 yield
+                async with asyncio.timeout_at(expires):
+                    await shared.wait()
+        finally:
+            self._leave(flight)
@@ -0,0 +1,80 @@
+import hmac
+from typing import Dict, List, Optional, Tuple
+
+from vanna.core.user import RequestContext, User, UserResolver
+
+from config import SERVER_API_TOKENS, SERVER_TRUST_USER_HEADER, SERVER_ALLOW_ANONYMOUS
+
+# 未指定群組的使用者只有一般權限；admin 必須在 token 或 X-User-Groups 中明確指定
+DEFAULT_GROUPS = ["user"]
+ANONYMOUS_GROUPS = ["anonymous"]
+
+
+class AuthenticationError(Exception):
+    """請求沒有可用的憑證（HTTP 服務回覆 401）"""
+
+
+def parse_api_tokens(spec: str) -> Dict[str, Tuple[str, List[str]]]:
+    """
+    解析 SERVER_API_TOKENS：token=user_id[:group1|group2]，多筆以逗號分隔。
+    未指定群組時為 DEFAULT_GROUPS。
+    """
+    tokens: Dict[str, Tuple[str, List[str]]] = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        token, sep, user = item.partition("=")
+        if not sep or not token.strip() or not user.strip():
+            raise ValueError(f"SERVER_API_TOKENS 格式錯誤: {item!r}（應為 token=user_id[:group1|group2]）")
+        user_id, _, groups = user.strip().partition(":")
+        tokens[token.strip()] = (user_id, [g for g in groups.split("|") if g] or list(DEFAULT_GROUPS))
+    return tokens
+
+
+class HeaderUserResolver(UserResolver):
+    """
+    依請求標頭解析使用者（取代固定回傳 demo 使用者的 SimpleUserResolver）：
+    1. Authorization: Bearer <token> → SERVER_API_TOKENS 對應的使用者
+    2. SERVER_TRUST_USER_HEADER 開啟時 → 上游 gateway 傳入的 X-User-Id / X-User-Groups
+    3. SERVER_ALLOW_ANONYMOUS 開啟時 → anonymous（群組為 ANONYMOUS_GROUPS）
+    以上皆不符合時丟出 AuthenticationError。
+    """
+
+    def __init__(
+        self,
+        tokens: Optional[Dict[str, Tuple[str, List[str]]]] = None,
+        trust_user_header: bool = SERVER_TRUST_USER_HEADER,
+        allow_anonymous: bool = SERVER_ALLOW_ANONYMOUS,
+    ):
+        self.tokens = parse_api_tokens(SERVER_API_TOKENS) if tokens is None else tokens
+        self.trust_user_header = trust_user_header
+        self.allow_anonymous = allow_anonymous
+        # 同一個 token 每次請求都回傳同一個 User，不重複建立 pydantic 物件
+        self._users: Dict[str, User] = {
+            token: User(id=user_id, username=user_id, group_memberships=groups)
+            for token, (user_id, groups) in self.tokens.items()
+        }
+
+    async def resolve_user(self, request_context: RequestContext) -> User:
+        headers = {k.lower(): v for k, v in request_context.headers.items()}
+        scheme, _, credential = headers.get("authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and credential.strip():
+            user = self._match_token(credential.strip())
+            if user is None:
+                raise AuthenticationError("invalid bearer token")
+            return user
+        user_id = headers.get("x-user-id", "").strip()
+        if self.trust_user_header and user_id:
+            groups = [g.strip() for g in headers.get("x-user-groups", "").split(",") if g.strip()]
+            return User(id=user_id, username=user_id, group_memberships=groups or list(DEFAULT_GROUPS))
+        if self.allow_anonymous:
+            return User(id="anonymous", username="anonymous", group_memberships=list(ANONYMOUS_GROUPS))
+        raise AuthenticationError("missing credentials")
+
+    def _match_token(self, credential: str) -> Optional[User]:
+        # 固定時間比較，避免以回應時間猜測 token
+        for token, user in self._users.items():
+            if hmac.compare_digest(token.encode("utf-8"), credential.encode("utf-8")):
+                return user
+        return None
@@ -0,0 +1,154 @@
+import asyncio
+import sqlite3
+import time
+from types import SimpleNamespace
+
+import pytest
+from vanna.core.tool import ToolContext
+from vanna.core.user import User
+
+from services import agent_memory
+from services.agent_memory import SQLiteAgentMemory
+
+DAY = 86400
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """以可手動推進的時鐘取代 services.agent_memory 的 time.time"""
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(
+        agent_memory, "time", SimpleNamespace(time=lambda: now[0], perf_counter=time.perf_counter)
+    )
+
+    def advance(seconds):
+        now[0] += seconds
+
+    return advance
+
+
+def _context(memory, conversation_id="c1", user_id="u1"):
+    return ToolContext(
+        user=User(id=user_id, group_memberships=["user"]),
+        conversation_id=conversation_id,
+        request_id="r1",
+        agent_memory=memory,
+    )
+
+
+def _rows(path, table="tool_memories"):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_each_conversation_keeps_only_its_latest_rows(tmp_path):
+    path = str(tmp_path / "memory" / "agent.sqlite3")
+
+    async def main():
+        memory = SQLiteAgentMemory(path, max_per_conversation=3)
+        a, b = _context(memory, "a"), _context(memory, "b")
+        for i in range(5):
+            await memory.save_tool_usage(f"q{i}", "run_sql", {"i": i}, a)
+        for i in range(2):
+            await memory.save_tool_usage(f"p{i}", "run_sql", {"i": i}, b)
+            await memory.save_text_memory(f"t{i}", b)
+        recent_a = await memory.get_recent_memories(a, limit=10)
+        recent_b = await memory.get_recent_memories(b, limit=10)
+        texts_b = await memory.get_recent_text_memories(b, limit=10)
+        await memory.aclose()
+        return recent_a, recent_b, texts_b
+
+    recent_a, recent_b, texts_b = asyncio.run(main())
+    assert [m.question for m in recent_a] == ["q4", "q3", "q2"]
+    assert recent_a[0].args == {"i": 4}
+    assert [m.question for m in recent_b] == ["p1", "p0"]
+    assert [m.content for m in texts_b] == ["t1", "t0"]
+    assert _rows(path) == 5
+
+
+def test_trim_spans_batches(tmp_path):
+    path = str(tmp_path / "agent.sqlite3")
+
+    async def main():
+        memory = SQLiteAgentMemory(path, max_per_conversation=2, batch_size=2, flush_interval=60)
+        context = _context(memory)
+        for i in range(5):
+            await memory.save_tool_usage(f"q{i}", "run_sql", {}, context)
+        recent = await memory.get_recent_memories(context)
+        await memory.aclose()
+        return recent
+
+    assert [m.question for m in asyncio.run(main())] == ["q4", "q3"]
+    assert _rows(path) == 2
+
+
+def test_retention_sweep_drops_expired_rows(tmp_path, clock):
+    path = str(tmp_path / "agent.sqlite3")
+
+    async def main():
+        memory = SQLiteAgentMemory(path, max_per_conversation=0, retention_days=1)
+        context, other = _context(memory), _context(memory, "c2", "u2")
+        await memory.save_tool_usage("old", "run_sql", {}, context)
+        await memory.save_text_memory("old", other)
+        await memory.flush()
+        clock(DAY - 1)
+        await memory.save_tool_usage("recent", "run_sql", {}, context)
+        await memory.flush()
+        before = (_rows(path), _rows(path, "text_memories"))
+        clock(2)
+        # 任何一次提交都會清除所有使用者與對話中過期的資料
+        await memory.save_tool_usage("new", "run_sql", {}, other)
+        recent = await memory.get_recent_memories(context)
+        await memory.aclose()
+        return before, recent
+
+    before, recent = asyncio.run(main())
+    assert before == (2, 1)
+    assert [m.question for m in recent] == ["recent"]
+    assert (_rows(path), _rows(path, "text_memories")) == (2, 0)
+
+
+def test_writes_are_committed_in_batched_transactions(tmp_path):
+    path = str(tmp_path / "agent.sqlite3")
+
+    async def main():
+        memory = SQLiteAgentMemory(path, batch_size=3, flush_interval=60)
+        statements = []
+        memory._conn.set_trace_callback(statements.append)
+        context = _context(memory)
+        await memory.save_tool_usage("q0", "run_sql", {}, context)
+        await memory.save_text_memory("t0", context)
+        pending = (_rows(path), _rows(path, "text_memories"))
+        # 第三筆達到 batch_size，三筆在同一個交易中提交
+        await memory.save_tool_usage("q1", "run_sql", {}, context)
+        committed = (_rows(path), _rows(path, "text_memories"))
+        transactions = statements.count("BEGIN IMMEDIATE")
+        await memory.aclose()
+        return pending, committed, transactions
+
+    assert asyncio.run(main()) == ((0, 0), (2, 1), 1)
+
+
+def test_pending_writes_are_flushed_after_interval_or_before_reads(tmp_path):
+    path = str(tmp_path / "agent.sqlite3")
+
+    async def main():
+        memory = SQLiteAgentMemory(path, flush_interval=0.02)
+        context = _context(memory)
+        await memory.save_tool_usage("q0", "run_sql", {}, context)
+        await asyncio.sleep(0.1)
+        after_interval = _rows(path)
+
+        memory.flush_interval = 60
+        await memory.save_tool_usage("q1", "run_sql", {}, context)
+        # 讀取前先提交佇列，讀得到剛寫入的資料
+        recent = await memory.get_recent_memories(context)
+        await memory.aclose()
+        return after_interval, recent
+
+    after_interval, recent = asyncio.run(main())
+    assert after_interval == 1
+    assert [m.question for m in recent] == ["q1", "q0"]
@@ -0,0 +1,175 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from benchmark.stub_server import LatencyModel, StubConfig, StubOpenAIServer
+from services import balancer
+from services.balancer import HEDGE_MIN_SAMPLES, Endpoint, EndpointPool
+from services.metrics import metrics
+from services.openai_client import OpenAIClient
+
+SYSTEM_PROMPT = "你是一個資料庫查詢意圖判斷助手。"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """以可手動推進的時鐘取代 services.balancer 的 time"""
+    now = [1000.0]
+    monkeypatch.setattr(balancer, "time", SimpleNamespace(monotonic=lambda: now[0]))
+
+    def advance(seconds):
+        now[0] += seconds
+
+    return advance
+
+
+def _pool(n=2, **kwargs):
+    http_client = httpx.AsyncClient()
+    endpoints = [Endpoint(f"http://replica{i}/v1", "m", "key", http_client) for i in range(n)]
+    return EndpointPool(endpoints, health_interval=0, **kwargs)
+
+
+def _fail(pool, endpoint, error=None):
+    pool.begin(endpoint)
+    pool.end(endpoint, error=error or httpx.ConnectError("connection refused"))
+
+
+def test_consecutive_failures_eject_then_recover(clock):
+    pool = _pool(eject_failures=2, eject_seconds=10, eject_max_seconds=25)
+    first, second = pool.endpoints
+    _fail(pool, first)
+    assert first.available(time.monotonic()) and first.stats.ejections == 0
+    _fail(pool, first)
+    assert first.stats.ejections == 1
+    # 剔除期間只路由到另一個端點
+    assert {pool.pick() for _ in range(4)} == {second}
+    clock(10)
+    assert {pool.pick() for _ in range(4)} == {first, second}
+
+    # 恢復後再次連續失敗：剔除時間加倍，且不超過上限
+    _fail(pool, first)
+    _fail(pool, first)
+    clock(19)
+    assert pool.pick(exclude=second, fallback=False) is None
+    clock(1)
+    assert pool.pick(exclude=second, fallback=False) is first
+    _fail(pool, first)
+    _fail(pool, first)
+    clock(24)
+    assert pool.pick(exclude=second, fallback=False) is None
+    clock(1)
+    assert pool.pick(exclude=second, fallback=False) is first
+
+    # 成功一次即重設剔除時間
+    pool.begin(first)
+    pool.end(first, latency=0.1, latency_key="k")
+    _fail(pool, first)
+    _fail(pool, first)
+    clock(10)
+    assert pool.pick(exclude=second, fallback=False) is first
+    assert (first.stats.failures, first.stats.ejections, first.outstanding) == (8, 4, 0)
+
+
+def test_request_errors_and_cancellation_do_not_eject(clock):
+    pool = _pool(eject_failures=1)
+    endpoint = pool.endpoints[0]
+    _fail(pool, endpoint, ValueError("bad request"))
+    pool.begin(endpoint)
+    pool.end(endpoint, cancelled=True)
+    assert endpoint.available(time.monotonic())
+    assert (endpoint.stats.failures, endpoint.stats.ejections) == (1, 0)
+
+
+def test_all_ejected_falls_back_to_earliest_recovery(clock):
+    pool = _pool(eject_failures=1, eject_seconds=10)
+    first, second = pool.endpoints
+    _fail(pool, second)
+    clock(5)
+    _fail(pool, first)
+    assert pool.pick(fallback=False) is None
+    assert pool.pick() is second
+
+
+def test_health_checks_eject_and_restore_endpoints():
+    async def main():
+        config = StubConfig(ttft=LatencyModel("fixed", 0.0), tokens_per_s=0)
+        async with StubOpenAIServer(config) as up, StubOpenAIServer(StubConfig(down=True)) as down:
+            async with httpx.AsyncClient() as http_client:
+                pool = EndpointPool.from_urls(
+                    [(up.base_url, "m"), (down.base_url, "m")], http_client, "key", health_interval=0.02
+                )
+                first, second = pool.endpoints
+                # 第一次路由時啟動背景健康檢查
+                pool.pick()
+                await asyncio.sleep(0.1)
+                ejected = (first.healthy, second.healthy, {pool.pick() for _ in range(4)} == {first})
+                down.config.down = False
+                await asyncio.sleep(0.1)
+                restored = (second.healthy, {pool.pick() for _ in range(4)} == {first, second})
+                await pool.aclose()
+                return ejected, restored, pool._health_task
+
+    assert asyncio.run(main()) == ((True, False, True), (True, True), None)
+
+
+def test_health_check_treats_connection_errors_as_unhealthy():
+    async def main():
+        async with httpx.AsyncClient() as http_client:
+            pool = EndpointPool.from_urls([("http://127.0.0.1:9/v1", "m")], http_client, "key", health_timeout=1)
+            return await pool.check(pool.endpoints[0]), pool.endpoints[0].healthy
+
+    assert asyncio.run(main()) == (False, False)
+
+
+def test_hedge_wins_and_cancels_the_slow_primary():
+    metrics.reset()
+
+    async def main():
+        slow = StubConfig(ttft=LatencyModel("fixed", 5000.0), tokens_per_s=0)
+        fast = StubConfig(ttft=LatencyModel("fixed", 0.0), tokens_per_s=0)
+        async with StubOpenAIServer(slow) as slow_stub, StubOpenAIServer(fast) as fast_stub:
+            llm = OpenAIClient(endpoints=[slow_stub.base_url, fast_stub.base_url], api_key="stub", model_name="stub-model")
+            llm.cache = None
+            llm.flights = None
+            pool = llm.pool
+            pool.hedge, pool.hedge_min_delay, pool.hedge_max_ratio, pool.health_interval = True, 0.05, 1.0, 0
+            # 同一種呼叫已有足夠的延遲樣本（p95 約 10ms）
+            for _ in range(HEDGE_MIN_SAMPLES):
+                pool.begin(pool.endpoints[1])
+                pool.end(pool.endpoints[1], 0.01, (SYSTEM_PROMPT, False))
+            try:
+                t0 = time.perf_counter()
+                content = await llm.chat(SYSTEM_PROMPT, "查詢 LTHDES101N 的溫度")
+                elapsed = time.perf_counter() - t0
+                # 讓被取消的 primary 完成清理
+                await asyncio.sleep(0.05)
+                return content, elapsed, pool.snapshot(), (slow_stub.requests, fast_stub.requests)
+            finally:
+                await llm.aclose()
+
+    content, elapsed, snapshot, requests = asyncio.run(main())
+    primary, backup = snapshot["endpoints"]
+    assert content and elapsed < 1.0
+    assert requests == (1, 1)
+    assert snapshot["hedges"] == 1
+    assert (backup["hedges_won"], backup["outstanding"]) == (1, 0)
+    # 被取消的 primary 不計入故障，也不影響健康狀態
+    assert (primary["outstanding"], primary["failures"], primary["ejected_for_s"]) == (0, 0, 0)
+    assert metrics.counter_value("llm_endpoint_requests_total", endpoint=primary["base_url"], outcome="cancelled") == 1
+    assert metrics.counter_value("llm_hedges_total", outcome="won") == 1
+
+
+def test_hedge_delay_requires_samples_and_respects_ratio():
+    pool = _pool(hedge=True, hedge_quantile=0.95, hedge_min_delay=0.01, hedge_max_ratio=0.1)
+    for i in range(HEDGE_MIN_SAMPLES - 1):
+        pool._record_latency("k", 0.1 + i / 1000)
+    pool.requests = 100
+    assert pool.hedge_delay("k") is None
+    pool._record_latency("k", 1.0)
+    assert pool.hedge_delay("k") == 1.0
+    assert pool.hedge_delay("other") is None
+    pool.hedges = 10
+    assert pool.hedge_delay("k") is None
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+from vanna import ToolResult
+
+from services.resilience import time_remaining
+from services.scheduler import PRIORITY_BATCH, current_priority
+from workflow.batch import BatchClassifier
+
+
+class _FakeSemanticTool:
+    """以文字結尾的數字作為處理毫秒數；記錄每次呼叫時的 deadline 與排程等級"""
+
+    def __init__(self):
+        self.calls = []
+        self.cancelled = 0
+        self.seen = []
+
+    async def execute(self, context, args):
+        self.calls.append(args.text)
+        self.seen.append((time_remaining(), current_priority()))
+        try:
+            await asyncio.sleep(int(args.text.rsplit("-", 1)[-1]) / 1000)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return ToolResult(success=True, result_for_llm="", metadata={"semantic_result": {"main_query": args.text}})
+
+
+class _FakeIntentTool:
+    async def execute(self, context, args):
+        return ToolResult(success=True, result_for_llm="", metadata={"main_query": args.query, "abcd": "A"})
+
+
+def _classifier(**kwargs):
+    return BatchClassifier(_FakeSemanticTool(), _FakeIntentTool(), **kwargs)
+
+
+def _run(classifier, inputs):
+    async def main():
+        return [record async for record in classifier.run(inputs)]
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("ordered, expected", [(True, [0, 1, 2]), (False, [2, 1, 0])])
+def test_output_order(ordered, expected):
+    classifier = _classifier(concurrency=3, ordered=ordered)
+    records = _run(classifier, ["a-60", "b-30", "c-1"])
+    assert [r["index"] for r in records] == expected
+    assert all(r["success"] and r["intent_result"]["abcd"] == "A" for r in records)
+    assert classifier.stats.total == 3
+
+
+def test_duplicates_share_in_flight_and_completed_results():
+    classifier = _classifier(concurrency=1)
+    # 視窗為 4 筆：最後的 a-5 在第一個 a-5 完成並輸出後才讀入
+    inputs = ["a-5", "a-5", "b-5", "c-5", "d-5", "e-5", "a-5"]
+    records = _run(classifier, inputs)
+    assert classifier.semantic_tool.calls == ["a-5", "b-5", "c-5", "d-5", "e-5"]
+    assert [r["duplicate"] for r in records] == [False, True, False, False, False, False, True]
+    assert records[-1]["semantic_result"] == records[0]["semantic_result"]
+    assert (classifier.stats.unique, classifier.stats.duplicates) == (5, 2)
+
+
+def test_completed_results_are_bounded_by_dedupe_max():
+    classifier = _classifier(concurrency=1, dedupe_max=1)
+    _run(classifier, ["a-1", "b-1", "c-1", "d-1", "e-1", "a-1", "e-1"])
+    # a 已被淘汰而重新分類，e 仍在保留範圍內
+    assert classifier.semantic_tool.calls == ["a-1", "b-1", "c-1", "d-1", "e-1", "a-1"]
+
+
+def test_breaking_early_cancels_pending_classifications():
+    classifier = _classifier(concurrency=4, ordered=False)
+
+    async def main():
+        run = classifier.run(["fast-1"] + [f"slow{i}-5000" for i in range(6)])
+        async for _ in run:
+            break
+        await run.aclose()
+        await asyncio.sleep(0)
+
+    asyncio.run(asyncio.wait_for(main(), 2))
+    # 已開始的慢速分類全部被取消（其餘尚在等待名額）
+    tool = classifier.semantic_tool
+    assert tool.calls[0] == "fast-1" and len(tool.calls) > 1
+    assert tool.cancelled == len(tool.calls) - 1
+
+
+def test_each_classification_runs_under_a_batch_deadline():
+    classifier = _classifier(concurrency=2, timeout=5.0)
+    _run(classifier, ["a-1", "b-1"])
+    assert len(classifier.semantic_tool.seen) == 2
+    for remaining, priority in classifier.semantic_tool.seen:
+        assert 4.0 < remaining <= 5.0
+        assert priority == PRIORITY_BATCH
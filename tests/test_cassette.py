@@ -0,0 +1,145 @@
+import asyncio
+import json
+
+import pytest
+
+from benchmark.stub_server import LatencyModel, StubConfig, StubOpenAIServer
+from services.cassette import (
+    CASSETTE_RECORD, CASSETTE_REPLAY, Cassette, CassetteMissError, build_cassette,
+)
+from services.openai_client import OpenAIClient
+
+STUB_CONFIG = StubConfig(ttft=LatencyModel("fixed", 0.0), tokens_per_s=0)
+
+
+def _client(base_url, cassette, model_name="stub-model", endpoints=None):
+    llm = OpenAIClient(
+        base_url=base_url, api_key="stub", model_name=model_name, endpoints=endpoints, cassette=cassette,
+    )
+    llm.cache = None
+    llm.flights = None
+    return llm
+
+
+async def _record(path, queries):
+    async with StubOpenAIServer(STUB_CONFIG) as stub:
+        llm = _client(stub.base_url, Cassette(path, CASSETTE_RECORD))
+        try:
+            replies = [await llm.chat("system", q) for q in queries]
+            chunks = [chunk async for chunk in llm.chat_stream("system", queries[0])]
+        finally:
+            await llm.aclose()
+    return replies, "".join(chunks)
+
+
+def test_replay_returns_recorded_responses_without_connecting(tmp_path):
+    path = str(tmp_path / "llm.jsonl")
+    queries = ["查詢 LTHDES101N 的溫度", "你好"]
+
+    async def main():
+        recorded = await _record(path, queries)
+        # 兩個端點都不存在：重播不應連線，也不應啟動健康檢查
+        endpoints = ["http://127.0.0.1:9/v1", "http://127.0.0.1:10/v1"]
+        cassette = Cassette(path, CASSETTE_REPLAY)
+        llm = _client(None, cassette, endpoints=endpoints)
+        try:
+            replies = [await llm.chat("system", q) for q in queries]
+            streamed = "".join([chunk async for chunk in llm.chat_stream("system", queries[0])])
+            health_task = llm.pool._health_task
+        finally:
+            await llm.aclose()
+        return recorded, (replies, streamed), health_task, cassette.stats.as_dict()
+
+    recorded, replayed, health_task, stats = asyncio.run(main())
+    assert replayed == recorded
+    assert health_task is None
+    assert stats == {"recorded": 0, "replayed": 3, "misses": 0}
+
+
+def test_replay_miss_raises(tmp_path):
+    path = tmp_path / "llm.jsonl"
+    path.write_text("", encoding="utf-8")
+
+    async def main():
+        llm = _client("http://127.0.0.1:9/v1", Cassette(str(path), CASSETTE_REPLAY))
+        try:
+            await llm.chat("system", "沒有錄製的請求")
+        finally:
+            await llm.aclose()
+
+    with pytest.raises(CassetteMissError):
+        asyncio.run(main())
+
+
+def test_build_cassette_shares_one_instance_per_path(tmp_path):
+    path = str(tmp_path / "llm.jsonl")
+    first = build_cassette(path, CASSETTE_RECORD)
+    assert build_cassette(str(tmp_path / "." / "llm.jsonl"), CASSETTE_RECORD) is first
+    assert build_cassette(str(tmp_path / "other.jsonl"), CASSETTE_RECORD) is not first
+    assert build_cassette(path, "") is None
+    with pytest.raises(ValueError):
+        build_cassette(path, CASSETTE_REPLAY)
+
+
+def test_clients_sharing_a_cassette_append_to_one_file(tmp_path):
+    path = str(tmp_path / "llm.jsonl")
+
+    async def main():
+        async with StubOpenAIServer(STUB_CONFIG) as stub:
+            small = _client(stub.base_url, build_cassette(path, CASSETTE_RECORD), model_name="small")
+            large = _client(stub.base_url, build_cassette(path, CASSETTE_RECORD), model_name="large")
+            try:
+                await small.chat("system", "查詢 A")
+                await large.chat("system", "查詢 B")
+                # 其中一個 client 先關閉，另一個仍可繼續錄製
+                await small.aclose()
+                await large.chat("system", "查詢 C")
+            finally:
+                await large.aclose()
+            return small.cassette is large.cassette
+
+    assert asyncio.run(main())
+    with open(path, "r", encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f]
+    assert len(entries) == 3
+    assert len({entry["k"] for entry in entries}) == 3
+
+
+def test_recording_is_written_in_the_background(tmp_path):
+    path = tmp_path / "tapes" / "llm.jsonl"
+
+    async def main():
+        cassette = Cassette(str(path), CASSETTE_RECORD, flush_interval=60)
+        async with StubOpenAIServer(STUB_CONFIG) as stub:
+            llm = _client(stub.base_url, cassette)
+            try:
+                for i in range(3):
+                    await llm.chat("system", f"查詢 {i}")
+                # 錄製不在 event loop 上寫檔：關閉前檔案尚未建立
+                before = path.exists()
+            finally:
+                await llm.aclose()
+        return before
+
+    assert asyncio.run(main()) is False
+    with open(path, "r", encoding="utf-8") as f:
+        assert len(f.readlines()) == 3
+
+
+def test_batches_keep_recording_order(tmp_path):
+    path = str(tmp_path / "llm.jsonl")
+    cassette = Cassette(path, CASSETTE_RECORD, flush_interval=0)
+
+    async def main():
+        for i in range(20):
+            cassette.record_stream(f"k{i}", 0.0, 0.0, [str(i)], None)
+            if i % 3 == 0:
+                await asyncio.sleep(0)
+        await cassette.aclose()
+
+    asyncio.run(main())
+    # 沒有 event loop 時直接寫入
+    cassette.record_stream("sync", 0.0, 0.0, [], None)
+    with open(path, "r", encoding="utf-8") as f:
+        keys = [json.loads(line)["k"] for line in f]
+    assert keys == [f"k{i}" for i in range(20)] + ["sync"]
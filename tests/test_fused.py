@@ -0,0 +1,100 @@
+import asyncio
+import json
+
+import pytest
+
+from services.similarity_cache import SimilarityCache
+from tool.fused import FusedClassificationTool
+from tool.intent import IntentClassifierTool
+from tool.semantic import SemanticAnalysisTool
+
+TEXT = "你好，查詢 LTHDES101N 的溫度，用折線圖呈現"
+MAIN_QUERY = "查詢 LTHDES101N 的溫度"
+
+
+class _FakeLLM:
+    """每次呼叫都回傳同一段輸出，並記錄呼叫次數"""
+
+    def __init__(self, output: str):
+        self.output = output
+        self.calls = 0
+
+    async def chat(self, system_prompt, user_prompt, **kwargs):
+        self.calls += 1
+        return self.output
+
+
+def _output(intent, **extra):
+    return json.dumps({
+        "sentences": [
+            {"text": "你好", "label": "greeting"},
+            {"text": MAIN_QUERY, "label": "main_query"},
+            {"text": "用折線圖呈現", "label": "presentation"},
+        ],
+        "main_query": MAIN_QUERY,
+        "greeting": "你好",
+        "presentation": "用折線圖呈現",
+        **extra,
+        "intent": intent,
+    }, ensure_ascii=False)
+
+
+def _fused(output):
+    llm = _FakeLLM(output)
+    semantic_tool = SemanticAnalysisTool(llm=object(), similarity_cache=SimilarityCache(threshold=0.9))
+    intent_tool = IntentClassifierTool(llm=object(), similarity_cache=SimilarityCache(threshold=0.9))
+    return FusedClassificationTool(semantic_tool, intent_tool, llm=llm), llm
+
+
+@pytest.mark.parametrize("output", [
+    _output("A"),
+    _output(" a "),
+    # 單引號等需修補的輸出也從修補後的結果取 intent
+    _output("A").replace('"', "'"),
+])
+def test_intent_is_read_from_the_parsed_output(output):
+    fused, _ = _fused(output)
+    semantic_result, intent_result = asyncio.run(fused.classify(TEXT))
+    assert semantic_result.success
+    assert semantic_result.metadata["semantic_result"]["main_query"] == MAIN_QUERY
+    assert intent_result.metadata["main_query"] == MAIN_QUERY
+    assert intent_result.metadata["abcd"] == "A"
+
+
+@pytest.mark.parametrize("output", [
+    _output(None),
+    _output("E"),
+    _output(["A"]),
+    # 巢狀物件中的 intent 不算數
+    _output(None, notes={"intent": "A"}),
+])
+def test_missing_or_invalid_intent_falls_back(output):
+    fused, _ = _fused(output)
+    semantic_result, intent_result = asyncio.run(fused.classify(TEXT))
+    assert semantic_result.success
+    assert intent_result is None
+
+
+def test_unparseable_output_is_a_semantic_parse_error():
+    fused, _ = _fused("抱歉，我無法回答")
+    semantic_result, intent_result = asyncio.run(fused.classify(TEXT))
+    assert semantic_result.metadata["error_type"] == "semantic_parse_error"
+    assert intent_result is None
+    assert len(fused.semantic_tool.similarity_cache) == 0
+
+
+def test_results_are_written_back_to_both_caches():
+    fused, llm = _fused(_output("B"))
+
+    async def main():
+        first = await fused.classify(TEXT)
+        second = await fused.classify(TEXT)
+        return first, second
+
+    (semantic_result, _), (cached_semantic, cached_intent) = asyncio.run(main())
+    # 第二次由語意快取命中，不再呼叫 LLM；intent 交由 IntentClassifierTool 的快取
+    assert llm.calls == 1
+    assert cached_intent is None
+    assert cached_semantic.metadata["semantic_result"] == semantic_result.metadata["semantic_result"]
+    hit = fused.intent_tool.cached_result(MAIN_QUERY)
+    assert hit is not None and hit.metadata["abcd"] == "B"
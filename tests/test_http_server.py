@@ -0,0 +1,139 @@
+import asyncio
+import json
+
+import pytest
+
+from services.http_server import HTTPServer, Request, StreamResponse, json_response
+
+
+async def _echo(request: Request):
+    if request.path == "/stream":
+        async def chunks():
+            for part in (b"a", b"", b"bc"):
+                yield part
+        return StreamResponse(chunks(), headers={"Content-Type": "text/plain"})
+    if request.path == "/broken":
+        async def chunks():
+            yield b"a"
+            raise RuntimeError("generator failed")
+        return StreamResponse(chunks(), headers={"Content-Type": "text/plain"})
+    return json_response({"method": request.method, "query": request.query, "body": request.body.decode()})
+
+
+async def _read_response(reader: asyncio.StreamReader):
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+    status = int(head.split(" ", 2)[1])
+    headers = {}
+    for line in head.split("\r\n")[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    if headers.get("transfer-encoding") == "chunked":
+        body = b""
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            chunk = await reader.readexactly(size + 2)
+            if size == 0:
+                break
+            body += chunk[:-2]
+    else:
+        body = await reader.readexactly(int(headers.get("content-length", "0")))
+    return status, headers, body
+
+
+def _exchange(raw_requests, max_body_bytes=1024):
+    """對 in-process server 送出原始請求位元組，回傳讀到的回應"""
+    async def main():
+        server = await HTTPServer(_echo, max_body_bytes=max_body_bytes).start()
+        try:
+            reader, writer = await asyncio.open_connection(server.host, server.port)
+            writer.write(b"".join(raw_requests))
+            await writer.drain()
+            results = [await _read_response(reader) for _ in raw_requests]
+            writer.close()
+            await writer.wait_closed()
+            return results
+        finally:
+            await server.close(grace=1.0)
+
+    return asyncio.run(main())
+
+
+def _post(body: bytes, length_header: str = None) -> bytes:
+    length = f"Content-Length: {len(body) if length_header is None else length_header}\r\n"
+    return b"POST /echo?x=1 HTTP/1.1\r\nHost: test\r\n" + length.encode("latin-1") + b"\r\n" + body
+
+
+def test_post_body_and_keep_alive():
+    results = _exchange([_post(b'{"query": 1}'), b"GET /echo HTTP/1.1\r\nHost: test\r\n\r\n"])
+    assert [status for status, _, _ in results] == [200, 200]
+    first = json.loads(results[0][2])
+    assert first == {"method": "POST", "query": {"x": "1"}, "body": '{"query": 1}'}
+    assert results[0][1]["connection"] == "keep-alive"
+    assert json.loads(results[1][2])["method"] == "GET"
+
+
+def test_chunked_stream_response():
+    [(status, headers, body)] = _exchange([b"GET /stream HTTP/1.1\r\nHost: test\r\n\r\n"])
+    assert (status, headers["transfer-encoding"], body) == (200, "chunked", b"abc")
+
+
+@pytest.mark.parametrize("value", ["abc", "-1", "+5", "1_0", " ", "0x10", "１２"])
+def test_malformed_content_length_is_rejected(value):
+    [(status, headers, body)] = _exchange([_post(b"", value.encode("utf-8").decode("latin-1"))])
+    assert status == 400
+    assert headers["connection"] == "close"
+    assert "content-length" in json.loads(body)["error"]["message"]
+
+
+def test_body_over_limit_is_rejected():
+    [(status, _, _)] = _exchange([_post(b"x" * 11)], max_body_bytes=10)
+    assert status == 413
+    [(status, _, _)] = _exchange([_post(b"x" * 10)], max_body_bytes=10)
+    assert status == 200
+
+
+def test_conflicting_content_length_is_rejected():
+    raw = b"POST /echo HTTP/1.1\r\nContent-Length: 1\r\nContent-Length: 2\r\n\r\nxy"
+    [(status, _, _)] = _exchange([raw])
+    assert status == 400
+
+
+def test_transfer_encoding_request_is_rejected():
+    raw = b"POST /echo HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n1\r\nx\r\n0\r\n\r\n"
+    [(status, _, _)] = _exchange([raw])
+    assert status == 400
+
+
+def test_failing_stream_aborts_the_connection(caplog):
+    async def main():
+        loop = asyncio.get_running_loop()
+        unhandled = []
+        loop.set_exception_handler(lambda _, context: unhandled.append(context))
+        server = await HTTPServer(_echo).start()
+        try:
+            reader, writer = await asyncio.open_connection(server.host, server.port)
+            writer.write(b"GET /broken HTTP/1.1\r\nHost: test\r\n\r\n")
+            # 讀到連線中斷為止
+            broken = await reader.read()
+            writer.close()
+            # server 仍可處理其他連線
+            reader, writer = await asyncio.open_connection(server.host, server.port)
+            writer.write(b"GET /stream HTTP/1.1\r\nHost: test\r\n\r\n")
+            after = await _read_response(reader)
+            writer.close()
+        finally:
+            await server.close(grace=1.0)
+        return broken, after, unhandled
+
+    broken, (status, _, body), unhandled = asyncio.run(main())
+    # 已送出的片段之後沒有結尾的 0 chunk
+    assert broken.endswith(b"\r\n\r\n1\r\na\r\n")
+    assert (status, body) == (200, b"abc")
+    assert unhandled == []
+    assert "stream response failed" in caplog.text
+
+
+def test_malformed_request_line_is_rejected():
+    [(status, _, _)] = _exchange([b"GARBAGE\r\n\r\n"])
+    assert status == 400
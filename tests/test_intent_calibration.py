@@ -0,0 +1,70 @@
+import asyncio
+import math
+
+import pytest
+
+from tool.intent import IntentClassifierTool, calibrate_logprobs
+from tool.intent.tool import INTENT_MODE_LOGPROBS
+
+
+def test_token_variants_are_merged_with_log_sum_exp():
+    probs = calibrate_logprobs({"A": math.log(0.3), " A": math.log(0.2), "a": math.log(0.1), "B": math.log(0.4)})
+    # A 的三個變體合計 0.6，B 為 0.4；C / D 不在 top logprobs 中
+    assert probs == pytest.approx({"A": 0.6, "B": 0.4, "C": 0.0, "D": 0.0})
+
+
+def test_merge_is_stable_for_very_small_logprobs():
+    probs = calibrate_logprobs({"A": -1000.0, " A": -1000.0, "B": -1000.0 + math.log(2)})
+    assert probs == pytest.approx({"A": 0.5, "B": 0.5, "C": 0.0, "D": 0.0})
+
+
+def test_non_label_tokens_are_ignored_and_result_is_renormalized():
+    probs = calibrate_logprobs({"A": math.log(0.2), "C": math.log(0.2), "Hello": math.log(0.5), "AB": math.log(0.1)})
+    assert probs == pytest.approx({"A": 0.5, "B": 0.0, "C": 0.5, "D": 0.0})
+
+
+def test_temperature_scaling():
+    logprobs = {"A": math.log(0.8), "B": math.log(0.2)}
+    assert calibrate_logprobs(logprobs, 1.0)["A"] == pytest.approx(0.8)
+    # T=2：機率正比於 p^(1/2)，分佈變平
+    assert calibrate_logprobs(logprobs, 2.0)["A"] == pytest.approx(math.sqrt(0.8) / (math.sqrt(0.8) + math.sqrt(0.2)))
+    # T=0.5：機率正比於 p^2，分佈變尖
+    assert calibrate_logprobs(logprobs, 0.5)["A"] == pytest.approx(0.64 / (0.64 + 0.04))
+    # 不合法的 temperature 視為 1
+    assert calibrate_logprobs(logprobs, 0)["A"] == pytest.approx(0.8)
+
+
+@pytest.mark.parametrize("logprobs", [{}, {"Hello": -0.1, "The": -2.0}, {" ": -0.5}])
+def test_no_label_token_returns_empty(logprobs):
+    assert calibrate_logprobs(logprobs) == {}
+
+
+class _FakeLLM:
+    def __init__(self, output, logprobs):
+        self.output = output
+        self.logprobs = logprobs
+
+    async def chat_logprobs(self, system_prompt, user_prompt, top_logprobs=5, timeout=None):
+        return self.output, self.logprobs
+
+    async def chat(self, system_prompt, user_prompt, **kwargs):
+        return self.output
+
+
+def _classify(output, logprobs):
+    tool = IntentClassifierTool(llm=_FakeLLM(output, logprobs), mode=INTENT_MODE_LOGPROBS, similarity_cache=None)
+    tool.cascade_llm = None
+    tool.similarity_cache = None
+    return asyncio.run(tool._classify("查詢 LTHDES101N 的溫度")).metadata
+
+
+def test_tool_falls_back_to_the_output_text_without_label_logprobs():
+    metadata = _classify("B", {"Hello": -0.1})
+    assert (metadata["abcd"], metadata["probabilities"], metadata["confidence"]) == ("B", None, None)
+    assert _classify("嗯", {"Hello": -0.1})["abcd"] == "D"
+
+
+def test_tool_uses_calibrated_probabilities():
+    metadata = _classify("A", {"A": math.log(0.9), "B": math.log(0.1)})
+    assert metadata["abcd"] == "A"
+    assert metadata["confidence"] == pytest.approx(metadata["probabilities"]["A"])
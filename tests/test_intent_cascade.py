@@ -0,0 +1,106 @@
+import asyncio
+import math
+
+import pytest
+
+from services.resilience import LLMTimeoutError
+from tool.intent import IntentClassifierTool, IntentInput
+from tool.intent.tool import INTENT_MODE_GENERATE, INTENT_MODE_LOGPROBS, TIER_LARGE, TIER_SMALL
+
+MAIN_QUERY = "查詢 LTHDES101N 的溫度"
+
+
+class _FakeLLM:
+    """回傳固定的輸出與 logprobs（或丟出指定的錯誤），並記錄呼叫次數"""
+
+    def __init__(self, output="B", logprobs=None, error=None):
+        self.output = output
+        self.logprobs = logprobs if logprobs is not None else {"B": math.log(0.9), "C": math.log(0.1)}
+        self.error = error
+        self.calls = 0
+
+    async def chat_logprobs(self, system_prompt, user_prompt, top_logprobs=5, timeout=None):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return self.output, self.logprobs
+
+    async def chat(self, system_prompt, user_prompt, **kwargs):
+        self.calls += 1
+        return self.output
+
+
+def _tool(small, large=None, mode=INTENT_MODE_GENERATE, threshold=0.8):
+    tool = IntentClassifierTool(llm=large or _FakeLLM(), mode=mode, cascade_llm=small, cascade_threshold=threshold)
+    tool.similarity_cache = None
+    return tool
+
+
+def _classify(tool, text=MAIN_QUERY):
+    return asyncio.run(tool.execute(None, IntentInput(query=text))).metadata
+
+
+def test_confident_small_model_answers_without_escalation():
+    small = _FakeLLM("A", {"A": math.log(0.9), " a": math.log(0.05), "B": math.log(0.05)})
+    tool = _tool(small)
+    metadata = _classify(tool)
+    assert (metadata["abcd"], metadata["tier"]) == ("A", TIER_SMALL)
+    assert metadata["confidence"] == pytest.approx(0.95)
+    assert (small.calls, tool.llm.calls) == (1, 0)
+    assert tool.cascade_stats()["small_hit_rate"] == 1.0
+
+
+@pytest.mark.parametrize("small, reason", [
+    (_FakeLLM("A", {"A": math.log(0.6), "B": math.log(0.4)}), "low_confidence"),
+    # 輸出不是 A/B/C/D，或 top logprobs 中沒有任何 A/B/C/D token
+    (_FakeLLM("Hello", {"Hello": math.log(0.9), "A": math.log(0.1)}), "malformed"),
+    (_FakeLLM("A", {"Hello": -0.1}), "malformed"),
+    (_FakeLLM(error=LLMTimeoutError("small model timed out")), "error"),
+])
+def test_small_model_escalates_to_the_large_model(small, reason):
+    tool = _tool(small)
+    metadata = _classify(tool)
+    assert (metadata["abcd"], metadata["tier"], metadata["raw_response"]) == ("B", TIER_LARGE, "B")
+    assert (small.calls, tool.llm.calls) == (1, 1)
+    stats = tool.cascade_stats()
+    assert stats["escalated_by_reason"] == {reason: 1}
+    assert (stats["total"], stats["escalation_rate"]) == (1, 1.0)
+
+
+def test_escalation_uses_the_large_model_logprobs():
+    small = _FakeLLM("A", {"A": math.log(0.5), "D": math.log(0.5)})
+    tool = _tool(small, mode=INTENT_MODE_LOGPROBS)
+    metadata = _classify(tool)
+    assert (metadata["abcd"], metadata["tier"]) == ("B", TIER_LARGE)
+    assert metadata["probabilities"] == pytest.approx({"A": 0.0, "B": 0.9, "C": 0.1, "D": 0.0})
+
+
+def test_threshold_boundary_is_accepted():
+    tool = _tool(_FakeLLM("A", {"A": math.log(0.8), "B": math.log(0.2)}))
+    assert _classify(tool)["tier"] == TIER_SMALL
+    tool.cascade_threshold = 0.81
+    assert _classify(tool)["tier"] == TIER_LARGE
+
+
+def test_large_model_failure_is_reported_as_an_error():
+    tool = _tool(
+        _FakeLLM("A", {"A": math.log(0.5), "B": math.log(0.5)}),
+        large=_FakeLLM(error=LLMTimeoutError("large model timed out")),
+        mode=INTENT_MODE_LOGPROBS,
+    )
+    result = asyncio.run(tool.execute(None, IntentInput(query=MAIN_QUERY)))
+    assert not result.success
+    assert result.metadata["error_type"] == "llm_timeout"
+
+
+def test_cascade_stats_over_mixed_traffic():
+    small = _FakeLLM("A", {"A": math.log(0.9), "B": math.log(0.1)})
+    tool = _tool(small)
+    for i in range(3):
+        _classify(tool, f"{MAIN_QUERY} {i}")
+    small.logprobs = {"A": math.log(0.5), "B": math.log(0.5)}
+    _classify(tool)
+    stats = tool.cascade_stats()
+    assert (stats["total"], stats["small_hit_rate"], stats["escalation_rate"]) == (4, 0.75, 0.25)
+    assert stats["escalated_by_reason"] == {"low_confidence": 1}
+    assert (small.calls, tool.llm.calls) == (4, 1)
@@ -0,0 +1,179 @@
+import asyncio
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+from benchmark.stub_server import LatencyModel, StubConfig, StubOpenAIServer
+from services import llm_cache
+from services.llm_cache import LLMResponseCache, MemoryLRUCache, SQLiteCache
+from services.metrics import metrics
+from services.openai_client import OpenAIClient
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """以可手動推進的時鐘取代 services.llm_cache 的 time（monotonic 與 time 同步推進）"""
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache, "time", SimpleNamespace(monotonic=lambda: now[0], time=lambda: now[0]))
+
+    def advance(seconds):
+        now[0] += seconds
+
+    return advance
+
+
+# ---------------- key ----------------
+
+def test_key_covers_model_prompts_temperature_and_extra():
+    key = LLMResponseCache.make_key("m", "system", "user", 0.0)
+    assert key == LLMResponseCache.make_key("m", "system", "user", 0.0)
+    assert len(key) == 64
+    variants = [
+        LLMResponseCache.make_key("other", "system", "user", 0.0),
+        LLMResponseCache.make_key("m", "system2", "user", 0.0),
+        LLMResponseCache.make_key("m", "system", "user2", 0.0),
+        LLMResponseCache.make_key("m", "system", "user", 0.5),
+        LLMResponseCache.make_key("m", "system", "user", 0.0, "logprobs", 5),
+        # 欄位邊界不可因串接而混淆
+        LLMResponseCache.make_key("m", "sys", "temuser", 0.0),
+    ]
+    assert key not in variants
+    assert len(set(variants)) == len(variants)
+
+
+# ---------------- 記憶體層 ----------------
+
+def test_memory_lru_is_bounded_by_bytes(clock):
+    cache = MemoryLRUCache(max_bytes=30, ttl=None)
+    cache.set("a", "x" * 9)
+    cache.set("b", "x" * 9)
+    cache.set("c", "x" * 9)
+    assert cache.get("a") == "x" * 9
+    cache.set("d", "x" * 9)
+    # b 最久未使用，被淘汰
+    assert cache.get("b") is None
+    assert [cache.get(k) is not None for k in ("a", "c", "d")] == [True, True, True]
+    assert cache.size_bytes == 30
+    assert cache.stats.evictions == 1
+    # 單筆超過容量時不寫入
+    cache.set("e", "x" * 40)
+    assert cache.get("e") is None
+    assert len(cache) == 3
+
+
+def test_memory_entries_expire_after_ttl(clock):
+    cache = MemoryLRUCache(max_bytes=1024, ttl=10)
+    cache.set("k", "v")
+    clock(9)
+    assert cache.get("k") == "v"
+    clock(1)
+    assert cache.get("k") is None
+    assert (len(cache), cache.size_bytes) == (0, 0)
+    assert cache.stats.as_dict() == {"hits": 1, "misses": 1, "evictions": 0, "expirations": 1}
+
+
+# ---------------- SQLite 層 ----------------
+
+def test_sqlite_persists_across_instances_and_expires(tmp_path, clock):
+    path = str(tmp_path / "cache" / "llm.sqlite3")
+    cache = SQLiteCache(path, ttl=10)
+    cache.set("k", "v")
+    cache.close()
+    cache = SQLiteCache(path, ttl=10)
+    assert cache.get("k") == "v"
+    clock(10)
+    assert cache.get("k") is None
+    assert len(cache) == 0
+    assert cache.stats.expirations == 1
+    cache.close()
+
+
+def test_sqlite_prune_drops_expired_then_oldest_rows(tmp_path, clock):
+    cache = SQLiteCache(str(tmp_path / "llm.sqlite3"), ttl=10, max_rows=3, prune_interval=3600)
+    cache.set_many([("old1", "v"), ("old2", "v")])
+    clock(5)
+    cache.set_many([(f"k{i}", "v") for i in range(4)])
+    # 覆寫的資料視為最新寫入
+    cache.set("k0", "v2")
+    assert len(cache) == 6
+    clock(5)
+    assert cache.prune() == 3
+    assert len(cache) == 3
+    assert [cache.get(k) for k in ("k0", "k1", "k2", "k3")] == ["v2", None, "v", "v"]
+    assert (cache.stats.expirations, cache.stats.evictions) == (2, 1)
+    cache.close()
+
+
+def test_sqlite_prunes_on_write_every_interval(tmp_path, clock):
+    cache = SQLiteCache(str(tmp_path / "llm.sqlite3"), ttl=None, max_rows=2, prune_interval=60)
+    cache.set_many([(f"k{i}", "v") for i in range(3)])
+    # 第一次寫入即清除
+    assert len(cache) == 2
+    cache.set("k3", "v")
+    assert len(cache) == 3
+    clock(60)
+    cache.set("k4", "v")
+    assert len(cache) == 2
+    assert cache.get("k4") == "v"
+    cache.close()
+
+
+# ---------------- 兩層快取 ----------------
+
+def test_tiered_cache_writes_in_background_and_backfills_memory(tmp_path):
+    path = str(tmp_path / "llm.sqlite3")
+
+    async def main():
+        cache = LLMResponseCache(MemoryLRUCache(), SQLiteCache(path))
+        cache.set("k", "v")
+        # 寫入尚在佇列中時仍可從第一層讀到
+        before = sqlite3.connect(path).execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        assert await cache.aget("k") == "v"
+        await cache.aclose()
+        assert cache.persistent is None
+
+        reopened = LLMResponseCache(MemoryLRUCache(), SQLiteCache(path))
+        value = await reopened.aget("k")
+        memory_value = reopened.memory.get("k")
+        await reopened.aclose()
+        return before, value, memory_value
+
+    assert asyncio.run(main()) == (0, "v", "v")
+
+
+def test_cache_outcomes_are_exported_as_counters(tmp_path):
+    metrics.reset()
+    cache = LLMResponseCache(MemoryLRUCache(max_bytes=1024), SQLiteCache(str(tmp_path / "llm.sqlite3")))
+    cache.set("k", "v")
+    cache.memory.clear()
+    assert cache.get("k") == "v"
+    assert cache.get("missing") is None
+    cache.close()
+    assert metrics.counter_value("llm_cache_lookups_total", tier="memory", outcome="miss") == 2
+    assert metrics.counter_value("llm_cache_lookups_total", tier="sqlite", outcome="hit") == 1
+    assert metrics.counter_value("llm_cache_lookups_total", tier="sqlite", outcome="miss") == 1
+
+
+def test_client_serves_repeats_from_cache_and_closes_it(tmp_path):
+    path = str(tmp_path / "llm.sqlite3")
+
+    async def main():
+        config = StubConfig(ttft=LatencyModel("fixed", 0.0), tokens_per_s=0)
+        async with StubOpenAIServer(config) as stub:
+            cache = LLMResponseCache(MemoryLRUCache(), SQLiteCache(path))
+            llm = OpenAIClient(base_url=stub.base_url, api_key="stub", model_name="stub-model")
+            # 不論 config 的 temperature 為何都啟用快取
+            llm.temperature = 0
+            llm.cache = cache
+            try:
+                first = await llm.chat("system", "查詢溫度")
+                second = await llm.chat("system", "查詢溫度")
+            finally:
+                await llm.aclose()
+            return first, second, stub.requests, cache.persistent
+
+    first, second, requests, persistent = asyncio.run(main())
+    assert (second, requests, persistent) == (first, 1, None)
+    rows = sqlite3.connect(path).execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+    assert rows == 1
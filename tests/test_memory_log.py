@@ -0,0 +1,120 @@
+import asyncio
+import os
+
+import pytest
+
+from services.memory_log import MemoryLogWriter, tail_file
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("n", [0, 1, 3, 5, 10])
+def test_tail_file_reads_last_lines(tmp_path, monkeypatch, n):
+    # 以很小的區塊讀取，確保跨區塊的行也能正確組合
+    monkeypatch.setattr("services.memory_log._TAIL_BLOCK", 4)
+    path = tmp_path / "memory.log"
+    lines = [f"第{i}行\n" for i in range(5)]
+    path.write_text("".join(lines), encoding="utf-8")
+    assert tail_file(str(path), n) == (lines[-n:] if n else [])
+
+
+def test_ring_buffer_keeps_only_recent_lines(tmp_path):
+    path = str(tmp_path / "logs" / "memory.log")
+    # 沒有 event loop 時每次 write 直接寫檔
+    writer = MemoryLogWriter(path, recent=3, max_bytes=0)
+    for i in range(5):
+        writer.write(f"line{i}")
+    assert list(writer._recent) == ["line2\n", "line3\n", "line4\n"]
+    assert writer.tail(2) == ["line3\n", "line4\n"]
+    # 超過 ring buffer 容量時改從檔尾讀取
+    assert writer.tail(5) == [f"line{i}\n" for i in range(5)]
+    assert writer.tail(10) == [f"line{i}\n" for i in range(5)]
+    # 重新開啟時以檔尾內容填入 ring buffer
+    assert MemoryLogWriter(path, recent=3).tail(3) == ["line2\n", "line3\n", "line4\n"]
+
+
+def test_tail_beyond_ring_buffer_includes_unflushed_lines(tmp_path):
+    path = str(tmp_path / "memory.log")
+
+    async def main():
+        writer = MemoryLogWriter(path, recent=2, flush_bytes=1 << 20, flush_interval=60)
+        for i in range(4):
+            writer.write(f"line{i}")
+        on_disk = os.path.exists(path)
+        lines = writer.tail(4)
+        await writer.aclose()
+        return on_disk, lines
+
+    assert asyncio.run(main()) == (False, [f"line{i}\n" for i in range(4)])
+    assert _read(path) == "".join(f"line{i}\n" for i in range(4))
+
+
+def test_flush_is_batched_by_bytes(tmp_path):
+    path = str(tmp_path / "memory.log")
+
+    async def main():
+        writer = MemoryLogWriter(path, flush_bytes=10, flush_interval=60)
+        writer.write("1234")
+        await asyncio.sleep(0.05)
+        before = os.path.exists(path)
+        # 累積 10 bytes 後喚醒背景 task 一次寫入
+        writer.write("5678")
+        await asyncio.sleep(0.05)
+        after = _read(path)
+        await writer.aclose()
+        return before, after
+
+    assert asyncio.run(main()) == (False, "1234\n5678\n")
+
+
+def test_flush_is_batched_by_interval(tmp_path):
+    path = str(tmp_path / "memory.log")
+
+    async def main():
+        writer = MemoryLogWriter(path, flush_bytes=1 << 20, flush_interval=0.05)
+        writer.write("a")
+        writer.write("b")
+        before = os.path.exists(path)
+        await asyncio.sleep(0.2)
+        after = _read(path)
+        await writer.aclose()
+        return before, after
+
+    assert asyncio.run(main()) == (False, "a\nb\n")
+
+
+def test_aclose_flushes_pending_and_ignores_later_writes(tmp_path):
+    path = str(tmp_path / "memory.log")
+
+    async def main():
+        writer = MemoryLogWriter(path, flush_bytes=1 << 20, flush_interval=60)
+        writer.write("a")
+        await writer.aclose()
+        writer.write("b")
+        return writer._flusher
+
+    assert asyncio.run(main()) is None
+    assert _read(path) == "a\n"
+
+
+def test_rotation_keeps_backup_count_files(tmp_path):
+    path = str(tmp_path / "memory.log")
+    writer = MemoryLogWriter(path, max_bytes=10, backup_count=2)
+    for i in range(7):
+        writer.write(f"l{i}xx")
+    assert _read(path) == "l6xx\n"
+    assert _read(f"{path}.1") == "l4xx\nl5xx\n"
+    assert _read(f"{path}.2") == "l2xx\nl3xx\n"
+    assert not os.path.exists(f"{path}.3")
+
+
+def test_rotation_without_backups_truncates(tmp_path):
+    path = str(tmp_path / "memory.log")
+    writer = MemoryLogWriter(path, max_bytes=10, backup_count=0)
+    for i in range(3):
+        writer.write(f"l{i}xx")
+    assert _read(path) == "l2xx\n"
+    assert os.listdir(tmp_path) == ["memory.log"]
@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+from tool.intent.model import IntentResult
+from tool.intent.utils import get_label, get_suggestion
+from tool.prefilter import RulePreClassifier
+from tool.prefilter.classifier import (
+    RULE_GREETING, RULE_IDENTIFIER_QUERY, RULE_IDENTIFIER_QUERY_WITH_GREETING, RULE_IDENTIFIER_ONLY,
+)
+from tool.prefilter.evaluate import evaluate
+from tool.semantic.model import SemanticResult
+
+
+def _intent(query, abcd="A"):
+    return IntentResult(
+        main_query=query, abcd=abcd, raw_response=abcd, label=get_label(abcd), suggestion=get_suggestion(abcd)
+    )
+
+
+@pytest.mark.parametrize("text, rule", [
+    ("你好", RULE_GREETING),
+    ("嗨，早安", RULE_GREETING),
+    ("查詢 LTHDES101N 設備資訊", RULE_IDENTIFIER_QUERY),
+    ("列出 ALM-10023 的發生時間", RULE_IDENTIFIER_QUERY),
+    ("你好，查詢 LTHDES101N 設備資訊", RULE_IDENTIFIER_QUERY_WITH_GREETING),
+    ("LTHDES101N", RULE_IDENTIFIER_ONLY),
+])
+def test_match_rules(text, rule):
+    result = RulePreClassifier().match(text)
+    assert result is not None and result.rule == rule
+
+
+@pytest.mark.parametrize("text", [
+    "LTHDES101N 看起來壞了要怎麼修",   # 維修問題（意圖 C）
+    "不要查 LTHDES101N",               # 否定
+    "不要查詢 LTHDES101N",
+    "查詢 ALM-1002 是什麼意思",        # 解釋
+    "LTHDES101N 溫度異常怎麼處理",
+    "查詢 LTHDES101N 並畫成折線圖",     # 呈現方式交給 LLM 拆句
+    "今天天氣如何",                    # 沒有代號
+])
+def test_inputs_the_llm_must_handle(text):
+    result = RulePreClassifier().match(text)
+    assert result is None or result.rule == RULE_IDENTIFIER_ONLY
+
+
+def test_single_character_verbs_do_not_count():
+    prefilter = RulePreClassifier()
+    assert prefilter.match("查 LTHDES101N").rule == RULE_IDENTIFIER_ONLY
+    assert prefilter.match("找 LTHDES101N").rule == RULE_IDENTIFIER_ONLY
+
+
+def test_confidence_is_measured_precision():
+    prefilter = RulePreClassifier(min_samples=10, threshold=0.9)
+    text = "查詢 LTHDES101N 設備資訊"
+    # 尚未與 LLM 比對：信心 0，不略過 LLM
+    assert prefilter.match(text).confidence == 0.0
+    assert prefilter.classify(text) is None
+
+    semantic = SemanticResult(labels={text: "main_query"}, main_query=text)
+    for i in range(10):
+        result = prefilter.match(text)
+        prefilter.observe(result, semantic, _intent(text, "A" if i < 9 else "C"))
+    assert prefilter.confidence(RULE_IDENTIFIER_QUERY) == pytest.approx(0.9)
+    assert prefilter.classify(text) is not None
+    prefilter.threshold = 0.95
+    assert prefilter.classify(text) is None
+
+
+def test_llm_failures_are_not_counted():
+    prefilter = RulePreClassifier()
+    result = prefilter.match("你好")
+    assert prefilter.observe(result, None, None) is False
+    assert prefilter.compared[RULE_GREETING] == 0
+
+
+def test_precision_round_trip(tmp_path):
+    path = str(tmp_path / "precision.json")
+    prefilter = RulePreClassifier(min_samples=1)
+    prefilter.observe(prefilter.match("你好"), SemanticResult(labels={"你好": "greeting"}, greeting="你好"), None)
+    prefilter.save_precision(path)
+    loaded = RulePreClassifier(min_samples=1, precision_path=path)
+    assert loaded.confidence(RULE_GREETING) == 1.0
+
+
+def test_evaluate_against_batch_output(tmp_path):
+    path = tmp_path / "labels.jsonl"
+    records = [
+        ("查詢 LTHDES101N 設備資訊", "查詢 LTHDES101N 設備資訊", "A"),
+        ("顯示 LTHDES102N 設備資訊", "顯示 LTHDES102N 設備資訊", "B"),
+        ("你好", None, None),
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        for text, main_query, abcd in records:
+            f.write(json.dumps({
+                "text": text,
+                "success": True,
+                "semantic_result": {"labels": {text: "main_query" if main_query else "greeting"}, "main_query": main_query},
+                "intent_result": _intent(main_query, abcd).model_dump() if abcd else None,
+            }, ensure_ascii=False) + "\n")
+
+    report = evaluate(RulePreClassifier(), str(path))
+    assert report["labelled"] == 3
+    assert report["rules"][RULE_IDENTIFIER_QUERY]["precision"] == 0.5
+    assert report["rules"][RULE_GREETING]["precision"] == 1.0
+    assert report["mismatches"][RULE_IDENTIFIER_QUERY][0]["llm_intent"] == "B"
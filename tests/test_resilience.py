@@ -0,0 +1,167 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from benchmark.stub_server import LatencyModel, StubConfig, StubOpenAIServer
+from services import resilience
+from services.openai_client import OpenAIClient
+from services.resilience import (
+    CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN,
+    CircuitBreaker, LLMError, LLMUnavailableError, RetryBudget, backoff_delay, deadline, time_remaining,
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """以可手動推進的時鐘取代 services.resilience 的 time.monotonic"""
+    now = [1000.0]
+    monkeypatch.setattr(resilience, "time", SimpleNamespace(monotonic=lambda: now[0]))
+
+    def advance(seconds):
+        now[0] += seconds
+
+    return advance
+
+
+def _breaker(**kwargs):
+    options = dict(window=4, min_requests=4, failure_ratio=0.5, open_seconds=10)
+    options.update(kwargs)
+    return CircuitBreaker("test", **options)
+
+
+# ---------------- 熔斷 ----------------
+
+def test_breaker_opens_at_failure_ratio_after_min_requests(clock):
+    breaker = _breaker()
+    for ok in (False, False, True):
+        assert breaker.allow()
+        breaker.record(ok)
+    assert breaker.state == CIRCUIT_CLOSED
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CIRCUIT_OPEN
+    assert not breaker.allow()
+    assert breaker.rejections == 1
+
+
+def test_inconclusive_outcomes_are_ignored(clock):
+    breaker = _breaker(min_requests=2)
+    for _ in range(5):
+        breaker.record(None)
+    assert breaker.snapshot()["window"] == 0
+    breaker.record(False)
+    breaker.record(True)
+    assert breaker.state == CIRCUIT_OPEN
+
+
+def test_old_failures_slide_out_of_the_window(clock):
+    breaker = _breaker(window=4, min_requests=4, failure_ratio=0.75)
+    for ok in (False, False, True, True, True):
+        breaker.record(ok)
+    assert breaker.snapshot()["failures"] == 1
+    assert breaker.state == CIRCUIT_CLOSED
+
+
+def test_half_open_allows_one_probe_and_closes_on_success(clock):
+    breaker = _breaker(min_requests=1, failure_ratio=1.0)
+    breaker.record(False)
+    assert breaker.state == CIRCUIT_OPEN
+    clock(10)
+    assert breaker.allow()
+    assert breaker.state == CIRCUIT_HALF_OPEN
+    assert not breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CIRCUIT_CLOSED
+    assert breaker.snapshot()["window"] == 0
+
+
+def test_half_open_probe_failure_reopens(clock):
+    breaker = _breaker(min_requests=1, failure_ratio=1.0)
+    breaker.record(False)
+    clock(10)
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == CIRCUIT_OPEN
+    assert not breaker.allow()
+
+
+def test_cancelled_probe_lets_the_next_caller_probe(clock):
+    breaker = _breaker(min_requests=1, failure_ratio=1.0)
+    breaker.record(False)
+    clock(10)
+    assert breaker.allow()
+    breaker.record(None)
+    assert breaker.state == CIRCUIT_HALF_OPEN
+    assert breaker.allow()
+
+
+# ---------------- 重試 ----------------
+
+def test_retry_budget_is_bounded_by_deposits_and_refill(clock):
+    budget = RetryBudget(ratio=0.5, min_per_s=0.1)
+    assert budget.capacity == 1.0
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+    clock(5)
+    assert not budget.withdraw()
+    clock(5)
+    assert budget.withdraw()
+
+
+def test_retry_budget_does_not_accumulate_past_capacity(clock):
+    budget = RetryBudget(ratio=1.0, min_per_s=0.2)
+    for _ in range(10):
+        budget.deposit()
+    clock(3600)
+    assert [budget.withdraw() for _ in range(3)] == [True, True, False]
+
+
+def test_backoff_delay_is_capped_full_jitter():
+    for attempt in range(8):
+        delay = backoff_delay(attempt, base=0.1, cap=1.0)
+        assert 0 <= delay <= min(1.0, 0.1 * 2 ** attempt)
+
+
+# ---------------- deadline ----------------
+
+def test_nested_deadline_keeps_the_earlier_expiry(clock):
+    assert time_remaining() is None
+    with deadline(5):
+        with deadline(10):
+            assert time_remaining() == pytest.approx(5)
+        with deadline(2):
+            assert time_remaining() == pytest.approx(2)
+        with deadline(None):
+            assert time_remaining() == pytest.approx(5)
+    assert time_remaining() is None
+
+
+# ---------------- OpenAIClient ----------------
+
+def test_client_retries_failures_then_fails_fast_when_open():
+    async def main():
+        config = StubConfig(ttft=LatencyModel("fixed", 0.0), tokens_per_s=0, error_rate=1.0)
+        async with StubOpenAIServer(config) as stub:
+            llm = OpenAIClient(base_url=stub.base_url, api_key="stub", model_name="stub-model")
+            llm.cache = None
+            llm.max_retries = 1
+            llm.breaker = _breaker(window=4, min_requests=2, failure_ratio=0.5, open_seconds=60)
+            try:
+                with pytest.raises(LLMError) as first:
+                    await llm.chat("system", "query 1")
+                after_first = stub.requests
+                with pytest.raises(LLMUnavailableError):
+                    await llm.chat("system", "query 2")
+            finally:
+                await llm.aclose()
+            return first.value, after_first, stub.requests, llm.breaker.state
+
+    first, after_first, requests, state = asyncio.run(main())
+    assert not isinstance(first, LLMUnavailableError)
+    # 第一次呼叫：原本的嘗試加一次重試；熔斷後第二次呼叫不送出
+    assert (after_first, requests, state) == (2, 2, CIRCUIT_OPEN)
@@ -0,0 +1,179 @@
+import asyncio
+
+import pytest
+
+from benchmark.stub_server import LatencyModel, StubConfig, StubOpenAIServer
+from services.openai_client import OpenAIClient
+from services.resilience import LLMOverloadedError
+from services.scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, LLMScheduler, llm_priority
+
+NO_QUEUE_LIMIT = {PRIORITY_INTERACTIVE: 100, PRIORITY_BATCH: 100}
+NO_QUEUE_TIMEOUT = {PRIORITY_INTERACTIVE: 0, PRIORITY_BATCH: 0}
+
+
+def _scheduler(limit=1, batch_share=0.5, max_queue=None, queue_timeout=None):
+    return LLMScheduler(
+        limit, batch_share=batch_share,
+        max_queue=max_queue or NO_QUEUE_LIMIT, queue_timeout=queue_timeout or NO_QUEUE_TIMEOUT,
+    )
+
+
+def test_interactive_is_granted_before_batch():
+    async def main():
+        scheduler = _scheduler(limit=1, batch_share=1.0)
+        order = []
+
+        async def call(priority, name):
+            with llm_priority(priority):
+                async with scheduler.slot("backend"):
+                    order.append(name)
+                    await asyncio.sleep(0.01)
+
+        holder = asyncio.create_task(call(PRIORITY_BATCH, "first"))
+        await asyncio.sleep(0)
+        batch = asyncio.create_task(call(PRIORITY_BATCH, "batch"))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(call(PRIORITY_INTERACTIVE, "interactive"))
+        await asyncio.gather(holder, batch, interactive)
+        return order
+
+    assert asyncio.run(main()) == ["first", "interactive", "batch"]
+
+
+def test_batch_is_limited_to_its_share():
+    async def main():
+        scheduler = _scheduler(limit=4, batch_share=0.5)
+        with llm_priority(PRIORITY_BATCH):
+            grants = [scheduler.try_acquire("backend") for _ in range(3)]
+        interactive = scheduler.try_acquire("backend")
+        return grants, interactive
+
+    grants, interactive = asyncio.run(main())
+    assert [g is not None for g in grants] == [True, True, False]
+    assert interactive is not None
+
+
+def test_full_queue_is_rejected():
+    async def main():
+        scheduler = _scheduler(limit=1, max_queue={PRIORITY_INTERACTIVE: 1, PRIORITY_BATCH: 1})
+        grant = await scheduler.acquire("backend")
+        waiter = asyncio.create_task(scheduler.acquire("backend"))
+        await asyncio.sleep(0)
+        with pytest.raises(LLMOverloadedError):
+            await scheduler.acquire("backend")
+        scheduler.release(grant)
+        scheduler.release(await waiter)
+        return scheduler.lane("backend").rejections
+
+    assert asyncio.run(main()) == {"queue_full": 1}
+
+
+@pytest.mark.parametrize("queue_timeout, caller_timeout, reason", [
+    (0.01, None, "queue_timeout"),
+    (0, 0.01, "deadline"),
+    (1.0, 0.01, "deadline"),
+])
+def test_queue_wait_timeout_is_an_overload_not_a_timeout(queue_timeout, caller_timeout, reason):
+    async def main():
+        scheduler = _scheduler(
+            limit=1, queue_timeout={PRIORITY_INTERACTIVE: queue_timeout, PRIORITY_BATCH: queue_timeout},
+        )
+        grant = await scheduler.acquire("backend")
+        with pytest.raises(LLMOverloadedError):
+            await scheduler.acquire("backend", caller_timeout)
+        lane = scheduler.lane("backend")
+        queued = len(lane.waiters[PRIORITY_INTERACTIVE])
+        scheduler.release(grant)
+        return lane.rejections, queued, sum(lane.active.values())
+
+    rejections, queued, active = asyncio.run(main())
+    assert rejections == {reason: 1}
+    assert (queued, active) == (0, 0)
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def main():
+        scheduler = _scheduler(limit=1)
+        grant = await scheduler.acquire("backend")
+        cancelled = asyncio.create_task(scheduler.acquire("backend"))
+        waiting = asyncio.create_task(scheduler.acquire("backend"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        scheduler.release(grant)
+        scheduler.release(await asyncio.wait_for(waiting, 1))
+        lane = scheduler.lane("backend")
+        return sum(lane.active.values()), sum(len(q) for q in lane.waiters.values())
+
+    assert asyncio.run(main()) == (0, 0)
+
+
+async def _client(stub, limit):
+    llm = OpenAIClient(base_url=stub.base_url, api_key="stub", model_name="stub-model")
+    llm.cache = None
+    llm.flights = None
+    llm.scheduler = _scheduler(limit=limit)
+    return llm
+
+
+def test_attempt_timeout_starts_after_the_slot_is_granted():
+    async def main():
+        config = StubConfig(ttft=LatencyModel("fixed", 300), tokens_per_s=0)
+        async with StubOpenAIServer(config) as stub:
+            llm = await _client(stub, limit=1)
+            llm.max_retries = 0
+            try:
+                # 先建立連線，避免第一個呼叫的連線時間干擾計時
+                await llm.chat("system", "warm up", timeout=5)
+                # 第二個呼叫排隊約 300ms，加上自己的 300ms 超過 timeout，但後端呼叫本身沒有逾時
+                return await asyncio.gather(*(llm.chat("system", f"query {i}", timeout=0.45) for i in range(2)))
+            finally:
+                await llm.aclose()
+
+    assert len(asyncio.run(main())) == 2
+
+
+def test_queue_timeout_is_not_retried_or_counted_by_the_breaker():
+    async def main():
+        config = StubConfig(ttft=LatencyModel("fixed", 200), tokens_per_s=0)
+        async with StubOpenAIServer(config) as stub:
+            llm = await _client(stub, limit=1)
+            try:
+                results = await asyncio.gather(
+                    llm.chat("system", "holder", timeout=1.0),
+                    llm.chat("system", "queued", timeout=0.05),
+                    return_exceptions=True,
+                )
+            finally:
+                await llm.aclose()
+            return results, stub.requests, llm.breaker.snapshot()
+
+    results, requests, breaker = asyncio.run(main())
+    assert isinstance(results[0], str)
+    assert isinstance(results[1], LLMOverloadedError)
+    assert requests == 1
+    assert (breaker["window"], breaker["failures"]) == (1, 0)
+
+
+def test_streaming_queue_timeout_is_an_overload():
+    async def main():
+        config = StubConfig(ttft=LatencyModel("fixed", 200), tokens_per_s=0)
+        async with StubOpenAIServer(config) as stub:
+            llm = await _client(stub, limit=1)
+
+            async def stream(text, timeout):
+                return "".join([chunk async for chunk in llm.chat_stream("system", text, timeout=timeout)])
+
+            try:
+                results = await asyncio.gather(
+                    stream("holder", 1.0), stream("queued", 0.05), return_exceptions=True,
+                )
+            finally:
+                await llm.aclose()
+            return results, stub.requests, llm.breaker.snapshot()
+
+    results, requests, breaker = asyncio.run(main())
+    assert isinstance(results[0], str) and results[0]
+    assert isinstance(results[1], LLMOverloadedError)
+    assert requests == 1
+    assert breaker["failures"] == 0
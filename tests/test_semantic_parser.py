@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from tool.semantic.parser import extract_json_object
+
+
+def _parse(text):
+    json_str, repaired = extract_json_object(text)
+    assert json_str is not None
+    return json.loads(json_str), repaired
+
+
+def test_valid_json_is_not_marked_repaired():
+    assert _parse('{"main_query": "查詢溫度", "greeting": null}') == (
+        {"main_query": "查詢溫度", "greeting": None}, False,
+    )
+
+
+def test_surrounding_prose_and_code_fence_are_skipped():
+    text = '好的，結果如下：\n```json\n{"sentences": [{"text": "你好", "label": "greeting"}]}\n```\n以上。'
+    data, repaired = _parse(text)
+    assert data == {"sentences": [{"text": "你好", "label": "greeting"}]}
+    assert repaired is False
+
+
+def test_brackets_inside_strings_do_not_end_the_object():
+    data, _ = _parse('{"text": "a } b ] {", "nested": {"list": [1, [2]]}} trailing }')
+    assert data == {"text": "a } b ] {", "nested": {"list": [1, [2]]}}
+
+
+def test_only_the_first_object_is_returned():
+    data, _ = _parse('{"a": 1} {"b": 2}')
+    assert data == {"a": 1}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"labels": ["G", "Q",], }', {"labels": ["G", "Q"]}),
+    ("{'main_query': '查詢溫度'}", {"main_query": "查詢溫度"}),
+    ('{"main_query": None, "ok": True, "bad": False}', {"main_query": None, "ok": True, "bad": False}),
+    ('{"text": "第一行\n第二行"}', {"text": "第一行\n第二行"}),
+    ("{'text': 'it\\'s'}", {"text": "it's"}),
+    ("{'text': 'say \"hi\"'}", {"text": 'say "hi"'}),
+    ("{\"text\": \"it\\'s\"}", {"text": "it's"}),
+])
+def test_common_mistakes_are_repaired(text, expected):
+    assert _parse(text) == (expected, True)
+
+
+def test_apostrophe_inside_double_quoted_string_is_kept():
+    assert _parse('{"text": "it\'s fine", "escaped": "a \\" b"}') == (
+        {"text": "it's fine", "escaped": 'a " b'}, False,
+    )
+
+
+def test_literal_words_inside_strings_are_untouched():
+    assert _parse('{"text": "None True False"}') == ({"text": "None True False"}, False)
+
+
+@pytest.mark.parametrize("text", ["", "no json here", '{"main_query": "查詢', '{"labels": ["G", "Q"'])
+def test_incomplete_output_returns_none(text):
+    assert extract_json_object(text) == (None, False)
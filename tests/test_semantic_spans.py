@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from tool.semantic import SemanticAnalysisTool
+from tool.semantic.segment import split_segments
+from tool.semantic.stream import SpanLabelStreamParser
+
+TEXT = "你好，查詢 LTHDES101N 的溫度，順便查詢 LTHDES102N 的壓力，並用折線圖呈現"
+
+
+@pytest.fixture
+def tool():
+    return SemanticAnalysisTool(llm=object(), similarity_cache=None, output_mode="spans")
+
+
+def test_split_segments():
+    assert split_segments(TEXT) == [
+        "你好", "查詢 LTHDES101N 的溫度", "順便查詢 LTHDES102N 的壓力", "並用折線圖呈現",
+    ]
+    assert split_segments("我想查詢異常趨勢並用折線圖呈現") == ["我想查詢異常趨勢", "用折線圖呈現"]
+
+
+def test_extra_query_segments_are_labelled_like_full_mode(tool):
+    segments = split_segments(TEXT)
+    spans = tool._parse_llm_output(json.dumps({"labels": ["G", "Q", "Q", "P"]}), segments)
+    full = tool._parse_llm_output(json.dumps({
+        "sentences": [
+            {"text": segments[0], "label": "greeting"},
+            {"text": segments[1], "label": "main_query"},
+            {"text": segments[2], "label": "other"},
+            {"text": segments[3], "label": "presentation"},
+        ],
+        "main_query": segments[1],
+        "greeting": segments[0],
+        "presentation": segments[3],
+    }, ensure_ascii=False))
+    assert spans == full
+    assert spans["labels"][segments[2]] == "other"
+    assert spans["other"] == [segments[2]]
+
+
+def test_span_codes_must_match_segments(tool):
+    segments = split_segments(TEXT)
+    assert tool._parse_llm_output('{"labels": ["G", "Q"]}', segments) is None
+    assert tool._parse_llm_output('{"labels": ["G", "Q", "X", "P"]}', segments) is None
+
+
+def test_stream_parser_emits_first_query_segment():
+    segments = split_segments(TEXT)
+    parser = SpanLabelStreamParser(segments)
+    emitted = [parser.feed(chunk) for chunk in ('{"labels": ["G', '", "Q"', ', "Q", "P"]}')]
+    assert emitted == [None, segments[1], None]
+    assert parser.main_query == segments[1]
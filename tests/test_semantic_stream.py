@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from tool.semantic.stream import MainQueryStreamParser, SpanLabelStreamParser
+
+MAIN_QUERY = '查詢 "LTHDES101N" 的溫度\\壓力'
+SEGMENTS = ["你好", "查詢 LTHDES101N 的溫度", "順便查詢壓力", "用折線圖呈現"]
+
+
+def _full_output(ensure_ascii=False, sentences_first=True):
+    sentences = [
+        {"text": "你好", "label": "greeting"},
+        {"text": MAIN_QUERY, "label": "main_query"},
+        {"text": "用折線圖呈現", "label": "presentation"},
+    ]
+    data = {"main_query": MAIN_QUERY, "greeting": "你好", "presentation": "用折線圖呈現"}
+    data = {"sentences": sentences, **data} if sentences_first else {**data, "sentences": sentences}
+    return "```json\n" + json.dumps(data, ensure_ascii=ensure_ascii) + "\n```"
+
+
+def _splits(text):
+    """逐字切分，以及所有一刀切成兩段的切法"""
+    yield list(text)
+    for i in range(1, len(text)):
+        yield [text[:i], text[i:]]
+
+
+def _feed(parser, chunks):
+    emitted = [value for value in (parser.feed(chunk) for chunk in chunks) if value is not None]
+    return emitted, parser
+
+
+@pytest.mark.parametrize("ensure_ascii", [False, True])
+@pytest.mark.parametrize("sentences_first", [True, False])
+def test_main_query_is_emitted_exactly_once_for_any_split(ensure_ascii, sentences_first):
+    # 切點涵蓋 key 中間、跳脫序列（\" \\ \uXXXX）中間與中文字之間
+    text = _full_output(ensure_ascii, sentences_first)
+    for chunks in _splits(text):
+        emitted, parser = _feed(MainQueryStreamParser(), chunks)
+        assert emitted == [MAIN_QUERY], chunks
+        assert parser.main_query == MAIN_QUERY
+        assert parser.text == text
+
+
+def test_main_query_is_emitted_as_soon_as_it_is_complete():
+    text = _full_output(sentences_first=True)
+    # sentences 中 main_query 物件結束的位置
+    end = text.index('"main_query"}') + len('"main_query"}')
+    parser = MainQueryStreamParser()
+    assert parser.feed(text[:end - 1]) is None
+    assert parser.feed(text[end - 1:end]) == MAIN_QUERY
+    assert parser.feed(text[end:]) is None
+
+
+@pytest.mark.parametrize("text", [
+    '{"main_query": null, "sentences": [{"text": "你好", "label": "greeting"}]}',
+    '{"main_query": "  ", "sentences": []}',
+    # 巢狀物件中的 main_query 不算數
+    '{"notes": {"main_query": "查詢溫度"}, "extra": [{"text": "查詢溫度", "label": "main_query"}]}',
+    # key 與值都只是字串內容
+    '{"greeting": "\\"main_query\\": \\"查詢溫度\\""}',
+])
+def test_no_main_query(text):
+    for chunks in _splits(text):
+        emitted, parser = _feed(MainQueryStreamParser(), chunks)
+        assert emitted == [] and parser.main_query is None
+
+
+@pytest.mark.parametrize("output, expected", [
+    ('{"labels": ["G", "Q", "Q", "P"]}', SEGMENTS[1]),
+    ('{ "labels" : [ " g " , "main_query" , "P" , "O" ] }', SEGMENTS[1]),
+    ('說明文字 {"labels": ["G", "O", "q", "P"]}', SEGMENTS[2]),
+])
+def test_span_parser_emits_first_query_segment_once(output, expected):
+    for chunks in _splits(output):
+        emitted, parser = _feed(SpanLabelStreamParser(SEGMENTS), chunks)
+        assert emitted == [expected], chunks
+        assert parser.text == output
+
+
+@pytest.mark.parametrize("output", [
+    '{"labels": ["G", "O", "P", "O"]}',
+    # 代號多於句子數時不對應到不存在的句子
+    '{"labels": ["G", "O", "P", "O", "Q"]}',
+    '{"other": ["Q"]}',
+])
+def test_span_parser_without_query(output):
+    for chunks in _splits(output):
+        emitted, parser = _feed(SpanLabelStreamParser(SEGMENTS), chunks)
+        assert emitted == [] and parser.main_query is None
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from services.similarity_cache import NgramVectorizer, SimilarityCache
+from tool.intent import IntentClassifierTool, key_terms
+
+
+def _similarity(a, b):
+    vectorizer = NgramVectorizer()
+    return float(vectorizer.transform(a) @ vectorizer.transform(b))
+
+
+def test_vectors_are_normalized():
+    vector = NgramVectorizer().transform("查詢 LTHDES101N 的溫度")
+    assert vector.dtype == np.float32
+    assert np.linalg.norm(vector) == pytest.approx(1.0, abs=1e-5)
+
+
+def test_exact_match_ignores_spacing_and_punctuation():
+    cache = SimilarityCache(threshold=0.99)
+    cache.add("查詢 LTHDES101N 的溫度", {"abcd": "A"})
+    assert cache.lookup("查詢LTHDES101N的溫度！") == ({"abcd": "A"}, 1.0)
+
+
+def test_near_duplicate_hit_and_miss():
+    cache = SimilarityCache(threshold=0.8)
+    cache.add("請統計各設備第 3 季的異常趨勢", 1)
+    hit = cache.lookup("統計各設備第 3 季的異常趨勢")
+    assert hit is not None and hit[0] == 1 and 0.8 <= hit[1] < 1.0
+    assert cache.lookup("今天天氣如何") is None
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+
+def test_validate_rejects_candidate():
+    cache = SimilarityCache(threshold=0.5)
+    cache.add("查詢 LTHDES101N 的溫度", "value")
+    assert cache.lookup("查詢 LTHDES101N 的溫度", validate=lambda value: False) is None
+
+
+def test_capacity_evicts_least_recently_used():
+    cache = SimilarityCache(threshold=0.99, capacity=2)
+    cache.add("甲設備", 1)
+    cache.add("乙設備", 2)
+    cache.lookup("甲設備")
+    cache.add("丙設備", 3)
+    assert len(cache) == 2
+    assert cache.lookup("乙設備") is None
+    assert cache.lookup("甲設備")[0] == 1
+    assert cache.stats.evictions == 1
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "intent.npz")
+    cache = SimilarityCache(threshold=0.9)
+    cache.add("查詢 LTHDES101N 的溫度", {"abcd": "A"})
+    cache.save(path)
+    loaded = SimilarityCache(threshold=0.9, path=path)
+    assert loaded.lookup("查詢 LTHDES101N 的溫度")[0] == {"abcd": "A"}
+
+
+@pytest.mark.parametrize("cached, query", [
+    ("LTHDES101N 溫度異常怎麼修", "LTHDES101N 溫度異常怎麼查"),
+    ("查詢 LTHDES101N 的溫度", "不要查詢 LTHDES101N 的溫度"),
+])
+def test_one_key_word_apart(cached, query):
+    # 字元相似度分不出來（約 0.94），意圖關鍵詞可以
+    assert _similarity(cached, query) > 0.9
+    assert key_terms(cached) != key_terms(query)
+
+
+@pytest.mark.parametrize("cached, query", [
+    ("LTHDES101N 溫度異常怎麼修", "LTHDES101N 溫度異常怎麼查"),
+    ("查詢 LTHDES101N 的溫度", "不要查詢 LTHDES101N 的溫度"),
+])
+def test_intent_cache_rejects_different_key_terms(cached, query):
+    # 門檻放低到兩者一定命中，確認是關鍵詞檢查擋下
+    tool = IntentClassifierTool(llm=object(), similarity_cache=SimilarityCache(threshold=0.5))
+    tool.similarity_cache.add(cached, {
+        "main_query": cached, "abcd": "C", "raw_response": "C", "probabilities": None, "confidence": None,
+    })
+    assert tool.cached_result(query) is None
+    hit = tool.cached_result(cached + "？")
+    assert hit is not None and hit.metadata["abcd"] == "C"
+
+
+def test_intent_cache_ignores_entries_without_main_query():
+    tool = IntentClassifierTool(llm=object(), similarity_cache=SimilarityCache(threshold=0.5))
+    tool.similarity_cache.add("查詢 LTHDES101N", {"abcd": "A", "raw_response": "A", "probabilities": None, "confidence": None})
+    assert tool.cached_result("查詢 LTHDES101N") is None
@@ -0,0 +1,217 @@
+import asyncio
+from types import SimpleNamespace
+
+from services.resilience import deadline, detached_context, time_remaining
+from services.scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, current_priority, llm_priority
+from services.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_result():
+    async def main():
+        flights = SingleFlight()
+        calls = 0
+
+        async def call():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flights.do("k", call) for _ in range(5)))
+        return flights, calls, results
+
+    flights, calls, results = asyncio.run(main())
+    assert calls == 1
+    assert [r for r, _ in results] == ["result"] * 5
+    assert sorted(coalesced for _, coalesced in results) == [False, True, True, True, True]
+    assert (flights.stats.leaders, flights.stats.followers) == (1, 4)
+    assert len(flights) == 0
+
+
+def test_exception_reaches_every_waiter():
+    async def main():
+        flights = SingleFlight()
+
+        async def call():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        return await asyncio.gather(*(flights.do("k", call) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_cancelled_waiter_does_not_cancel_shared_call():
+    async def main():
+        flights = SingleFlight()
+
+        async def call():
+            await asyncio.sleep(0.05)
+            return "result"
+
+        leader = asyncio.create_task(flights.do("k", call))
+        follower = asyncio.create_task(flights.do("k", call))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower, flights.stats.abandoned
+
+    (result, coalesced), abandoned = asyncio.run(main())
+    assert (result, coalesced, abandoned) == ("result", True, 0)
+
+
+def test_shared_call_cancelled_when_all_waiters_leave():
+    async def main():
+        flights = SingleFlight()
+        started = asyncio.Event()
+        cancelled = False
+
+        async def call():
+            nonlocal cancelled
+            started.set()
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+
+        waiter = asyncio.create_task(flights.do("k", call))
+        await started.wait()
+        waiter.cancel()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return cancelled, flights.stats.abandoned, len(flights)
+
+    assert asyncio.run(main()) == (True, 1, 0)
+
+
+def test_shared_call_does_not_inherit_leader_deadline():
+    async def main():
+        flights = SingleFlight(context=detached_context)
+        seen = []
+
+        async def call():
+            seen.append(time_remaining())
+            await asyncio.sleep(0.05)
+            return "result"
+
+        async def leader():
+            with deadline(0.02):
+                return await flights.do("k", call, time_remaining())
+
+        async def follower():
+            await asyncio.sleep(0.005)
+            return await flights.do("k", call)
+
+        return seen, await asyncio.gather(leader(), follower(), return_exceptions=True)
+
+    seen, (leader, follower) = asyncio.run(main())
+    # 共用呼叫沒有 deadline；leader 只有自己的等待逾時，follower 仍拿到結果
+    assert seen == [None]
+    assert isinstance(leader, TimeoutError)
+    assert follower == ("result", True)
+
+
+def test_default_context_is_copied_from_leader():
+    async def main():
+        flights = SingleFlight()
+
+        async def call():
+            return time_remaining() is not None
+
+        with deadline(5):
+            return await flights.do("k", call)
+
+    assert asyncio.run(main()) == (True, False)
+
+
+def test_detached_context_keeps_other_context_vars():
+    async def main():
+        flights = SingleFlight(context=detached_context)
+
+        async def call():
+            return current_priority(), time_remaining()
+
+        with llm_priority(PRIORITY_BATCH), deadline(5):
+            return await flights.do("k", call)
+
+    assert asyncio.run(main()) == ((PRIORITY_BATCH, None), False)
+
+
+def test_stream_replays_chunks_to_late_subscriber():
+    async def main():
+        flights = SingleFlight()
+        calls = 0
+
+        async def call():
+            nonlocal calls
+            calls += 1
+            for chunk in ("a", "b", "c"):
+                await asyncio.sleep(0.01)
+                yield chunk
+
+        async def collect(delay):
+            await asyncio.sleep(delay)
+            return [chunk async for chunk in flights.stream("k", call)]
+
+        results = await asyncio.gather(collect(0), collect(0.015))
+        return calls, results
+
+    calls, results = asyncio.run(main())
+    assert calls == 1
+    assert results == [["a", "b", "c"], ["a", "b", "c"]]
+
+
+def test_stream_timeout_only_affects_its_subscriber():
+    async def main():
+        flights = SingleFlight(context=detached_context)
+
+        async def call():
+            for chunk in ("a", "b"):
+                await asyncio.sleep(0.03)
+                yield chunk
+
+        async def collect(timeout):
+            return [chunk async for chunk in flights.stream("k", call, timeout=timeout)]
+
+        return await asyncio.gather(collect(0.01), collect(None), return_exceptions=True)
+
+    short, full = asyncio.run(main())
+    assert isinstance(short, TimeoutError)
+    assert full == ["a", "b"]
+
+
+def test_openai_client_coalesces_per_priority(monkeypatch):
+    from services.openai_client import OpenAIClient
+    from services.resilience import LLMTimeoutError
+
+    async def main():
+        llm = OpenAIClient(base_url="http://127.0.0.1:9/v1", api_key="test", model_name="test-model")
+        llm.cache = None
+        priorities = []
+
+        async def create(timeout, **params):
+            priorities.append((current_priority(), time_remaining()))
+            await asyncio.sleep(0.05)
+            message = SimpleNamespace(content="reply")
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+        monkeypatch.setattr(llm, "_create", create)
+
+        async def ask(priority, seconds=None):
+            with llm_priority(priority), deadline(seconds):
+                return await llm.chat("system", "user")
+
+        try:
+            results = await asyncio.gather(
+                ask(PRIORITY_INTERACTIVE, 0.01), ask(PRIORITY_INTERACTIVE), ask(PRIORITY_BATCH), return_exceptions=True,
+            )
+        finally:
+            await llm.aclose()
+        return priorities, results
+
+    priorities, results = asyncio.run(main())
+    # 不同優先等級不合併；共用呼叫不帶任何呼叫者的 deadline
+    assert sorted(priorities) == [(PRIORITY_BATCH, None), (PRIORITY_INTERACTIVE, None)]
+    assert isinstance(results[0], LLMTimeoutError)
+    assert results[1:] == ["reply", "reply"]
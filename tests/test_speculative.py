@@ -0,0 +1,142 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from vanna import ToolResult
+from vanna.core import ToolRegistry
+
+from services.metrics import metrics
+from workflow.workflow import MODE_SPECULATIVE, Workflow
+
+MAIN_QUERY = "查詢 LTHDES101N 的溫度"
+
+
+class _FakeSemanticTool:
+    """依輸入回傳指定的 main_query（None 表示沒有）；raises 為 True 時丟出錯誤"""
+
+    def __init__(self, main_queries, delay=0.02, raises=False):
+        self.main_queries = main_queries
+        self.delay = delay
+        self.raises = raises
+
+    async def execute(self, context, args):
+        await asyncio.sleep(self.delay)
+        if self.raises:
+            raise RuntimeError("semantic backend failed")
+        semantic_result = {"main_query": self.main_queries[args.text]}
+        return ToolResult(success=True, result_for_llm="", metadata={"semantic_result": semantic_result})
+
+
+class _FakeIntentTool:
+    """
+    同一個查詢回傳同一個 ToolResult 物件（模擬快取命中時共用的結果），
+    並記錄每次呼叫的查詢與被取消的次數
+    """
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.calls = []
+        self.cancelled = 0
+        self.results = {}
+
+    async def execute(self, context, args):
+        self.calls.append(args.query)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if args.query not in self.results:
+            metadata = {"main_query": args.query, "abcd": "A"}
+            self.results[args.query] = ToolResult(success=True, result_for_llm="", metadata=metadata)
+        return self.results[args.query]
+
+
+def _workflow(main_queries, semantic_delay=0.02, intent_delay=0.01, raises=False):
+    agent = SimpleNamespace(tool_registry=ToolRegistry(), agent_memory=None)
+    workflow = Workflow(agent, llm=object())
+    workflow.semantic_tool = _FakeSemanticTool(main_queries, semantic_delay, raises)
+    workflow.intent_tool = _FakeIntentTool(intent_delay)
+    workflow.speculation_threshold = 0.9
+    return workflow
+
+
+def _classify(workflow, text):
+    return asyncio.run(workflow._classify_with_llm(text, MODE_SPECULATIVE))
+
+
+def test_exact_hit_reuses_the_speculative_call():
+    workflow = _workflow({MAIN_QUERY: MAIN_QUERY})
+    _, intent_result = _classify(workflow, MAIN_QUERY)
+    assert workflow.intent_tool.calls == [MAIN_QUERY]
+    assert intent_result.metadata == {"main_query": MAIN_QUERY, "abcd": "A"}
+    assert workflow.speculation == {"exact": 1}
+
+
+def test_similar_hit_relabels_main_query_without_mutating_the_shared_result():
+    text = f"你好，{MAIN_QUERY}"
+    workflow = _workflow({text: MAIN_QUERY})
+    _, intent_result = _classify(workflow, text)
+    shared = workflow.intent_tool.results[text]
+    assert workflow.intent_tool.calls == [text]
+    assert intent_result.metadata == {"main_query": MAIN_QUERY, "abcd": "A"}
+    # 快取中共用的結果仍保留原本的 main_query
+    assert intent_result is not shared
+    assert shared.metadata["main_query"] == text
+    assert workflow.speculation == {"similar": 1}
+
+
+def test_miss_cancels_the_speculative_call_and_reclassifies():
+    text = f"你好，請問{MAIN_QUERY}，用折線圖呈現"
+    # 推測的呼叫比語意分析慢，語意分析完成時仍在進行中
+    workflow = _workflow({text: MAIN_QUERY}, semantic_delay=0.01, intent_delay=0.05)
+    _, intent_result = _classify(workflow, text)
+    assert workflow.intent_tool.calls == [text, MAIN_QUERY]
+    assert workflow.intent_tool.cancelled == 1
+    assert intent_result.metadata["main_query"] == MAIN_QUERY
+    assert workflow.speculation == {"miss": 1}
+
+
+def test_threshold_of_one_only_accepts_exact_matches():
+    text = f"你好，{MAIN_QUERY}"
+    workflow = _workflow({text: MAIN_QUERY})
+    workflow.speculation_threshold = 1
+    _classify(workflow, text)
+    assert workflow.intent_tool.calls == [text, MAIN_QUERY]
+    assert workflow.speculation == {"miss": 1}
+
+
+@pytest.mark.parametrize("main_query", [None, ""])
+def test_no_main_query_discards_the_speculative_call(main_query):
+    workflow = _workflow({"你好": main_query}, semantic_delay=0.01, intent_delay=0.05)
+    _, intent_result = _classify(workflow, "你好")
+    assert intent_result is None
+    assert (workflow.intent_tool.calls, workflow.intent_tool.cancelled) == (["你好"], 1)
+    assert workflow.speculation == {"no_main_query": 1}
+
+
+def test_semantic_failure_cancels_the_speculative_call():
+    workflow = _workflow({}, semantic_delay=0.01, intent_delay=0.05, raises=True)
+    with pytest.raises(RuntimeError):
+        _classify(workflow, MAIN_QUERY)
+    assert workflow.intent_tool.cancelled == 1
+    assert sum(workflow.speculation.values()) == 0
+
+
+def test_speculation_stats_count_hits_and_waste():
+    metrics.reset()
+    similar, miss = f"你好，{MAIN_QUERY}", f"你好，請問{MAIN_QUERY}，用折線圖呈現"
+    workflow = _workflow({MAIN_QUERY: MAIN_QUERY, similar: MAIN_QUERY, miss: MAIN_QUERY, "你好": None})
+    for text in (MAIN_QUERY, MAIN_QUERY, similar, miss, "你好"):
+        _classify(workflow, text)
+    assert workflow.speculation_stats() == {
+        "total": 5,
+        "hit_rate": 0.6,
+        "wasted_rate": 0.4,
+        "exact": 2,
+        "similar": 1,
+        "miss": 1,
+        "no_main_query": 1,
+    }
+    assert metrics.counter_value("workflow_speculation_total", outcome="exact") == 2
+    assert metrics.counter_value("workflow_speculation_total", outcome="miss") == 1
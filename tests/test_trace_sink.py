@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+from services.metrics import JsonlTraceSink, Trace
+
+
+def _trace(request_id):
+    trace = Trace(request_id)
+    trace.add("step", trace.started, 0.001)
+    return trace
+
+
+def _read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line)["request_id"] for line in f]
+
+
+def test_write_inside_event_loop_is_deferred_to_flush(tmp_path):
+    path = tmp_path / "traces" / "traces.jsonl"
+
+    async def main():
+        sink = JsonlTraceSink(str(path), flush_interval=60)
+        for i in range(3):
+            sink.write(_trace(f"r{i}"))
+        written_before_close = path.exists()
+        await sink.aclose()
+        return written_before_close
+
+    assert asyncio.run(main()) is False
+    assert _read(path) == ["r0", "r1", "r2"]
+
+
+def test_background_flush(tmp_path):
+    path = tmp_path / "traces.jsonl"
+
+    async def main():
+        sink = JsonlTraceSink(str(path), flush_interval=0.01)
+        sink.write(_trace("r0"))
+        await asyncio.sleep(0.1)
+        lines = _read(path)
+        await sink.aclose()
+        return lines
+
+    assert asyncio.run(main()) == ["r0"]
+
+
+def test_oldest_traces_dropped_when_pending_is_full(tmp_path):
+    path = tmp_path / "traces.jsonl"
+
+    async def main():
+        sink = JsonlTraceSink(str(path), flush_interval=60, max_pending=2)
+        for i in range(3):
+            sink.write(_trace(f"r{i}"))
+        await sink.aclose()
+        return sink.dropped
+
+    assert asyncio.run(main()) == 1
+    assert _read(path) == ["r1", "r2"]
+
+
+def test_write_without_event_loop_is_immediate(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    JsonlTraceSink(str(path)).write(_trace("r0"))
+    assert _read(path) == ["r0"]
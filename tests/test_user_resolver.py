@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+from vanna.core.user import RequestContext
+
+from services.user_resolver import AuthenticationError, HeaderUserResolver, parse_api_tokens
+
+
+def _resolve(resolver, headers):
+    return asyncio.run(resolver.resolve_user(RequestContext(headers=headers)))
+
+
+def test_token_groups_default_to_non_admin():
+    tokens = parse_api_tokens("t1=alice:admin|ops, t2=bob")
+    assert tokens == {"t1": ("alice", ["admin", "ops"]), "t2": ("bob", ["user"])}
+    resolver = HeaderUserResolver(tokens=tokens)
+    assert _resolve(resolver, {"Authorization": "Bearer t1"}).group_memberships == ["admin", "ops"]
+    assert _resolve(resolver, {"Authorization": "Bearer t2"}).group_memberships == ["user"]
+    with pytest.raises(AuthenticationError):
+        _resolve(resolver, {"Authorization": "Bearer nope"})
+
+
+def test_untagged_gateway_user_is_not_admin():
+    resolver = HeaderUserResolver(tokens={}, trust_user_header=True)
+    assert _resolve(resolver, {"X-User-Id": "carol"}).group_memberships == ["user"]
+    tagged = _resolve(resolver, {"X-User-Id": "carol", "X-User-Groups": "admin, ops"})
+    assert tagged.group_memberships == ["admin", "ops"]
+
+
+def test_anonymous_user_is_not_admin():
+    resolver = HeaderUserResolver(tokens={}, allow_anonymous=True)
+    user = _resolve(resolver, {})
+    assert (user.id, user.group_memberships) == ("anonymous", ["anonymous"])
+    with pytest.raises(AuthenticationError):
+        _resolve(HeaderUserResolver(tokens={}), {})
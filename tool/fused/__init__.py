@@ -0,0 +1,2 @@
+from .prompts import SYSTEM_PROMPT_FUSED_CLASSIFICATION, USER_PROMPT_TEMPLATE_FUSED, FUSED_CLASSIFICATION_PROMPT
+from .tool import FusedClassificationTool
\ No newline at end of file
@@ -0,0 +1,92 @@
+from typing import Optional, Tuple, Type
+
+from vanna import Tool, ToolContext, ToolResult
+from services.openai_client import OpenAIClient, get_openai_client
+from services.resilience import LLMError
+from services.metrics import span, track_usage
+from tool.semantic import SemanticAnalysisTool, SemanticAnalysisInput
+from tool.intent import IntentClassifierTool
+from .prompts import FUSED_CLASSIFICATION_PROMPT
+
+
+class FusedClassificationTool(Tool[SemanticAnalysisInput]):
+    """
+    單次呼叫完成語意分類與意圖判斷。
+    解析與結果包裝沿用 SemanticAnalysisTool / IntentClassifierTool，
+    因此產出的 SemanticResult、IntentResult 與 trace 文字與兩段式流程一致。
+    """
+
+    @property
+    def name(self) -> str:
+        return "semantic_intent_classifier"
+
+    @property
+    def description(self) -> str:
+        return (
+            "以單次 LLM 呼叫同時完成語意分類（greeting/main_query/presentation/other）"
+            "與 main_query 的資料庫查詢意圖判斷 (A/B/C/D)。"
+        )
+
+    def get_args_schema(self) -> Type[SemanticAnalysisInput]:
+        return SemanticAnalysisInput
+
+    def __init__(
+        self,
+        semantic_tool: SemanticAnalysisTool,
+        intent_tool: IntentClassifierTool,
+        llm: Optional[OpenAIClient] = None,
+    ):
+        self.semantic_tool = semantic_tool
+        self.intent_tool = intent_tool
+        self.llm = llm or get_openai_client()
+
+    async def classify(self, text: str) -> Tuple[ToolResult, Optional[ToolResult]]:
+        """
+        回傳 (semantic ToolResult, intent ToolResult)。
+        若沒有 main_query、main_query 過短或 LLM 未給出合法的 intent，intent 部分回傳 None，
+        由呼叫端改走 IntentClassifierTool。
+        """
+        # 近似重複的輸入：語意結果直接重用，intent 交由 IntentClassifierTool（同樣有快取）
+        cached = self.semantic_tool.cached_result(text)
+        if cached is not None:
+            return cached, None
+        with track_usage() as usage, span("fused"):
+            try:
+                system_prompt, user_prompt = FUSED_CLASSIFICATION_PROMPT.render(text)
+                raw_output = await self.llm.chat(system_prompt=system_prompt, user_prompt=user_prompt)
+                parsed = self.semantic_tool.parse_output(raw_output)
+                semantic_result = self.semantic_tool.result_from_parsed(parsed)
+            except Exception as e:
+                error_type = e.error_type if isinstance(e, LLMError) else "fused_tool_error"
+                return ToolResult(
+                    success=False,
+                    result_for_llm=f"Error executing fused classification: {str(e)}",
+                    metadata={"error_type": error_type, "usage": usage.as_dict()},
+                ), None
+        # 單次呼叫的用量記在語意分析結果上
+        semantic_result.metadata["usage"] = usage.as_dict()
+        if not semantic_result.success:
+            return semantic_result, None
+        self.semantic_tool.remember(text, semantic_result)
+
+        mq = (semantic_result.metadata["semantic_result"].get("main_query") or "").strip()
+        abcd = parsed["intent"]
+        if len(mq) < 2 or abcd is None:
+            return semantic_result, None
+        intent_result = self.intent_tool.wrap_result(mq, abcd, abcd)
+        self.intent_tool.remember(mq, intent_result)
+        return semantic_result, intent_result
+
+    async def execute(self, context: ToolContext, args: SemanticAnalysisInput) -> ToolResult:
+        semantic_result, intent_result = await self.classify(args.text)
+        if not semantic_result.success or intent_result is None:
+            return semantic_result
+        return ToolResult(
+            success=True,
+            result_for_llm=f"{semantic_result.result_for_llm}\n{intent_result.result_for_llm}",
+            metadata={
+                "semantic_result": semantic_result.metadata["semantic_result"],
+                "intent_result": intent_result.metadata,
+                "usage": semantic_result.metadata.get("usage"),
+            },
+        )
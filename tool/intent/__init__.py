@@ -1,4 +1,4 @@
 from .model import IntentInput, IntentResult
-from .prompts import SYSTEM_PROMPT_INTENT_CLASSIFICATION, INTENT_LABELS, INTENT_SUGGESTIONS
+from .prompts import SYSTEM_PROMPT_INTENT_CLASSIFICATION, USER_PROMPT_TEMPLATE_INTENT, INTENT_CLASSIFICATION_PROMPT, INTENT_LABELS, INTENT_SUGGESTIONS
 from .tool import IntentClassifierTool
-from .utils import get_label, get_suggestion
\ No newline at end of file
+from .utils import get_label, get_suggestion, calibrate_logprobs, key_terms
\ No newline at end of file
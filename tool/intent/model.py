@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, Optional
 from pydantic import BaseModel
 
 class IntentInput(BaseModel):
@@ -10,3 +10,8 @@ class IntentResult(BaseModel):
     raw_response: str
     label: str
     suggestion: str
+    # logprobs 模式下的 A/B/C/D 機率分佈與最高機率（generate 模式為 None）
+    probabilities: Optional[Dict[str, float]] = None
+    confidence: Optional[float] = None
+    # cascade 啟用時回答的模型層級（small / large）
+    tier: Optional[str] = None
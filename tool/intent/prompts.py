@@ -1,9 +1,10 @@
 import textwrap
+from tool.prompt_registry import prompt_registry
+
 # ---------------- LLM 意圖判斷提示詞 ----------------
+# system 為固定指令；主查詢放在 user 訊息尾端，讓所有請求共用相同的前綴（後端前綴快取）
 SYSTEM_PROMPT_INTENT_CLASSIFICATION = textwrap.dedent("""
-    你是一個資料庫查詢意圖判斷助手。請根據給定的主查詢（main_query）判斷其與資料庫查詢的關聯度，並只回覆一個字母（A、B、C 或 D）。
-
-    主查詢（main_query）：「{question}」
+    你是一個資料庫查詢意圖判斷助手。請根據使用者提供的主查詢（main_query）判斷其與資料庫查詢的關聯度，並只回覆一個字母（A、B、C 或 D）。
 
     分類定義：
     A - 明確與資料庫查詢相關（如：查詢特定數據、統計分析等）
@@ -15,6 +16,12 @@ SYSTEM_PROMPT_INTENT_CLASSIFICATION = textwrap.dedent("""
     僅輸出一個字母（A、B、C 或 D），不要附加任何其他文字。
 """).strip()
 
+USER_PROMPT_TEMPLATE_INTENT = "主查詢（main_query）：「{question}」"
+
+INTENT_CLASSIFICATION_PROMPT = prompt_registry.register(
+    "intent_classification", SYSTEM_PROMPT_INTENT_CLASSIFICATION, USER_PROMPT_TEMPLATE_INTENT
+)
+
 # ---------------- 預設意圖回覆文本 ----------------
 
 INTENT_LABELS = {
@@ -1,11 +1,29 @@
-from typing import Type
+import time
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple, Type
 
 from vanna import Tool, ToolContext, ToolResult
 from vanna.components import UiComponent, SimpleTextComponent, NotificationComponent, ComponentType
 from .model import IntentInput, IntentResult
-from .prompts import SYSTEM_PROMPT_INTENT_CLASSIFICATION
-from .utils import get_label, get_suggestion
-from services.openai_client import OpenAIClient
+from .prompts import INTENT_CLASSIFICATION_PROMPT
+from .utils import get_label, get_suggestion, calibrate_logprobs, key_terms
+from services.openai_client import OpenAIClient, get_openai_client
+from services.resilience import LLMError
+from services.metrics import metrics, span, track_usage
+from services.similarity_cache import SimilarityCache, build_similarity_cache
+from config import (
+    INTENT_MODE, INTENT_TOP_LOGPROBS, INTENT_CALIBRATION_TEMPERATURE, INTENT_CONFIDENCE_THRESHOLD,
+    SIMILARITY_CACHE_INTENT_THRESHOLD,
+    INTENT_CASCADE_ENABLED, INTENT_CASCADE_MODEL, INTENT_CASCADE_BASE_URL, INTENT_CASCADE_THRESHOLD,
+)
+
+INTENT_MODE_GENERATE = "generate"
+INTENT_MODE_LOGPROBS = "logprobs"
+
+TIER_SMALL = "small"
+TIER_LARGE = "large"
+
+metrics.describe("intent_cascade_total", "Intent classifications by answering tier and reason (accepted / low_confidence / malformed / error)")
 
 
 class IntentClassifierTool(Tool[IntentInput]):
@@ -24,24 +42,58 @@ class IntentClassifierTool(Tool[IntentInput]):
     def get_args_schema(self) -> Type[IntentInput]:
         return IntentInput
 
-    def __init__(self):
-        self.llm = OpenAIClient()
+    def __init__(
+        self,
+        llm: Optional[OpenAIClient] = None,
+        mode: str = INTENT_MODE,
+        similarity_cache: Optional[SimilarityCache] = None,
+        cascade_llm: Optional[OpenAIClient] = None,
+        cascade_threshold: float = INTENT_CASCADE_THRESHOLD,
+    ):
+        # 預設共用 process 內唯一的 client 與連線池
+        self.llm = llm or get_openai_client()
+        self.mode = mode
+        # cascade：先由小模型判斷，信心不足時才交給 self.llm；未傳入 cascade_llm 且未啟用時為 None
+        self.cascade_llm = cascade_llm or (
+            get_openai_client(INTENT_CASCADE_MODEL, INTENT_CASCADE_BASE_URL) if INTENT_CASCADE_ENABLED else None
+        )
+        self.cascade_threshold = cascade_threshold
+        # 各層級的判斷次數（small / 升級原因）與累計耗時
+        self.cascade: Counter = Counter()
+        self.cascade_ms: Counter = Counter()
+        # 近似重複 main_query 的結果快取（未啟用時為 None）
+        self.similarity_cache = (
+            similarity_cache if similarity_cache is not None
+            else build_similarity_cache("intent", SIMILARITY_CACHE_INTENT_THRESHOLD)
+        )
 
     async def execute(self, context: ToolContext, args: IntentInput) -> ToolResult:
+        with track_usage() as usage, span("intent"):
+            result = await self._execute(args)
+        result.metadata["usage"] = usage.as_dict()
+        return result
+
+    async def _execute(self, args: IntentInput) -> ToolResult:
         try:
             mq = (args.query or "").strip()
             if not mq or len(mq) < 2:
-                return self._wrap_result(mq, "C", "")
+                return self.wrap_result(mq, "C", "")
 
-            raw_output = await self.llm.chat(
-                system_prompt=SYSTEM_PROMPT_INTENT_CLASSIFICATION.format(question=mq),
-                user_prompt=""
-            )
-            abcd = self._extract_label(raw_output)
+            cached = self.cached_result(mq)
+            if cached is not None:
+                return cached
+
+            if self.cascade_llm is not None:
+                result = await self._classify_cascade(mq)
+            else:
+                result = await self._classify(mq)
 
-            return self._wrap_result(mq, abcd, raw_output)
+            self.remember(mq, result)
+            return result
 
         except Exception as e:
+            # LLM 呼叫失敗（逾時、熔斷等）回報為錯誤，不當成 D 類結果
+            error_type = e.error_type if isinstance(e, LLMError) else "intent_tool_error"
             error_message = f"Error executing intent classification: {str(e)}"
             return ToolResult(
                 success=False,
@@ -55,23 +107,152 @@ class IntentClassifierTool(Tool[IntentInput]):
                     simple_component=SimpleTextComponent(text=error_message),
                 ),
                 error=str(e),
-                metadata={"error_type": "intent_tool_error"},
+                metadata={"error_type": error_type},
             )
 
+    async def _classify(self, mq: str, tier: Optional[str] = None) -> ToolResult:
+        """以主要模型（self.llm）依 self.mode 判斷"""
+        if self.mode == INTENT_MODE_LOGPROBS:
+            return await self._classify_logprobs(mq, tier)
+        system_prompt, user_prompt = INTENT_CLASSIFICATION_PROMPT.render(mq)
+        raw_output = await self.llm.chat(system_prompt=system_prompt, user_prompt=user_prompt)
+        return self.wrap_result(mq, self._extract_label(raw_output), raw_output, tier=tier)
+
+    async def _score(self, mq: str, llm: OpenAIClient) -> Tuple[str, Dict[str, float]]:
+        """只解碼一個 token，回傳 (輸出文字, 校正後的 A/B/C/D 機率)；沒有可用的 logprobs 時機率為空 dict"""
+        system_prompt, user_prompt = INTENT_CLASSIFICATION_PROMPT.render(mq)
+        raw_output, logprobs = await llm.chat_logprobs(
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            top_logprobs=INTENT_TOP_LOGPROBS,
+        )
+        return raw_output, calibrate_logprobs(logprobs, INTENT_CALIBRATION_TEMPERATURE)
+
+    async def _classify_logprobs(self, mq: str, tier: Optional[str] = None) -> ToolResult:
+        """
+        只解碼一個 token，並由 A/B/C/D 的 logprobs 得到機率分佈。
+        後端未回傳可用的 logprobs 時退回字串解析。
+        """
+        raw_output, probabilities = await self._score(mq, self.llm)
+        if not probabilities:
+            return self.wrap_result(mq, self._extract_label(raw_output), raw_output, tier=tier)
+
+        abcd = max(probabilities, key=probabilities.get)
+        confidence = probabilities[abcd]
+        # 信心不足時請使用者補充資訊
+        if confidence < INTENT_CONFIDENCE_THRESHOLD:
+            abcd = "D"
+        return self.wrap_result(mq, abcd, raw_output, probabilities, confidence, tier)
+
+    async def _classify_cascade(self, mq: str) -> ToolResult:
+        """
+        小模型（cascade_llm）先以 logprobs 判斷，最高機率達 cascade_threshold 時直接採用；
+        信心不足、輸出不是 A/B/C/D（或沒有可用的 logprobs）、呼叫失敗時才交給主要模型。
+        """
+        t0 = time.perf_counter()
+        with span("intent.small"):
+            try:
+                raw_output, probabilities = await self._score(mq, self.cascade_llm)
+            except LLMError:
+                reason = "error"
+            else:
+                reason = self._escalation_reason(raw_output, probabilities)
+        self.cascade_ms[TIER_SMALL] += (time.perf_counter() - t0) * 1000
+        if reason is None:
+            self.cascade[TIER_SMALL] += 1
+            metrics.inc("intent_cascade_total", tier=TIER_SMALL, reason="accepted")
+            abcd = max(probabilities, key=probabilities.get)
+            return self.wrap_result(mq, abcd, raw_output, probabilities, probabilities[abcd], TIER_SMALL)
+
+        self.cascade[f"escalated_{reason}"] += 1
+        metrics.inc("intent_cascade_total", tier=TIER_LARGE, reason=reason)
+        t1 = time.perf_counter()
+        with span("intent.large", reason=reason):
+            result = await self._classify(mq, TIER_LARGE)
+        self.cascade_ms[TIER_LARGE] += (time.perf_counter() - t1) * 1000
+        return result
+
+    def _escalation_reason(self, raw_output: str, probabilities: Dict[str, float]) -> Optional[str]:
+        """小模型結果可採用時回傳 None，否則回傳升級原因"""
+        raw = raw_output.strip().upper()
+        if not probabilities or not raw or raw[0] not in probabilities:
+            return "malformed"
+        if max(probabilities.values()) < self.cascade_threshold:
+            return "low_confidence"
+        return None
+
+    def cascade_stats(self) -> Dict[str, Any]:
+        """cascade 各層級的命中率與平均耗時（small_ms 含升級前的小模型呼叫）"""
+        total = sum(self.cascade.values())
+        escalated = total - self.cascade[TIER_SMALL]
+        return {
+            "total": total,
+            "small_hit_rate": self.cascade[TIER_SMALL] / total if total else 0.0,
+            "escalation_rate": escalated / total if total else 0.0,
+            "escalated_by_reason": {
+                k.removeprefix("escalated_"): v for k, v in self.cascade.items() if k.startswith("escalated_")
+            },
+            "small_mean_ms": self.cascade_ms[TIER_SMALL] / total if total else 0.0,
+            "large_mean_ms": self.cascade_ms[TIER_LARGE] / escalated if escalated else 0.0,
+        }
+
+    def cached_result(self, mq: str) -> Optional[ToolResult]:
+        """
+        近似重複的 main_query 重用先前的判斷結果。
+        兩者的意圖關鍵詞（動作、否定、維修 / 解釋）必須相同，
+        避免例如「怎麼修」沿用「怎麼查」、「不要查詢」沿用「查詢」的結果。
+        """
+        if self.similarity_cache is None:
+            return None
+        terms = key_terms(mq)
+
+        def same_terms(value: Dict[str, Any]) -> bool:
+            # 舊版存檔沒有 main_query，一律不重用
+            return value.get("main_query") is not None and key_terms(value["main_query"]) == terms
+
+        hit = self.similarity_cache.lookup(mq, validate=same_terms)
+        if hit is None:
+            return None
+        value, similarity = hit
+        result = self.wrap_result(mq, value["abcd"], value["raw_response"], value["probabilities"], value["confidence"])
+        result.metadata["similarity"] = similarity
+        return result
+
+    def remember(self, mq: str, result: ToolResult) -> None:
+        if self.similarity_cache is None or not result.success:
+            return
+        self.similarity_cache.add(mq, {
+            "main_query": mq,
+            **{k: result.metadata[k] for k in ("abcd", "raw_response", "probabilities", "confidence")},
+        })
+
     def _extract_label(self, raw: str) -> str:
         raw = raw.strip().upper()
         return raw[0] if raw and raw[0] in ["A", "B", "C", "D"] else "D"
 
-    def _wrap_result(self, mq: str, abcd: str, raw: str) -> ToolResult:
+    def wrap_result(
+        self,
+        mq: str,
+        abcd: str,
+        raw: str,
+        probabilities: Optional[Dict[str, float]] = None,
+        confidence: Optional[float] = None,
+        tier: Optional[str] = None,
+    ) -> ToolResult:
         result = IntentResult(
             main_query=mq,
             abcd=abcd,
             raw_response=raw,
             label=get_label(abcd),
             suggestion=get_suggestion(abcd),
+            probabilities=probabilities,
+            confidence=confidence,
+            tier=tier,
         )
 
         result_for_llm = f"意圖判斷完成：{result.abcd} ({result.label})；建議：{result.suggestion or '無'}"
+        if result.confidence is not None:
+            result_for_llm += f"；信心：{result.confidence:.2f}"
 
         return ToolResult(
             success=True,
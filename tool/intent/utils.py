@@ -1,7 +1,45 @@
+import math
+from typing import Dict, FrozenSet
+
 from .prompts import INTENT_LABELS, INTENT_SUGGESTIONS
 
+# 決定意圖的關鍵詞（動作、否定、維修 / 解釋）：兩個查詢在這些詞上不同時
+# （例如「怎麼修」與「怎麼查」、多了「不要」），即使字元相似度很高，意圖也可能不同
+INTENT_KEY_TERMS = (
+    "查", "看", "找", "列", "顯示", "統計", "搜尋", "比較", "匯出", "刪", "改", "新增", "設定",
+    "不", "別", "勿", "沒", "非",
+    "修", "壞", "怎麼", "怎樣", "如何", "為什麼", "為何", "意思", "是什麼", "什麼是", "解釋", "說明", "原因", "處理",
+)
+
+def key_terms(text: str) -> FrozenSet[str]:
+    """text 中出現的意圖關鍵詞"""
+    return frozenset(term for term in INTENT_KEY_TERMS if term in text)
+
 def get_label(abcd: str) -> str:
     return INTENT_LABELS.get(abcd, "未知")
 
 def get_suggestion(abcd: str) -> str:
-    return INTENT_SUGGESTIONS.get(abcd, "")
\ No newline at end of file
+    return INTENT_SUGGESTIONS.get(abcd, "")
+
+def calibrate_logprobs(logprobs: Dict[str, float], temperature: float = 1.0) -> Dict[str, float]:
+    """
+    將第一個 token 的 top logprobs 轉成 A/B/C/D 的機率分佈。
+    " A"、"a" 等變體會合併到同一個字母；以 temperature scaling 校正後在四類內重新正規化。
+    top logprobs 中完全沒有 A/B/C/D 時回傳空 dict。
+    """
+    merged: Dict[str, float] = {}
+    for token, logprob in logprobs.items():
+        letter = token.strip().upper()
+        if letter not in INTENT_LABELS:
+            continue
+        # log-sum-exp 合併同一字母的多個 token
+        prev = merged.get(letter)
+        merged[letter] = logprob if prev is None else max(prev, logprob) + math.log1p(math.exp(-abs(prev - logprob)))
+    if not merged:
+        return {}
+
+    t = temperature if temperature > 0 else 1.0
+    peak = max(merged.values())
+    weights = {k: math.exp((v - peak) / t) for k, v in merged.items()}
+    total = sum(weights.values())
+    return {k: weights.get(k, 0.0) / total for k in INTENT_LABELS}
@@ -0,0 +1,6 @@
+from .model import PrefilterResult
+from .rules import (
+    GREETING_KEYWORDS, QUERY_VERBS, PRESENTATION_KEYWORDS, NEGATION_KEYWORDS, ADVICE_KEYWORDS,
+    EQUIPMENT_CODE_PATTERN, ALARM_ID_PATTERN,
+)
+from .classifier import RulePreClassifier
\ No newline at end of file
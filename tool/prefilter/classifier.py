@@ -0,0 +1,234 @@
+import json
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Pattern, Any
+
+from config import PREFILTER_CONFIDENCE_THRESHOLD, PREFILTER_MAX_LENGTH, PREFILTER_MIN_SAMPLES
+from tool.semantic.model import SemanticResult
+from tool.intent.model import IntentResult
+from tool.intent.utils import get_label, get_suggestion
+from .model import PrefilterResult
+from .rules import (
+    GREETING_KEYWORDS, QUERY_VERBS, PRESENTATION_KEYWORDS, NEGATION_KEYWORDS, ADVICE_KEYWORDS, FILLER_WORDS,
+    EQUIPMENT_CODE_PATTERN, ALARM_ID_PATTERN, SENTENCE_SPLIT_PATTERN,
+)
+
+RULE_GREETING = "greeting"
+RULE_IDENTIFIER_QUERY = "identifier_query"
+RULE_IDENTIFIER_QUERY_WITH_GREETING = "identifier_query_with_greeting"
+RULE_IDENTIFIER_ONLY = "identifier_only"
+RULES = (RULE_GREETING, RULE_IDENTIFIER_QUERY, RULE_IDENTIFIER_QUERY_WITH_GREETING, RULE_IDENTIFIER_ONLY)
+
+
+class RulePreClassifier:
+    """
+    LLM 前的本地預分類器：處理純問候語與「設備/警報代號 + 查詢動詞」的短句。
+    每條規則的信心分數是它對照 LLM 標註的實測精確率（樣本不足時為 0），
+    只在信心分數 >= threshold 時回傳結果，其餘交給 LLM。
+    精確率來自 shadow 比對（record_shadow）或離線評估（python -m tool.prefilter.evaluate），可存檔後載入。
+    """
+
+    def __init__(
+        self,
+        greeting_keywords: Iterable[str] = GREETING_KEYWORDS,
+        query_verbs: Iterable[str] = QUERY_VERBS,
+        presentation_keywords: Iterable[str] = PRESENTATION_KEYWORDS,
+        blocked_keywords: Iterable[str] = (*NEGATION_KEYWORDS, *ADVICE_KEYWORDS),
+        identifier_patterns: Iterable[Pattern[str]] = (EQUIPMENT_CODE_PATTERN, ALARM_ID_PATTERN),
+        threshold: float = PREFILTER_CONFIDENCE_THRESHOLD,
+        max_length: int = PREFILTER_MAX_LENGTH,
+        min_samples: int = PREFILTER_MIN_SAMPLES,
+        precision_path: Optional[str] = None,
+    ):
+        # 長詞優先比對，避免「查一下」被較短的詞先吃掉
+        self.greeting_keywords = sorted({k.lower() for k in greeting_keywords}, key=len, reverse=True)
+        self.query_verbs = sorted(set(query_verbs), key=len, reverse=True)
+        self.presentation_keywords = list(presentation_keywords)
+        self.blocked_keywords = list(blocked_keywords)
+        self.identifier_patterns = list(identifier_patterns)
+        self.threshold = threshold
+        self.max_length = max_length
+        self.min_samples = min_samples
+        self.precision_path = precision_path
+        self._greeting_re = re.compile(
+            "(?:" + "|".join(re.escape(k) for k in self.greeting_keywords) + r")+", re.IGNORECASE
+        )
+
+        self.total = 0
+        self.fired: Counter = Counter()
+        self.below_threshold: Counter = Counter()
+        self.shadow: Counter = Counter()
+        # 各規則與 LLM 標註比對的次數與一致次數
+        self.compared: Counter = Counter()
+        self.agreed: Counter = Counter()
+        if precision_path and os.path.exists(precision_path):
+            self.load_precision(precision_path)
+
+    # ------------------ 分類 ------------------
+
+    def classify(self, text: str) -> Optional[PrefilterResult]:
+        """信心足夠時回傳 PrefilterResult，否則回傳 None。"""
+        result = self.match(text)
+        if result is None:
+            return None
+        if result.confidence < self.threshold:
+            self.below_threshold[result.rule] += 1
+            return None
+        self.fired[result.rule] += 1
+        return result
+
+    def match(self, text: str) -> Optional[PrefilterResult]:
+        """不論信心分數，回傳規則比對的結果（shadow 模式用來與 LLM 比對）；沒有規則適用時回傳 None"""
+        self.total += 1
+        text = (text or "").strip()
+        if not text or len(text) > self.max_length:
+            return None
+
+        segments = [s.strip() for s in SENTENCE_SPLIT_PATTERN.split(text) if s.strip()]
+        greetings = [s for s in segments if self._is_greeting(s)]
+        rest = [s for s in segments if s not in greetings]
+
+        if not rest:
+            greeting = "，".join(greetings)
+            return PrefilterResult(
+                rule=RULE_GREETING,
+                confidence=self.confidence(RULE_GREETING),
+                semantic=SemanticResult(labels={s: "greeting" for s in greetings}, greeting=greeting),
+            )
+
+        # 只處理「可選的問候 + 單一查詢句」的輸入；否定、維修 / 解釋類問題與呈現方式交給 LLM
+        if len(rest) != 1 or any(k in text for k in self.presentation_keywords):
+            return None
+        if any(k in text for k in self.blocked_keywords):
+            return None
+        query = rest[0]
+        if not any(p.search(query) for p in self.identifier_patterns):
+            return None
+
+        if not self._has_query_verb(query):
+            rule = RULE_IDENTIFIER_ONLY
+        elif greetings:
+            rule = RULE_IDENTIFIER_QUERY_WITH_GREETING
+        else:
+            rule = RULE_IDENTIFIER_QUERY
+
+        labels = {s: "greeting" for s in greetings}
+        labels[query] = "main_query"
+        return PrefilterResult(
+            rule=rule,
+            confidence=self.confidence(rule),
+            semantic=SemanticResult(
+                labels=labels,
+                main_query=query,
+                greeting=greetings[0] if greetings else None,
+            ),
+            intent=IntentResult(
+                main_query=query,
+                abcd="A",
+                raw_response="",
+                label=get_label("A"),
+                suggestion=get_suggestion("A"),
+            ),
+        )
+
+    def _is_greeting(self, segment: str) -> bool:
+        compact = re.sub(r"\s+", "", segment)
+        return bool(compact) and self._greeting_re.fullmatch(compact) is not None
+
+    def _has_query_verb(self, segment: str) -> bool:
+        for filler in FILLER_WORDS:
+            segment = segment.replace(filler, "")
+        return any(v in segment for v in self.query_verbs)
+
+    # ------------------ 精確率 ------------------
+
+    def confidence(self, rule: str) -> float:
+        """規則的實測精確率；比對樣本少於 min_samples 時回傳 0"""
+        compared = self.compared[rule]
+        if compared < self.min_samples:
+            return 0.0
+        return self.agreed[rule] / compared
+
+    @staticmethod
+    def agrees(
+        result: PrefilterResult, llm_semantic: Optional[SemanticResult], llm_intent: Optional[IntentResult]
+    ) -> bool:
+        """規則結果與 LLM 標註是否一致：main_query 相同，且意圖相同（純問候時 LLM 也沒有 main_query）"""
+        if llm_semantic is None or llm_semantic.main_query != result.semantic.main_query:
+            return False
+        rule_abcd = result.intent.abcd if result.intent is not None else None
+        llm_abcd = llm_intent.abcd if llm_intent is not None else None
+        return rule_abcd == llm_abcd
+
+    def observe(
+        self, result: PrefilterResult, llm_semantic: Optional[SemanticResult], llm_intent: Optional[IntentResult]
+    ) -> bool:
+        """以一筆 LLM 標註更新規則的精確率，回傳是否一致；LLM 呼叫失敗（llm_semantic 為 None）時不計入"""
+        if llm_semantic is None:
+            return False
+        agree = self.agrees(result, llm_semantic, llm_intent)
+        self.compared[result.rule] += 1
+        self.agreed[result.rule] += agree
+        return agree
+
+    def precision_report(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            rule: {
+                "compared": self.compared[rule],
+                "agreed": self.agreed[rule],
+                "precision": self.agreed[rule] / self.compared[rule] if self.compared[rule] else None,
+                "confidence": self.confidence(rule),
+            }
+            for rule in RULES
+        }
+
+    def load_precision(self, path: str) -> None:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for rule, counts in data.items():
+            self.compared[rule] = counts["compared"]
+            self.agreed[rule] = counts["agreed"]
+
+    def save_precision(self, path: Optional[str] = None) -> None:
+        path = path or self.precision_path
+        if not path:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = {rule: {"compared": self.compared[rule], "agreed": self.agreed[rule]} for rule in RULES}
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+    # ------------------ 統計 ------------------
+
+    def record_shadow(
+        self,
+        result: PrefilterResult,
+        llm_semantic: Optional[SemanticResult],
+        llm_intent: Optional[IntentResult],
+    ) -> bool:
+        """shadow 模式：記錄預分類結果與 LLM 結果是否一致，並更新規則的精確率；回傳是否一致。"""
+        self.shadow["compared"] += 1
+        if llm_semantic is not None and llm_semantic.main_query == result.semantic.main_query:
+            self.shadow["main_query_agree"] += 1
+        llm_abcd = llm_intent.abcd if llm_intent is not None else None
+        rule_abcd = result.intent.abcd if result.intent is not None else None
+        if llm_abcd == rule_abcd:
+            self.shadow["intent_agree"] += 1
+        return self.observe(result, llm_semantic, llm_intent)
+
+    def stats(self) -> Dict[str, Any]:
+        fired = sum(self.fired.values())
+        return {
+            "total": self.total,
+            "fired": fired,
+            "fire_rate": fired / self.total if self.total else 0.0,
+            "fired_by_rule": dict(self.fired),
+            "below_threshold_by_rule": dict(self.below_threshold),
+            "shadow": dict(self.shadow),
+            "precision_by_rule": self.precision_report(),
+        }
@@ -0,0 +1,77 @@
+"""
+以 LLM 標註評估預分類規則：讀取批次分類的輸出（python -m workflow.batch 的 JSONL，即 LLM 的標註），
+對每筆輸入執行規則，統計各規則的觸發數與精確率（與 LLM 的 main_query 及意圖皆一致的比例）。
+
+python -m tool.prefilter.evaluate labels.jsonl
+python -m tool.prefilter.evaluate labels.jsonl --save data/prefilter/precision.json   # 供 PREFILTER_PRECISION_PATH 載入
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from config import PREFILTER_PRECISION_PATH
+from tool.semantic.model import SemanticResult
+from tool.intent.model import IntentResult
+from .classifier import RulePreClassifier, RULES
+
+
+def read_labels(path: str) -> Iterator[Tuple[str, SemanticResult, Optional[IntentResult]]]:
+    """逐筆回傳 (輸入, LLM 語意分析結果, LLM 意圖判斷結果)；略過 LLM 失敗的紀錄"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if not record.get("success") or not record.get("semantic_result"):
+                continue
+            semantic = SemanticResult(**record["semantic_result"])
+            intent = IntentResult(**record["intent_result"]) if record.get("intent_result") else None
+            yield record["text"], semantic, intent
+
+
+def evaluate(prefilter: RulePreClassifier, path: str) -> Dict[str, Any]:
+    """回傳各規則的精確率報告與不一致的範例（每條規則最多 5 筆）"""
+    mismatches: Dict[str, List[Dict[str, Any]]] = {rule: [] for rule in RULES}
+    labelled = 0
+    for text, semantic, intent in read_labels(path):
+        labelled += 1
+        result = prefilter.match(text)
+        if result is None or prefilter.observe(result, semantic, intent):
+            continue
+        if len(mismatches[result.rule]) < 5:
+            mismatches[result.rule].append({
+                "text": text,
+                "llm_main_query": semantic.main_query,
+                "llm_intent": intent.abcd if intent is not None else None,
+            })
+    return {"labelled": labelled, "rules": prefilter.precision_report(), "mismatches": mismatches}
+
+
+def _main() -> int:
+    parser = argparse.ArgumentParser(description="以 LLM 標註（批次分類輸出）評估預分類規則的精確率")
+    parser.add_argument("labels", help="python -m workflow.batch 的輸出 JSONL")
+    parser.add_argument("--save", nargs="?", const=PREFILTER_PRECISION_PATH or None, default=None,
+                        help="精確率存檔路徑（未指定值時使用 PREFILTER_PRECISION_PATH）")
+    args = parser.parse_args()
+
+    # 只看這份標註的結果，不疊加既有存檔
+    prefilter = RulePreClassifier(precision_path=None)
+    report = evaluate(prefilter, args.labels)
+    print(f"labelled={report['labelled']}  threshold={prefilter.threshold}  min_samples={prefilter.min_samples}")
+    print(f"{'rule':<32} {'compared':>9} {'agreed':>7} {'precision':>10} {'confidence':>11}")
+    for rule, r in report["rules"].items():
+        precision = "-" if r["precision"] is None else f"{r['precision']:.3f}"
+        print(f"{rule:<32} {r['compared']:>9} {r['agreed']:>7} {precision:>10} {r['confidence']:>11.3f}")
+    for rule, examples in report["mismatches"].items():
+        for example in examples:
+            print(f"  mismatch [{rule}] {json.dumps(example, ensure_ascii=False)}")
+    if args.save:
+        prefilter.save_precision(args.save)
+        print(f"saved to {args.save}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
@@ -0,0 +1,16 @@
+from typing import Optional
+from pydantic import BaseModel
+
+from tool.semantic.model import SemanticResult
+from tool.intent.model import IntentResult
+
+
+class PrefilterResult(BaseModel):
+    """
+    本地預分類結果。
+    信心分數達門檻時，Workflow 直接使用 semantic / intent，不再呼叫 LLM。
+    """
+    rule: str
+    confidence: float
+    semantic: SemanticResult
+    intent: Optional[IntentResult] = None
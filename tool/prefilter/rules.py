@@ -0,0 +1,40 @@
+import re
+
+# ---------------- 本地預分類規則 ----------------
+# 關鍵字與正則可於建立 RulePreClassifier 時覆寫，方便依 LLM 標註結果調整
+
+# 純問候 / 寒暄語（整段輸入僅由這些詞組成時視為 greeting）
+GREETING_KEYWORDS = [
+    "你好", "您好", "妳好", "嗨", "哈囉", "哈啰", "早安", "午安", "晚安", "安安", "大家好",
+    "hi", "hello", "hey",
+]
+
+# 查詢動詞（需與設備 / 警報代號同時出現才視為明確查詢）
+# 只收多字詞：「查」「看」「找」等單字也出現在「看起來」「查 ALM-1002 是什麼意思」這類非查詢句中
+QUERY_VERBS = [
+    "查詢", "查看", "查一下", "列出", "顯示", "統計", "搜尋", "找出", "給我", "有哪些", "多少",
+]
+
+# 否定詞：「不要查詢 LTHDES101N」不是查詢請求，交給 LLM
+NEGATION_KEYWORDS = ["不要", "不用", "不必", "不想", "別", "勿", "沒有", "不是"]
+
+# 維修 / 解釋類用語：這類問題屬於其他意圖（例如 C），即使帶有代號也交給 LLM
+ADVICE_KEYWORDS = [
+    "怎麼", "怎樣", "如何", "為什麼", "為何", "修", "壞", "故障排除", "處理", "意思", "是什麼", "什麼是",
+    "解釋", "說明", "原因",
+]
+
+# 呈現方式關鍵字：出現時交給 LLM 拆句，不走快速路徑
+PRESENTATION_KEYWORDS = [
+    "圖表", "折線", "長條", "圓餅", "柱狀", "排序", "分組", "呈現", "畫", "圖",
+]
+
+# 句首可忽略的口語填充詞
+FILLER_WORDS = ["我想", "我要", "請", "幫我", "麻煩", "想"]
+
+# 設備代號（例：LTHDES101N）與警報代號（例：ALM-10023）
+EQUIPMENT_CODE_PATTERN = re.compile(r"(?<![A-Za-z0-9])[A-Z]{2,}\d{2,}[A-Z]{0,3}(?![A-Za-z0-9])")
+ALARM_ID_PATTERN = re.compile(r"(?<![A-Za-z0-9])(?:ALM|ALARM|AL)[-_]?\d{3,}(?![A-Za-z0-9])", re.IGNORECASE)
+
+# 分句標點，與語意分析提示詞的分句指引一致
+SENTENCE_SPLIT_PATTERN = re.compile(r"[。！？!?，,]+")
@@ -0,0 +1,61 @@
+import hashlib
+from dataclasses import dataclass
+from string import Formatter
+from typing import Dict, Tuple
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """
+    預先編譯的提示詞：system 與 user_prefix 為每次請求逐位元組相同的前綴，
+    每次請求的內容只接在 user 訊息的尾端（user_suffix 為固定的結尾，例如分隔線）。
+    後端（如 vLLM automatic prefix caching）因此可重用前綴的 KV cache。
+    """
+    name: str
+    system: str
+    user_prefix: str
+    user_suffix: str = ""
+
+    def render(self, value: str) -> Tuple[str, str]:
+        """回傳 (system_prompt, user_prompt)；只做字串串接，不再解析模板"""
+        return self.system, f"{self.user_prefix}{value}{self.user_suffix}"
+
+    @property
+    def prefix_fingerprint(self) -> str:
+        """靜態前綴的雜湊，用來確認部署前後前綴是否改變（改變會讓後端的前綴快取全部失效）"""
+        return hashlib.sha256(f"{self.system}\x00{self.user_prefix}".encode("utf-8")).hexdigest()[:16]
+
+
+class PromptRegistry:
+    """
+    提示詞註冊表：各工具的 prompts.py 於 import 時註冊一次，
+    system 原樣使用（不經過 str.format）；user 模板必須恰好含一個欄位，註冊時拆成固定前綴與尾端。
+    """
+
+    def __init__(self) -> None:
+        self._templates: Dict[str, PromptTemplate] = {}
+
+    def register(self, name: str, system: str, user_template: str) -> PromptTemplate:
+        fields = [field for _, field, _, _ in Formatter().parse(user_template) if field is not None]
+        if len(fields) != 1:
+            raise ValueError(f"prompt {name!r}: user 模板必須恰好包含一個欄位，實際為 {fields}")
+        placeholder = "{" + fields[0] + "}"
+        prefix, suffix = user_template.split(placeholder, 1)
+        # 模板其餘部分的 {{ }} 跳脫在此還原，render 時不再經過 str.format
+        template = PromptTemplate(
+            name=name,
+            system=system,
+            user_prefix=prefix.replace("{{", "{").replace("}}", "}"),
+            user_suffix=suffix.replace("{{", "{").replace("}}", "}"),
+        )
+        self._templates[name] = template
+        return template
+
+    def get(self, name: str) -> PromptTemplate:
+        return self._templates[name]
+
+    def items(self):
+        return self._templates.items()
+
+
+prompt_registry = PromptRegistry()
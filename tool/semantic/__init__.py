@@ -1,4 +1,5 @@
-from .prompts import SYSTEM_PROMPT_SEMANTIC_CLASSIFICATION, USER_PROMPT_TEMPLATE_CLASSIFICATION, DEFAULT_GREETING_RESPONSE, DEFAULT_PRESENTATION_RESPONSE
+from .prompts import SYSTEM_PROMPT_SEMANTIC_CLASSIFICATION, USER_PROMPT_TEMPLATE_CLASSIFICATION, DEFAULT_GREETING_RESPONSE, DEFAULT_PRESENTATION_RESPONSE, SEMANTIC_RESPONSE_FORMAT, SEMANTIC_CLASSIFICATION_PROMPT
 from .utils import build_semantic_reply
 from .model import SemanticAnalysisInput, SemanticResult
-from .tool import SemanticAnalysisTool
\ No newline at end of file
+from .tool import SemanticAnalysisTool
+from .parser import extract_json_object
\ No newline at end of file
@@ -0,0 +1,88 @@
+from typing import List, Optional, Tuple
+
+from services.metrics import metrics
+
+# Python 風格的字面值（LLM 偶爾輸出 repr 而非 JSON）
+_PY_LITERALS = {"None": "null", "True": "true", "False": "false"}
+
+metrics.describe("semantic_parse_total", "Semantic analysis output parses by outcome (ok / repaired / error)")
+
+
+def extract_json_object(text: str) -> Tuple[Optional[str], bool]:
+    """
+    單次線性掃描取出第一個完整的 JSON 物件，回傳 (JSON 字串, 是否經過修補)；找不到完整物件時回傳 (None, False)。
+
+    - 以括號深度配對（字串內的括號不計），巢狀的 sentences 陣列不會被截斷
+    - 物件前後的說明文字與 ```json 程式碼區塊標記會被略過
+    - 修補常見錯誤：結尾多餘的逗號、單引號字串、字串內的 \\'、未跳脫的換行、None / True / False
+    - 雙引號字串內的單引號（例如 it's）維持原樣
+    """
+    start = text.find("{")
+    if start < 0:
+        return None, False
+    out: List[str] = []
+    depth = 0
+    quote = None
+    escape = False
+    repaired = False
+    skip = 0
+    for i in range(start, len(text)):
+        if skip:
+            skip -= 1
+            continue
+        ch = text[i]
+        if quote is not None:
+            if escape:
+                escape = False
+                if ch == "'":
+                    # \' 在 JSON 中不合法（不論在單引號或雙引號字串中），改為單純的 '
+                    out[-1] = "'"
+                    repaired = True
+                    continue
+                out.append(ch)
+            elif ch == "\\":
+                escape = True
+                out.append(ch)
+            elif ch == quote:
+                quote = None
+                out.append('"')
+            elif ch == '"':
+                out.append('\\"')
+            elif ch == "\n":
+                out.append("\\n")
+                repaired = True
+            else:
+                out.append(ch)
+            continue
+        if ch == '"' or ch == "'":
+            if ch == "'":
+                repaired = True
+            quote = ch
+            out.append('"')
+        elif ch == "{" or ch == "[":
+            depth += 1
+            out.append(ch)
+        elif ch == "}" or ch == "]":
+            # 去除結尾多餘的逗號（只回溯空白，整體仍為線性）
+            j = len(out) - 1
+            while j >= 0 and out[j].isspace():
+                j -= 1
+            if j >= 0 and out[j] == ",":
+                del out[j]
+                repaired = True
+            depth -= 1
+            out.append(ch)
+            if depth == 0:
+                return "".join(out), repaired
+        elif ch in "NTF" and not (out and (out[-1].isalnum() or out[-1] == "_")):
+            for word, literal in _PY_LITERALS.items():
+                if text.startswith(word, i):
+                    out.append(literal)
+                    skip = len(word) - 1
+                    repaired = True
+                    break
+            else:
+                out.append(ch)
+        else:
+            out.append(ch)
+    return None, False
@@ -1,3 +1,5 @@
+from tool.prompt_registry import prompt_registry
+
 # ---------------- LLM 語意分類提示詞 ----------------
 SYSTEM_PROMPT_SEMANTIC_CLASSIFICATION = (
     "你是一個中文語意分析助手，負責將使用者輸入拆分並標註每個句子的語意類別。\n"
@@ -28,12 +30,97 @@ SYSTEM_PROMPT_SEMANTIC_CLASSIFICATION = (
     "5. 若存在 main_query，請確保它與 sentences 中對應的項目一致（完全相同字串）。\n"
 )
 
+# 固定說明在前、使用者輸入在尾端，讓所有請求共用相同的前綴（後端前綴快取）
 USER_PROMPT_TEMPLATE_CLASSIFICATION = (
-    "請分析以下使用者輸入:\n\n"
-    "================\n{user_input}\n================\n\n"
-    "請輸出 JSON，並確保若存在查詢意圖時 'main_query' 一定填入："
+    "請分析以下使用者輸入並輸出 JSON，若存在查詢意圖時 'main_query' 一定填入:\n\n"
+    "================\n{user_input}\n================"
+)
+
+SEMANTIC_CLASSIFICATION_PROMPT = prompt_registry.register(
+    "semantic_classification", SYSTEM_PROMPT_SEMANTIC_CLASSIFICATION, USER_PROMPT_TEMPLATE_CLASSIFICATION
+)
+
+# ---------------- 精簡輸出（span 模式）提示詞 ----------------
+# 輸入已在本地分句並編號，模型只需依序回覆每句的類別代號，不再複述句子內容
+SPAN_LABEL_CODES = {
+    "G": "greeting",
+    "Q": "main_query",
+    "P": "presentation",
+    "O": "other",
+}
+
+SYSTEM_PROMPT_SEMANTIC_SPANS = (
+    "你是一個中文語意分析助手。使用者輸入已預先分句並編號，請依序標註每個句子的語意類別代號。\n\n"
+    "類別代號：\n"
+    "- G（greeting）：問候或寒暄語，通常在開頭且不包含查詢意圖（例：您好、你好、嗨）。\n"
+    "- Q（main_query）：需要進行資料查詢、統計、分析的核心問句，通常包含設備代號、時間範圍、異常類型等。\n"
+    "- P（presentation）：關於結果呈現/顯示方式的描述（如：圖表類型、排序方式、分組粒度、限制筆數等）。\n"
+    "- O（other）：其他補充說明、背景資訊、無法分類或重複的內容。\n\n"
+    "輸出格式：只輸出 JSON，labels 的長度必須等於句子數，順序與編號一致，不要複述句子內容：\n"
+    "{\"labels\": [\"G\"|\"Q\"|\"P\"|\"O\", ...]}\n\n"
+    "補充規則：\n"
+    "1. 若出現多個查詢句，只將最主要的一句標為 Q，其餘標為 O。\n"
+    "2. 若 presentation 出現多次，只將第一個標為 P，其餘標為 O。\n"
+    "3. 嚴格確保輸出為有效 JSON，無多餘文字或註解。\n"
 )
 
+USER_PROMPT_TEMPLATE_SPANS = (
+    "請標註以下已編號的句子並輸出 JSON:\n\n"
+    "================\n{segments}\n================"
+)
+
+SEMANTIC_SPANS_PROMPT = prompt_registry.register(
+    "semantic_spans", SYSTEM_PROMPT_SEMANTIC_SPANS, USER_PROMPT_TEMPLATE_SPANS
+)
+
+# ---------------- guided decoding 用的輸出 schema ----------------
+# 與 SYSTEM_PROMPT_SEMANTIC_CLASSIFICATION 的輸出格式一致；strict 模式要求所有欄位列為 required
+SEMANTIC_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "semantic_classification",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "sentences": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "text": {"type": "string"},
+                            "label": {"type": "string", "enum": ["greeting", "main_query", "presentation", "other"]},
+                        },
+                        "required": ["text", "label"],
+                        "additionalProperties": False,
+                    },
+                },
+                "main_query": {"type": ["string", "null"]},
+                "greeting": {"type": ["string", "null"]},
+                "presentation": {"type": ["string", "null"]},
+            },
+            "required": ["sentences", "main_query", "greeting", "presentation"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+SEMANTIC_SPANS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "semantic_spans",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "labels": {"type": "array", "items": {"type": "string", "enum": list(SPAN_LABEL_CODES)}},
+            },
+            "required": ["labels"],
+            "additionalProperties": False,
+        },
+    },
+}
+
 # ---------------- 預設系統回覆文本 ----------------
 
 DEFAULT_GREETING_RESPONSE = "您好！我是 ALS 警報管理系統，能協助您查詢設備資訊、使用者登入紀錄、警報設定等等資料。請問您想查詢什麼呢？"
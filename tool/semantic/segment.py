@@ -0,0 +1,39 @@
+import re
+from typing import List
+
+# ---------------- 本地分句（span 輸出模式使用） ----------------
+# 規則與 SYSTEM_PROMPT_SEMANTIC_CLASSIFICATION 的分句指引一致：
+# 1. 依標點（。！？!?，,）切開，標點本身不屬於句子
+# 2. 同一句中「查詢 + 連接詞 + 呈現方式」拆成兩句，連接詞捨去
+#    例：「我想查詢異常趨勢並用折線圖呈現」→「我想查詢異常趨勢」、「用折線圖呈現」
+
+SENTENCE_SPLIT_PATTERN = re.compile(r"[。！？!?，,\n]+")
+
+# 連接詞之後緊接呈現方式的開頭詞，才視為查詢與呈現的分界（避免「使用者」之類的誤切）
+PRESENTATION_CLAUSE_PATTERN = re.compile(
+    r"(?:並且|而且|然後|並|再|且)\s*(?=(?:用|以|改用|畫成|畫|依照|依|按照|按|做成|呈現|顯示))"
+)
+PRESENTATION_KEYWORDS = ("圖", "排序", "分組", "呈現", "顯示", "排列", "表格")
+
+
+def _split_presentation(sentence: str) -> List[str]:
+    for match in PRESENTATION_CLAUSE_PATTERN.finditer(sentence):
+        head, tail = sentence[:match.start()].strip(), sentence[match.end():].strip()
+        if head and any(k in tail for k in PRESENTATION_KEYWORDS):
+            return [head, tail]
+    return [sentence]
+
+
+def split_segments(text: str) -> List[str]:
+    """將使用者輸入切成句子（順序不變、去除空白與分句標點）"""
+    segments: List[str] = []
+    for part in SENTENCE_SPLIT_PATTERN.split(text):
+        part = part.strip()
+        if part:
+            segments.extend(_split_presentation(part))
+    return segments
+
+
+def number_segments(segments: List[str]) -> str:
+    """span 模式送給模型的編號句子，一行一句：[1] 句子"""
+    return "\n".join(f"[{i}] {s}" for i, s in enumerate(segments, start=1))
@@ -0,0 +1,152 @@
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+
+class MainQueryStreamParser:
+    """
+    語意分析 JSON 的增量解析器：逐段餵入 LLM 串流輸出，
+    在 main_query 確定的當下回傳，不必等整份 JSON 產生完畢。
+
+    main_query 的來源（取先出現者）：
+    1. sentences 陣列中第一個 label 為 main_query 的完整物件（提示詞規定兩者為相同字串）
+    2. 最外層 "main_query" 欄位的字串值
+
+    每個字元只掃描一次；JSON 之前的雜訊（如 ```json）會被略過。
+    """
+
+    def __init__(self) -> None:
+        self._text = ""
+        self._pos = 0
+        self._stack: List[Dict[str, Any]] = []
+        self._in_string = False
+        self._escape = False
+        self._str_start = 0
+        self.main_query: Optional[str] = None
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """餵入一段輸出；若此段讓 main_query 首次確定，回傳該字串，否則回傳 None。"""
+        self._text += chunk
+        found = None
+        text = self._text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    found = self._on_string(text[self._str_start:i + 1]) or found
+                continue
+
+            if ch == '"':
+                if self._stack:
+                    self._in_string = True
+                    self._str_start = i
+            elif ch in "{[":
+                self._stack.append({
+                    "type": "obj" if ch == "{" else "arr",
+                    "key": self._value_key(),
+                    "start": i,
+                    "expect": "key",
+                    "cur_key": None,
+                })
+            elif ch in "}]" and self._stack:
+                frame = self._stack.pop()
+                if frame["type"] == "obj":
+                    found = self._on_object(frame, text[frame["start"]:i + 1]) or found
+            elif self._stack and self._stack[-1]["type"] == "obj":
+                if ch == ":":
+                    self._stack[-1]["expect"] = "value"
+                elif ch == ",":
+                    self._stack[-1]["expect"] = "key"
+                    self._stack[-1]["cur_key"] = None
+        self._pos = len(text)
+        return found
+
+    def _value_key(self) -> Optional[str]:
+        """目前位置的值在父物件中的 key（父層為陣列時沿用陣列的 key）"""
+        if not self._stack:
+            return None
+        top = self._stack[-1]
+        return top["cur_key"] if top["type"] == "obj" else top["key"]
+
+    def _on_string(self, literal: str) -> Optional[str]:
+        top = self._stack[-1]
+        if top["type"] != "obj":
+            return None
+        try:
+            value = json.loads(literal)
+        except ValueError:
+            return None
+        if top["expect"] == "key":
+            top["cur_key"] = value
+            return None
+        if len(self._stack) == 1 and top["cur_key"] == "main_query":
+            return self._emit(value)
+        return None
+
+    def _on_object(self, frame: Dict[str, Any], literal: str) -> Optional[str]:
+        # 只關心最外層物件下 sentences 陣列中的元素
+        if len(self._stack) != 2 or self._stack[-1]["type"] != "arr" or frame["key"] != "sentences":
+            return None
+        try:
+            item = json.loads(literal)
+        except ValueError:
+            return None
+        if isinstance(item, dict) and item.get("label") == "main_query" and item.get("text"):
+            return self._emit(item["text"])
+        return None
+
+    def _emit(self, value: Any) -> Optional[str]:
+        if self.main_query is not None or not isinstance(value, str) or not value.strip():
+            return None
+        self.main_query = value
+        return value
+
+
+class SpanLabelStreamParser:
+    """
+    span 輸出模式的增量解析器：模型依序輸出每個本地句子的類別代號，
+    labels 陣列中出現第一個 Q 時即可對應回本地句子，作為 main_query 回傳。
+    介面與 MainQueryStreamParser 相同（feed / text / main_query）。
+    """
+
+    _LABELS_START = re.compile(r'"labels"\s*:\s*\[')
+    _LABEL = re.compile(r'"\s*([A-Za-z_]+)\s*"')
+
+    def __init__(self, segments: List[str]) -> None:
+        self.segments = segments
+        self._text = ""
+        self._pos = -1
+        self._index = 0
+        self.main_query: Optional[str] = None
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    def feed(self, chunk: str) -> Optional[str]:
+        self._text += chunk
+        if self.main_query is not None:
+            return None
+        if self._pos < 0:
+            match = self._LABELS_START.search(self._text)
+            if match is None:
+                return None
+            self._pos = match.end()
+        # 只處理已完整輸出的代號；不完整的尾端留待下一段
+        for match in self._LABEL.finditer(self._text, self._pos):
+            self._pos = match.end()
+            code = match.group(1).upper()
+            if (code == "Q" or code == "MAIN_QUERY") and self._index < len(self.segments):
+                self.main_query = self.segments[self._index]
+                return self.main_query
+            self._index += 1
+        return None
@@ -1,16 +1,28 @@
-import re
 import json
-from typing import Optional, Dict, Any, Type
-from services.openai_client import OpenAIClient
+from typing import Optional, Dict, Any, List, Tuple, Type, Callable
+from services.openai_client import OpenAIClient, get_openai_client
+from services.resilience import LLMError
+from services.metrics import metrics, span, track_usage
+from services.similarity_cache import NgramVectorizer, SimilarityCache, build_similarity_cache
+from config import SIMILARITY_CACHE_SEMANTIC_THRESHOLD, SEMANTIC_GUIDED_JSON, SEMANTIC_OUTPUT_MODE
 from .prompts import (
-    SYSTEM_PROMPT_SEMANTIC_CLASSIFICATION,
-    USER_PROMPT_TEMPLATE_CLASSIFICATION,
+    SEMANTIC_CLASSIFICATION_PROMPT,
+    SEMANTIC_RESPONSE_FORMAT,
+    SEMANTIC_SPANS_PROMPT,
+    SEMANTIC_SPANS_RESPONSE_FORMAT,
+    SPAN_LABEL_CODES,
 )
 from .model import SemanticAnalysisInput, SemanticResult
 from .model import SemanticAnalysisInput, SemanticResult
+from .stream import MainQueryStreamParser, SpanLabelStreamParser
+from .parser import extract_json_object
+from .segment import split_segments, number_segments
 
 from vanna import Tool, ToolContext, ToolResult
 
+SEMANTIC_OUTPUT_FULL = "full"
+SEMANTIC_OUTPUT_SPANS = "spans"
+
 class SemanticAnalysisTool(Tool[SemanticAnalysisInput]):
     """
     語意分析工具：負責呼叫 LLM 並解析輸出。
@@ -32,91 +44,255 @@ class SemanticAnalysisTool(Tool[SemanticAnalysisInput]):
     def get_args_schema(self) -> Type[SemanticAnalysisInput]:
         return SemanticAnalysisInput
 
-    def __init__(self):
-        self.llm = OpenAIClient()
+    def __init__(
+        self,
+        llm: Optional[OpenAIClient] = None,
+        similarity_cache: Optional[SimilarityCache] = None,
+        output_mode: str = SEMANTIC_OUTPUT_MODE,
+    ):
+        # 預設共用 process 內唯一的 client 與連線池
+        self.llm = llm or get_openai_client()
+        # full：模型複述每個句子；spans：本地分句，模型只回覆每句的類別代號
+        self.output_mode = output_mode
+        # 後端支援時以 JSON schema 限制輸出格式（guided decoding）
+        self.guided_json = SEMANTIC_GUIDED_JSON
+        # 近似重複輸入的結果快取（未啟用時為 None）
+        self.similarity_cache = (
+            similarity_cache if similarity_cache is not None
+            else build_similarity_cache("semantic", SIMILARITY_CACHE_SEMANTIC_THRESHOLD)
+        )
 
     async def execute(self, context: ToolContext, args: SemanticAnalysisInput) -> ToolResult:
+        with track_usage() as usage, span("semantic"):
+            result = await self._execute(args)
+        result.metadata["usage"] = usage.as_dict()
+        return result
+
+    async def _execute(self, args: SemanticAnalysisInput) -> ToolResult:
         try:
+            cached = self.cached_result(args.text)
+            if cached is not None:
+                return cached
             # 呼叫 LLM 做語意分類
+            system_prompt, user_prompt, response_format, segments = self._request(args.text)
             raw_output = await self.llm.chat(
-                system_prompt=SYSTEM_PROMPT_SEMANTIC_CLASSIFICATION,
-                user_prompt=USER_PROMPT_TEMPLATE_CLASSIFICATION.format(user_input=args.text)
-            )
-
-            parsed = self._parse_llm_output(raw_output)
-            if parsed is None:
-                return ToolResult(
-                    success=False,
-                    result_for_llm="LLM 輸出解析失敗，請重試或提供更清晰的輸入。",
-                    metadata={"error_type": "semantic_parse_error"},
-                )
-
-            semantic_result = SemanticResult(
-                labels=parsed["labels"],
-                greeting=parsed["greeting"],
-                main_query=parsed["main_query"],
-                presentation=parsed["presentation"],
-                other=parsed["other"]
+                system_prompt=system_prompt,
+                user_prompt=user_prompt,
+                response_format=response_format,
             )
+            result = self.build_result(raw_output, segments)
+            self.remember(args.text, result)
+            return result
 
-            # 簡短摘要給 Agent 使用
-            result_for_llm = (
-                f"分類完成。主查詢: {semantic_result.main_query or '無'}；"
-                f"問候語: {semantic_result.greeting or '無'}；"
-                f"展示語: {semantic_result.presentation or '無'}；"
-                f"其他句子數量: {len(semantic_result.other)}。"
-            )
+        except Exception as e:
+            return self._error_result(e)
 
-            # 提示 Agent：如果有 main_query，應該進一步呼叫 intent_classifier
-            if semantic_result.main_query:
-                result_for_llm += (
-                    f"\n檢測到 main_query='{semantic_result.main_query}'，"
-                    "請使用 intent_classifier 工具進一步判斷查詢是否與資料庫相關。"
-                )
+    async def execute_streaming(
+        self,
+        args: SemanticAnalysisInput,
+        on_main_query: Optional[Callable[[str], None]] = None,
+    ) -> ToolResult:
+        """
+        串流版 execute：邊接收 LLM 輸出邊增量解析，
+        main_query 一確定就呼叫 on_main_query（最多一次），讓呼叫端提前啟動後續工具。
+        最終結果與 execute 相同。
+        """
+        with track_usage() as usage, span("semantic", streaming=True):
+            result = await self._execute_streaming(args, on_main_query)
+        result.metadata["usage"] = usage.as_dict()
+        return result
 
-            return ToolResult(
-                success=True,
-                result_for_llm=f"<tool_call>{self.name}</tool_call>\n{result_for_llm}",
-                metadata={"semantic_result": semantic_result.model_dump()},
-            )
+    async def _execute_streaming(
+        self,
+        args: SemanticAnalysisInput,
+        on_main_query: Optional[Callable[[str], None]],
+    ) -> ToolResult:
+        try:
+            cached = self.cached_result(args.text)
+            if cached is not None:
+                return cached
+            system_prompt, user_prompt, response_format, segments = self._request(args.text)
+            parser = MainQueryStreamParser() if segments is None else SpanLabelStreamParser(segments)
+            async for chunk in self.llm.chat_stream(
+                system_prompt=system_prompt,
+                user_prompt=user_prompt,
+                response_format=response_format,
+            ):
+                main_query = parser.feed(chunk)
+                if main_query and on_main_query is not None:
+                    on_main_query(main_query)
+            result = self.build_result(parser.text.strip(), segments)
+            self.remember(args.text, result)
+            return result
 
         except Exception as e:
+            return self._error_result(e)
+
+    @staticmethod
+    def _error_result(error: Exception) -> ToolResult:
+        """LLM 呼叫失敗（逾時、熔斷等）以 LLMError 的 error_type 回報，與輸出解析失敗區分"""
+        return ToolResult(
+            success=False,
+            result_for_llm=f"Error executing semantic analysis: {str(error)}",
+            metadata={"error_type": error.error_type if isinstance(error, LLMError) else "semantic_tool_error"},
+        )
+
+    def _request(self, text: str) -> Tuple[str, str, Optional[Dict[str, Any]], Optional[List[str]]]:
+        """回傳 (system_prompt, user_prompt, response_format, 本地分句)；full 模式的本地分句為 None"""
+        if self.output_mode == SEMANTIC_OUTPUT_SPANS:
+            segments = split_segments(text)
+            system_prompt, user_prompt = SEMANTIC_SPANS_PROMPT.render(number_segments(segments))
+            return system_prompt, user_prompt, SEMANTIC_SPANS_RESPONSE_FORMAT if self.guided_json else None, segments
+        system_prompt, user_prompt = SEMANTIC_CLASSIFICATION_PROMPT.render(text)
+        return system_prompt, user_prompt, SEMANTIC_RESPONSE_FORMAT if self.guided_json else None, None
+
+    def parse_output(self, raw_output: str, segments: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """解析 LLM 原始輸出（span 模式需傳入本地分句）；無法解析時回傳 None"""
+        with span("semantic.parse"):
+            return self._parse_llm_output(raw_output, segments)
+
+    def build_result(self, raw_output: str, segments: Optional[List[str]] = None) -> ToolResult:
+        """解析 LLM 原始輸出並包裝成 ToolResult（解析失敗時回傳 semantic_parse_error）"""
+        return self.result_from_parsed(self.parse_output(raw_output, segments))
+
+    def result_from_parsed(self, parsed: Optional[Dict[str, Any]]) -> ToolResult:
+        """將 parse_output() 的結果包裝成 ToolResult；parsed 為 None 時回傳 semantic_parse_error"""
+        if parsed is None:
             return ToolResult(
                 success=False,
-                result_for_llm=f"Error executing semantic analysis: {str(e)}",
-                metadata={"error_type": "semantic_tool_error"},
+                result_for_llm="LLM 輸出解析失敗，請重試或提供更清晰的輸入。",
+                metadata={"error_type": "semantic_parse_error"},
             )
 
+        semantic_result = SemanticResult(
+            labels=parsed["labels"],
+            greeting=parsed["greeting"],
+            main_query=parsed["main_query"],
+            presentation=parsed["presentation"],
+            other=parsed["other"]
+        )
+        return self.wrap_result(semantic_result)
+
+    def wrap_result(self, semantic_result: SemanticResult) -> ToolResult:
+        # 簡短摘要給 Agent 使用
+        result_for_llm = (
+            f"分類完成。主查詢: {semantic_result.main_query or '無'}；"
+            f"問候語: {semantic_result.greeting or '無'}；"
+            f"展示語: {semantic_result.presentation or '無'}；"
+            f"其他句子數量: {len(semantic_result.other)}。"
+        )
+
+        # 提示 Agent：如果有 main_query，應該進一步呼叫 intent_classifier
+        if semantic_result.main_query:
+            result_for_llm += (
+                f"\n檢測到 main_query='{semantic_result.main_query}'，"
+                "請使用 intent_classifier 工具進一步判斷查詢是否與資料庫相關。"
+            )
+
+        return ToolResult(
+            success=True,
+            result_for_llm=f"<tool_call>{self.name}</tool_call>\n{result_for_llm}",
+            metadata={"semantic_result": semantic_result.model_dump()},
+        )
+
+    def cached_result(self, text: str) -> Optional[ToolResult]:
+        """
+        近似重複的輸入重用先前的結果。
+        結果中的句子必須恰好組成這次的輸入（忽略空白、標點與順序），
+        避免例如多了一句問候語時沿用缺少 greeting 的舊結果。
+        """
+        if self.similarity_cache is None:
+            return None
+        normalized = NgramVectorizer.normalize(text)
+
+        def grounded(value: Dict[str, Any]) -> bool:
+            rest = normalized
+            for sentence in value.get("labels") or {}:
+                part = NgramVectorizer.normalize(sentence)
+                if not part or part not in rest:
+                    return False
+                rest = rest.replace(part, "", 1)
+            return bool(value.get("labels")) and not rest
+
+        hit = self.similarity_cache.lookup(text, validate=grounded)
+        if hit is None:
+            return None
+        result = self.wrap_result(SemanticResult(**hit[0]))
+        result.metadata["similarity"] = hit[1]
+        return result
+
+    def remember(self, text: str, result: ToolResult) -> None:
+        if self.similarity_cache is not None and result.success:
+            self.similarity_cache.add(text, result.metadata["semantic_result"])
+
     # ------------------ 輔助方法 ------------------
 
-    def _extract_json_block(self, text: str) -> Optional[str]:
-        """從 LLM 輸出中提取 JSON 區塊"""
+    def _load_json(self, content: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """
+        回傳 (JSON 物件, 是否經過修補)。
+        整段、或第一個 { 到最後一個 } 之間（去掉程式碼區塊標記與說明文字）即為合法 JSON 時，
+        直接交給 json.loads，不需逐字掃描。
+        """
+        content = content.strip()
+        start, end = content.find("{"), content.rfind("}")
+        if start < 0 or end < start:
+            return None, False
         try:
-            json.loads(text)
-            return text
-        except Exception:
+            data = json.loads(content[start:end + 1])
+            if isinstance(data, dict):
+                return data, start > 0 or end < len(content) - 1
+        except ValueError:
             pass
-        code_block = re.search(r"```json\s*(\{.*?\})\s*```", text, re.DOTALL)
-        if code_block:
-            return code_block.group(1)
-        brace_match = re.search(r"(\{.*?\})", text, re.DOTALL)
-        if brace_match:
-            return brace_match.group(1)
-        return None
-
-    def _parse_llm_output(self, content: str) -> Optional[Dict[str, Any]]:
-        """解析 LLM 輸出成 dict"""
-        json_str = self._extract_json_block(content)
-        if not json_str:
-            return None
+        json_str, repaired = extract_json_object(content)
+        if json_str is None:
+            return None, False
         try:
-            data = json.loads(json_str.replace("'", '"').strip())
-        except Exception:
+            data = json.loads(json_str)
+        except ValueError:
+            return None, False
+        return (data, True) if isinstance(data, dict) else (None, False)
+
+    def _expand_spans(self, data: Optional[Dict[str, Any]], segments: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        將 span 模式的輸出（每句一個類別代號）還原成 full 模式的 JSON 結構：
+        句子文字取自本地分句，main_query / greeting / presentation 為各類別的第一句。
+        與 full 模式的規則一致，只有第一個 Q 標為 main_query，其餘的 Q 標為 other。
+        代號數量與句子數不符或出現未知代號時回傳 None。
+        """
+        codes = data.get("labels") if data is not None else None
+        if not isinstance(codes, list) or len(codes) != len(segments):
             return None
+        sentences, first = [], {}
+        for text, code in zip(segments, codes):
+            code = str(code).strip()
+            label = SPAN_LABEL_CODES.get(code.upper()) or (code if code in SPAN_LABEL_CODES.values() else None)
+            if label is None:
+                return None
+            if label == "main_query" and label in first:
+                label = "other"
+            sentences.append({"text": text, "label": label})
+            first.setdefault(label, text)
+        return {
+            "sentences": sentences,
+            "main_query": first.get("main_query"),
+            "greeting": first.get("greeting"),
+            "presentation": first.get("presentation"),
+        }
 
-        sentences = data.get("sentences")
+    def _parse_llm_output(self, content: str, segments: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        解析 LLM 輸出成 dict，並依結果記錄 semantic_parse_total（ok / repaired / error）。
+        span 模式需傳入本地分句 segments，以代號還原句子。
+        intent 只在 fused 模式的輸出中出現，不是 A/B/C/D 其中之一時為 None。
+        """
+        data, repaired = self._load_json(content)
+        if segments is not None:
+            data = self._expand_spans(data, segments)
+        sentences = data.get("sentences") if data is not None else None
         if not isinstance(sentences, list):
+            metrics.inc("semantic_parse_total", outcome="error")
             return None
+        metrics.inc("semantic_parse_total", outcome="repaired" if repaired else "ok")
 
         labels, other = {}, []
         main_query = data.get("main_query")
@@ -134,10 +310,14 @@ class SemanticAnalysisTool(Tool[SemanticAnalysisInput]):
             if label == "other" or (not is_primary and label in ("main_query", "presentation", "greeting")):
                 other.append(text)
 
+        intent = data.get("intent")
+        intent = intent.strip().upper() if isinstance(intent, str) else None
+
         return {
             "labels": labels,
             "greeting": greeting,
             "main_query": main_query,
             "presentation": presentation,
             "other": other,
+            "intent": intent if intent in ("A", "B", "C", "D") else None,
         }
@@ -0,0 +1,246 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterable, AsyncIterator, Deque, Dict, Iterable, List, Optional, Tuple, Union
+
+from vanna import ToolResult
+
+from config import BATCH_CONCURRENCY, BATCH_DEDUPE_MAX, WORKFLOW_DEADLINE
+from services.resilience import deadline
+from services.scheduler import PRIORITY_BATCH, llm_priority
+from tool.semantic import SemanticAnalysisTool, SemanticAnalysisInput
+from tool.intent import IntentClassifierTool, IntentInput
+
+STAGES = ("semantic", "intent", "total")
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+
+@dataclass
+class BatchStats:
+    """批次執行統計：吞吐量與各階段延遲（毫秒）"""
+    total: int = 0
+    unique: int = 0
+    duplicates: int = 0
+    failures: int = 0
+    elapsed: float = 0.0
+    latencies: Dict[str, List[float]] = field(default_factory=lambda: {s: [] for s in STAGES})
+
+    @property
+    def qps(self) -> float:
+        return self.total / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        stages = {}
+        for stage, values in self.latencies.items():
+            ordered = sorted(values)
+            stages[stage] = {
+                "count": len(ordered),
+                "mean_ms": sum(ordered) / len(ordered) if ordered else 0.0,
+                "p50_ms": _percentile(ordered, 0.50),
+                "p95_ms": _percentile(ordered, 0.95),
+                "p99_ms": _percentile(ordered, 0.99),
+            }
+        return {
+            "total": self.total,
+            "unique": self.unique,
+            "duplicates": self.duplicates,
+            "failures": self.failures,
+            "elapsed_s": round(self.elapsed, 3),
+            "qps": round(self.qps, 2),
+            "stages": stages,
+        }
+
+
+async def _aiter(inputs: Union[Iterable[str], AsyncIterable[str]]) -> AsyncIterator[str]:
+    if hasattr(inputs, "__aiter__"):
+        async for item in inputs:
+            yield item
+    else:
+        for item in inputs:
+            yield item
+
+
+class BatchClassifier:
+    """
+    批次語意分析 + 意圖判斷。
+    - 相同文字只分類一次：進行中的重複項共用同一個 task，已完成的結果保留最近 dedupe_max 筆（LRU）
+    - 以 semaphore 限制同時進行的分類數，輸入採延遲讀取，記憶體只保留固定大小的視窗
+    - ordered=True 依輸入順序輸出；False 則依完成順序輸出
+    """
+
+    def __init__(
+        self,
+        semantic_tool: SemanticAnalysisTool,
+        intent_tool: IntentClassifierTool,
+        concurrency: int = BATCH_CONCURRENCY,
+        ordered: bool = True,
+        dedupe_max: int = BATCH_DEDUPE_MAX,
+        timeout: float = WORKFLOW_DEADLINE,
+        priority: str = PRIORITY_BATCH,
+    ):
+        self.semantic_tool = semantic_tool
+        self.intent_tool = intent_tool
+        self.concurrency = max(1, concurrency)
+        self.ordered = ordered
+        self.dedupe_max = dedupe_max
+        # 每筆分類（取得執行名額後起算）的時限，與 Workflow.run 相同
+        self.timeout = timeout
+        # LLM 呼叫的排程等級：預設 batch，與線上請求共用後端時不會佔滿所有名額
+        self.priority = priority
+        self.stats = BatchStats()
+
+    @classmethod
+    def from_workflow(cls, workflow, **kwargs) -> "BatchClassifier":
+        """沿用 Workflow 已建立的工具（與其共用 LLM client）"""
+        return cls(workflow.semantic_tool, workflow.intent_tool, **kwargs)
+
+    async def run(self, inputs: Union[Iterable[str], AsyncIterable[str]]) -> AsyncIterator[Dict[str, Any]]:
+        """逐筆產出分類結果 dict；inputs 可為一般或非同步 iterable。"""
+        self.stats = BatchStats()
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        loop = asyncio.get_running_loop()
+        # 進行中的分類（完成即移除，結果改存到 results）
+        inflight: Dict[str, asyncio.Task] = {}
+        results: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        pending: Deque[Tuple[int, str, asyncio.Future, bool]] = deque()
+        window = self.concurrency * 4
+
+        def finished(text: str, task: asyncio.Task) -> None:
+            inflight.pop(text, None)
+            if self.dedupe_max > 0 and not task.cancelled() and task.exception() is None:
+                results[text] = task.result()
+                if len(results) > self.dedupe_max:
+                    results.popitem(last=False)
+
+        try:
+            index = 0
+            async for text in _aiter(inputs):
+                task = inflight.get(text)
+                if task is None and text in results:
+                    results.move_to_end(text)
+                    task = loop.create_future()
+                    task.set_result(results[text])
+                duplicate = task is not None
+                if duplicate:
+                    self.stats.duplicates += 1
+                else:
+                    task = inflight[text] = asyncio.create_task(self._classify(text, semaphore))
+                    task.add_done_callback(lambda t, text=text: finished(text, t))
+                pending.append((index, text, task, duplicate))
+                index += 1
+                while len(pending) >= window:
+                    for record in await self._drain(pending):
+                        yield record
+            while pending:
+                for record in await self._drain(pending):
+                    yield record
+        finally:
+            for _, _, task, _ in pending:
+                task.cancel()
+            self.stats.elapsed = time.perf_counter() - started
+
+    async def run_jsonl(self, in_path: str, out_path: str, text_field: str = "text") -> BatchStats:
+        """讀取 JSONL（每行為字串或含 text_field 的物件），結果逐行寫入 out_path。"""
+        with open(out_path, "w", encoding="utf-8") as out:
+            async for record in self.run(_read_jsonl(in_path, text_field)):
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return self.stats
+
+    # ------------------ 內部 ------------------
+
+    async def _drain(self, pending: Deque[Tuple[int, str, asyncio.Future, bool]]) -> List[Dict[str, Any]]:
+        """等待視窗中至少一筆完成並取出可輸出的結果"""
+        if self.ordered:
+            index, text, task, duplicate = pending.popleft()
+            return [self._record(index, text, await task, duplicate)]
+
+        await asyncio.wait({item[2] for item in pending}, return_when=asyncio.FIRST_COMPLETED)
+        ready = [item for item in pending if item[2].done()]
+        for item in ready:
+            pending.remove(item)
+        return [self._record(index, text, task.result(), duplicate) for index, text, task, duplicate in ready]
+
+    async def _classify(self, text: str, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        async with semaphore:
+            with deadline(self.timeout), llm_priority(self.priority):
+                t0 = time.perf_counter()
+                semantic = await self.semantic_tool.execute(None, SemanticAnalysisInput(text=text))
+                t1 = time.perf_counter()
+                intent: Optional[ToolResult] = None
+                main_query = semantic.metadata.get("semantic_result", {}).get("main_query") if semantic.success else None
+                if main_query:
+                    intent = await self.intent_tool.execute(None, IntentInput(query=main_query))
+                t2 = time.perf_counter()
+
+        latency = {"semantic": (t1 - t0) * 1000, "total": (t2 - t0) * 1000}
+        if intent is not None:
+            latency["intent"] = (t2 - t1) * 1000
+        for stage, value in latency.items():
+            self.stats.latencies[stage].append(value)
+        self.stats.unique += 1
+
+        success = semantic.success and (intent is None or intent.success)
+        if not success:
+            self.stats.failures += 1
+        failed = intent if intent is not None and not intent.success else semantic
+        return {
+            "success": success,
+            "semantic_result": semantic.metadata.get("semantic_result"),
+            "intent_result": intent.metadata if intent is not None and intent.success else None,
+            "error": None if success else failed.result_for_llm,
+            "error_type": None if success else failed.metadata.get("error_type"),
+            "latency_ms": {k: round(v, 2) for k, v in latency.items()},
+        }
+
+    def _record(self, index: int, text: str, outcome: Dict[str, Any], duplicate: bool) -> Dict[str, Any]:
+        self.stats.total += 1
+        return {"index": index, "text": text, "duplicate": duplicate, **outcome}
+
+
+def _read_jsonl(path: str, text_field: str) -> Iterable[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            yield item if isinstance(item, str) else item[text_field]
+
+
+async def _main() -> None:
+    from services.openai_client import get_openai_client, close_openai_client
+
+    parser = argparse.ArgumentParser(description="批次語意分析 + 意圖判斷（JSONL in / JSONL out）")
+    parser.add_argument("input", help="輸入 JSONL，每行為字串或含 --field 欄位的物件")
+    parser.add_argument("output", help="輸出 JSONL")
+    parser.add_argument("--field", default="text")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--unordered", action="store_true", help="依完成順序輸出")
+    args = parser.parse_args()
+
+    llm = get_openai_client()
+    classifier = BatchClassifier(
+        SemanticAnalysisTool(llm),
+        IntentClassifierTool(llm),
+        concurrency=args.concurrency,
+        ordered=not args.unordered,
+    )
+    try:
+        stats = await classifier.run_jsonl(args.input, args.output, args.field)
+    finally:
+        await close_openai_client()
+    print(json.dumps(stats.summary(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
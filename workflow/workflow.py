@@ -1,149 +1,415 @@
+import asyncio
+import time
 import uuid
 import os
+from collections import Counter
 from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+from vanna import ToolResult
 from vanna import ToolContext
 from vanna.core.user import User
 
 from tool.semantic import SemanticAnalysisTool, SemanticAnalysisInput, SemanticResult, build_semantic_reply
 from tool.intent import IntentClassifierTool, IntentInput, IntentResult
+from tool.fused import FusedClassificationTool
+from tool.prefilter import RulePreClassifier, PrefilterResult
+from config import WORKFLOW_MODE, WORKFLOW_DEADLINE, WORKFLOW_SPECULATION_THRESHOLD, PREFILTER_ENABLED, PREFILTER_SHADOW, PREFILTER_PRECISION_PATH, MEMORY_LOG_ENABLED, MEMORY_LOG_PATH
+from services.openai_client import OpenAIClient, get_openai_client
+from services.metrics import metrics, request_trace, span, trace_event
+from services.memory_log import MemoryLogWriter
+from services.resilience import deadline
+from services.scheduler import PRIORITY_INTERACTIVE, llm_priority
+from services.similarity_cache import NgramVectorizer
+
+MODE_PIPELINE = "pipeline"
+MODE_FUSED = "fused"
+MODE_STREAMING = "streaming"
+MODE_SPECULATIVE = "speculative"
+WORKFLOW_MODES = (MODE_PIPELINE, MODE_FUSED, MODE_STREAMING, MODE_SPECULATIVE)
+
+metrics.describe(
+    "workflow_speculation_total",
+    "Speculative intent classifications by outcome (exact / similar / miss / no_main_query)",
+)
+metrics.describe("prefilter_shadow_total", "Prefilter rule matches compared with the LLM in shadow mode, by rule and agreement")
+
 
 class Workflow:
     """
     Workflow 負責全局決策：
+    0. 本地預分類命中（問候語、設備代號查詢）→ 直接產生結果，不呼叫 LLM
     1. 呼叫 semantic tool
     2. 如果有 main_query → 呼叫 intent tool
     3. 如果沒有 main_query → 使用 build_semantic_reply
-    4. 把工具呼叫與回覆存進 agent_memory (只存文字)
+    4. 把工具呼叫與回覆存進 agent_memory (只存文字，以使用者與 conversation_id 區分)
+
+    mode 可於執行期切換（self.mode 或 run(mode=...)），方便比較兩種流程的延遲：
+    - pipeline：semantic、intent 各一次 LLM 呼叫
+    - fused：單次 LLM 呼叫同時產生語意分類與意圖，輸出格式與 trace 不變
+    - streaming：串流接收語意分析輸出，main_query 一確定就並行啟動 intent tool
+    - speculative：以原始輸入與 semantic tool 同時呼叫 intent tool，main_query 與原始輸入相近時沿用其結果
     """
-    def __init__(self, agent):
+    def __init__(self, agent, llm: Optional[OpenAIClient] = None):
         self.agent = agent
-        self.semantic_tool = SemanticAnalysisTool()
-        self.intent_tool = IntentClassifierTool()
+        # 所有工具共用同一個 LLM client（連線池）
+        self.llm = llm or get_openai_client()
+        self.semantic_tool = SemanticAnalysisTool(self.llm)
+        self.intent_tool = IntentClassifierTool(self.llm)
+        self.fused_tool = FusedClassificationTool(self.semantic_tool, self.intent_tool, self.llm)
+        self.mode = WORKFLOW_MODE
+        self.prefilter = RulePreClassifier(precision_path=PREFILTER_PRECISION_PATH) if PREFILTER_ENABLED else None
+        # speculative 模式的結果統計（exact / similar 為沿用，miss / no_main_query 為浪費的呼叫）
+        self.speculation: Counter = Counter()
+        self.speculation_threshold = WORKFLOW_SPECULATION_THRESHOLD
+        self._vectorizer = NgramVectorizer()
         # 註冊工具到 Agent
         self.agent.tool_registry.register_local_tool(self.semantic_tool, access_groups=["admin"])
         self.agent.tool_registry.register_local_tool(self.intent_tool, access_groups=["admin"])
+        self.agent.tool_registry.register_local_tool(self.fused_tool, access_groups=["admin"])
         # 準備本地記憶日誌檔案路徑
-        self._memory_log_path = os.path.join("data", "memory", "demo_conversation.log")
-        os.makedirs(os.path.dirname(self._memory_log_path), exist_ok=True)
+        self._memory_log_path = MEMORY_LOG_PATH
+        self.memory_log = MemoryLogWriter(self._memory_log_path)
 
-    async def run(self, user_input: str, user: User) -> str:
+    async def run(
+        self,
+        user_input: str,
+        user: User,
+        mode: Optional[str] = None,
+        conversation_id: Optional[str] = None,
+        request_id: Optional[str] = None,
+        on_chunk: Optional[Callable[[str], None]] = None,
+        timeout: Optional[float] = None,
+        priority: str = PRIORITY_INTERACTIVE,
+    ) -> str:
         """
         執行工作流程並回傳字串結果。
+        mode 未指定時使用 self.mode；conversation_id 未指定時視為新對話；request_id 未指定時自動產生。
+        on_chunk 會依序收到回覆的每一段（以換行串接即為回傳值），語意分析一完成就送出第一段，
+        不必等待意圖判斷，供串流回應使用。
+        timeout 為整個請求的時限（秒，未指定時為 WORKFLOW_DEADLINE），期間的每次 LLM 呼叫都以剩餘時間為上限；
+        時限已到的工具回傳 error_type=llm_timeout 的失敗結果，不會被當成分類結果。
+        priority 為期間 LLM 呼叫的排程等級（services.scheduler）；後端滿載而被拒絕時工具回傳 error_type=llm_overloaded。
 
         為了方便觀察工具呼叫，這裡會在回覆中插入輕量級 trace 標記：
         - <tool_call name="SemanticAnalysisTool"> ... </tool_call>
         - <tool_call name="IntentClassifierTool"> ... </tool_call>
+
+        每次執行會產生一份請求 trace（各階段與每次 LLM 呼叫的耗時），
+        並將 workflow 本身的額外耗時（總時間扣除分類階段）記為 workflow.overhead。
         """
+        mode = mode or self.mode
+        if mode not in WORKFLOW_MODES:
+            raise ValueError(f"未知的 workflow mode: {mode}")
+
+        request_id = request_id or str(uuid.uuid4())
+        with request_trace(request_id) as trace:
+            started = time.perf_counter()
+            limit = WORKFLOW_DEADLINE if timeout is None else timeout
+            with span("workflow", mode=mode), deadline(limit), llm_priority(priority):
+                reply = await self._run(
+                    user_input, user, mode, conversation_id or str(uuid.uuid4()), request_id, on_chunk
+                )
+            total = time.perf_counter() - started
+            classify = sum(s["duration_ms"] for s in trace.spans if s["name"] == "workflow.classify") / 1000
+            metrics.observe("span_duration_seconds", max(0.0, total - classify), span="workflow.overhead")
+        return reply
 
+    async def _run(
+        self,
+        user_input: str,
+        user: User,
+        mode: str,
+        conversation_id: str,
+        request_id: str,
+        on_chunk: Optional[Callable[[str], None]] = None,
+    ) -> str:
         trace_chunks = []
 
+        def emit(chunk: str) -> None:
+            trace_chunks.append(chunk)
+            if on_chunk is not None:
+                on_chunk(chunk)
+
+        def semantic_trace(result: ToolResult) -> str:
+            return f"<tool_call name=\"SemanticAnalysisTool\">success={result.success}; msg={result.result_for_llm}</tool_call>"
+
         # 建立 ToolContext，讓記憶系統知道這次對話
         context = ToolContext(
             user=user,
-            conversation_id="demo_conversation",
-            request_id=str(uuid.uuid4()),
+            conversation_id=conversation_id,
+            request_id=request_id,
             agent_memory=self.agent.agent_memory,
         )
-        conversation_id = context.conversation_id
-        request_id = context.request_id
 
-        # Step 1: 呼叫 semantic tool
-        args = SemanticAnalysisInput(text=user_input)
-        tool_result = await self.semantic_tool.execute(None, args)
+        # Step 1: 語意分析與意圖判斷（預分類命中時不呼叫 LLM）
+        # 語意分析一完成就送出其 trace，不等待意圖判斷
+        with span("workflow.classify"):
+            tool_result, intent_result = await self._classify(
+                user_input, mode, on_semantic=lambda result: emit(semantic_trace(result))
+            )
 
         # 在回覆中嵌入工具呼叫 trace
-        trace_chunks.append(
-            f"<tool_call name=\"SemanticAnalysisTool\">success={tool_result.success}; msg={tool_result.result_for_llm}</tool_call>"
-        )
+        if not trace_chunks:
+            emit(semantic_trace(tool_result))
 
-        # 存文字記憶（工具呼叫結果）
-        # await self.agent.agent_memory.save_text_memory(
-        #     context=context,
-        #     content=trace_chunks[-1],
-        # )
-        # self._log_memory(conversation_id, request_id, user, trace_chunks[-1])
+        await self._remember(context, trace_chunks[-1])
 
         if not tool_result.success:
-            # await self.agent.agent_memory.save_text_memory(
-            #     context=context,
-            #     content=tool_result.result_for_llm,
-            # )
-            # self._log_memory(conversation_id, request_id, user, tool_result.result_for_llm)
-            tail = self._tail_log(10)
-            return "\n".join(trace_chunks + [tool_result.result_for_llm, "\n[最近記憶紀錄]\n" + tail])
+            await self._remember(context, tool_result.result_for_llm)
+            emit(tool_result.result_for_llm)
+            emit("\n[最近記憶紀錄]\n" + self._tail_log(10))
+            return "\n".join(trace_chunks)
 
         # 轉成 SemanticResult
         semantic_result = SemanticResult(**tool_result.metadata["semantic_result"])
 
-        # Step 2: 如果有 main_query → 呼叫 intent tool
+        # Step 2: 如果有 main_query → 輸出 intent tool 結果
         if semantic_result.main_query:
-            intent_args = IntentInput(query=semantic_result.main_query)
-            intent_result = await self.intent_tool.execute(None, intent_args)
-
-            trace_chunks.append(
+            emit(
                 f"<tool_call name=\"IntentClassifierTool\">success={intent_result.success}; msg={intent_result.result_for_llm}</tool_call>"
             )
 
-            # 存文字記憶（工具呼叫結果）
-            # await self.agent.agent_memory.save_text_memory(
-            #     context=context,
-            #     content=trace_chunks[-1],
-            # )
-            # self._log_memory(conversation_id, request_id, user, trace_chunks[-1])
+            await self._remember(context, trace_chunks[-1])
 
             if not intent_result.success:
-                # await self.agent.agent_memory.save_text_memory(
-                #     context=context,
-                #     content=intent_result.result_for_llm,
-                # )
-                # self._log_memory(conversation_id, request_id, user, intent_result.result_for_llm)
-                tail = self._tail_log(10)
-                return "\n".join(trace_chunks + [intent_result.result_for_llm, "\n[最近記憶紀錄]\n" + tail])            
-            
+                await self._remember(context, intent_result.result_for_llm)
+                emit(intent_result.result_for_llm)
+                emit("\n[最近記憶紀錄]\n" + self._tail_log(10))
+                return "\n".join(trace_chunks)
+
             # 轉成 IntentResult
             ir = IntentResult(**intent_result.metadata)
             final_msg = f"意圖判斷結果：{ir.abcd} ({ir.label}) → 建議：{ir.suggestion or '無'}"
 
-            # 存文字記憶（最終回覆）
-            # await self.agent.agent_memory.save_text_memory(
-            #     context=context,
-            #     content=final_msg,
-            # )
-            # self._log_memory(conversation_id, request_id, user, final_msg)
-            tail = self._tail_log(10)
-            return "\n".join(trace_chunks + [final_msg, "\n[最近記憶紀錄]\n" + tail])
+            await self._remember(context, final_msg)
+            emit(final_msg)
+            emit("\n[最近記憶紀錄]\n" + self._tail_log(10))
+            return "\n".join(trace_chunks)
 
         # Step 3: 如果沒有 main_query → 使用 build_semantic_reply
         final_msg = build_semantic_reply(semantic_result)
 
-        # await self.agent.agent_memory.save_text_memory(
-        #     context=context,
-        #     content=final_msg,
-        # )
-        # self._log_memory(conversation_id, request_id, user, final_msg)
-        tail = self._tail_log(10)
-        return "\n".join(trace_chunks + [final_msg, "\n[最近記憶紀錄]\n" + tail])
-
-    # 將保存的文字記憶額外寫入本地檔案，便於驗證
-    # def _log_memory(self, conversation_id: str, request_id: str, user: User, content: str) -> None:
-    #     try:
-    #         ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    #         user_id = getattr(user, "id", "unknown")
-    #         line = f"[{ts}] conversation={conversation_id} | request={request_id} | user={user_id} | {content}\n"
-    #         with open(self._memory_log_path, "a", encoding="utf-8") as f:
-    #             f.write(line)
-    #     except Exception:
-    #         pass
-
-    # 讀取本地記憶日誌最後 n 行
+        await self._remember(context, final_msg)
+        emit(final_msg)
+        emit("\n[最近記憶紀錄]\n" + self._tail_log(10))
+        return "\n".join(trace_chunks)
+
+    async def _classify(
+        self, user_input: str, mode: str, on_semantic: Optional[Callable[[ToolResult], None]] = None
+    ) -> Tuple[ToolResult, Optional[ToolResult]]:
+        """
+        回傳 (semantic ToolResult, intent ToolResult)；沒有 main_query 時 intent 為 None。
+        預分類命中時直接包裝規則結果；shadow 模式下仍以 LLM 結果為準，
+        規則與 LLM 的標籤記入請求 trace（prefilter.shadow），並累計規則的精確率。
+        經過 LLM 時，語意分析結果一確定（意圖判斷之前）就呼叫 on_semantic。
+        """
+        pre = None
+        if self.prefilter is not None:
+            with span("prefilter"):
+                pre = self.prefilter.match(user_input) if PREFILTER_SHADOW else self.prefilter.classify(user_input)
+        if pre is not None and not PREFILTER_SHADOW:
+            return self._wrap_prefilter(pre)
+
+        tool_result, intent_result = await self._classify_with_llm(user_input, mode, on_semantic)
+        if pre is not None:
+            llm_semantic = (
+                SemanticResult(**tool_result.metadata["semantic_result"]) if tool_result.success else None
+            )
+            llm_intent = (
+                IntentResult(**intent_result.metadata) if intent_result is not None and intent_result.success else None
+            )
+            agree = self.prefilter.record_shadow(pre, llm_semantic, llm_intent)
+            metrics.inc("prefilter_shadow_total", rule=pre.rule, agree=agree)
+            trace_event(
+                "prefilter.shadow",
+                rule=pre.rule,
+                confidence=round(pre.confidence, 4),
+                rule_main_query=pre.semantic.main_query,
+                rule_intent=pre.intent.abcd if pre.intent is not None else None,
+                llm_main_query=llm_semantic.main_query if llm_semantic is not None else None,
+                llm_intent=llm_intent.abcd if llm_intent is not None else None,
+                agree=agree,
+            )
+        return tool_result, intent_result
+
+    async def _classify_with_llm(
+        self, user_input: str, mode: str, on_semantic: Optional[Callable[[ToolResult], None]] = None
+    ) -> Tuple[ToolResult, Optional[ToolResult]]:
+        if mode == MODE_STREAMING:
+            return await self._classify_streaming(user_input, on_semantic)
+        if mode == MODE_SPECULATIVE:
+            return await self._classify_speculative(user_input, on_semantic)
+        # fused 模式會在同一次呼叫中一併取得 intent 結果
+        intent_result = None
+        if mode == MODE_FUSED:
+            tool_result, intent_result = await self.fused_tool.classify(user_input)
+        else:
+            args = SemanticAnalysisInput(text=user_input)
+            tool_result = await self.semantic_tool.execute(None, args)
+        if on_semantic is not None:
+            on_semantic(tool_result)
+        if not tool_result.success:
+            return tool_result, None
+
+        main_query = tool_result.metadata["semantic_result"].get("main_query")
+        if not main_query:
+            return tool_result, None
+        if intent_result is None:
+            intent_args = IntentInput(query=main_query)
+            intent_result = await self.intent_tool.execute(None, intent_args)
+        return tool_result, intent_result
+
+    async def _classify_streaming(
+        self, user_input: str, on_semantic: Optional[Callable[[ToolResult], None]] = None
+    ) -> Tuple[ToolResult, Optional[ToolResult]]:
+        """
+        語意分析以串流執行；main_query 一出現即啟動 intent tool，與剩餘的語意輸出並行。
+        若最終解析出的 main_query 與提前取得的不同，則取消提前的呼叫並重新判斷。
+        """
+        early = {}
+
+        def on_main_query(main_query: str) -> None:
+            early["query"] = main_query
+            early["task"] = asyncio.create_task(
+                self.intent_tool.execute(None, IntentInput(query=main_query))
+            )
+
+        try:
+            args = SemanticAnalysisInput(text=user_input)
+            tool_result = await self.semantic_tool.execute_streaming(args, on_main_query)
+        except BaseException:
+            await _cancel(early.get("task"))
+            raise
+        if on_semantic is not None:
+            on_semantic(tool_result)
+
+        main_query = tool_result.metadata["semantic_result"].get("main_query") if tool_result.success else None
+        if not main_query:
+            await _cancel(early.get("task"))
+            return tool_result, None
+        if early.get("query") == main_query:
+            return tool_result, await early["task"]
+
+        await _cancel(early.get("task"))
+        intent_args = IntentInput(query=main_query)
+        return tool_result, await self.intent_tool.execute(None, intent_args)
+
+    async def _classify_speculative(
+        self, user_input: str, on_semantic: Optional[Callable[[ToolResult], None]] = None
+    ) -> Tuple[ToolResult, Optional[ToolResult]]:
+        """
+        intent tool 以原始輸入與 semantic tool 同時執行（單句查詢時 main_query 幾乎等於原始輸入）。
+        main_query 與原始輸入相同或相似度達 speculation_threshold 時沿用推測結果，
+        否則取消推測的呼叫並以實際的 main_query 重新判斷；沒有 main_query 時推測結果捨棄。
+        """
+        speculative = asyncio.create_task(self.intent_tool.execute(None, IntentInput(query=user_input.strip())))
+        try:
+            args = SemanticAnalysisInput(text=user_input)
+            tool_result = await self.semantic_tool.execute(None, args)
+        except BaseException:
+            await _cancel(speculative)
+            raise
+        if on_semantic is not None:
+            on_semantic(tool_result)
+
+        main_query = tool_result.metadata["semantic_result"].get("main_query") if tool_result.success else None
+        outcome = self._speculation_outcome(user_input, main_query)
+        self.speculation[outcome] += 1
+        metrics.inc("workflow_speculation_total", outcome=outcome)
+        if outcome == "no_main_query":
+            await _cancel(speculative)
+            return tool_result, None
+        if outcome == "miss":
+            await _cancel(speculative)
+            return tool_result, await self.intent_tool.execute(None, IntentInput(query=main_query))
+
+        intent_result = await speculative
+        if intent_result.success:
+            # 判斷依據是原始輸入，結果中的 main_query 改為語意分析取得的值；
+            # 結果可能來自快取而被共用，因此複製一份而不直接修改
+            intent_result = intent_result.model_copy(
+                update={"metadata": {**intent_result.metadata, "main_query": main_query}}
+            )
+        return tool_result, intent_result
+
+    def _speculation_outcome(self, user_input: str, main_query: Optional[str]) -> str:
+        if not main_query:
+            return "no_main_query"
+        if NgramVectorizer.normalize(main_query) == NgramVectorizer.normalize(user_input):
+            return "exact"
+        if self.speculation_threshold < 1:
+            similarity = float(self._vectorizer.transform(main_query) @ self._vectorizer.transform(user_input))
+            if similarity >= self.speculation_threshold:
+                return "similar"
+        return "miss"
+
+    def speculation_stats(self) -> Dict[str, Any]:
+        """speculative 模式的命中率（沿用推測結果）與浪費率（推測的呼叫被捨棄）"""
+        total = sum(self.speculation.values())
+        hits = self.speculation["exact"] + self.speculation["similar"]
+        return {
+            "total": total,
+            "hit_rate": hits / total if total else 0.0,
+            "wasted_rate": (total - hits) / total if total else 0.0,
+            **dict(self.speculation),
+        }
+
+    def _wrap_prefilter(self, pre: PrefilterResult) -> Tuple[ToolResult, Optional[ToolResult]]:
+        """將預分類結果包裝成與工具相同格式的 ToolResult，trace 輸出不變"""
+        tool_result = self.semantic_tool.wrap_result(pre.semantic)
+        intent_result = None
+        if pre.intent is not None:
+            intent_result = self.intent_tool.wrap_result(pre.intent.main_query, pre.intent.abcd, pre.intent.raw_response)
+        return tool_result, intent_result
+
+    async def aclose(self) -> None:
+        """將尚未寫入的記憶日誌 flush 到檔案、保存預分類精確率與近似重複快取索引，並提交 agent_memory 尚未寫入的批次"""
+        await self.memory_log.aclose()
+        if self.prefilter is not None:
+            await asyncio.to_thread(self.prefilter.save_precision)
+        for cache in (self.semantic_tool.similarity_cache, self.intent_tool.similarity_cache):
+            if cache is not None:
+                await asyncio.to_thread(cache.save)
+        flush = getattr(self.agent.agent_memory, "flush", None)
+        if flush is not None:
+            await flush()
+
+    async def _remember(self, context: ToolContext, content: str) -> None:
+        """存文字記憶到 agent_memory，並寫入本地記憶日誌"""
+        await self.agent.agent_memory.save_text_memory(content=content, context=context)
+        self._log_memory(context.conversation_id, context.request_id, context.user, content)
+
+    # 將保存的文字記憶額外寫入本地檔案，便於驗證（MEMORY_LOG_ENABLED 開啟時；批次非同步寫入）
+    def _log_memory(self, conversation_id: str, request_id: str, user: User, content: str) -> None:
+        if not MEMORY_LOG_ENABLED:
+            return
+        try:
+            ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            user_id = getattr(user, "id", "unknown")
+            line = f"[{ts}] conversation={conversation_id} | request={request_id} | user={user_id} | {content}\n"
+            self.memory_log.write(line)
+        except Exception:
+            pass
+
+    # 讀取本地記憶日誌最後 n 行（由記憶體 ring buffer 提供，必要時才從檔尾讀取）
     def _tail_log(self, n: int = 10) -> str:
         try:
-            if not os.path.exists(self._memory_log_path):
-                return "(log 檔案不存在)"
-            with open(self._memory_log_path, "r", encoding="utf-8") as f:
-                lines = f.readlines()
+            lines = self.memory_log.tail(n)
             if not lines:
+                if not os.path.exists(self._memory_log_path):
+                    return "(log 檔案不存在)"
                 return "(log 目前為空)"
-            return "".join(lines[-n:])
+            return "".join(lines)
         except Exception as e:
             return f"(讀取 log 失敗: {e})"
+
+
+async def _cancel(task: Optional[asyncio.Task]) -> None:
+    """取消尚未完成的背景工具呼叫並等待其結束"""
+    if task is None or task.done():
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass